@@ -0,0 +1,101 @@
+"""
+Record/replay cassette for the Groq agents in restapp.py.
+
+Uses the same JSON-lines format as the server's app/services/llm_cassette.py
+so both apps can share tooling. Controlled by environment variables:
+
+    LLM_CASSETTE_MODE=off|record|replay|auto   (default off)
+    LLM_CASSETTE_PATH=cassettes/groq.jsonl.gz
+    LLM_CASSETTE_SIMULATE_LATENCY=true|false
+"""
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+MODE = os.getenv("LLM_CASSETTE_MODE", "off").lower()
+PATH = os.getenv("LLM_CASSETTE_PATH", "cassettes/groq.jsonl.gz")
+SIMULATE_LATENCY = os.getenv("LLM_CASSETTE_SIMULATE_LATENCY", "false").lower() == "true"
+
+_entries = None
+_lock = threading.Lock()
+
+
+class CassetteMiss(RuntimeError):
+    pass
+
+
+class ReplayedResponse:
+    """Minimal stand-in for phi's RunResponse"""
+
+    def __init__(self, content):
+        self.content = content
+
+
+def _open(mode):
+    if PATH.endswith(".gz"):
+        return gzip.open(PATH, mode + "t", encoding="utf-8")
+    return open(PATH, mode, encoding="utf-8")
+
+
+def _load():
+    global _entries
+    if _entries is None:
+        _entries = {}
+        if os.path.exists(PATH):
+            with _open("r") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        _entries[entry["key"]] = entry
+    return _entries
+
+
+def _key(agent, prompt):
+    model_id = getattr(getattr(agent, "model", None), "id", "")
+    payload = json.dumps({
+        "model": f"{agent.name}|{model_id}",
+        "history": [{"role": "system", "parts": list(agent.instructions or [])}],
+        "message": prompt,
+    }, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def run_agent(agent, prompt):
+    """agent.run(prompt), answered from / recorded to the cassette depending on LLM_CASSETTE_MODE"""
+    if MODE == "off":
+        return agent.run(prompt)
+
+    key = _key(agent, prompt)
+    entries = _load()
+    entry = entries.get(key) if MODE in ("replay", "auto") else None
+    if entry is not None:
+        if SIMULATE_LATENCY:
+            time.sleep(entry.get("latency_s", 0))
+        return ReplayedResponse(entry["response"])
+    if MODE == "replay":
+        raise CassetteMiss(f"No recorded response for prompt {key[:12]}")
+
+    start = time.perf_counter()
+    response = agent.run(prompt)
+    latency = time.perf_counter() - start
+    content = getattr(response, "content", str(response))
+    entry = {
+        "key": key,
+        "model": getattr(getattr(agent, "model", None), "id", ""),
+        "prompt_chars": len(prompt),
+        "response": content,
+        "latency_s": round(latency, 4),
+        "usage": {},
+        "recorded_at": datetime.utcnow().isoformat(timespec="seconds"),
+    }
+    with _lock:
+        entries[key] = entry
+        if os.path.dirname(PATH):
+            os.makedirs(os.path.dirname(PATH), exist_ok=True)
+        with _open("a") as f:
+            f.write(json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n")
+    return response
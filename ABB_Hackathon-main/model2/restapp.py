@@ -5,6 +5,7 @@ from dotenv import load_dotenv
 from phi.agent import Agent
 from phi.model.groq import Groq
 from phi.tools.duckduckgo import DuckDuckGo
+from cassette import run_agent
 
 load_dotenv()
 
@@ -204,7 +205,7 @@ def handle_generate_code(prompt: str):
         with st.spinner("Analyzing requirements..."):
             clarification_agent = make_clarification_agent()
             context_prompt = f"User input: {prompt}\n\nInput analysis: {analysis}"
-            clarification_response = clarification_agent.run(context_prompt)
+            clarification_response = run_agent(clarification_agent, context_prompt)
             clarification_content = getattr(clarification_response, "content", str(clarification_response))
         
         if "CLEAR_INPUT" not in clarification_content.upper():
@@ -218,7 +219,7 @@ def handle_generate_code(prompt: str):
     with st.spinner("Generating IEC 61131-3 code..."):
         agent = make_enhanced_code_agent()
         enhanced_prompt = build_context_prompt(prompt)
-        resp = agent.run(enhanced_prompt)
+        resp = run_agent(agent, enhanced_prompt)
         content = getattr(resp, "content", str(resp))
         code_only = extract_first_code_block(content) or content
         st.session_state.generated_code = code_only
@@ -237,7 +238,7 @@ def handle_generate_flowchart(prompt: str):
     with st.spinner("Generating flowchart..."):
         agent = make_enhanced_flow_agent()
         enhanced_prompt = build_context_prompt(prompt)
-        resp = agent.run(enhanced_prompt)
+        resp = run_agent(agent, enhanced_prompt)
         content = getattr(resp, "content", str(resp))
         st.session_state.generated_flowchart = content
         
@@ -303,7 +304,7 @@ with col_validate:
                     markdown=True,
                     debug_mode=False,
                 )
-                validation_response = validation_agent.run(st.session_state.generated_code)
+                validation_response = run_agent(validation_agent, st.session_state.generated_code)
                 st.markdown("### Validation Result")
                 st.markdown(getattr(validation_response, "content", str(validation_response)))
 
@@ -334,7 +335,7 @@ with col_refine:
                     )
                     
                     refinement_prompt = f"Original code:\n{st.session_state.generated_code}\n\nRefinement request: {refinement_request}"
-                    refinement_response = refinement_agent.run(refinement_prompt)
+                    refinement_response = run_agent(refinement_agent, refinement_prompt)
                     
                     refined_code = extract_first_code_block(getattr(refinement_response, "content", str(refinement_response)))
                     if refined_code:
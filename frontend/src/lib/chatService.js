@@ -20,6 +20,7 @@ export class ChatService {
     this.user = user;
     this.getIdToken = getIdToken;
     this.listeners = new Map();
+    this.sockets = new Map();
   }
 
   /**
@@ -98,34 +99,138 @@ export class ChatService {
   }
 
   /**
-   * Send a message to a session via API
+   * Open (or reuse) the WebSocket channel of a session. The ID token is sent
+   * once, in the first frame; resolves when the server is ready.
    */
-  async sendMessage(sessionId, message, conversationHistory = []) {
-    try {
-      const token = await this.getIdToken();
-      
-      // Clean up conversation history format for backend
-      const cleanHistory = conversationHistory.map((msg) => {
-        let content = msg.content;
+  connectSession(sessionId, onEvent = null) {
+    const existing = this.sockets.get(sessionId);
+    if (existing) {
+      if (onEvent) existing.onEvent = onEvent;
+      return existing.ready;
+    }
+
+    const channel = { turns: new Map(), onEvent };
+    const url = `wss://sujay-jmg9.onrender.com/api/v1/chat/sessions/${sessionId}/ws`;
+    channel.ready = new Promise((resolve, reject) => {
+      const ws = new WebSocket(url);
+      channel.ws = ws;
+      ws.onopen = async () => {
+        try {
+          ws.send(JSON.stringify({ t: 'auth', token: await this.getIdToken() }));
+        } catch (error) {
+          ws.close();
+          reject(error);
+        }
+      };
+      ws.onmessage = (event) => {
+        const frame = JSON.parse(event.data);
+        const turn = frame.id != null ? channel.turns.get(frame.id) : null;
+        if (frame.t === 'ready') {
+          resolve(channel);
+        } else if (frame.t === 'part' && turn) {
+          turn.parts[frame.i] = frame.part;
+        } else if (frame.t === 'done' && turn) {
+          channel.turns.delete(frame.id);
+          turn.resolve(turn.parts);
+        } else if (frame.t === 'error' && turn) {
+          channel.turns.delete(frame.id);
+          turn.reject(Object.assign(new Error(frame.detail), { status: frame.status }));
+        } else if (['message', 'session', 'deleted'].includes(frame.t) && channel.onEvent) {
+          channel.onEvent(frame);
+        }
+      };
+      ws.onclose = (event) => {
+        this.sockets.delete(sessionId);
+        const error = new Error(`WebSocket closed (${event.code})`);
+        channel.turns.forEach(turn => turn.reject(Object.assign(error, { dropped: true })));
+        channel.turns.clear();
+        reject(error);
+      };
+    });
+    this.sockets.set(sessionId, channel);
+    return channel.ready;
+  }
+
+  /**
+   * Close the WebSocket channel of a session
+   */
+  disconnectSession(sessionId) {
+    const channel = this.sockets.get(sessionId);
+    if (channel) {
+      this.sockets.delete(sessionId);
+      channel.ws.close();
+    }
+  }
+
+  /**
+   * Send a message over the session's WebSocket; resolves with the answer parts
+   */
+  async _sendOverSocket(sessionId, message) {
+    const channel = await this.connectSession(sessionId);
+    const id = `c${Date.now()}${Math.random().toString(36).slice(2, 6)}`;
+    return new Promise((resolve, reject) => {
+      channel.turns.set(id, { parts: [], resolve, reject });
+      channel.ws.send(JSON.stringify({ t: 'msg', id, text: message }));
+    });
+  }
+
+  /**
+   * Shape a stored answer for the UI: { responses } or a single text reply
+   */
+  _toReply(response) {
+    // Always parse the response content consistently
+    if (typeof response === 'string') {
+      try {
+        const parsed = JSON.parse(response);
         
-        // If content is an object (structured response), convert to string
-        if (typeof content === 'object' && content !== null) {
-          if (content.responses && Array.isArray(content.responses)) {
-            // Extract text content from structured responses
-            content = content.responses.map(r => r.content || '').join('\n\n');
-          } else {
-            // Fallback: stringify the object
-            content = JSON.stringify(content);
+        // Response should always be an array due to response schema
+        if (Array.isArray(parsed)) {
+          const validResponses = parsed.every(item => 
+            item && typeof item === 'object' && item.type && item.content
+          );
+          if (validResponses) {
+            return { responses: parsed };
           }
         }
         
-        return {
-          role: msg.role,
-          content: String(content), // Ensure it's always a string
-          // Convert timestamp to ISO string if it exists, otherwise omit
-          ...(msg.timestamp && { timestamp: new Date(msg.timestamp).toISOString() })
-        };
-      });
+      } catch (e) {
+        // Not JSON, return as text
+      }
+    }
+    
+    // Fallback to text response
+    return {
+      type: "text",
+      content: response || "No response received"
+    };
+  }
+
+  /**
+   * Send a message to a session, over its WebSocket when one can be opened,
+   * otherwise via the HTTP API
+   */
+  async sendMessage(sessionId, message) {
+    if (typeof WebSocket !== 'undefined') {
+      try {
+        const parts = await this._sendOverSocket(sessionId, message);
+        return this._toReply(JSON.stringify(parts));
+      } catch (error) {
+        // Answers from the server (rate limits, errors) are final, and a turn
+        // cut off mid-way may already be stored; only a socket that could
+        // not be opened falls back to HTTP
+        if (error.status || error.dropped) throw error;
+        console.warn('WebSocket unavailable, sending over HTTP:', error);
+      }
+    }
+    return this._sendOverHttp(sessionId, message);
+  }
+
+  /**
+   * Send a message to a session via API
+   */
+  async _sendOverHttp(sessionId, message) {
+    try {
+      const token = await this.getIdToken();
       
       const response = await fetch(`https://sujay-jmg9.onrender.com/api/v1/chat/sessions/${sessionId}/messages`, {
         method: 'POST',
@@ -133,10 +238,8 @@ export class ChatService {
           'Content-Type': 'application/json',
           'Authorization': `Bearer ${token}`,
         },
-        body: JSON.stringify({
-          message,
-          conversation_history: cleanHistory,
-        }),
+        // The server reads the conversation history from the session
+        body: JSON.stringify({ message }),
       });
 
       if (!response.ok) {
@@ -144,32 +247,7 @@ export class ChatService {
       }
       
       const data = await response.json();
-      
-      // Always parse the response content consistently
-      if (typeof data.response === 'string') {
-        try {
-          const parsed = JSON.parse(data.response);
-          
-          // Response should always be an array due to response schema
-          if (Array.isArray(parsed)) {
-            const validResponses = parsed.every(item => 
-              item && typeof item === 'object' && item.type && item.content
-            );
-            if (validResponses) {
-              return { responses: parsed };
-            }
-          }
-          
-        } catch (e) {
-          // Not JSON, return as text
-        }
-      }
-      
-      // Fallback to text response
-      return {
-        type: "text",
-        content: data.response || "No response received"
-      };
+      return this._toReply(data.response);
     } catch (error) {
       console.error('Error sending message:', error);
       throw error;
@@ -303,6 +381,7 @@ export class ChatService {
   stopAllListeners() {
     this.listeners.forEach(unsubscribe => unsubscribe());
     this.listeners.clear();
+    this.sockets.forEach((_, sessionId) => this.disconnectSession(sessionId));
   }
 
   /**
@@ -3,6 +3,9 @@ export class LibraryService {
     this.user = user;
     this.getIdToken = getIdToken;
     this.baseUrl = 'https://sujay-jmg9.onrender.com/api/v1/library';
+    // Last search result per request body, revalidated with its ETag (the
+    // browser only does that by itself for GET requests)
+    this.searchCache = new Map();
   }
 
   /**
@@ -50,7 +53,7 @@ export class LibraryService {
   }
 
   /**
-   * Get all library entries for the user
+   * Get library entry summaries (question, preview, tags) for the list view
    */
   async getLibraryEntries(limit = 50) {
     try {
@@ -73,31 +76,66 @@ export class LibraryService {
     }
   }
 
+  /**
+   * Get a single library entry with the full response
+   */
+  async getLibraryEntry(entryId) {
+    try {
+      const token = await this.getIdToken();
+      const response = await fetch(`${this.baseUrl}/entries/${entryId}`, {
+        method: 'GET',
+        headers: {
+          'Authorization': `Bearer ${token}`,
+        },
+      });
+
+      if (!response.ok) {
+        throw new Error(`HTTP error! status: ${response.status}`);
+      }
+
+      return await response.json();
+    } catch (error) {
+      console.error('Error getting library entry:', error);
+      throw error;
+    }
+  }
+
   /**
    * Search through library entries
    */
   async searchLibrary(query, limit = 20, category = null, tags = []) {
     try {
       const token = await this.getIdToken();
+      const body = JSON.stringify({
+        query,
+        limit,
+        category,
+        tags
+      });
+      const cached = this.searchCache.get(body);
       const response = await fetch(`${this.baseUrl}/search`, {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
           'Authorization': `Bearer ${token}`,
+          ...(cached && { 'If-None-Match': cached.etag }),
         },
-        body: JSON.stringify({
-          query,
-          limit,
-          category,
-          tags
-        }),
+        body,
       });
 
+      if (response.status === 304 && cached) {
+        return cached.data;
+      }
       if (!response.ok) {
         throw new Error(`HTTP error! status: ${response.status}`);
       }
 
-      return await response.json();
+      const data = await response.json();
+      const etag = response.headers.get('ETag');
+      if (etag) {
+        this.searchCache.set(body, { etag, data });
+      }
+      return data;
     } catch (error) {
       console.error('Error searching library:', error);
       throw error;
@@ -63,20 +63,10 @@ export function Home() {
   const isMessageInLibrary = (userMessage, assistantMessage) => {
     if (!userMessage || !assistantMessage) return false;
     
-    // Convert assistant message content to string for comparison
-    let assistantContent = assistantMessage.content;
-    if (typeof assistantContent === 'object' && assistantContent !== null) {
-      if (assistantContent.responses && Array.isArray(assistantContent.responses)) {
-        assistantContent = assistantContent.responses.map(r => r.content || '').join('\n\n');
-      } else {
-        assistantContent = JSON.stringify(assistantContent);
-      }
-    }
-    
-    // Check if this exact Q&A pair exists in library
+    // The library list carries summaries only, so match on the question within this session
     return libraryEntries.some(entry => 
       entry.user_question === userMessage && 
-      entry.assistant_response === assistantContent
+      entry.session_id === currentSessionId
     );
   };
 
@@ -249,7 +239,7 @@ export function Home() {
     const userMessage = { role: 'user', content: text, timestamp: new Date() };
     setMessages(prev => [...prev, userMessage]);    try {
       // Send message to backend - it will handle adding to Firestore
-      const assistantReply = await chatService.sendMessage(currentSessionId, text, messages);
+      const assistantReply = await chatService.sendMessage(currentSessionId, text);
       
       // Store the structured response directly - ResponseRenderer will handle parsing
       let contentToStore = assistantReply;
@@ -24,6 +24,8 @@ export function Library() {
   const [isLoading, setIsLoading] = useState(true);
   const [isSearching, setIsSearching] = useState(false);
   const [stats, setStats] = useState(null);
+  const [fullResponses, setFullResponses] = useState({});
+  const [loadingEntryId, setLoadingEntryId] = useState(null);
 
   // Initialize library service
   useEffect(() => {
@@ -92,7 +94,7 @@ export function Library() {
       const query = searchQuery.trim().toLowerCase();
       const filtered = entries.filter(entry => {
         const questionMatch = entry.user_question.toLowerCase().includes(query);
-        const responseMatch = entry.assistant_response.toLowerCase().includes(query);
+        const responseMatch = entry.response_preview.toLowerCase().includes(query);
         const tagsMatch = entry.tags.some(tag => tag.toLowerCase().includes(query));
         return questionMatch || responseMatch || tagsMatch;
       });
@@ -109,6 +111,26 @@ export function Library() {
     }
   };
 
+  const toggleFullResponse = async (entryId) => {
+    if (fullResponses[entryId] !== undefined) {
+      setFullResponses(prev => {
+        const { [entryId]: _, ...rest } = prev;
+        return rest;
+      });
+      return;
+    }
+
+    try {
+      setLoadingEntryId(entryId);
+      const entry = await libraryService.getLibraryEntry(entryId);
+      setFullResponses(prev => ({ ...prev, [entryId]: entry.assistant_response }));
+    } catch (error) {
+      console.error('Error loading library entry:', error);
+    } finally {
+      setLoadingEntryId(null);
+    }
+  };
+
   const clearSearch = () => {
     setSearchQuery('');
     setSearchResults(null);
@@ -274,13 +296,27 @@ export function Library() {
                   <h3 className="text-lg font-medium text-gray-900 mb-3">
                     {entry.user_question}
                   </h3>
+                  {entry.duplicate_of && (
+                    <span className="px-2 py-1 bg-yellow-100 text-yellow-800 text-xs rounded-full">
+                      Near-duplicate of an earlier entry
+                    </span>
+                  )}
                 </div>
                 
                 <div className="bg-gray-50 rounded-lg p-4">
                   <h4 className="text-sm font-medium text-gray-700 mb-2">AI Response:</h4>
                   <p className="text-gray-900 whitespace-pre-wrap leading-relaxed">
-                    {entry.assistant_response}
+                    {fullResponses[entry.entry_id] ?? entry.response_preview}
                   </p>
+                  <button
+                    onClick={() => toggleFullResponse(entry.entry_id)}
+                    disabled={loadingEntryId === entry.entry_id}
+                    className="mt-2 text-sm text-blue-600 hover:text-blue-800 disabled:text-gray-400"
+                  >
+                    {loadingEntryId === entry.entry_id
+                      ? 'Loading...'
+                      : fullResponses[entry.entry_id] !== undefined ? 'Show less' : 'Show full response'}
+                  </button>
                 </div>
                 
                 {entry.tags && entry.tags.length > 0 && (
@@ -1,20 +1,40 @@
+import json
 from fastapi import APIRouter, Depends, HTTPException, status
-from app.core.dependencies import get_current_user
-from app.models.chat import ChatRequest, ChatResponse
+from fastapi.responses import StreamingResponse
+from app.core.dependencies import get_current_user, get_rate_limited_user, admission_error
+from app.models.chat import CachedAnswer, ChatRequest, ChatResponse
+from app.models.job import CreateJobRequest, JobResponse, JobListResponse
 from app.services.gemini_service import gemini_service
+from app.services.job_service import job_service
+from app.services.admission import llm_admission, AdmissionRejected
+from app.services.resilience import UpstreamError
+from app.services.scope_gate import scope_gate
+from app.services.semantic_cache import semantic_cache
+from app.services.session_summary import session_summary
 
 router = APIRouter(prefix="/ai", tags=["ai"])
 
 @router.post("/chat", response_model=ChatResponse)
 async def chat_with_gemini(
     chat_request: ChatRequest,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_rate_limited_user)
 ):
     """
-    Send a message to Gemini 2.0 Flash and get a response
+    Send a message to Gemini 2.0 Flash and get a response. A stand-alone
+    question close to one already answered (knowledge library, or the user's
+    recent questions) is answered from it in SEMANTIC_CACHE_MODE=serve, or
+    gets it as a suggestion in offer mode.
     """
+    uid = current_user.get("uid")
+    match = None
+    use_cache = semantic_cache.enabled and chat_request.use_cache and not chat_request.conversation_history
+    if use_cache:
+        match = await semantic_cache.lookup(uid, chat_request.message)
+        if match is not None and semantic_cache.mode == "serve":
+            return ChatResponse(response=match["answer"], success=True, cached=CachedAnswer(**match))
+    
     try:
-        if not gemini_service.is_available():
+        if not await gemini_service.ensure_available():
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail="Gemini API key not configured"
@@ -27,16 +47,27 @@ async def chat_with_gemini(
         ] if chat_request.conversation_history else []
         
         # Get response from Gemini service
-        response_text = gemini_service.chat(
+        response_text = await gemini_service.chat_async(
             message=chat_request.message,
-            conversation_history=conversation_history
+            conversation_history=conversation_history,
+            user_id=uid
         )
         
+        if use_cache:
+            semantic_cache.remember(uid, chat_request.message, response_text)
         return ChatResponse(
             response=response_text,
-            success=True
+            success=True,
+            suggestion=CachedAnswer(**match) if match is not None else None
         )
         
+    except AdmissionRejected as e:
+        raise admission_error(e)
+    except UpstreamError as e:
+        raise HTTPException(
+            status_code=status.HTTP_502_BAD_GATEWAY,
+            detail=str(e)
+        )
     except ValueError as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -57,5 +88,111 @@ async def get_ai_status(current_user: dict = Depends(get_current_user)):
     return {
         "gemini_available": gemini_service.is_available(),
         "user_id": current_user.get("uid"),
-        "service": "Gemini 2.0 Flash"
+        "service": "Gemini 2.0 Flash",
+        "models": gemini_service.tier_stats(),
+        "session_summary": session_summary.stats(),
+        "coalescing": gemini_service.single_flight.stats(),
+        "admission": llm_admission.stats(),
+        "resilience": gemini_service.resilience.stats(),
+        "jobs": job_service.stats(),
+        "semantic_cache": semantic_cache.stats(),
+        "scope_gate": scope_gate.stats()
     }
+
+@router.post("/jobs", response_model=JobResponse, status_code=status.HTTP_202_ACCEPTED)
+async def create_generation_job(
+    job_request: CreateJobRequest,
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Queue a batch of prompts (with optional shared context) for background
+    generation. Returns immediately; poll GET /ai/jobs/{job_id} or stream
+    GET /ai/jobs/{job_id}/stream for progress and results. Each item is
+    charged to the user's rate limit when it runs, not here.
+    """
+    if not await gemini_service.ensure_available():
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Gemini API key not configured"
+        )
+    try:
+        return await job_service.submit(
+            current_user.get("uid"),
+            job_request.prompts,
+            context=job_request.context,
+            title=job_request.title
+        )
+    except AdmissionRejected as e:
+        raise admission_error(e)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+
+@router.get("/jobs", response_model=JobListResponse)
+async def list_generation_jobs(
+    current_user: dict = Depends(get_current_user),
+    limit: int = 20
+):
+    """
+    List the current user's generation jobs, newest first (without item results)
+    """
+    jobs = await job_service.list_jobs(current_user.get("uid"), limit=limit)
+    return JobListResponse(jobs=jobs, total=len(jobs))
+
+@router.get("/jobs/{job_id}", response_model=JobResponse)
+async def get_generation_job(
+    job_id: str,
+    current_user: dict = Depends(get_current_user),
+    include_items: bool = True
+):
+    """
+    Job status and progress, with the per-item results produced so far
+    """
+    job = await job_service.get(job_id, current_user.get("uid"), include_items=include_items)
+    if job is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Job not found or access denied"
+        )
+    return job
+
+@router.get("/jobs/{job_id}/stream")
+async def stream_generation_job(
+    job_id: str,
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Newline-delimited JSON progress stream: an "item" event per finished item
+    (including those already done), "progress" events and a final "job" event.
+    Disconnecting only stops the stream; the job keeps running.
+    """
+    events = await job_service.stream(job_id, current_user.get("uid"))
+    if events is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Job not found or access denied"
+        )
+
+    async def ndjson():
+        async for event in events:
+            yield json.dumps(event, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+@router.delete("/jobs/{job_id}", response_model=JobResponse)
+async def cancel_generation_job(
+    job_id: str,
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Cancel the items of a job that have not started yet
+    """
+    job = await job_service.cancel(job_id, current_user.get("uid"))
+    if job is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Job not found or access denied"
+        )
+    return job
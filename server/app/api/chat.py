@@ -1,19 +1,97 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, Header, HTTPException, status
 from fastapi.exceptions import RequestValidationError
-from typing import List
-from app.core.dependencies import get_current_user
+from datetime import datetime
+from typing import Awaitable, Callable, List, Optional, Tuple
+from app.core.dependencies import get_current_user, get_rate_limited_user, admission_error
 from app.models.session import (
     CreateSessionRequest, UpdateSessionRequest, AddMessageRequest,
     SessionResponse, SessionListResponse, SessionMessagesResponse,
-    ChatMessage
+    ChatMessage, SymbolRef, SymbolLookupResponse
 )
-from app.models.chat import ChatResponse, StructuredResponse, MultipleStructuredResponse
-import json
+from app.models.chat import ChatResponse
+import asyncio
 from app.services.firestore_service import firestore_service
+from app.services.storage import storage
 from app.services.gemini_service import gemini_service
+from app.services.admission import AdmissionRejected
+from app.services.resilience import UpstreamError
+from app.services.response_parser import parse_ai_response
+from app.services.st_symbols import MAX_SYMBOL_LENGTH, symbol_key
+from app.services.session_hub import session_hub
+from app.services.session_summary import session_summary
+from app.core.metrics import span
+from app.core.responses import etag_matches, make_etag, not_modified, trusted_response
 
 router = APIRouter(prefix="/chat", tags=["chat"])
 
+async def run_chat_turn(
+    session_id: str,
+    user_id: str,
+    message: str,
+    on_user_message: Optional[Callable[[str], Awaitable[None]]] = None
+) -> Tuple[str, str, str]:
+    """
+    One chat turn, shared by the HTTP route and the WebSocket channel: store
+    the user message, answer it with the session's rolling summary and recent
+    messages as context (session_summary.py), store the answer. Returns
+    (user message id, assistant message id, stored content).
+    Raises ValueError when the session does not exist or is not the user's.
+    """
+    # Add user message to session while reading the summary and the recent
+    # messages it does not cover; the two round trips are independent
+    user_message_id, (summary, messages) = await asyncio.gather(
+        storage.add_message_to_session(
+            session_id=session_id,
+            user_id=user_id,
+            role="user",
+            content=message
+        ),
+        session_summary.context(session_id, user_id)
+    )
+    if on_user_message is not None:
+        await on_user_message(user_message_id)
+    
+    # Convert to format expected by Gemini service
+    conversation_history = [
+        {"role": msg.role, "content": msg.content}
+        for msg in messages
+        if msg.message_id != user_message_id  # in case the read saw the new message
+    ]
+    
+    # Get AI response
+    ai_response = await gemini_service.chat_async(
+        message=message,
+        conversation_history=conversation_history,
+        user_id=user_id,
+        summary=summary
+    )
+    
+    # Parse the JSON response and run structural checks
+    with span("parse_response"):
+        content_to_store = parse_ai_response(ai_response)
+    
+    # Add AI response to session
+    assistant_message_id = await storage.add_message_to_session(
+        session_id=session_id,
+        user_id=user_id,
+        role="assistant",
+        content=content_to_store
+    )
+    # This turn's two messages join the ones outside the summary; folds older ones in the background
+    session_summary.after_turn(session_id, user_id, len(conversation_history) + 2)
+    return user_message_id, assistant_message_id, content_to_store
+
+async def publish_turn(session_id: str, message: str, user_message_id: str,
+                       assistant_message_id: str, content: str, exclude=None):
+    """Push a finished turn to the session's live connections"""
+    now = datetime.utcnow()
+    await session_hub.publish_turn(
+        session_id,
+        {"message_id": user_message_id, "role": "user", "content": message, "timestamp": now},
+        {"message_id": assistant_message_id, "role": "assistant", "content": content, "timestamp": now},
+        exclude=exclude
+    )
+
 @router.get("/debug/firestore")
 async def debug_firestore(current_user: dict = Depends(get_current_user)):
     """Debug endpoint to test Firestore connection"""
@@ -21,14 +99,14 @@ async def debug_firestore(current_user: dict = Depends(get_current_user)):
         user_id = current_user.get("uid")
         
         # Test if Firestore is available
-        if not firestore_service.is_available():
+        if not await firestore_service.ensure_available():
             return {"error": "Firestore not available", "user_id": user_id}
         
         # Test simple query
         try:
             collection_ref = firestore_service.db.collection("chat_sessions")
             count = 0
-            for doc in collection_ref.limit(1).stream():
+            async for doc in collection_ref.limit(1).stream():
                 count += 1
                 break
             
@@ -56,7 +134,7 @@ async def create_chat_session(
 ):
     """Create a new chat session"""
     try:
-        session_id = firestore_service.create_chat_session(
+        session_id = await storage.create_chat_session(
             user_id=current_user.get("uid"),
             title=request.title
         )
@@ -81,11 +159,11 @@ async def get_user_sessions(
                 detail="User ID not found in token"
             )
         
-        sessions = firestore_service.get_user_sessions(
+        sessions = await storage.get_user_sessions(
             user_id=user_id,
             limit=limit
         )
-        return SessionListResponse(sessions=sessions, total=len(sessions))
+        return trusted_response(SessionListResponse.model_construct(sessions=sessions, total=len(sessions)))
     except ValueError as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -102,20 +180,28 @@ async def get_user_sessions(
 async def get_session_messages(
     session_id: str,
     current_user: dict = Depends(get_current_user),
-    limit: int = 100
+    limit: int = 100,
+    if_none_match: Optional[str] = Header(None)
 ):
-    """Get all messages for a specific chat session"""
+    """Get all messages for a specific chat session (304 when unchanged since the client's ETag)"""
     try:
-        messages = firestore_service.get_session_messages(
+        user_id = current_user.get("uid")
+        # One session read decides whether the messages need to be read at all
+        version = await storage.get_session_version(session_id, user_id)
+        etag = make_etag("messages", session_id, limit, version)
+        if etag_matches(if_none_match, etag):
+            return not_modified(etag)
+        
+        messages = await storage.get_session_messages(
             session_id=session_id,
-            user_id=current_user.get("uid"),
+            user_id=user_id,
             limit=limit
         )
-        return SessionMessagesResponse(
+        return trusted_response(SessionMessagesResponse.model_construct(
             session_id=session_id,
             messages=messages,
             total=len(messages)
-        )
+        ), etag=etag)
     except ValueError as e:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -131,113 +217,23 @@ async def get_session_messages(
 async def send_message_to_session(
     session_id: str,
     request: AddMessageRequest,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_rate_limited_user)
 ):
     """Send a message to a specific chat session and get AI response"""
     try:
-        # Debug logging for request validation
-        print(f"Request received - message: '{request.message}', history length: {len(request.conversation_history)}")
-        for i, msg in enumerate(request.conversation_history):
-            print(f"  Message {i}: role={msg.role}, content_length={len(msg.content)}, timestamp={msg.timestamp}")
-        
         user_id = current_user.get("uid")
         
         # Verify AI service is available
-        if not gemini_service.is_available():
+        if not await gemini_service.ensure_available():
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail="Gemini AI service not available"
             )
         
-        # Add user message to session
-        firestore_service.add_message_to_session(
-            session_id=session_id,
-            user_id=user_id,
-            role="user",
-            content=request.message
-        )
-        
-        # Get conversation history from Firestore
-        messages = firestore_service.get_session_messages(
-            session_id=session_id,
-            user_id=user_id,
-            limit=20  # Last 20 messages for context
-        )
-        
-        # Convert to format expected by Gemini service
-        conversation_history = [
-            {"role": msg.role, "content": msg.content}
-            for msg in messages[:-1]  # Exclude the just-added user message
-        ]
-        
-        # Get AI response
-        ai_response = gemini_service.chat(
-            message=request.message,
-            conversation_history=conversation_history
-        )
-        
-        # Parse the JSON response - clean up markdown formatting first
-        structured_response = None
-        clean_response = ai_response.strip()
-        
-        # Remove markdown code blocks if present
-        if clean_response.startswith('```json'):
-            clean_response = clean_response[7:]  # Remove ```json
-        if clean_response.startswith('```'):
-            clean_response = clean_response[3:]   # Remove ```
-        if clean_response.endswith('```'):
-            clean_response = clean_response[:-3]  # Remove ending ```
-        
-        clean_response = clean_response.strip()
-        
-        try:
-            # Parse the response as JSON array (enforced by schema)
-            parsed_response = json.loads(clean_response)
-            valid_types = ["text", "ladder", "plc-code"]
-            
-            # Response should always be an array due to schema enforcement
-            if isinstance(parsed_response, list):
-                responses = []
-                valid_responses = True
-                
-                for resp in parsed_response:
-                    if (isinstance(resp, dict) and 
-                        "type" in resp and "content" in resp and 
-                        resp["type"] in valid_types):
-                        responses.append(StructuredResponse(
-                            type=resp["type"],
-                            content=resp["content"],
-                            validation=resp.get("validation")
-                        ))
-                    else:
-                        valid_responses = False
-                        break
-                
-                if valid_responses and responses:
-                    structured_response = MultipleStructuredResponse(responses=responses)
-                    # Store the structured response as JSON for consistency
-                    content_to_store = json.dumps(parsed_response)
-                else:
-                    # Fallback to plain text if validation fails
-                    content_to_store = clean_response
-                    structured_response = None
-            else:
-                # Unexpected format (not array), treat as plain text
-                content_to_store = clean_response
-                structured_response = None
-                
-        except json.JSONDecodeError:
-            # If not valid JSON, treat as plain text
-            content_to_store = clean_response
-            structured_response = None
-        
-        # Add AI response to session
-        firestore_service.add_message_to_session(
-            session_id=session_id,
-            user_id=user_id,
-            role="assistant",
-            content=content_to_store
+        user_message_id, assistant_message_id, content_to_store = await run_chat_turn(
+            session_id, user_id, request.message
         )
+        await publish_turn(session_id, request.message, user_message_id, assistant_message_id, content_to_store)
 
         return ChatResponse(
             response=content_to_store,  # Always return the stored content
@@ -245,6 +241,13 @@ async def send_message_to_session(
             success=True
         )
         
+    except AdmissionRejected as e:
+        raise admission_error(e)
+    except UpstreamError as e:
+        raise HTTPException(
+            status_code=status.HTTP_502_BAD_GATEWAY,
+            detail=str(e)
+        )
     except ValueError as e:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -271,13 +274,16 @@ async def update_session_title(
                 detail="Title is required"
             )
         
-        success = firestore_service.update_session_title(
+        success = await storage.update_session_title(
             session_id=session_id,
             user_id=current_user.get("uid"),
             title=request.title
         )
         
         if success:
+            await session_hub.publish(session_id, {
+                "t": "session", "session_id": session_id, "title": request.title, "updated_at": datetime.utcnow()
+            })
             return {"message": "Session title updated successfully"}
         else:
             raise HTTPException(
@@ -298,12 +304,13 @@ async def delete_session(
 ):
     """Delete a chat session and all its messages"""
     try:
-        success = firestore_service.delete_session(
+        success = await storage.delete_session(
             session_id=session_id,
             user_id=current_user.get("uid")
         )
         
         if success:
+            await session_hub.publish(session_id, {"t": "deleted", "session_id": session_id})
             return {"message": "Session deleted successfully"}
         else:
             raise HTTPException(
@@ -316,3 +323,35 @@ async def delete_session(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=str(e)
         )
+
+@router.get("/symbols", response_model=SymbolLookupResponse)
+async def find_symbol(
+    name: str,
+    prefix: bool = False,
+    limit: int = 50,
+    current_user: dict = Depends(get_current_user)
+):
+    """Where a symbol (variable, I/O, FB instance, POU) was declared in the user's chat sessions"""
+    key = symbol_key(name)
+    if not key or len(key) > MAX_SYMBOL_LENGTH:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"name must be 1-{MAX_SYMBOL_LENGTH} characters"
+        )
+    try:
+        refs = await storage.find_symbol_refs(
+            user_id=current_user.get("uid"),
+            key=key,
+            prefix=prefix,
+            limit=max(1, min(limit, 100))
+        )
+        return trusted_response(SymbolLookupResponse.model_construct(
+            name=name,
+            refs=[SymbolRef(**{f: ref.get(f) for f in SymbolRef.model_fields if f in ref}) for ref in refs],
+            total=len(refs)
+        ))
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to look up symbol: {str(e)}"
+        )
@@ -0,0 +1,185 @@
+"""
+WebSocket channel for a chat session.
+
+    ws(s)://host/api/v1/chat/sessions/{session_id}/ws
+
+The Firebase ID token is verified once, from the first frame, instead of on
+every turn. Frames are compact JSON objects keyed by "t":
+
+client -> server
+    {"t": "auth", "token": "..."}          first frame; again later to refresh an expiring token
+    {"t": "msg", "id": "c1", "text": "..."}  one chat turn (id is echoed back)
+    {"t": "ping"}
+
+server -> client
+    {"t": "ready", "session_id": ...}
+    {"t": "ack", "id": "c1", "message_id": ...}               user message stored
+    {"t": "part", "id": "c1", "i": 0, "part": {...}}          one part of the stored answer
+    {"t": "done", "id": "c1", "message_id": ..., "parts": n}
+    {"t": "message" | "session" | "deleted", ...}             pushed changes made elsewhere
+    {"t": "error", "id": "c1", "status": 429, "detail": ..., "retry_after": 3}
+    {"t": "pong"}
+
+A connection that does not authenticate within WS_AUTH_TIMEOUT is closed
+with 4401; an unknown session (or someone else's) with 4404.
+"""
+import asyncio
+import json
+import time
+from typing import Any, Dict, List, Optional
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+from app.api.chat import publish_turn, run_chat_turn
+from app.core.config import settings
+from app.core.metrics import span
+from app.services.admission import AdmissionRejected, llm_admission
+from app.services.firebase_service import firebase_service
+from app.services.firestore_accounting import finish_request_tally, set_request_user, start_request_tally
+from app.services.gemini_service import gemini_service
+from app.services.resilience import UpstreamError
+from app.services.session_hub import WS_FRAMES, session_hub
+from app.services.storage import storage
+
+router = APIRouter(prefix="/chat", tags=["chat"])
+
+WS_ROUTE = "/api/v1/chat/sessions/{session_id}/ws"
+CLOSE_AUTH_FAILED = 4401
+CLOSE_NOT_FOUND = 4404
+_CLIENT_FRAMES = {"auth", "msg", "ping"}
+
+
+async def _authenticate(token: Any) -> dict:
+    if not isinstance(token, str) or not token:
+        raise ValueError("missing token")
+    with span("auth"):
+        return await firebase_service.verify_id_token_cached(token)
+
+
+def _expired(user: dict) -> bool:
+    exp = user.get("exp")
+    return isinstance(exp, (int, float)) and time.time() >= exp
+
+
+def _parts(content: str) -> List[Dict[str, Any]]:
+    """Parts of a stored answer: the structured array, or one text part"""
+    try:
+        parsed = json.loads(content)
+    except ValueError:
+        parsed = None
+    if isinstance(parsed, list) and all(isinstance(p, dict) for p in parsed):
+        return parsed
+    return [{"type": "text", "content": content}]
+
+
+async def _error(websocket: WebSocket, status: int, detail: str, turn_id: Optional[str] = None,
+                 retry_after: Optional[int] = None):
+    event = {"t": "error", "id": turn_id, "status": status, "detail": detail}
+    if retry_after is not None:
+        event["retry_after"] = retry_after
+    await session_hub.send(websocket, event)
+
+
+async def _turn(websocket: WebSocket, session_id: str, user: dict, request: Dict[str, Any]):
+    turn_id = request.get("id")
+    text = request.get("text")
+    user_id = user.get("uid")
+    if not isinstance(text, str) or not text.strip():
+        return await _error(websocket, 400, "text is required", turn_id)
+    if len(text) > settings.WS_MAX_MESSAGE_CHARS:
+        return await _error(websocket, 413, f"text is limited to {settings.WS_MAX_MESSAGE_CHARS} characters", turn_id)
+    if _expired(user):
+        return await _error(websocket, 401, "Token expired; send a new auth frame", turn_id)
+    try:
+        await llm_admission.check_rate(user_id)
+    except AdmissionRejected as e:
+        return await _error(websocket, e.status_code, e.detail, turn_id, e.retry_after)
+    if not await gemini_service.ensure_available():
+        return await _error(websocket, 500, "Gemini AI service not available", turn_id)
+
+    async def ack(message_id: str):
+        await session_hub.send(websocket, {"t": "ack", "id": turn_id, "message_id": message_id})
+
+    tally = start_request_tally()
+    set_request_user(user_id)
+    try:
+        user_message_id, assistant_message_id, content = await run_chat_turn(session_id, user_id, text, ack)
+    except AdmissionRejected as e:
+        return await _error(websocket, e.status_code, e.detail, turn_id, e.retry_after)
+    except UpstreamError as e:
+        return await _error(websocket, 502, str(e), turn_id)
+    except ValueError as e:
+        return await _error(websocket, 404, str(e), turn_id)
+    except Exception as e:
+        print(f"Error in chat WebSocket turn: {str(e)}")
+        return await _error(websocket, 500, f"Failed to send message: {str(e)}", turn_id)
+    finally:
+        finish_request_tally(tally, "WS", WS_ROUTE)
+
+    parts = _parts(content)
+    for i, part in enumerate(parts):
+        await session_hub.send(websocket, {"t": "part", "id": turn_id, "i": i, "part": part})
+    await session_hub.send(websocket, {"t": "done", "id": turn_id, "message_id": assistant_message_id,
+                                       "parts": len(parts)})
+    await publish_turn(session_id, text, user_message_id, assistant_message_id, content, exclude=websocket)
+
+
+@router.websocket("/sessions/{session_id}/ws")
+async def chat_socket(websocket: WebSocket, session_id: str):
+    """Chat turns and session updates over one authenticated connection"""
+    await websocket.accept()
+    try:
+        await firebase_service.ensure_initialized()
+        request = json.loads(await asyncio.wait_for(websocket.receive_text(), settings.WS_AUTH_TIMEOUT))
+        if not isinstance(request, dict) or request.get("t") != "auth":
+            raise ValueError("the first frame must be an auth frame")
+        user = await _authenticate(request.get("token"))
+    except WebSocketDisconnect:
+        return
+    except Exception as e:
+        print(f"Chat WebSocket authentication failed: {str(e)}")
+        await websocket.close(code=CLOSE_AUTH_FAILED, reason="Authentication failed")
+        return
+    user_id = user.get("uid")
+
+    # Ownership check, once per connection
+    tally = start_request_tally()
+    set_request_user(user_id)
+    try:
+        await storage.get_session_messages(session_id=session_id, user_id=user_id, limit=1)
+    except ValueError:
+        await websocket.close(code=CLOSE_NOT_FOUND, reason="Session not found or access denied")
+        return
+    finally:
+        finish_request_tally(tally, "WS", WS_ROUTE)
+
+    session_hub.subscribe(session_id, websocket)
+    try:
+        await session_hub.send(websocket, {"t": "ready", "session_id": session_id})
+        while True:
+            text = await websocket.receive_text()
+            try:
+                request = json.loads(text)
+                kind = request.get("t")
+            except (ValueError, AttributeError):
+                await _error(websocket, 400, "Frames must be JSON objects")
+                continue
+            WS_FRAMES.inc(direction="in", type=kind if kind in _CLIENT_FRAMES else "unknown")
+            if kind == "msg":
+                await _turn(websocket, session_id, user, request)
+            elif kind == "ping":
+                await session_hub.send(websocket, {"t": "pong"})
+            elif kind == "auth":
+                try:
+                    refreshed = await _authenticate(request.get("token"))
+                except Exception as e:
+                    await _error(websocket, 401, f"Invalid authentication credentials: {str(e)}")
+                    continue
+                if refreshed.get("uid") != user_id:
+                    await websocket.close(code=CLOSE_AUTH_FAILED, reason="Token belongs to another user")
+                    return
+                user = refreshed
+            else:
+                await _error(websocket, 400, f"Unknown frame type: {kind}")
+    except WebSocketDisconnect:
+        pass
+    finally:
+        session_hub.unsubscribe(session_id, websocket)
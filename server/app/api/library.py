@@ -1,18 +1,66 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from typing import List
+from fastapi import APIRouter, Depends, Header, HTTPException, Request, status
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
+from typing import AsyncIterator, List, Optional
+import json
+import zlib
+from app.core.config import settings
 from app.core.dependencies import get_current_user
+from app.core.responses import etag_matches, make_etag, not_modified, trusted_response
 from app.models.library import (
-    CreateLibraryEntryRequest, LibrarySearchRequest,
-    LibraryEntryResponse, LibrarySearchResponse, LibraryStatsResponse
+    CreateLibraryEntryRequest, LibrarySearchRequest, LibraryEntry, LibraryImportResponse,
+    LibraryEntryResponse, LibraryEntrySummary, LibrarySearchResponse, LibraryStatsResponse
 )
-from app.services.firestore_service import firestore_service
-from google.cloud.firestore import FieldFilter
-from firebase_admin import firestore
+from app.services.storage import storage
+from app.services.library_dedup import library_dedup, response_preview, LIBRARY_DUPLICATES
+from app.services.semantic_cache import semantic_cache
 import uuid
 from datetime import datetime
 
 router = APIRouter(prefix="/library", tags=["library"])
 
+EXPORT_PAGE_SIZE = 500       # entries per storage read while exporting
+EXPORT_CHUNK_BYTES = 64 * 1024
+IMPORT_BATCH_SIZE = 500      # entries per batched commit while importing
+MAX_IMPORT_LINE_BYTES = 1024 * 1024  # a Firestore document is at most 1 MiB
+MAX_IMPORT_ERRORS = 20
+
+def _to_response(data: dict) -> dict:
+    """LibraryEntryResponse fields of a stored entry (validated when it was saved)"""
+    return {
+        "entry_id": data["entry_id"],
+        "user_name": data.get("user_name", "Anonymous User"),
+        "user_question": data["user_question"],
+        "assistant_response": data["assistant_response"],
+        "session_id": data["session_id"],
+        "created_at": data["created_at"],
+        "tags": data.get("tags", []),
+        "category": data.get("category"),
+        "duplicate_of": data.get("duplicate_of")
+    }
+
+def _to_summary(data: dict) -> dict:
+    """
+    LibraryEntrySummary fields of a stored summary; entries saved before
+    previews existed list with an empty one until the dedupe pass fills it in
+    """
+    return {
+        "entry_id": data["entry_id"],
+        "user_name": data.get("user_name", "Anonymous User"),
+        "user_question": data["user_question"],
+        "response_preview": data.get("response_preview") or "",
+        "session_id": data["session_id"],
+        "created_at": data["created_at"],
+        "tags": data.get("tags", []),
+        "category": data.get("category"),
+        "duplicate_of": data.get("duplicate_of")
+    }
+
+def _require_library_admin(current_user: dict):
+    admins = {uid.strip() for uid in settings.LIBRARY_ADMIN_UIDS.split(",") if uid.strip()}
+    if current_user.get("uid") not in admins:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Library administration not allowed")
+
 @router.post("/entries", response_model=dict)
 async def save_to_library(
     request: CreateLibraryEntryRequest,
@@ -38,13 +86,51 @@ async def save_to_library(
             "message_pair_id": request.message_pair_id,
             "created_at": datetime.utcnow(),
             "tags": request.tags or [],
-            "category": request.category
+            "category": request.category,
+            "response_preview": response_preview(request.assistant_response)
         }
         
-        # Save to Firestore
-        firestore_service.db.collection("knowledge_library").document(entry_id).set(entry_data)
+        # Near-duplicate check against the canonical entries
+        duplicate_of = None
+        if library_dedup.enabled:
+            entry_data["minhash"], duplicate_of = await library_dedup.check(
+                entry_id, request.user_question, request.assistant_response
+            )
+        
+        if duplicate_of and library_dedup.mode == "merge":
+            # Keep the existing entry; only new tags are added to it
+            if request.tags:
+                existing = await storage.get_library_entry(duplicate_of)
+                if existing is not None:
+                    tags = list(existing.get("tags") or [])
+                    new_tags = [t for t in request.tags if t not in tags]
+                    if new_tags:
+                        await storage.update_library_entries({duplicate_of: {"tags": tags + new_tags}})
+            LIBRARY_DUPLICATES.inc(source="save", action="merged")
+            return {
+                "entry_id": duplicate_of,
+                "duplicate_of": duplicate_of,
+                "message": "A nearly identical entry is already in the library"
+            }
+        
+        entry_data["duplicate_of"] = duplicate_of
+        
+        # Save to the storage backend
+        try:
+            await storage.add_library_entry(entry_data)
+        except Exception:
+            library_dedup.forget(entry_id)
+            raise
         
-        return {"entry_id": entry_id, "message": "Successfully saved to library"}
+        if duplicate_of:
+            LIBRARY_DUPLICATES.inc(source="save", action="flagged")
+            return {
+                "entry_id": entry_id,
+                "duplicate_of": duplicate_of,
+                "message": "Saved to library (flagged as a near-duplicate)"
+            }
+        semantic_cache.add_library_entry(entry_id, request.user_question)
+        return {"entry_id": entry_id, "duplicate_of": None, "message": "Successfully saved to library"}
         
     except Exception as e:
         print(f"Error saving to library: {str(e)}")
@@ -53,34 +139,20 @@ async def save_to_library(
             detail=f"Failed to save to library: {str(e)}"
         )
 
-@router.get("/entries", response_model=List[LibraryEntryResponse])
+@router.get("/entries", response_model=List[LibraryEntrySummary])
 async def get_library_entries(
     current_user: dict = Depends(get_current_user),
-    limit: int = 50
+    limit: int = 50,
+    if_none_match: Optional[str] = Header(None)
 ):
-    """Get all library entries from all users (global library)"""
+    """List the global library, newest first: summaries only, fetch full entries by id"""
     try:
-        user_id = current_user.get("uid")
+        etag = make_etag("library-summaries", limit, await storage.get_library_version())
+        if etag_matches(if_none_match, etag):
+            return not_modified(etag)
         
-        # Get all entries from Firestore (global library)
-        entries_ref = firestore_service.db.collection("knowledge_library")
-        query = entries_ref.order_by("created_at", direction=firestore.Query.DESCENDING).limit(limit)
-        
-        entries = []
-        for doc in query.stream():
-            data = doc.to_dict()
-            entries.append(LibraryEntryResponse(
-                entry_id=data["entry_id"],
-                user_name=data.get("user_name", "Anonymous User"),
-                user_question=data["user_question"],
-                assistant_response=data["assistant_response"],
-                session_id=data["session_id"],
-                created_at=data["created_at"],
-                tags=data.get("tags", []),
-                category=data.get("category")
-            ))
-        
-        return entries
+        summaries = await storage.get_library_summaries(limit)
+        return trusted_response([_to_summary(data) for data in summaries], etag=etag)
         
     except Exception as e:
         print(f"Error getting library entries: {str(e)}")
@@ -89,38 +161,47 @@ async def get_library_entries(
             detail=f"Failed to get library entries: {str(e)}"
         )
 
+@router.get("/entries/{entry_id}", response_model=LibraryEntryResponse)
+async def get_library_entry(
+    entry_id: str,
+    current_user: dict = Depends(get_current_user)
+):
+    """Get one library entry with the full response"""
+    try:
+        data = await storage.get_library_entry(entry_id)
+    except Exception as e:
+        print(f"Error getting library entry: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to get library entry: {str(e)}"
+        )
+    if data is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Library entry not found")
+    return trusted_response(_to_response(data))
+
 @router.post("/search", response_model=LibrarySearchResponse)
 async def search_library(
     request: LibrarySearchRequest,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    if_none_match: Optional[str] = Header(None)
 ):
     """Search through library entries - simplified to return all entries for frontend filtering"""
     try:
         user_id = current_user.get("uid")
         
+        # A read despite the POST: a client that sends back the ETag gets a 304
+        etag = make_etag("library-search", request.query, await storage.get_library_version())
+        if etag_matches(if_none_match, etag):
+            return not_modified(etag)
+        
         # Get all entries from all users - let frontend handle search/filtering
-        entries_ref = firestore_service.db.collection("knowledge_library")
-        query = entries_ref
-        
-        all_entries = []
-        for doc in query.stream():
-            data = doc.to_dict()
-            all_entries.append(LibraryEntryResponse(
-                entry_id=data["entry_id"],
-                user_name=data.get("user_name", "Anonymous User"),
-                user_question=data["user_question"],
-                assistant_response=data["assistant_response"],
-                session_id=data["session_id"],
-                created_at=data["created_at"],
-                tags=data.get("tags", []),
-                category=data.get("category")
-            ))
-        
-        return LibrarySearchResponse(
-            entries=all_entries,
-            total=len(all_entries),
-            query=request.query
-        )
+        all_entries = [_to_response(data) for data in await storage.get_all_library_entries()]
+        
+        return trusted_response({
+            "entries": all_entries,
+            "total": len(all_entries),
+            "query": request.query
+        }, etag=etag)
         
     except Exception as e:
         print(f"Error searching library: {str(e)}")
@@ -138,12 +219,7 @@ async def get_library_stats(
         user_id = current_user.get("uid")
         
         # Get all entries from all users
-        entries_ref = firestore_service.db.collection("knowledge_library")
-        query = entries_ref
-        
-        entries = []
-        for doc in query.stream():
-            entries.append(doc.to_dict())
+        entries = await storage.get_all_library_entries()
         
         # Simple stats - let frontend handle complex calculations
         total_entries = len(entries)
@@ -170,3 +246,166 @@ async def get_library_stats(
             detail=f"Failed to get library stats: {str(e)}"
         )
 
+
+def _export_default(value):
+    return value.isoformat() if isinstance(value, datetime) else str(value)
+
+async def _ndjson_chunks() -> AsyncIterator[bytes]:
+    """Library entries as NDJSON, in chunks of about EXPORT_CHUNK_BYTES"""
+    buffer, size = [], 0
+    async for entry in storage.iter_library_entries(EXPORT_PAGE_SIZE):
+        line = (json.dumps(entry, default=_export_default, ensure_ascii=False) + "\n").encode()
+        buffer.append(line)
+        size += len(line)
+        if size >= EXPORT_CHUNK_BYTES:
+            yield b"".join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield b"".join(buffer)
+
+async def _gzipped(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    async for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+@router.get("/export")
+async def export_library(
+    compress: bool = False,
+    current_user: dict = Depends(get_current_user)
+):
+    """Stream every library entry as NDJSON (gzip file with compress=true)"""
+    if not await storage.ensure_available():
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Library storage not available"
+        )
+    if compress:
+        return StreamingResponse(
+            _gzipped(_ndjson_chunks()),
+            media_type="application/gzip",
+            headers={"Content-Disposition": 'attachment; filename="knowledge_library.ndjson.gz"'}
+        )
+    return StreamingResponse(
+        _ndjson_chunks(),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": 'attachment; filename="knowledge_library.ndjson"'}
+    )
+
+def _inflate(decompressor, chunk: bytes):
+    """Decompress a body chunk in bounded pieces (a small gzip chunk can expand a lot)"""
+    data = decompressor.decompress(chunk, EXPORT_CHUNK_BYTES)
+    yield data
+    while decompressor.unconsumed_tail:
+        yield decompressor.decompress(decompressor.unconsumed_tail, EXPORT_CHUNK_BYTES)
+
+def _import_entry(line: bytes) -> dict:
+    """Validate one NDJSON line into a storable library entry"""
+    entry = LibraryEntry(**json.loads(line))
+    data = entry.model_dump()
+    data["entry_id"] = data["entry_id"] or str(uuid.uuid4())
+    data["created_at"] = data["created_at"] or datetime.utcnow()
+    data["tags"] = data["tags"] or []
+    if data["response_preview"] is None:
+        data["response_preview"] = response_preview(data["assistant_response"])
+    return data
+
+@router.post("/import", response_model=LibraryImportResponse)
+async def import_library(
+    request: Request,
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Import library entries from a streamed NDJSON body (gzip with
+    Content-Encoding: gzip or Content-Type: application/gzip). Entries are
+    upserted by entry_id in batched commits; invalid lines are skipped.
+    """
+    _require_library_admin(current_user)
+    if not await storage.ensure_available():
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Library storage not available"
+        )
+
+    gzipped = (request.headers.get("content-encoding") == "gzip"
+               or request.headers.get("content-type", "").startswith("application/gzip"))
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS) if gzipped else None
+    batch, imported, skipped, errors = [], 0, 0, []
+    pending, line_number = b"", 0
+
+    def take(line: bytes):
+        nonlocal skipped
+        if not line.strip():
+            return
+        try:
+            batch.append(_import_entry(line))
+        except (ValueError, TypeError, ValidationError) as e:
+            skipped += 1
+            if len(errors) < MAX_IMPORT_ERRORS:
+                errors.append(f"line {line_number}: {str(e).splitlines()[0]}")
+
+    try:
+        async for chunk in request.stream():
+            for data in _inflate(decompressor, chunk) if decompressor is not None else (chunk,):
+                *lines, pending = (pending + data).split(b"\n")
+                if len(pending) > MAX_IMPORT_LINE_BYTES:
+                    raise HTTPException(
+                        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                        detail=f"Line {line_number + len(lines) + 1} exceeds {MAX_IMPORT_LINE_BYTES} bytes"
+                    )
+                for line in lines:
+                    line_number += 1
+                    take(line)
+                if len(batch) >= IMPORT_BATCH_SIZE:
+                    imported += await storage.add_library_entries(batch)
+                    batch = []
+        if decompressor is not None:
+            pending += decompressor.flush()
+        line_number += 1
+        take(pending)
+        if batch:
+            imported += await storage.add_library_entries(batch)
+    except HTTPException:
+        raise
+    except zlib.error as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Invalid gzip body: {e}")
+    except Exception as e:
+        print(f"Error importing library entries: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to import library entries after {imported} entries: {str(e)}"
+        )
+
+    # Imported entries are not in the near-duplicate index yet
+    library_dedup.reset()
+    semantic_cache.start_sync()
+    print(f"Library import by {current_user.get('uid')}: {imported} imported, {skipped} skipped")
+    return LibraryImportResponse(imported=imported, skipped=skipped, errors=errors)
+
+@router.post("/dedupe", response_model=dict, status_code=status.HTTP_202_ACCEPTED)
+async def dedupe_library(
+    mode: str = "flag",
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Start a background pass over existing entries: near-duplicates of an
+    older entry are flagged (mode=flag) or merged into it (mode=merge)
+    """
+    _require_library_admin(current_user)
+    if mode not in ("flag", "merge"):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="mode must be 'flag' or 'merge'")
+    if not await storage.ensure_available():
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Library storage not available"
+        )
+    return library_dedup.start_pass(mode)
+
+@router.get("/dedupe", response_model=dict)
+async def dedupe_status(
+    current_user: dict = Depends(get_current_user)
+):
+    """Near-duplicate detection settings and the result of the last pass"""
+    return library_dedup.stats()
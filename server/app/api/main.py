@@ -1,5 +1,5 @@
 from fastapi import APIRouter
-from app.api import user, ai, chat, library
+from app.api import user, ai, chat, chat_ws, library
 
 api_router = APIRouter()
 
@@ -7,6 +7,7 @@ api_router = APIRouter()
 api_router.include_router(user.router)
 api_router.include_router(ai.router)
 api_router.include_router(chat.router)
+api_router.include_router(chat_ws.router)
 api_router.include_router(library.router)
 
 # You can add more routers here as your application grows
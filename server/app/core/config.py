@@ -15,6 +15,111 @@ class Settings:
     
     # Gemini AI settings
     GEMINI_API_KEY: str = os.getenv("GEMINI_API_KEY", "")
+    # Model tier per request (text / code / ladder / refine) and for session summaries;
+    # overrides as "tier=model:max_tokens,..."
+    GEMINI_MODEL_ROUTING: bool = os.getenv("GEMINI_MODEL_ROUTING", "True").lower() == "true"
+    GEMINI_MODEL_TIERS: str = os.getenv("GEMINI_MODEL_TIERS", "")
+    
+    # LLM admission control
+    LLM_MAX_CONCURRENCY: int = int(os.getenv("LLM_MAX_CONCURRENCY", 8))
+    LLM_QUEUE_TIMEOUT: float = float(os.getenv("LLM_QUEUE_TIMEOUT", 20))
+    LLM_MAX_QUEUE: int = int(os.getenv("LLM_MAX_QUEUE", 200))
+    LLM_USER_RATE_PER_MINUTE: float = float(os.getenv("LLM_USER_RATE_PER_MINUTE", 20))
+    LLM_USER_BURST: int = int(os.getenv("LLM_USER_BURST", 5))
+    # Weighted round-robin shares, e.g. "uid1:3,uid2:2" (default weight 1)
+    LLM_USER_WEIGHTS: str = os.getenv("LLM_USER_WEIGHTS", "")
+    
+    # LLM resilience: retries with jittered backoff, hedging, circuit breaker
+    LLM_RETRY_ATTEMPTS: int = int(os.getenv("LLM_RETRY_ATTEMPTS", 3))
+    LLM_RETRY_BASE_DELAY: float = float(os.getenv("LLM_RETRY_BASE_DELAY", 0.5))
+    LLM_RETRY_MAX_DELAY: float = float(os.getenv("LLM_RETRY_MAX_DELAY", 8))
+    LLM_DEADLINE: float = float(os.getenv("LLM_DEADLINE", 60))
+    LLM_HEDGE: bool = os.getenv("LLM_HEDGE", "False").lower() == "true"
+    LLM_BREAKER_FAILURES: int = int(os.getenv("LLM_BREAKER_FAILURES", 5))
+    LLM_BREAKER_COOLDOWN: float = float(os.getenv("LLM_BREAKER_COOLDOWN", 30))
+    
+    # Bulk generation jobs
+    JOB_WORKERS: int = int(os.getenv("JOB_WORKERS", 4))
+    JOB_MAX_PROMPTS: int = int(os.getenv("JOB_MAX_PROMPTS", 100))
+    JOB_MAX_PENDING: int = int(os.getenv("JOB_MAX_PENDING", 1000))
+    JOB_MAX_PENDING_PER_USER: int = int(os.getenv("JOB_MAX_PENDING_PER_USER", 200))
+    
+    # Multi-worker deployment (python -m app.launcher)
+    WORKERS: int = int(os.getenv("WORKERS", 1))
+    # memory | local (stand-in server on SHARED_STATE_SOCKET) | unix:///path | redis://host:port/db
+    SHARED_STATE: str = os.getenv("SHARED_STATE", "memory")
+    SHARED_STATE_SOCKET: str = os.getenv("SHARED_STATE_SOCKET", "/tmp/iec-shared-state.sock")
+    # Seconds a verified ID token is served from the shared cache (0 = verify every request)
+    ID_TOKEN_CACHE_TTL: float = float(os.getenv("ID_TOKEN_CACHE_TTL", 300))
+    
+    # Startup: services initialize in the background after the server starts
+    # listening; STARTUP_BLOCKING waits for them first, STARTUP_WARMUP makes one
+    # round trip to Firestore and Gemini once they are up
+    STARTUP_BLOCKING: bool = os.getenv("STARTUP_BLOCKING", "False").lower() == "true"
+    STARTUP_WARMUP: bool = os.getenv("STARTUP_WARMUP", "False").lower() == "true"
+    
+    # Response compression (br with the brotli module installed, else gzip)
+    COMPRESSION_ENABLED: bool = os.getenv("COMPRESSION_ENABLED", "True").lower() == "true"
+    COMPRESSION_MIN_BYTES: int = int(os.getenv("COMPRESSION_MIN_BYTES", 1024))
+    COMPRESSION_GZIP_LEVEL: int = int(os.getenv("COMPRESSION_GZIP_LEVEL", 6))
+    COMPRESSION_BROTLI_QUALITY: int = int(os.getenv("COMPRESSION_BROTLI_QUALITY", 4))
+    
+    # Chat WebSocket: seconds a new connection has to send its auth frame
+    WS_AUTH_TIMEOUT: float = float(os.getenv("WS_AUTH_TIMEOUT", 10))
+    WS_MAX_MESSAGE_CHARS: int = int(os.getenv("WS_MAX_MESSAGE_CHARS", 20000))
+    
+    # Session turns send a rolling summary plus at most SESSION_CONTEXT_MESSAGES recent
+    # messages; every SESSION_SUMMARY_EVERY_TURNS turns the older ones are folded into
+    # the summary in the background, one extra summary-tier call each time
+    # (off: the recent messages only)
+    SESSION_SUMMARY_MODE: str = os.getenv("SESSION_SUMMARY_MODE", "off").lower()
+    SESSION_CONTEXT_MESSAGES: int = int(os.getenv("SESSION_CONTEXT_MESSAGES", 8))
+    SESSION_SUMMARY_EVERY_TURNS: int = int(os.getenv("SESSION_SUMMARY_EVERY_TURNS", 2))
+    SESSION_SUMMARY_MAX_CHARS: int = int(os.getenv("SESSION_SUMMARY_MAX_CHARS", 1500))
+    
+    # LLM record/replay cassette (off | record | replay | auto)
+    LLM_CASSETTE_MODE: str = os.getenv("LLM_CASSETTE_MODE", "off").lower()
+    LLM_CASSETTE_PATH: str = os.getenv("LLM_CASSETTE_PATH", "cassettes/gemini.jsonl.gz")
+    LLM_CASSETTE_SIMULATE_LATENCY: bool = os.getenv("LLM_CASSETTE_SIMULATE_LATENCY", "False").lower() == "true"
+    
+    # Knowledge library: uids allowed to bulk-import entries (comma-separated; empty disables import)
+    LIBRARY_ADMIN_UIDS: str = os.getenv("LIBRARY_ADMIN_UIDS", "")
+    # Near-duplicate saves: off | flag (save with duplicate_of) | merge (keep the existing entry)
+    LIBRARY_DEDUP_MODE: str = os.getenv("LIBRARY_DEDUP_MODE", "flag").lower()
+    LIBRARY_DEDUP_THRESHOLD: float = float(os.getenv("LIBRARY_DEDUP_THRESHOLD", 0.8))
+    
+    # Semantic answer cache for /ai/chat: off | offer (return the match as a suggestion) | serve (answer from it)
+    SEMANTIC_CACHE_MODE: str = os.getenv("SEMANTIC_CACHE_MODE", "off").lower()
+    SEMANTIC_CACHE_THRESHOLD: float = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", 0.85))
+    SEMANTIC_CACHE_DIR: str = os.getenv("SEMANTIC_CACHE_DIR", "data/semantic_index")
+    SEMANTIC_CACHE_NPROBE: int = int(os.getenv("SEMANTIC_CACHE_NPROBE", 8))
+    # Recently answered questions kept per process, and how long their answers are reused (seconds)
+    SEMANTIC_CACHE_HISTORY: int = int(os.getenv("SEMANTIC_CACHE_HISTORY", 5000))
+    SEMANTIC_CACHE_HISTORY_TTL: float = float(os.getenv("SEMANTIC_CACHE_HISTORY_TTL", 86400))
+    # Seconds between library version checks (a rebuild follows when it changed)
+    SEMANTIC_CACHE_SYNC_SECONDS: float = float(os.getenv("SEMANTIC_CACHE_SYNC_SECONDS", 300))
+    
+    # Local scope gate before LLM calls: off | shadow (count only) | on (reject clearly off-topic questions)
+    SCOPE_GATE_MODE: str = os.getenv("SCOPE_GATE_MODE", "shadow").lower()
+    # Rejects below this probability of being in scope (stricter for messages sent with history)
+    SCOPE_GATE_THRESHOLD: float = float(os.getenv("SCOPE_GATE_THRESHOLD", 0.2))
+    SCOPE_GATE_FOLLOW_UP_THRESHOLD: float = float(os.getenv("SCOPE_GATE_FOLLOW_UP_THRESHOLD", 0.05))
+    
+    # Storage backend: firestore | sqlite
+    STORAGE_BACKEND: str = os.getenv("STORAGE_BACKEND", "firestore").lower()
+    SQLITE_PATH: str = os.getenv("SQLITE_PATH", "data/iec_assistant.db")
+    
+    # Firestore settings
+    # Adds an X-Firestore-Ops header (reads/writes/deletes/bytes) to every response
+    FIRESTORE_OPS_HEADER: bool = os.getenv("FIRESTORE_OPS_HEADER", "False").lower() == "true"
+    
+    # Ladder diagram settings
+    LADDER_NORMALIZE: bool = os.getenv("LADDER_NORMALIZE", "False").lower() == "true"
+    
+    # Structured Text settings
+    # Re-lay out generated plc-code in canonical form (keyword case, indentation, spacing)
+    ST_FORMAT: bool = os.getenv("ST_FORMAT", "False").lower() == "true"
+    ST_STRIP_COMMENTS: bool = os.getenv("ST_STRIP_COMMENTS", "False").lower() == "true"
     
     # CORS settings
     ALLOWED_ORIGINS: list = [
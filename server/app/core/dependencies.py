@@ -1,6 +1,9 @@
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from app.services.firebase_service import firebase_service
+from app.core.metrics import span
+from app.services.firestore_accounting import set_request_user
+from app.services.admission import llm_admission, AdmissionRejected
 
 # Security
 security = HTTPBearer()
@@ -14,8 +17,11 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
         id_token = credentials.credentials
         print(f"Received token: {id_token[:50]}...")  # Log first 50 chars for debugging
         
-        # Verify the ID token using Firebase service
-        decoded_token = firebase_service.verify_id_token(id_token)
+        # Verify the ID token using Firebase service (initialized in the background at startup)
+        await firebase_service.ensure_initialized()
+        with span("auth"):
+            decoded_token = await firebase_service.verify_id_token_cached(id_token)
+        set_request_user(decoded_token.get("uid"))
         print(f"Token verified for user: {decoded_token.get('email', 'unknown')}")
         
         return decoded_token
@@ -26,3 +32,21 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
             detail=f"Invalid authentication credentials: {str(e)}",
             headers={"WWW-Authenticate": "Bearer"},
         )
+
+def admission_error(rejection: AdmissionRejected) -> HTTPException:
+    """HTTP error for a call rejected by LLM admission control"""
+    return HTTPException(
+        status_code=rejection.status_code,
+        detail=rejection.detail,
+        headers={"Retry-After": str(rejection.retry_after)},
+    )
+
+async def get_rate_limited_user(current_user: dict = Depends(get_current_user)) -> dict:
+    """
+    Authenticated user whose per-user LLM token bucket has room for this request
+    """
+    try:
+        await llm_admission.check_rate(current_user.get("uid"))
+    except AdmissionRejected as e:
+        raise admission_error(e)
+    return current_user
@@ -0,0 +1,85 @@
+"""
+Application lifespan: service startup off the import path.
+
+Importing app.main no longer loads the Firebase, Firestore or Gemini SDKs.
+The lifespan handler starts their initialization in the background, each in
+a worker thread so they overlap, and the server starts accepting requests
+right away (STARTUP_BLOCKING=True waits instead). A request that arrives
+early waits only for the service it uses; /health reports each one's state.
+"""
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Dict
+from starlette.concurrency import run_in_threadpool
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.services.firebase_service import firebase_service
+from app.services.gemini_service import gemini_service
+from app.services.job_service import job_service
+from app.services.library_dedup import library_dedup
+from app.services.scope_gate import scope_gate
+from app.services.semantic_cache import semantic_cache
+from app.services.session_summary import session_summary
+from app.services.shared_state import shared_state
+from app.services.storage import storage
+
+STARTUP_SECONDS = metrics.gauge("startup_seconds", "Time taken to initialize the services at startup")
+
+
+async def _warmup():
+    """One round trip per remote dependency; failures only get logged"""
+    results = await asyncio.gather(storage.warmup(), run_in_threadpool(gemini_service.warmup),
+                                   return_exceptions=True)
+    for name, result in zip(("storage", "gemini"), results):
+        if isinstance(result, Exception):
+            print(f"Warmup of {name} failed: {result}")
+
+
+async def initialize_services():
+    started = time.perf_counter()
+    # Firestore waits for the Firebase app inside its own initialize()
+    await asyncio.gather(
+        firebase_service.ensure_initialized(),
+        storage.ensure_initialized(),
+        gemini_service.ensure_initialized(),
+        shared_state.ping(),
+        semantic_cache.ensure_initialized(),
+        scope_gate.ensure_initialized(),
+    )
+    # Catch the library index up in the background (a no-op when it is current)
+    semantic_cache.start_sync()
+    # Near-duplicate index from the stored signatures; saves are not checked until it is ready
+    library_dedup.start_index_build()
+    # Jobs a previous process left queued or running cannot resume: their queue was in its memory
+    await job_service.recover()
+    if settings.STARTUP_WARMUP:
+        await _warmup()
+    elapsed = time.perf_counter() - started
+    STARTUP_SECONDS.set(elapsed)
+    print(f"Services initialized in {elapsed * 1000:.0f} ms")
+
+
+def readiness() -> Dict[str, Dict[str, Any]]:
+    """Per-dependency state: starting, ready, unavailable, failed or degraded (shared state fell back to memory)"""
+    return {
+        "firebase": firebase_service.readiness(),
+        "storage": {"backend": storage.name, **storage.readiness()},
+        "gemini": gemini_service.readiness(),
+        "shared_state": shared_state.readiness(),
+        "semantic_cache": {"mode": semantic_cache.mode, **semantic_cache.readiness()},
+        "scope_gate": {"mode": scope_gate.mode, **scope_gate.readiness()},
+    }
+
+
+@asynccontextmanager
+async def lifespan(app):
+    task = asyncio.create_task(initialize_services())
+    if settings.STARTUP_BLOCKING:
+        await task
+    yield
+    if not task.done():
+        task.cancel()
+    # Summaries of the last turns are one LLM call away; let them land
+    await session_summary.drain()
+    await job_service.shutdown()
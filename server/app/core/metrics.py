@@ -0,0 +1,283 @@
+"""
+In-process metrics registry with Prometheus text exposition.
+
+Histograms keep cumulative buckets (for Prometheus) plus a bounded window of
+recent samples so p50/p95/p99 can be read straight from /metrics without a
+Prometheus server doing histogram_quantile().
+"""
+import bisect
+import functools
+import inspect
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Tuple, Iterable, Optional, List
+
+DEFAULT_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0
+)
+QUANTILES = (0.5, 0.95, 0.99)
+SAMPLE_WINDOW = 2048
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def _header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def items(self):
+        with self._lock:
+            return list(self._values.items())
+
+    def render(self) -> List[str]:
+        lines = self._header()
+        for key, value in self.items():
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    @contextmanager
+    def track_inprogress(self, **labels):
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+
+class _HistogramSeries:
+    __slots__ = ("counts", "total", "count", "samples")
+
+    def __init__(self, n_buckets: int):
+        self.counts = [0] * n_buckets
+        self.total = 0.0
+        self.count = 0
+        self.samples = deque(maxlen=SAMPLE_WINDOW)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._series: Dict[Tuple[str, ...], _HistogramSeries] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = _HistogramSeries(len(self.buckets))
+            series.counts[bisect.bisect_left(self.buckets, value)] += 1
+            series.total += value
+            series.count += 1
+            series.samples.append(value)
+
+    def quantiles(self, **labels) -> Dict[float, float]:
+        """Quantiles over the recent sample window for one label set"""
+        series = self._series.get(self._key(labels))
+        if series is None:
+            return {}
+        with self._lock:
+            samples = sorted(series.samples)
+        return {q: _quantile(samples, q) for q in QUANTILES}
+
+    def count(self, **labels) -> int:
+        series = self._series.get(self._key(labels))
+        return series.count if series else 0
+
+    def render(self) -> List[str]:
+        with self._lock:
+            snapshot = [
+                (key, list(s.counts), s.total, s.count, sorted(s.samples))
+                for key, s in self._series.items()
+            ]
+        lines = self._header()
+        quantile_lines = [
+            f"# HELP {self.name}_quantiles Recent-window quantiles of {self.name}",
+            f"# TYPE {self.name}_quantiles gauge",
+        ]
+        for key, counts, total, count, samples in snapshot:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = _format_labels(self.labelnames, key, f'le="{_format_value(bound)}"')
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            plain = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{plain} {_format_value(total)}")
+            lines.append(f"{self.name}_count{plain} {count}")
+            for q in QUANTILES:
+                ql = _format_labels(self.labelnames, key, f'quantile="{q}"')
+                quantile_lines.append(f"{self.name}_quantiles{ql} {_format_value(_quantile(samples, q))}")
+        return lines + quantile_lines
+
+
+def _quantile(samples: List[float], q: float) -> float:
+    if not samples:
+        return 0.0
+    index = min(len(samples) - 1, max(0, int(round(q * len(samples) + 0.5)) - 1))
+    return samples[index]
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Iterable[str] = (), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        _update_cache_ratios()
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+# Standard metrics
+HTTP_REQUESTS = metrics.counter(
+    "http_requests_total", "HTTP requests by route and status", ("method", "route", "status")
+)
+HTTP_LATENCY = metrics.histogram(
+    "http_request_duration_seconds", "HTTP request latency by route", ("method", "route")
+)
+STAGE_LATENCY = metrics.histogram(
+    "stage_duration_seconds", "Latency of individual request stages (auth, firestore, gemini, parse)", ("stage",)
+)
+STAGE_ERRORS = metrics.counter(
+    "stage_errors_total", "Exceptions raised inside an instrumented stage", ("stage",)
+)
+LLM_IN_FLIGHT = metrics.gauge(
+    "llm_calls_in_flight", "LLM calls currently waiting on the upstream model", ("model",)
+)
+CACHE_REQUESTS = metrics.counter(
+    "cache_requests_total", "Cache lookups by cache and result (hit/miss)", ("cache", "result")
+)
+CACHE_HIT_RATIO = metrics.gauge(
+    "cache_hit_ratio", "Lifetime hit ratio per cache", ("cache",)
+)
+
+
+@contextmanager
+def span(stage: str):
+    """Time a block of code as a named stage"""
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        STAGE_ERRORS.inc(stage=stage)
+        raise
+    finally:
+        STAGE_LATENCY.observe(time.perf_counter() - start, stage=stage)
+
+
+def timed(stage: str):
+    """Decorator form of span() for sync and async callables"""
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(stage):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def record_cache(cache: str, hit: bool):
+    """Count a cache lookup; hit ratios are derived at scrape time"""
+    CACHE_REQUESTS.inc(cache=cache, result="hit" if hit else "miss")
+
+
+def _update_cache_ratios():
+    totals: Dict[str, List[float]] = {}
+    for (cache, result), value in CACHE_REQUESTS.items():
+        hits_and_total = totals.setdefault(cache, [0, 0])
+        if result == "hit":
+            hits_and_total[0] += value
+        hits_and_total[1] += value
+    for cache, (hits, total) in totals.items():
+        CACHE_HIT_RATIO.set(hits / total if total else 0.0, cache=cache)
+
+
+def route_label(scope: dict) -> Optional[str]:
+    """Route template for a request scope (e.g. /api/v1/chat/sessions/{session_id})"""
+    route = scope.get("route")
+    return getattr(route, "path", None)
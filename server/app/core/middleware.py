@@ -0,0 +1,170 @@
+import gzip
+import time
+from typing import Optional
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+from app.core.metrics import HTTP_REQUESTS, HTTP_LATENCY, metrics, route_label
+from app.services.firestore_accounting import start_request_tally, finish_request_tally
+
+try:
+    import brotli
+except ImportError:  # optional; gzip only without it
+    brotli = None
+
+RESPONSE_BYTES = metrics.counter(
+    "http_response_bytes_total", "Compressible response bodies, before and after compression",
+    ("encoding", "stage")
+)
+
+COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", "application/javascript",
+                      "application/xml", "text/")
+# Larger bodies are compressed in a worker thread, off the event loop
+THREADPOOL_COMPRESS_BYTES = 256 * 1024
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware recording request count and latency per route template.
+    Unmatched paths are folded into one label to keep cardinality bounded.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = route_label(scope) or "unmatched"
+            method = scope.get("method", "")
+            HTTP_REQUESTS.inc(method=method, route=route, status=str(status_code))
+            HTTP_LATENCY.observe(time.perf_counter() - start, method=method, route=route)
+
+
+class FirestoreOpsMiddleware:
+    """
+    Opens a Firestore operation tally for each request, publishes it per route
+    and user when the request finishes and optionally reports it to the client
+    in an X-Firestore-Ops debug header.
+    """
+
+    def __init__(self, app, expose_header: bool = False):
+        self.app = app
+        self.expose_header = expose_header
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        tally = start_request_tally()
+
+        async def send_wrapper(message):
+            if self.expose_header and message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"x-firestore-ops", tally.as_header().encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            finish_request_tally(tally, scope.get("method", ""), route_label(scope) or "unmatched")
+
+
+def accepted_encoding(accept_encoding: str) -> Optional[str]:
+    """br or gzip, whichever the client accepts (br preferred), else None"""
+    accepted = {}
+    for item in accept_encoding.lower().split(","):
+        name, _, params = item.partition(";")
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[name.strip()] = q
+    for encoding in (("br", "gzip") if brotli is not None else ("gzip",)):
+        if accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+            return encoding
+    return None
+
+
+class CompressionMiddleware:
+    """
+    Pure ASGI middleware compressing complete JSON and text responses of at
+    least minimum_size bytes with the encoding the client accepts: br when the
+    brotli module is installed, else gzip. Streamed responses and responses
+    that already have a Content-Encoding pass through. A compressed
+    response's ETag gets a -br / -gzip suffix since its bytes differ from the
+    identity representation; etag_matches() strips it again.
+    """
+
+    def __init__(self, app, minimum_size: int = 1024, gzip_level: int = 6, brotli_quality: int = 4):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    def compress(self, body: bytes, encoding: str) -> bytes:
+        if encoding == "br":
+            return brotli.compress(body, quality=self.brotli_quality)
+        return gzip.compress(body, compresslevel=self.gzip_level, mtime=0)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = accepted_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        start = None
+
+        async def send_wrapper(message):
+            nonlocal start
+            if message["type"] == "http.response.start":
+                start = message  # held until the first body message shows whether the body is complete
+                return
+            if start is None or message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            headers = MutableHeaders(raw=list(start["headers"]))
+            body = message.get("body", b"")
+            if (not message.get("more_body", False)
+                    and start["status"] not in (204, 304)
+                    and "content-encoding" not in headers
+                    and headers.get("content-type", "").startswith(COMPRESSIBLE_TYPES)):
+                headers.add_vary_header("Accept-Encoding")
+                if encoding is not None and len(body) >= self.minimum_size:
+                    if len(body) >= THREADPOOL_COMPRESS_BYTES:
+                        compressed = await run_in_threadpool(self.compress, body, encoding)
+                    else:
+                        compressed = self.compress(body, encoding)
+                    RESPONSE_BYTES.inc(len(body), encoding=encoding, stage="uncompressed")
+                    RESPONSE_BYTES.inc(len(compressed), encoding=encoding, stage="sent")
+                    headers["Content-Encoding"] = encoding
+                    headers["Content-Length"] = str(len(compressed))
+                    etag = headers.get("etag")
+                    if etag and etag.endswith('"'):
+                        headers["ETag"] = f'{etag[:-1]}-{encoding}"'
+                    message = {**message, "body": compressed}
+            await send({**start, "headers": headers.raw})
+            start = None
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
@@ -0,0 +1,110 @@
+"""
+JSON responses.
+
+FastJSONResponse is the app's default response class: orjson when it is
+installed, the standard library otherwise. Routes that return large lists
+read from storage (sessions, messages, library, symbols) also skip FastAPI's
+response_model pass, which validates every item again and walks it through
+jsonable_encoder before dumping: they return trusted_response() with the
+storage models as they are, or with plain dicts in the schema's shape (the
+data was validated when it was written; with pydantic 2, model_construct()
+costs as much as validating). The route's response_model still documents
+the schema.
+
+Conditional GET: those routes also send a strong ETag built by make_etag()
+from a version the storage backend reads in one document (the session's
+updated_at and message_count, the library's version token) and the route's
+parameters. When If-None-Match carries it, the route answers
+304 Not Modified without reading the documents.
+"""
+import hashlib
+import json
+from datetime import datetime
+from typing import Any, Optional
+from pydantic import BaseModel
+from starlette.responses import JSONResponse, Response
+
+try:
+    import orjson
+except ImportError:  # optional; the standard library encoder is used instead
+    orjson = None
+
+ORJSON_OPTIONS = orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS if orjson else 0
+
+
+def _default(obj: Any) -> Any:
+    if isinstance(obj, BaseModel):
+        return obj.__dict__
+    if isinstance(obj, datetime):
+        # Subclasses (Firestore's DatetimeWithNanoseconds) as a plain datetime
+        return datetime.combine(obj.date(), obj.timetz())
+    if isinstance(obj, (set, frozenset, tuple)):
+        return list(obj)
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+def _default_std(obj: Any) -> Any:
+    if isinstance(obj, datetime):
+        text = obj.isoformat()
+        return text[:-6] + "Z" if text.endswith("+00:00") else text
+    return _default(obj)
+
+
+def dumps(content: Any) -> bytes:
+    """Encode JSON content, including pydantic models and datetimes, to bytes"""
+    if orjson is not None:
+        return orjson.dumps(content, default=_default, option=ORJSON_OPTIONS)
+    return json.dumps(content, default=_default_std, ensure_ascii=False, allow_nan=False,
+                      separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse encoded with orjson when available"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def trusted_response(content: Any, status_code: int = 200, etag: Optional[str] = None) -> Response:
+    """Serialize trusted content as is, bypassing response_model validation"""
+    return FastJSONResponse(content, status_code=status_code, headers=_cache_headers(etag) if etag else None)
+
+
+# -- conditional GET -------------------------------------------------------
+
+# Cached copies are the user's own and must be revalidated on every use
+CACHE_CONTROL = "private, no-cache"
+# CompressionMiddleware tags compressed representations "<etag>-<encoding>"
+ENCODING_SUFFIXES = ("-br", "-gzip")
+
+
+def _cache_headers(etag: str) -> dict:
+    return {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+
+
+def make_etag(*parts: Any) -> str:
+    """Strong ETag for the representation identified by parts (versions, route parameters)"""
+    return '"%s"' % hashlib.blake2b(repr(parts).encode(), digest_size=12).hexdigest()
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match check (weak comparison, as RFC 9110 specifies for it)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        for suffix in ENCODING_SUFFIXES:
+            if tag.endswith(suffix + '"'):
+                tag = tag[:-len(suffix) - 1] + '"'
+                break
+        if tag == etag:
+            return True
+    return False
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers=_cache_headers(etag))
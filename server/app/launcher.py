@@ -0,0 +1,77 @@
+"""
+Multi-worker launcher.
+
+    cd server
+    WORKERS=4 SHARED_STATE=local python -m app.launcher
+    python -m app.launcher --workers 4 --shared-state redis://localhost:6379/0
+
+Runs `app.main:app` in a pool of uvicorn worker processes. With
+SHARED_STATE=local it first starts the stand-in state server
+(app/services/state_server.py) on SHARED_STATE_SOCKET and points the workers
+at it, so cached token verifications and per-user rate limits are shared
+instead of multiplied by the worker count. With more than one worker and
+SHARED_STATE=memory each worker keeps its own.
+
+Still per worker: LLM_MAX_CONCURRENCY (the total cap is workers x the
+setting), request coalescing, the WebSocket session hub and queued jobs.
+Session events are pushed only to the sockets of the worker that handled the
+change, so another tab of the same user on a different worker does not see
+them live.
+"""
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import time
+from app.core.config import settings
+
+
+def start_state_server(socket_path: str, timeout: float = 10.0) -> subprocess.Popen:
+    """Start the stand-in on a Unix socket and wait until it accepts connections"""
+    proc = subprocess.Popen([sys.executable, "-m", "app.services.state_server", "--socket", socket_path])
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"shared state server exited with code {proc.returncode}")
+        try:
+            with socket.socket(socket.AF_UNIX) as s:
+                s.connect(socket_path)
+            return proc
+        except OSError:
+            time.sleep(0.05)
+    proc.terminate()
+    raise RuntimeError(f"shared state server did not start on {socket_path}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the API in several worker processes")
+    parser.add_argument("--workers", type=int, default=settings.WORKERS)
+    parser.add_argument("--host", default=settings.HOST)
+    parser.add_argument("--port", type=int, default=settings.PORT)
+    parser.add_argument("--shared-state", default=settings.SHARED_STATE,
+                        help="memory, local, unix:///path or redis://host:port/db")
+    args = parser.parse_args(argv)
+
+    import uvicorn
+
+    state_server = None
+    shared = args.shared_state
+    if shared == "local":
+        state_server = start_state_server(settings.SHARED_STATE_SOCKET)
+        shared = f"unix://{settings.SHARED_STATE_SOCKET}"
+    elif shared == "memory" and args.workers > 1:
+        print("Warning: SHARED_STATE=memory with several workers; caches and rate limits are per worker")
+    # Workers are new processes and read their settings from the environment
+    os.environ["SHARED_STATE"] = shared
+    print(f"Starting {args.workers} worker(s) on {args.host}:{args.port}, shared state: {shared}")
+    try:
+        uvicorn.run("app.main:app", host=args.host, port=args.port, workers=args.workers)
+    finally:
+        if state_server is not None:
+            state_server.terminate()
+            state_server.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,24 @@
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.exceptions import RequestValidationError
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 from app.core.config import settings
+from app.core.lifespan import lifespan, readiness
+from app.core.metrics import metrics
+from app.core.middleware import MetricsMiddleware, FirestoreOpsMiddleware, CompressionMiddleware
+from app.core.responses import FastJSONResponse
 from app.api.main import api_router
 from app.services.firebase_service import firebase_service
 from app.services.gemini_service import gemini_service
+from app.services.storage import storage
 
 # Create FastAPI app
 app = FastAPI(
     title="Firebase Auth API", 
     version="1.0.0",
-    description="A modular FastAPI application with Firebase authentication and Gemini AI integration"
+    description="A modular FastAPI application with Firebase authentication and Gemini AI integration",
+    lifespan=lifespan,  # initializes Firebase, storage and Gemini
+    default_response_class=FastJSONResponse  # orjson when installed
 )
 
 # Configure CORS
@@ -21,15 +28,23 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Firestore-Ops", "ETag"],
 )
 
-# Initialize services (this will trigger the singleton initialization)
-firebase_service  # Initialize Firebase
-gemini_service    # Initialize Gemini
+# gzip / br for large JSON bodies (inside the metrics middleware, so latency includes it)
+if settings.COMPRESSION_ENABLED:
+    app.add_middleware(
+        CompressionMiddleware,
+        minimum_size=settings.COMPRESSION_MIN_BYTES,
+        gzip_level=settings.COMPRESSION_GZIP_LEVEL,
+        brotli_quality=settings.COMPRESSION_BROTLI_QUALITY,
+    )
+
+# Firestore reads/writes per request, attributed to route (the user shows in the debug header only)
+app.add_middleware(FirestoreOpsMiddleware, expose_header=settings.FIRESTORE_OPS_HEADER)
 
-# Import firestore service to initialize it
-from app.services.firestore_service import firestore_service
-firestore_service  # Initialize Firestore
+# Request count and latency per route (exported at /metrics)
+app.add_middleware(MetricsMiddleware)
 
 # Add exception handler for validation errors
 @app.exception_handler(RequestValidationError)
@@ -59,18 +74,43 @@ async def root():
     return {
         "message": "Firebase Auth API is running!",
         "version": "1.0.0",
-        "firebase_initialized": True,
+        "firebase_initialized": firebase_service.is_available(),
         "gemini_available": gemini_service.is_available()
     }
 
 @app.get("/health")
 async def health_check():
     """
-    Health check endpoint
+    Health check endpoint. Reports "starting" until every service has been
+    initialized, and "degraded" when one failed to initialize or while the
+    Gemini circuit breaker is open, so the service stays up but AI calls fail
+    fast with 503. `dependencies` has the state of each one.
     """
+    gemini_health = gemini_service.health()
+    dependencies = readiness()
+    states = {d["status"] for d in dependencies.values()}
+    if "starting" in states:
+        overall = "starting"
+    elif states & {"failed", "degraded"} or gemini_health == "degraded":
+        overall = "degraded"
+    else:
+        overall = "healthy"
     return {
-        "status": "healthy", 
+        "status": overall, 
         "service": "Firebase Auth API",
-        "firebase_ready": True,
-        "gemini_ready": gemini_service.is_available()
+        "dependencies": dependencies,
+        "firebase_ready": firebase_service.is_available(),
+        "storage": storage.name,
+        "storage_ready": storage.is_available(),
+        "gemini_ready": gemini_service.is_available(),
+        "gemini": gemini_health,
+        "gemini_circuit": gemini_service.resilience.breaker.stats()
     }
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """
+    Prometheus text-format metrics: request counts, per-route and per-stage
+    latency histograms with p50/p95/p99, in-flight LLM calls and cache hit rates
+    """
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
@@ -8,6 +8,7 @@ class ChatMessage(BaseModel):
 class ChatRequest(BaseModel):
     message: str
     conversation_history: Optional[List[ChatMessage]] = []
+    use_cache: bool = True  # False always asks the model (e.g. "regenerate")
 
 class ValidationInfo(BaseModel):
     status: Literal["valid", "invalid", "unknown"]
@@ -19,11 +20,21 @@ class StructuredResponse(BaseModel):
     type: Literal["text", "ladder", "plc-code"]
     content: str
     validation: Optional[ValidationInfo] = None
+    code_hash: Optional[str] = None  # plc-code only: same for cosmetically different programs
 
 class MultipleStructuredResponse(BaseModel):
     responses: List[StructuredResponse]
 
+class CachedAnswer(BaseModel):
+    """A previously answered question similar to the one asked"""
+    source: Literal["library", "history"]
+    question: str
+    similarity: float
+    entry_id: Optional[str] = None  # library entries only
+
 class ChatResponse(BaseModel):
     response: str
     structured_response: Optional[Union[StructuredResponse, MultipleStructuredResponse]] = None
     success: bool = True
+    cached: Optional[CachedAnswer] = None  # set when the response was served from the semantic cache
+    suggestion: Optional[CachedAnswer] = None  # offer mode: a close match, returned next to the model's answer
@@ -0,0 +1,34 @@
+from pydantic import BaseModel, Field
+from typing import Optional, List, Literal
+from datetime import datetime
+
+JobStatus = Literal["queued", "running", "completed", "failed", "cancelled"]
+
+class CreateJobRequest(BaseModel):
+    prompts: List[str] = Field(..., min_length=1)
+    context: Optional[str] = None  # Shared context sent with every prompt (e.g. the spec excerpt)
+    title: Optional[str] = None
+
+class JobItem(BaseModel):
+    index: int
+    prompt: str
+    status: JobStatus = "queued"
+    response: Optional[str] = None
+    error: Optional[str] = None
+    attempts: int = 0
+    completed_at: Optional[datetime] = None
+
+class JobResponse(BaseModel):
+    job_id: str
+    title: Optional[str] = None
+    status: JobStatus
+    total: int
+    completed: int = 0
+    failed: int = 0
+    created_at: datetime
+    updated_at: datetime
+    items: Optional[List[JobItem]] = None
+
+class JobListResponse(BaseModel):
+    jobs: List[JobResponse]
+    total: int
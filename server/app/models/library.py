@@ -13,6 +13,9 @@ class LibraryEntry(BaseModel):
     created_at: Optional[datetime] = None
     tags: Optional[List[str]] = []
     category: Optional[str] = None
+    response_preview: Optional[str] = None  # Short plain-text excerpt for list views
+    minhash: Optional[str] = None  # Near-duplicate signature (base64)
+    duplicate_of: Optional[str] = None  # Canonical entry this one nearly duplicates
 
 class CreateLibraryEntryRequest(BaseModel):
     user_question: str
@@ -37,6 +40,19 @@ class LibraryEntryResponse(BaseModel):
     created_at: datetime
     tags: List[str]
     category: Optional[str] = None
+    duplicate_of: Optional[str] = None
+
+class LibraryEntrySummary(BaseModel):
+    """List view of an entry; the full response is fetched by entry_id"""
+    entry_id: str
+    user_name: Optional[str] = None
+    user_question: str
+    response_preview: str = ""
+    session_id: str
+    created_at: datetime
+    tags: List[str]
+    category: Optional[str] = None
+    duplicate_of: Optional[str] = None
 
 class LibrarySearchResponse(BaseModel):
     entries: List[LibraryEntryResponse]
@@ -47,3 +63,8 @@ class LibraryStatsResponse(BaseModel):
     total_entries: int
     categories: List[dict]  # [{"name": "category", "count": 5}]
     recent_entries_count: int  # last 7 days
+
+class LibraryImportResponse(BaseModel):
+    imported: int
+    skipped: int
+    errors: List[str]  # first few rejected lines, "line N: reason"
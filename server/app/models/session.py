@@ -24,8 +24,9 @@ class UpdateSessionRequest(BaseModel):
     title: Optional[str] = None
 
 class AddMessageRequest(BaseModel):
+    # The history comes from storage; a conversation_history field sent by
+    # older clients is ignored without being parsed
     message: str
-    conversation_history: Optional[List[ChatMessage]] = []
 
 class SessionResponse(BaseModel):
     session_id: str
@@ -43,3 +44,19 @@ class SessionMessagesResponse(BaseModel):
     session_id: str
     messages: List[ChatMessage]
     total: int
+
+class SymbolRef(BaseModel):
+    symbol: str
+    kind: str  # program, function_block, function, input, output, in_out, local, global, ...
+    data_type: Optional[str] = None
+    address: Optional[str] = None  # AT address, e.g. %IX0.0
+    fb_instance: bool = False
+    pou: Optional[str] = None  # declaring program / function block
+    session_id: str
+    message_id: str
+    timestamp: Optional[datetime] = None
+
+class SymbolLookupResponse(BaseModel):
+    name: str
+    refs: List[SymbolRef]
+    total: int
@@ -0,0 +1,185 @@
+"""
+Admission control for LLM calls.
+
+- Per-user token buckets (keyed by Firebase uid) limit how fast one user can
+  call the model; an empty bucket is rejected with 429 and a Retry-After. The
+  buckets live in shared_state, so with SHARED_STATE set the limit holds
+  across every worker process.
+- A concurrency cap (per worker process) bounds upstream calls in flight. Callers beyond the
+  cap wait in per-user queues that are served weighted round-robin, so a user
+  with many queued requests cannot starve the others.
+- Waiting is bounded: after the queue timeout (or when the queue is full) the
+  call is shed with 503 and a Retry-After estimated from recent service times.
+"""
+import asyncio
+import math
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict, Optional
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.services.shared_state import shared_state
+
+ADMISSION_REJECTED = metrics.counter(
+    "llm_admission_rejected_total", "LLM calls rejected by admission control", ("reason",)
+)
+ADMISSION_QUEUE_WAIT = metrics.histogram(
+    "llm_admission_queue_wait_seconds", "Time spent waiting for an LLM concurrency slot"
+)
+ADMISSION_QUEUED = metrics.gauge(
+    "llm_admission_queued", "LLM calls waiting for a concurrency slot"
+)
+
+
+class AdmissionRejected(Exception):
+    """Carries the HTTP status and Retry-After seconds for the rejected call"""
+
+    def __init__(self, status_code: int, detail: str, retry_after: int):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+def parse_weights(spec: str) -> Dict[str, int]:
+    """'uid1:3,uid2:2' -> {'uid1': 3, 'uid2': 2}"""
+    weights = {}
+    for item in filter(None, (p.strip() for p in spec.split(","))):
+        uid, _, weight = item.partition(":")
+        weights[uid] = max(1, int(weight or 1))
+    return weights
+
+
+class LLMAdmission:
+    def __init__(
+        self,
+        max_concurrency: int,
+        queue_timeout: float,
+        max_queue: int,
+        user_rate_per_minute: float,
+        user_burst: int,
+        weights: Optional[Dict[str, int]] = None,
+    ):
+        self.max_concurrency = max_concurrency
+        self.queue_timeout = queue_timeout
+        self.max_queue = max_queue
+        self.user_rate = user_rate_per_minute / 60.0
+        self.user_burst = user_burst
+        self.weights = weights or {}
+        self._active = 0
+        self._queues: "OrderedDict[str, Deque[asyncio.Future]]" = OrderedDict()
+        self._queued = 0
+        self._credits: Dict[str, int] = {}
+        self._service_time = 1.0  # EWMA of slot hold time, seconds
+
+    # -- rate limiting -----------------------------------------------------
+
+    async def take_rate(self, user_id: str) -> float:
+        """Charge one call to the user's bucket; 0 when allowed, else the seconds until a token is free"""
+        if self.user_rate <= 0:
+            return 0.0
+        allowed, wait = await shared_state.take_token(f"rate:{user_id}", self.user_rate, self.user_burst)
+        return 0.0 if allowed else max(wait, 0.001)
+
+    async def check_rate(self, user_id: str):
+        """Charge one request to the user's bucket or raise a 429 rejection"""
+        wait = await self.take_rate(user_id)
+        if wait:
+            ADMISSION_REJECTED.inc(reason="rate_limited")
+            raise AdmissionRejected(429, "Too many AI requests, please slow down", max(1, math.ceil(wait)))
+
+    # -- fair concurrency --------------------------------------------------
+
+    def _retry_after(self) -> int:
+        backlog = (self._queued + 1) / max(1, self.max_concurrency)
+        return max(1, math.ceil(self._service_time * backlog))
+
+    def _dispatch(self):
+        """Hand free slots to queued callers, weighted round-robin across users"""
+        while self._active < self.max_concurrency and self._queues:
+            user_id, queue = next(iter(self._queues.items()))
+            waiter = queue.popleft()
+            self._queued -= 1
+            credits = self._credits.get(user_id, self.weights.get(user_id, 1)) - 1
+            if not queue:
+                del self._queues[user_id]
+                self._credits.pop(user_id, None)
+            elif credits <= 0:
+                # Used up this round's share: move to the back of the rotation
+                self._queues.move_to_end(user_id)
+                self._credits[user_id] = self.weights.get(user_id, 1)
+            else:
+                self._credits[user_id] = credits
+            if waiter.done():
+                continue  # timed out or cancelled while queued
+            self._active += 1
+            waiter.set_result(None)
+        ADMISSION_QUEUED.set(self._queued)
+
+    @asynccontextmanager
+    async def slot(self, user_id: str):
+        """Hold one of the global concurrency slots for the duration of an upstream call"""
+        if self._active < self.max_concurrency and not self._queues:
+            self._active += 1
+        else:
+            if self._queued >= self.max_queue:
+                ADMISSION_REJECTED.inc(reason="queue_full")
+                raise AdmissionRejected(503, "AI service is busy, please retry", self._retry_after())
+            waiter = asyncio.get_running_loop().create_future()
+            self._queues.setdefault(user_id, deque()).append(waiter)
+            self._queued += 1
+            ADMISSION_QUEUED.set(self._queued)
+            queued_at = time.perf_counter()
+            try:
+                await asyncio.wait_for(asyncio.shield(waiter), self.queue_timeout)
+            except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+                if waiter.done() and not waiter.cancelled():
+                    # Granted just as we gave up: pass the slot on
+                    self._active -= 1
+                    self._dispatch()
+                else:
+                    waiter.cancel()
+                    self._remove(user_id, waiter)
+                if isinstance(e, asyncio.TimeoutError):
+                    ADMISSION_REJECTED.inc(reason="queue_timeout")
+                    raise AdmissionRejected(503, "AI service is busy, please retry", self._retry_after())
+                raise
+            finally:
+                ADMISSION_QUEUE_WAIT.observe(time.perf_counter() - queued_at)
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._service_time = 0.8 * self._service_time + 0.2 * (time.perf_counter() - start)
+            self._active -= 1
+            self._dispatch()
+
+    def _remove(self, user_id: str, waiter: asyncio.Future):
+        queue = self._queues.get(user_id)
+        if queue is not None and waiter in queue:
+            queue.remove(waiter)
+            self._queued -= 1
+            if not queue:
+                del self._queues[user_id]
+                self._credits.pop(user_id, None)
+            ADMISSION_QUEUED.set(self._queued)
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "active": self._active,
+            "queued": self._queued,
+            "max_concurrency": self.max_concurrency,
+            "queued_users": len(self._queues),
+        }
+
+
+llm_admission = LLMAdmission(
+    max_concurrency=settings.LLM_MAX_CONCURRENCY,
+    queue_timeout=settings.LLM_QUEUE_TIMEOUT,
+    max_queue=settings.LLM_MAX_QUEUE,
+    user_rate_per_minute=settings.LLM_USER_RATE_PER_MINUTE,
+    user_burst=settings.LLM_USER_BURST,
+    weights=parse_weights(settings.LLM_USER_WEIGHTS),
+)
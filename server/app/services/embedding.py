@@ -0,0 +1,74 @@
+"""
+Question embeddings for the semantic answer cache, computed locally on the
+CPU without a model download.
+
+HashingEmbedder turns a question into a unit vector by feature hashing:
+- words, case-folded, without filler words ("show me an example of ...")
+- IEC 61131-3 vocabulary folded onto shared concepts, so "TON",
+  "on-delay timer" and "delay on" produce the same features
+- the concepts that tell blocks of a family apart (on- vs off-delay, up vs
+  down, rising vs falling) weighted double
+- numbers split from their units, units folded ("5s", "5 sec", "5 seconds")
+  (the tokenization and folding are app/services/iec_vocabulary.py)
+- word bigrams, for word order
+- character 4-grams of other long words, for inflections and typos
+Each feature is hashed to a dimension and a sign; the dot product of two
+embeddings is their cosine similarity. EMBEDDING_VERSION is stored with a
+persisted index; bump it whenever the features change.
+"""
+import hashlib
+from functools import lru_cache
+from typing import Iterable, List, Tuple
+
+import numpy as np
+
+from app.services.iec_vocabulary import VARIANTS, terms
+
+EMBEDDING_VERSION = "hash-1"
+DIM = 256
+
+WORD_WEIGHT = 1.0
+VARIANT_WEIGHT = 2.0            # on- vs off-delay, up vs down, rising vs falling: different code
+BIGRAM_WEIGHT = 0.5
+CHARGRAM_WEIGHT = 0.3
+CHARGRAM_SIZE = 4
+
+
+def features(text: str) -> List[Tuple[str, float]]:
+    """Weighted features of a question (before hashing)"""
+    folded, rest = terms(text)
+    result = [(f"w:{t}", VARIANT_WEIGHT if t in VARIANTS else WORD_WEIGHT) for t in dict.fromkeys(folded)]
+    result.extend((f"b:{a} {b}", BIGRAM_WEIGHT) for a, b in dict.fromkeys(zip(folded, folded[1:])))
+    for word in dict.fromkeys(rest):
+        if len(word) > CHARGRAM_SIZE:
+            padded = f"<{word}>"
+            result.extend((f"c:{padded[j:j + CHARGRAM_SIZE]}", CHARGRAM_WEIGHT)
+                          for j in range(len(padded) - CHARGRAM_SIZE + 1))
+    return result
+
+
+@lru_cache(maxsize=1 << 16)
+def _slot(feature: str) -> Tuple[int, float]:
+    digest = int.from_bytes(hashlib.blake2b(feature.encode(), digest_size=8).digest(), "little")
+    return digest % DIM, 1.0 if digest >> 63 else -1.0
+
+
+class HashingEmbedder:
+    version = EMBEDDING_VERSION
+    dim = DIM
+
+    def embed(self, text: str) -> np.ndarray:
+        """Unit vector (float32); all zeros when nothing is left after filtering"""
+        vector = np.zeros(DIM, dtype=np.float32)
+        for feature, weight in features(text):
+            index, sign = _slot(feature)
+            vector[index] += sign * weight
+        norm = float(np.linalg.norm(vector))
+        return vector / norm if norm > 0 else vector
+
+    def embed_many(self, texts: Iterable[str]) -> np.ndarray:
+        texts = list(texts)
+        matrix = np.zeros((len(texts), DIM), dtype=np.float32)
+        for row, text in enumerate(texts):
+            matrix[row] = self.embed(text)
+        return matrix
@@ -1,9 +1,13 @@
+import hashlib
+import json
 import os
-import firebase_admin
-from firebase_admin import credentials, auth
+import time
 from app.core.config import settings
+from app.core.metrics import record_cache
+from app.services.lazy_init import LazyInit
+from app.services.shared_state import shared_state
 
-class FirebaseService:
+class FirebaseService(LazyInit):
     _instance = None
     _initialized = False
     
@@ -14,14 +18,21 @@ class FirebaseService:
     
     def __init__(self):
         if not self._initialized:
-            self._initialize_firebase()
+            # firebase_admin is imported by initialize(), run from the app lifespan
+            self._setup_lazy_init()
+            self.app = None
             self._initialized = True
     
-    def _initialize_firebase(self):
+    def is_available(self) -> bool:
+        return self.app is not None
+    
+    def _initialize(self):
         """Initialize Firebase Admin SDK"""
+        import firebase_admin
+        from firebase_admin import credentials
         try:
             # Check if Firebase app is already initialized
-            firebase_admin.get_app()
+            self.app = firebase_admin.get_app()
             print("Firebase Admin SDK already initialized.")
         except ValueError:
             # App doesn't exist, so initialize it
@@ -29,26 +40,55 @@ class FirebaseService:
                 # Use service account key file
                 if os.path.exists(settings.FIREBASE_SERVICE_ACCOUNT_PATH):
                     cred = credentials.Certificate(settings.FIREBASE_SERVICE_ACCOUNT_PATH)
-                    firebase_admin.initialize_app(cred)
+                    self.app = firebase_admin.initialize_app(cred)
                     print("Firebase Admin SDK initialized with service account file.")
                 else:
                     # Initialize with default application credentials (for production)
                     cred = credentials.ApplicationDefault()
-                    firebase_admin.initialize_app(cred)
+                    self.app = firebase_admin.initialize_app(cred)
                     print("Firebase Admin SDK initialized with default credentials.")
             except Exception as e:
                 print(f"Firebase initialization error: {e}")
                 print("Warning: Firebase Admin SDK not initialized. Authentication will not work.")
+                raise
         except Exception as e:
             print(f"Error checking Firebase app status: {e}")
+            raise
     
     def verify_id_token(self, id_token: str) -> dict:
         """Verify Firebase ID token and return user information"""
+        self.initialize()
         try:
+            from firebase_admin import auth
             decoded_token = auth.verify_id_token(id_token)
             return decoded_token
         except Exception as e:
             raise ValueError(f"Invalid authentication credentials: {str(e)}")
+    
+    async def verify_id_token_cached(self, id_token: str) -> dict:
+        """
+        verify_id_token() through shared_state: a token verified by any worker
+        is accepted from the cache until it expires, for at most
+        ID_TOKEN_CACHE_TTL seconds. Keyed by the token's hash.
+        """
+        ttl = settings.ID_TOKEN_CACHE_TTL
+        if ttl <= 0:
+            return self.verify_id_token(id_token)
+        key = "idtoken:" + hashlib.sha256(id_token.encode()).hexdigest()
+        cached = await shared_state.get(key)
+        if cached is not None:
+            decoded = json.loads(cached)
+            exp = decoded.get("exp")
+            if not isinstance(exp, (int, float)) or exp > time.time():
+                record_cache("id_token", True)
+                return decoded
+        record_cache("id_token", False)
+        decoded = self.verify_id_token(id_token)
+        exp = decoded.get("exp")
+        lifetime = min(ttl, exp - time.time()) if isinstance(exp, (int, float)) else ttl
+        if lifetime > 0:
+            await shared_state.set(key, json.dumps(decoded, default=str).encode(), lifetime)
+        return decoded
 
 # Create singleton instance
 firebase_service = FirebaseService()
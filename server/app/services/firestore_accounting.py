@@ -0,0 +1,399 @@
+"""
+Firestore operation accounting.
+
+Thin proxies around the Firestore client, references and queries that count
+document reads, writes and deletes plus an estimate of the bytes moved. Counts
+go to the tally of the current request (set up by FirestoreOpsMiddleware) and
+to process-wide metrics labelled by route. The requesting user is kept on the
+tally only: it shows in the debug header and the over-budget log line, never
+as a metrics label.
+
+AccountedClient wraps the synchronous client, AsyncAccountedClient the
+AsyncClient (awaitable reads/writes, async iteration over query streams).
+"""
+import datetime
+from contextvars import ContextVar
+from typing import Optional, Dict, Any, Iterator, AsyncIterator
+from app.core.metrics import metrics
+
+FIRESTORE_OPS = metrics.counter(
+    "firestore_ops_total", "Firestore document operations by route", ("route", "op")
+)
+FIRESTORE_BYTES = metrics.counter(
+    "firestore_bytes_total", "Estimated Firestore bytes transferred by route", ("route", "direction")
+)
+FIRESTORE_BUDGET_EXCEEDED = metrics.counter(
+    "firestore_read_budget_exceeded_total", "Requests whose document reads exceeded the route budget", ("route",)
+)
+
+# Maximum document reads per request, keyed by "METHOD route-template".
+# Whole-collection scans show up here first when the library grows.
+READ_BUDGETS: Dict[str, int] = {
+    "GET /api/v1/chat/sessions": 51,
+    "GET /api/v1/chat/sessions/{session_id}/messages": 102,  # 1 with a matching If-None-Match
+    "POST /api/v1/chat/sessions/{session_id}/messages": 11,  # 3 session reads + SESSION_CONTEXT_MESSAGES
+    "PUT /api/v1/chat/sessions/{session_id}": 1,
+    "WS /api/v1/chat/sessions/{session_id}/ws": 11,  # per turn; the connect check reads 2
+    "GET /api/v1/chat/symbols": 100,
+    "POST /api/v1/chat/sessions": 0,
+    "GET /api/v1/library/entries": 51,  # 1 with a matching If-None-Match
+    "GET /api/v1/library/entries/{entry_id}": 1,
+    "POST /api/v1/library/entries": 1,  # merge mode reads the existing entry's tags
+    "POST /api/v1/library/search": 501,
+    "GET /api/v1/library/stats": 500,
+    "POST /api/v1/ai/chat": 2,  # semantic cache: the matched library entries
+    "POST /api/v1/ai/jobs": 0,
+    "GET /api/v1/ai/jobs": 20,
+    "GET /api/v1/ai/jobs/{job_id}": 101,
+}
+
+
+class OpTally:
+    """Per-request operation counts"""
+    __slots__ = ("reads", "writes", "deletes", "bytes_read", "bytes_written", "user")
+
+    def __init__(self):
+        self.reads = 0
+        self.writes = 0
+        self.deletes = 0
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.user: Optional[str] = None
+
+    def as_header(self) -> str:
+        header = (
+            f"reads={self.reads}; writes={self.writes}; deletes={self.deletes}; "
+            f"bytes_read={self.bytes_read}; bytes_written={self.bytes_written}"
+        )
+        return f"{header}; user={self.user}" if self.user else header
+
+    def as_dict(self) -> Dict[str, int]:
+        return {
+            "reads": self.reads,
+            "writes": self.writes,
+            "deletes": self.deletes,
+            "bytes_read": self.bytes_read,
+            "bytes_written": self.bytes_written,
+        }
+
+
+_current_tally: ContextVar[Optional[OpTally]] = ContextVar("firestore_op_tally", default=None)
+
+
+def start_request_tally() -> OpTally:
+    tally = OpTally()
+    _current_tally.set(tally)
+    return tally
+
+
+def current_tally() -> Optional[OpTally]:
+    return _current_tally.get()
+
+
+def set_request_user(user_id: Optional[str]):
+    """Attribute the operations of the current request to a user"""
+    tally = _current_tally.get()
+    if tally is not None:
+        tally.user = user_id
+
+
+def finish_request_tally(tally: OpTally, method: str, route: str) -> bool:
+    """Publish a request's counts to metrics; returns False when the read budget was exceeded"""
+    for op in ("reads", "writes", "deletes"):
+        count = getattr(tally, op)
+        if count:
+            FIRESTORE_OPS.inc(count, route=route, op=op)
+    if tally.bytes_read:
+        FIRESTORE_BYTES.inc(tally.bytes_read, route=route, direction="read")
+    if tally.bytes_written:
+        FIRESTORE_BYTES.inc(tally.bytes_written, route=route, direction="write")
+
+    budget = READ_BUDGETS.get(f"{method} {route}")
+    if budget is not None and tally.reads > budget:
+        FIRESTORE_BUDGET_EXCEEDED.inc(route=route)
+        print(f"Firestore read budget exceeded on {method} {route}: {tally.reads} > {budget} (user {tally.user or 'unknown'})")
+        return False
+    return True
+
+
+def estimate_size(value: Any) -> int:
+    """Approximate Firestore storage size of a value (see Firestore storage size rules)"""
+    if value is None or isinstance(value, bool):
+        return 1
+    if isinstance(value, (int, float, datetime.datetime)):
+        return 8
+    if isinstance(value, str):
+        return len(value.encode("utf-8")) + 1
+    if isinstance(value, bytes):
+        return len(value)
+    if isinstance(value, dict):
+        return sum(len(k.encode("utf-8")) + 1 + estimate_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return sum(estimate_size(v) for v in value)
+    return 16
+
+
+_DOCUMENT_OVERHEAD = 32
+
+
+def _record(op: str, count: int = 1, size: int = 0):
+    tally = _current_tally.get()
+    if tally is None:
+        return
+    if op == "read":
+        tally.reads += count
+        tally.bytes_read += size
+    elif op == "write":
+        tally.writes += count
+        tally.bytes_written += size
+    elif op == "delete":
+        tally.deletes += count
+
+
+class _Proxy:
+    __slots__ = ("_wrapped",)
+
+    def __init__(self, wrapped):
+        self._wrapped = wrapped
+
+    def __getattr__(self, name):
+        return getattr(self._wrapped, name)
+
+
+class AccountedSnapshot(_Proxy):
+    __slots__ = ()
+
+    @property
+    def reference(self):
+        return AccountedDocument(self._wrapped.reference)
+
+
+def _snapshot_size(snapshot) -> int:
+    data = snapshot.to_dict() if snapshot.exists else None
+    return _DOCUMENT_OVERHEAD + estimate_size(data) if data else 0
+
+
+class AccountedQuery(_Proxy):
+    """Wraps Query and CollectionReference; chained query builders stay wrapped"""
+    __slots__ = ()
+
+    def _chain(name):
+        def method(self, *args, **kwargs):
+            return AccountedQuery(getattr(self._wrapped, name)(*args, **kwargs))
+        method.__name__ = name
+        return method
+
+    where = _chain("where")
+    order_by = _chain("order_by")
+    limit = _chain("limit")
+    limit_to_last = _chain("limit_to_last")
+    offset = _chain("offset")
+    select = _chain("select")
+    start_at = _chain("start_at")
+    start_after = _chain("start_after")
+    end_at = _chain("end_at")
+    end_before = _chain("end_before")
+    del _chain
+
+    def stream(self, *args, **kwargs) -> Iterator[AccountedSnapshot]:
+        count = 0
+        for snapshot in self._wrapped.stream(*args, **kwargs):
+            count += 1
+            _record("read", 1, _snapshot_size(snapshot))
+            yield AccountedSnapshot(snapshot)
+        if count == 0:
+            # Firestore bills one read for a query with no results
+            _record("read", 1)
+
+    def get(self, *args, **kwargs):
+        return list(self.stream(*args, **kwargs))
+
+    def document(self, *path):
+        return AccountedDocument(self._wrapped.document(*path))
+
+    def add(self, document_data, *args, **kwargs):
+        _record("write", 1, _DOCUMENT_OVERHEAD + estimate_size(document_data))
+        update_time, ref = self._wrapped.add(document_data, *args, **kwargs)
+        return update_time, AccountedDocument(ref)
+
+
+class AccountedDocument(_Proxy):
+    __slots__ = ()
+
+    def get(self, *args, **kwargs):
+        snapshot = self._wrapped.get(*args, **kwargs)
+        _record("read", 1, _snapshot_size(snapshot))
+        return AccountedSnapshot(snapshot)
+
+    def set(self, document_data, *args, **kwargs):
+        _record("write", 1, _DOCUMENT_OVERHEAD + estimate_size(document_data))
+        return self._wrapped.set(document_data, *args, **kwargs)
+
+    def create(self, document_data, *args, **kwargs):
+        _record("write", 1, _DOCUMENT_OVERHEAD + estimate_size(document_data))
+        return self._wrapped.create(document_data, *args, **kwargs)
+
+    def update(self, field_updates, *args, **kwargs):
+        _record("write", 1, estimate_size(field_updates))
+        return self._wrapped.update(field_updates, *args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        _record("delete", 1)
+        return self._wrapped.delete(*args, **kwargs)
+
+    def collection(self, *path):
+        return AccountedQuery(self._wrapped.collection(*path))
+
+
+class AccountedBatch(_Proxy):
+    """Write batch; operations are counted when the batch is committed"""
+    __slots__ = ("_pending",)
+
+    def __init__(self, wrapped):
+        super().__init__(wrapped)
+        self._pending = []
+
+    @staticmethod
+    def _unwrap(reference):
+        return reference._wrapped if isinstance(reference, _Proxy) else reference
+
+    def set(self, reference, document_data, *args, **kwargs):
+        self._pending.append(("write", _DOCUMENT_OVERHEAD + estimate_size(document_data)))
+        return self._wrapped.set(self._unwrap(reference), document_data, *args, **kwargs)
+
+    def update(self, reference, field_updates, *args, **kwargs):
+        self._pending.append(("write", estimate_size(field_updates)))
+        return self._wrapped.update(self._unwrap(reference), field_updates, *args, **kwargs)
+
+    def delete(self, reference, *args, **kwargs):
+        self._pending.append(("delete", 0))
+        return self._wrapped.delete(self._unwrap(reference), *args, **kwargs)
+
+    def commit(self, *args, **kwargs):
+        result = self._wrapped.commit(*args, **kwargs)
+        for op, size in self._pending:
+            _record(op, 1, size)
+        self._pending = []
+        return result
+
+
+class AccountedClient(_Proxy):
+    """Drop-in wrapper for a google.cloud.firestore Client"""
+    __slots__ = ()
+
+    def collection(self, *path):
+        return AccountedQuery(self._wrapped.collection(*path))
+
+    def document(self, *path):
+        return AccountedDocument(self._wrapped.document(*path))
+
+    def batch(self):
+        return AccountedBatch(self._wrapped.batch())
+
+
+# ---------------------------------------------------------------------------
+# AsyncClient
+# ---------------------------------------------------------------------------
+
+class AsyncAccountedSnapshot(_Proxy):
+    __slots__ = ()
+
+    @property
+    def reference(self):
+        return AsyncAccountedDocument(self._wrapped.reference)
+
+
+class AsyncAccountedQuery(_Proxy):
+    """Wraps AsyncQuery and AsyncCollectionReference"""
+    __slots__ = ()
+
+    def _chain(name):
+        def method(self, *args, **kwargs):
+            return AsyncAccountedQuery(getattr(self._wrapped, name)(*args, **kwargs))
+        method.__name__ = name
+        return method
+
+    where = _chain("where")
+    order_by = _chain("order_by")
+    limit = _chain("limit")
+    limit_to_last = _chain("limit_to_last")
+    offset = _chain("offset")
+    select = _chain("select")
+    start_at = _chain("start_at")
+    start_after = _chain("start_after")
+    end_at = _chain("end_at")
+    end_before = _chain("end_before")
+    del _chain
+
+    async def stream(self, *args, **kwargs) -> AsyncIterator[AsyncAccountedSnapshot]:
+        count = 0
+        async for snapshot in self._wrapped.stream(*args, **kwargs):
+            count += 1
+            _record("read", 1, _snapshot_size(snapshot))
+            yield AsyncAccountedSnapshot(snapshot)
+        if count == 0:
+            _record("read", 1)
+
+    async def get(self, *args, **kwargs):
+        return [snapshot async for snapshot in self.stream(*args, **kwargs)]
+
+    def document(self, *path):
+        return AsyncAccountedDocument(self._wrapped.document(*path))
+
+    async def add(self, document_data, *args, **kwargs):
+        _record("write", 1, _DOCUMENT_OVERHEAD + estimate_size(document_data))
+        update_time, ref = await self._wrapped.add(document_data, *args, **kwargs)
+        return update_time, AsyncAccountedDocument(ref)
+
+
+class AsyncAccountedDocument(_Proxy):
+    __slots__ = ()
+
+    async def get(self, *args, **kwargs):
+        snapshot = await self._wrapped.get(*args, **kwargs)
+        _record("read", 1, _snapshot_size(snapshot))
+        return AsyncAccountedSnapshot(snapshot)
+
+    async def set(self, document_data, *args, **kwargs):
+        _record("write", 1, _DOCUMENT_OVERHEAD + estimate_size(document_data))
+        return await self._wrapped.set(document_data, *args, **kwargs)
+
+    async def create(self, document_data, *args, **kwargs):
+        _record("write", 1, _DOCUMENT_OVERHEAD + estimate_size(document_data))
+        return await self._wrapped.create(document_data, *args, **kwargs)
+
+    async def update(self, field_updates, *args, **kwargs):
+        _record("write", 1, estimate_size(field_updates))
+        return await self._wrapped.update(field_updates, *args, **kwargs)
+
+    async def delete(self, *args, **kwargs):
+        _record("delete", 1)
+        return await self._wrapped.delete(*args, **kwargs)
+
+    def collection(self, *path):
+        return AsyncAccountedQuery(self._wrapped.collection(*path))
+
+
+class AsyncAccountedBatch(AccountedBatch):
+    __slots__ = ()
+
+    async def commit(self, *args, **kwargs):
+        result = await self._wrapped.commit(*args, **kwargs)
+        for op, size in self._pending:
+            _record(op, 1, size)
+        self._pending = []
+        return result
+
+
+class AsyncAccountedClient(_Proxy):
+    """Drop-in wrapper for a google.cloud.firestore AsyncClient"""
+    __slots__ = ()
+
+    def collection(self, *path):
+        return AsyncAccountedQuery(self._wrapped.collection(*path))
+
+    def document(self, *path):
+        return AsyncAccountedDocument(self._wrapped.document(*path))
+
+    def batch(self):
+        return AsyncAccountedBatch(self._wrapped.batch())
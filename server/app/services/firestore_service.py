@@ -1,12 +1,29 @@
-from firebase_admin import firestore
-from google.cloud.firestore import FieldFilter
-from typing import List, Optional, Dict, Any
+import asyncio
+from typing import List, Optional, Dict, Any, Tuple, AsyncIterator, Sequence
 from datetime import datetime
 import uuid
 from app.models.session import ChatSession, ChatMessage, SessionResponse
 from app.services.firebase_service import firebase_service
+from app.core.metrics import timed
+from app.services.firestore_accounting import AsyncAccountedClient
+from app.services.storage_backend import LIBRARY_SUMMARY_FIELDS, StorageBackend
+from app.services.st_symbols import message_symbols
+from app.services.lazy_init import LazyInit
 
-class FirestoreService:
+# Firestore allows at most 500 writes per batch
+BATCH_LIMIT = 500
+# Library batches also rewrite the collection's version document
+LIBRARY_BATCH_ENTRIES = BATCH_LIMIT - 1
+DESCENDING = "DESCENDING"  # firestore.Query.DESCENDING, without importing the SDK
+
+
+def FieldFilter(field_path: str, op_string: str, value: Any):
+    """google.cloud.firestore.FieldFilter, imported on first use"""
+    from google.cloud.firestore import FieldFilter as _FieldFilter
+    return _FieldFilter(field_path, op_string, value)
+
+class FirestoreService(LazyInit, StorageBackend):
+    name = "firestore"
     _instance = None
     _initialized = False
     
@@ -17,27 +34,49 @@ class FirestoreService:
     
     def __init__(self):
         if not self._initialized:
-            self._initialize_firestore()
+            # The client is created by initialize(), run from the app lifespan
+            self._setup_lazy_init()
+            self.db = None
             self._initialized = True
     
-    def _initialize_firestore(self):
-        """Initialize Firestore client"""
+    def _initialize(self):
+        """Initialize the async Firestore client (all methods below are awaitable)"""
+        if self.db is not None:
+            return  # supplied directly (benchmarks)
         try:
             # Ensure Firebase is initialized first
-            firebase_service  # This will initialize Firebase if not already done
-            self.db = firestore.client()
+            firebase_service.initialize()
+            from firebase_admin import firestore_async
+            # Wrapped so every document read/write is counted per request
+            self.db = AsyncAccountedClient(firestore_async.client())
             print("Firestore client initialized successfully.")
         except Exception as e:
             print(f"Error initializing Firestore: {e}")
-            self.db = None
+            raise
+    
+    async def warmup(self):
+        """Open the gRPC channel with one document read"""
+        await self.db.collection("chat_sessions").document("_warmup").get()
     
     def is_available(self) -> bool:
         """Check if Firestore is available"""
         return self.db is not None
+
+    def _library_version_ref(self):
+        # Rewritten with a new token in the same batch as every library write
+        return self.db.collection("collection_versions").document("knowledge_library")
+
+    def _bump_library_version(self, batch):
+        batch.set(self._library_version_ref(), {"version": uuid.uuid4().hex, "updated_at": datetime.utcnow()})
+
+    def _symbol_refs(self, user_id: str):
+        # symbol_index/{uid}/refs/{message_id}:{symbol_key}; lookups use a (symbol_key, timestamp desc) index
+        return self.db.collection("symbol_index").document(user_id).collection("refs")
     
-    def create_chat_session(self, user_id: str, title: str = "New Chat") -> str:
+    @timed("firestore.create_chat_session")
+    async def create_chat_session(self, user_id: str, title: str = "New Chat") -> str:
         """Create a new chat session"""
-        if not self.is_available():
+        if not await self.ensure_available():
             raise ValueError("Firestore not available")
         
         session_id = str(uuid.uuid4())
@@ -54,13 +93,14 @@ class FirestoreService:
         }
         
         # Store in Firestore
-        self.db.collection("chat_sessions").document(session_id).set(session_data)
+        await self.db.collection("chat_sessions").document(session_id).set(session_data)
         
         return session_id
     
-    def get_user_sessions(self, user_id: str, limit: int = 50) -> List[SessionResponse]:
+    @timed("firestore.get_user_sessions")
+    async def get_user_sessions(self, user_id: str, limit: int = 50) -> List[SessionResponse]:
         """Get all chat sessions for a user"""
-        if not self.is_available():
+        if not await self.ensure_available():
             raise ValueError("Firestore not available")
         
         try:
@@ -68,12 +108,12 @@ class FirestoreService:
             sessions_ref = (
                 self.db.collection("chat_sessions")
                 .where(filter=FieldFilter("user_id", "==", user_id))
-                .order_by("updated_at", direction=firestore.Query.DESCENDING)
+                .order_by("updated_at", direction=DESCENDING)
                 .limit(limit)
             )
             
             sessions = []
-            for doc in sessions_ref.stream():
+            async for doc in sessions_ref.stream():
                 data = doc.to_dict()
                 if data:  # Ensure data is not None
                     sessions.append(SessionResponse(
@@ -98,7 +138,7 @@ class FirestoreService:
                 )
                 
                 sessions = []
-                for doc in sessions_ref.stream():
+                async for doc in sessions_ref.stream():
                     data = doc.to_dict()
                     if data:  # Ensure data is not None
                         sessions.append(SessionResponse(
@@ -119,25 +159,29 @@ class FirestoreService:
                 # Return empty list if both queries fail
                 return []
     
-    def get_session_messages(self, session_id: str, user_id: str, limit: int = 100) -> List[ChatMessage]:
+    @timed("firestore.get_session_messages")
+    async def get_session_messages(self, session_id: str, user_id: str, limit: int = 100) -> List[ChatMessage]:
         """Get all messages for a chat session"""
-        if not self.is_available():
+        if not await self.ensure_available():
             raise ValueError("Firestore not available")
         
-        # Verify session belongs to user
-        session_doc = self.db.collection("chat_sessions").document(session_id).get()
-        if not session_doc.exists or session_doc.to_dict().get("user_id") != user_id:
-            raise ValueError("Session not found or access denied")
-        
+        session_ref = self.db.collection("chat_sessions").document(session_id)
         messages_ref = (
-            self.db.collection("chat_sessions").document(session_id)
+            session_ref
             .collection("messages")
             .order_by("timestamp")
             .limit(limit)
         )
         
+        # The ownership check and the message query are independent round trips
+        session_doc, docs = await asyncio.gather(session_ref.get(), messages_ref.get())
+        
+        # Verify session belongs to user
+        if not session_doc.exists or session_doc.to_dict().get("user_id") != user_id:
+            raise ValueError("Session not found or access denied")
+        
         messages = []
-        for doc in messages_ref.stream():
+        for doc in docs:
             data = doc.to_dict()
             messages.append(ChatMessage(
                 role=data["role"],
@@ -148,7 +192,64 @@ class FirestoreService:
         
         return messages
     
-    def add_message_to_session(
+    @timed("firestore.get_session_version")
+    async def get_session_version(self, session_id: str, user_id: str) -> str:
+        """updated_at and message_count of a session (one document read)"""
+        if not await self.ensure_available():
+            raise ValueError("Firestore not available")
+        
+        session_doc = await self.db.collection("chat_sessions").document(session_id).get()
+        data = session_doc.to_dict() if session_doc.exists else None
+        if not data or data.get("user_id") != user_id:
+            raise ValueError("Session not found or access denied")
+        updated_at = data.get("updated_at")
+        return f"{updated_at.isoformat() if updated_at else ''}:{data.get('message_count', 0)}"
+    
+    @timed("firestore.get_session_context")
+    async def get_session_context(self, session_id: str, user_id: str,
+                                  limit: int) -> Tuple[Dict[str, Any], List[ChatMessage]]:
+        """Summary fields of the session document and its newest messages"""
+        if not await self.ensure_available():
+            raise ValueError("Firestore not available")
+        
+        session_ref = self.db.collection("chat_sessions").document(session_id)
+        messages_ref = (
+            session_ref
+            .collection("messages")
+            .order_by("timestamp", direction=DESCENDING)
+            .limit(limit)
+        )
+        session_doc, docs = await asyncio.gather(session_ref.get(), messages_ref.get())
+        data = session_doc.to_dict() if session_doc.exists else None
+        if not data or data.get("user_id") != user_id:
+            raise ValueError("Session not found or access denied")
+        
+        summary = {
+            "summary": data.get("summary"),
+            "summary_through": data.get("summary_through"),
+            "summary_count": data.get("summary_count", 0),
+        }
+        messages = [
+            ChatMessage(role=d["role"], content=d["content"], timestamp=d["timestamp"], message_id=doc.id)
+            for doc, d in ((doc, doc.to_dict()) for doc in reversed(docs))
+        ]
+        return summary, messages
+    
+    @timed("firestore.save_session_summary")
+    async def save_session_summary(self, session_id: str, user_id: str, summary: str,
+                                   through: datetime, count: int):
+        """One update of the session document (ownership was checked when the messages were read)"""
+        if not await self.ensure_available():
+            raise ValueError("Firestore not available")
+        
+        await self.db.collection("chat_sessions").document(session_id).update({
+            "summary": summary,
+            "summary_through": through,
+            "summary_count": count,
+        })
+    
+    @timed("firestore.add_message_to_session")
+    async def add_message_to_session(
         self, 
         session_id: str, 
         user_id: str, 
@@ -156,12 +257,12 @@ class FirestoreService:
         content: str
     ) -> str:
         """Add a message to a chat session"""
-        if not self.is_available():
+        if not await self.ensure_available():
             raise ValueError("Firestore not available")
         
         # Verify session belongs to user
         session_ref = self.db.collection("chat_sessions").document(session_id)
-        session_doc = session_ref.get()
+        session_doc = await session_ref.get()
         
         if not session_doc.exists or session_doc.to_dict().get("user_id") != user_id:
             raise ValueError("Session not found or access denied")
@@ -177,57 +278,299 @@ class FirestoreService:
             "message_id": message_id
         }
         
-        # Add message to subcollection
-        session_ref.collection("messages").document(message_id).set(message_data)
-        
-        # Update session metadata
+        # Add message to subcollection and update session metadata concurrently
         session_data = session_doc.to_dict()
-        session_ref.update({
-            "updated_at": now,
-            "message_count": session_data.get("message_count", 0) + 1,
-            "last_message": content[:100] + "..." if len(content) > 100 else content
-        })
+        writes = [
+            session_ref.collection("messages").document(message_id).set(message_data),
+            session_ref.update({
+                "updated_at": now,
+                "message_count": session_data.get("message_count", 0) + 1,
+                "last_message": content[:100] + "..." if len(content) > 100 else content
+            })
+        ]
+        symbols = message_symbols(content)
+        if symbols:
+            # At most MAX_SYMBOLS_PER_MESSAGE, so one batch
+            batch, refs = self.db.batch(), self._symbol_refs(user_id)
+            for symbol in symbols:
+                batch.set(refs.document(f"{message_id}:{symbol['symbol_key']}"), {
+                    **symbol, "session_id": session_id, "message_id": message_id, "timestamp": now
+                })
+            writes.append(batch.commit())
+        await asyncio.gather(*writes)
         
         return message_id
     
-    def update_session_title(self, session_id: str, user_id: str, title: str) -> bool:
+    @timed("firestore.update_session_title")
+    async def update_session_title(self, session_id: str, user_id: str, title: str) -> bool:
         """Update the title of a chat session"""
-        if not self.is_available():
+        if not await self.ensure_available():
             raise ValueError("Firestore not available")
         
         session_ref = self.db.collection("chat_sessions").document(session_id)
-        session_doc = session_ref.get()
+        session_doc = await session_ref.get()
         
         if not session_doc.exists or session_doc.to_dict().get("user_id") != user_id:
             raise ValueError("Session not found or access denied")
         
-        session_ref.update({
+        await session_ref.update({
             "title": title,
             "updated_at": datetime.utcnow()
         })
         
         return True
     
-    def delete_session(self, session_id: str, user_id: str) -> bool:
+    @timed("firestore.delete_session")
+    async def delete_session(self, session_id: str, user_id: str) -> bool:
         """Delete a chat session and all its messages"""
-        if not self.is_available():
+        if not await self.ensure_available():
             raise ValueError("Firestore not available")
         
         session_ref = self.db.collection("chat_sessions").document(session_id)
-        session_doc = session_ref.get()
+        session_doc = await session_ref.get()
         
         if not session_doc.exists or session_doc.to_dict().get("user_id") != user_id:
             raise ValueError("Session not found or access denied")
         
-        # Delete all messages in the session
-        messages_ref = session_ref.collection("messages")
-        for doc in messages_ref.stream():
-            doc.reference.delete()
-        
-        # Delete the session
-        session_ref.delete()
+        # Delete all messages and symbol references of the session, in batches,
+        # then the session itself
+        refs = self._symbol_refs(user_id).where(filter=FieldFilter("session_id", "==", session_id))
+        batch, pending = self.db.batch(), 0
+        for query in (session_ref.collection("messages"), refs):
+            async for doc in query.select([]).stream():
+                batch.delete(doc.reference)
+                pending += 1
+                if pending == BATCH_LIMIT:
+                    await batch.commit()
+                    batch, pending = self.db.batch(), 0
+        batch.delete(session_ref)
+        await batch.commit()
         
         return True
 
+    @timed("firestore.find_symbol_refs")
+    async def find_symbol_refs(self, user_id: str, key: str, prefix: bool = False,
+                               limit: int = 50) -> List[Dict[str, Any]]:
+        """References to a symbol in the user's messages (one indexed query, no session scan)"""
+        if not await self.ensure_available():
+            raise ValueError("Firestore not available")
+        
+        refs = self._symbol_refs(user_id)
+        if prefix:
+            query = (refs.where(filter=FieldFilter("symbol_key", ">=", key))
+                     .where(filter=FieldFilter("symbol_key", "<", key + "\uf8ff")))
+        else:
+            query = refs.where(filter=FieldFilter("symbol_key", "==", key))
+        try:
+            # Composite index on refs (symbol_key, timestamp desc). A range on
+            # symbol_key must be ordered by it first, so a prefix lookup gets
+            # the newest references of the alphabetically first symbols.
+            ordered = query.order_by("symbol_key").order_by("timestamp", direction=DESCENDING) if prefix \
+                else query.order_by("timestamp", direction=DESCENDING)
+            results = [doc.to_dict() async for doc in ordered.limit(limit).stream()]
+        except Exception as e:
+            # Without the index: any `limit` matching references
+            print(f"Error with ordered symbol query, trying simple query: {e}")
+            results = [doc.to_dict() async for doc in query.limit(limit).stream()]
+        results.sort(key=lambda r: r.get("timestamp") or datetime.min, reverse=True)
+        return results
+
+    # -- knowledge library ---------------------------------------------------
+    
+    @timed("firestore.get_library_version")
+    async def get_library_version(self) -> str:
+        """Token rewritten by every library write (one document read)"""
+        if not await self.ensure_available():
+            raise ValueError("Firestore not available")
+        
+        doc = await self._library_version_ref().get()
+        return (doc.to_dict() or {}).get("version", "0") if doc.exists else "0"
+    
+    @timed("firestore.add_library_entry")
+    async def add_library_entry(self, entry: Dict[str, Any]) -> str:
+        """Store a library entry"""
+        if not await self.ensure_available():
+            raise ValueError("Firestore not available")
+        
+        batch = self.db.batch()
+        batch.set(self.db.collection("knowledge_library").document(entry["entry_id"]), entry)
+        self._bump_library_version(batch)
+        await batch.commit()
+        return entry["entry_id"]
+    
+    @timed("firestore.get_recent_library_entries")
+    async def get_recent_library_entries(self, limit: int = 50) -> List[Dict[str, Any]]:
+        """Library entries from all users, newest first"""
+        if not await self.ensure_available():
+            raise ValueError("Firestore not available")
+        
+        query = (
+            self.db.collection("knowledge_library")
+            .order_by("created_at", direction=DESCENDING)
+            .limit(limit)
+        )
+        return [doc.to_dict() async for doc in query.stream()]
+    
+    @timed("firestore.get_library_summaries")
+    async def get_library_summaries(self, limit: int = 50) -> List[Dict[str, Any]]:
+        """Newest library entries, projected to the summary fields"""
+        if not await self.ensure_available():
+            raise ValueError("Firestore not available")
+        
+        # Field projection: assistant_response never leaves Firestore
+        query = (
+            self.db.collection("knowledge_library")
+            .select(list(LIBRARY_SUMMARY_FIELDS))
+            .order_by("created_at", direction=DESCENDING)
+            .limit(limit)
+        )
+        return [doc.to_dict() async for doc in query.stream()]
+    
+    @timed("firestore.get_library_entry")
+    async def get_library_entry(self, entry_id: str) -> Optional[Dict[str, Any]]:
+        """A single library entry, including the full response"""
+        if not await self.ensure_available():
+            raise ValueError("Firestore not available")
+        
+        doc = await self.db.collection("knowledge_library").document(entry_id).get()
+        return doc.to_dict() if doc.exists else None
+    
+    @timed("firestore.get_all_library_entries")
+    async def get_all_library_entries(self) -> List[Dict[str, Any]]:
+        """Every library entry"""
+        if not await self.ensure_available():
+            raise ValueError("Firestore not available")
+        
+        return [doc.to_dict() async for doc in self.db.collection("knowledge_library").stream()]
+    
+    async def iter_library_entries(self, page_size: int = 500,
+                                   fields: Optional[Sequence[str]] = None) -> AsyncIterator[Dict[str, Any]]:
+        """Every library entry, paged with a cursor so memory stays at one page"""
+        if not await self.ensure_available():
+            raise ValueError("Firestore not available")
+        
+        collection = self.db.collection("knowledge_library")
+        if fields is not None:
+            # The cursor needs entry_id
+            collection = collection.select(list(dict.fromkeys(["entry_id", *fields])))
+        last_id = None
+        while True:
+            query = collection.order_by("entry_id").limit(page_size)
+            if last_id is not None:
+                query = query.start_after({"entry_id": last_id})
+            page = [doc.to_dict() async for doc in query.stream()]
+            for entry in page:
+                yield entry
+            if len(page) < page_size:
+                return
+            last_id = page[-1]["entry_id"]
+    
+    @timed("firestore.add_library_entries")
+    async def add_library_entries(self, entries: List[Dict[str, Any]]) -> int:
+        """Upsert library entries, BATCH_LIMIT writes per commit (one is the version)"""
+        if not await self.ensure_available():
+            raise ValueError("Firestore not available")
+        
+        collection = self.db.collection("knowledge_library")
+        for start in range(0, len(entries), LIBRARY_BATCH_ENTRIES):
+            batch = self.db.batch()
+            for entry in entries[start:start + LIBRARY_BATCH_ENTRIES]:
+                batch.set(collection.document(entry["entry_id"]), entry)
+            self._bump_library_version(batch)
+            await batch.commit()
+        return len(entries)
+    
+    @timed("firestore.update_library_entries")
+    async def update_library_entries(self, updates: Dict[str, Dict[str, Any]]) -> int:
+        """Set fields on existing library entries, BATCH_LIMIT writes per commit (one is the version)"""
+        if not await self.ensure_available():
+            raise ValueError("Firestore not available")
+        
+        collection = self.db.collection("knowledge_library")
+        items = list(updates.items())
+        for start in range(0, len(items), LIBRARY_BATCH_ENTRIES):
+            batch = self.db.batch()
+            for entry_id, fields in items[start:start + LIBRARY_BATCH_ENTRIES]:
+                batch.update(collection.document(entry_id), fields)
+            self._bump_library_version(batch)
+            await batch.commit()
+        return len(items)
+    
+    @timed("firestore.delete_library_entries")
+    async def delete_library_entries(self, entry_ids: List[str]) -> int:
+        """Delete library entries, BATCH_LIMIT writes per commit (one is the version)"""
+        if not await self.ensure_available():
+            raise ValueError("Firestore not available")
+        
+        collection = self.db.collection("knowledge_library")
+        for start in range(0, len(entry_ids), LIBRARY_BATCH_ENTRIES):
+            batch = self.db.batch()
+            for entry_id in entry_ids[start:start + LIBRARY_BATCH_ENTRIES]:
+                batch.delete(collection.document(entry_id))
+            self._bump_library_version(batch)
+            await batch.commit()
+        return len(entry_ids)
+    
+    # -- generation jobs -----------------------------------------------------
+    
+    def _job_items(self, job_id: str):
+        return self.db.collection("generation_jobs").document(job_id).collection("items")
+    
+    @timed("firestore.save_job")
+    async def save_job(self, job: Dict[str, Any], items: List[Dict[str, Any]]):
+        """Write the job document and items in one batch"""
+        if not await self.ensure_available():
+            raise ValueError("Firestore not available")
+        
+        batch = self.db.batch()
+        batch.set(self.db.collection("generation_jobs").document(job["job_id"]), job)
+        for item in items:
+            batch.set(self._job_items(job["job_id"]).document(f"{item['index']:04d}"), item)
+        await batch.commit()
+    
+    @timed("firestore.load_job")
+    async def load_job(self, job_id: str, include_items: bool = True) -> Tuple[Optional[Dict[str, Any]], Optional[List[Dict[str, Any]]]]:
+        """Job document and (optionally) its items, read concurrently"""
+        if not await self.ensure_available():
+            raise ValueError("Firestore not available")
+        
+        doc_read = self.db.collection("generation_jobs").document(job_id).get()
+        if include_items:
+            doc, item_docs = await asyncio.gather(doc_read, self._job_items(job_id).order_by("index").get())
+            items = [d.to_dict() for d in item_docs]
+        else:
+            doc, items = await doc_read, None
+        return (doc.to_dict() if doc.exists else None), items
+    
+    @timed("firestore.list_jobs")
+    async def list_jobs(self, user_id: str, limit: int = 20) -> List[Dict[str, Any]]:
+        """A user's newest job documents (composite index on user_id, created_at desc)"""
+        if not await self.ensure_available():
+            raise ValueError("Firestore not available")
+        
+        jobs = self.db.collection("generation_jobs").where(filter=FieldFilter("user_id", "==", user_id))
+        try:
+            query = jobs.order_by("created_at", direction=DESCENDING).limit(limit)
+            return [doc.to_dict() async for doc in query.stream()]
+        except Exception as e:
+            # Without the index: any `limit` of the user's jobs, newest first
+            print(f"Error with ordered jobs query, trying simple query: {e}")
+            results = [doc.to_dict() async for doc in jobs.limit(limit).stream()]
+            results.sort(key=lambda r: r.get("created_at") or datetime.min, reverse=True)
+            return results
+    
+    @timed("firestore.list_unfinished_jobs")
+    async def list_unfinished_jobs(self, limit: int = 500) -> List[Dict[str, Any]]:
+        """Job documents still queued or running (single-field index on status)"""
+        if not await self.ensure_available():
+            raise ValueError("Firestore not available")
+        
+        query = (
+            self.db.collection("generation_jobs")
+            .where(filter=FieldFilter("status", "in", ["queued", "running"]))
+            .limit(limit)
+        )
+        return [doc.to_dict() async for doc in query.stream()]
+
 # Create singleton instance
 firestore_service = FirestoreService()
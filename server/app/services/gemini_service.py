@@ -1,87 +1,27 @@
-import google.generativeai as genai
-from typing import List, Dict, Any
+import asyncio
+import json
+import time
+from typing import List, Dict, Any, Optional
+from starlette.concurrency import run_in_threadpool
 from app.core.config import settings
+from app.core.metrics import metrics, span, LLM_IN_FLIGHT
+from app.services.llm_cassette import cassette_from_settings, prompt_key
+from app.services.singleflight import SingleFlight, coalescing_key
+from app.services.admission import llm_admission, AdmissionRejected
+from app.services.resilience import UpstreamError, resilient_caller_from_settings
+from app.services.lazy_init import LazyInit
+from app.services.model_router import FALLBACK_TIER, Tier, classify, parse_tiers
+from app.services.scope_gate import scope_gate
 
-class GeminiService:
-    _instance = None
-    _initialized = False
-    
-    def __new__(cls):
-        if cls._instance is None:
-            cls._instance = super().__new__(cls)
-        return cls._instance
-    
-    def __init__(self):
-        if not self._initialized:
-            self._initialize_gemini()
-            self._initialized = True
-    
-    def _initialize_gemini(self):
-        """Initialize Gemini AI service"""
-        if settings.GEMINI_API_KEY:
-            genai.configure(api_key=settings.GEMINI_API_KEY)
-            print(f"Gemini configured with API key: {settings.GEMINI_API_KEY[:10]}...")
-            
-            # Define response schema for structured array output
-            response_schema = {
-                "type": "array",
-                "items": {
-                    "type": "object",
-                    "properties": {
-                        "type": {
-                            "type": "string",
-                            "enum": ["text", "ladder", "plc-code"]
-                        },
-                        "content": {
-                            "type": "string"
-                        },
-                        # Optional validation block for ladder/code outputs
-                        "validation": {
-                            "type": "object",
-                            "properties": {
-                                "status": {
-                                    "type": "string",
-                                    "enum": ["valid", "invalid", "unknown"]
-                                },
-                                "executable": {"type": "boolean"},
-                                "reason": {"type": "string"},
-                                "warnings": {
-                                    "type": "array",
-                                    "items": {"type": "string"}
-                                }
-                            },
-                            "required": ["status", "executable"],
-                        }
-                    },
-                    "required": ["type", "content"],
-                }
-            }
-            
-            self.model = genai.GenerativeModel(
-                'gemini-2.0-flash',
-                generation_config=genai.GenerationConfig(
-                    temperature=0.3,
-                    max_output_tokens=2048,
-                    response_mime_type="application/json",
-                    response_schema=response_schema
-                )
-            )
-        else:
-            print("Warning: GEMINI_API_KEY not found in environment variables")
-            self.model = None
-    
-    def is_available(self) -> bool:
-        """Check if Gemini service is available"""
-        return self.model is not None and bool(settings.GEMINI_API_KEY)
-    
-    def chat(self, message: str, conversation_history: List[Dict[str, str]] = None) -> str:
-        """Send a message to Gemini and get a response"""
-        if not self.is_available():
-            raise ValueError("Gemini API key not configured")
-        
-        try:
-            # System prompt for IEC analyst
-            system_prompt = """You are an IEC 61131-3 programming analyst and expert. You specialize ONLY in PLC programming, ladder diagrams, and industrial automation.
+LLM_TIER_LATENCY = metrics.histogram(
+    "llm_tier_call_duration_seconds", "Upstream LLM call latency by model tier", ("tier", "model")
+)
+LLM_TIER_TOKENS = metrics.counter(
+    "llm_tier_tokens_total", "Tokens reported by the model by model tier and kind (input/output)", ("tier", "model", "kind")
+)
+
+# System prompt for IEC analyst
+SYSTEM_PROMPT = """You are an IEC 61131-3 programming analyst and expert. You specialize ONLY in PLC programming, ladder diagrams, and industrial automation.
 
 SCOPE RESTRICTION - VERY IMPORTANT:
 - You ONLY answer questions related to PLCs, IEC 61131-3, industrial automation, control systems, ladder diagrams, SCADA, HMI, and related industrial topics
@@ -156,30 +96,292 @@ Response: [{"type": "text", "content": "I'm sorry, but I can only answer questio
 User: "Tell me about history"
 Response: [{"type": "text", "content": "I'm sorry, but I can only answer questions related to PLCs, IEC 61131-3 programming, industrial automation, and control systems. Please ask me about ladder diagrams, PLC programming, SCADA systems, or other industrial automation topics."}]"""
 
-            # Prepare conversation history for Gemini
-            history = []
-            
-            # Add system prompt as first message
-            history.append({"role": "user", "parts": [system_prompt]})
-            history.append({"role": "model", "parts": ["Understood. I will respond only in valid JSON format with the specified types based on what you ask."]})
-            
-            if conversation_history:
-                for msg in conversation_history[-8:]:  # Keep last 8 messages for context (reduced to save space)
-                    if msg.get("role") == "user":
-                        history.append({"role": "user", "parts": [msg.get("content", "")]})
-                    elif msg.get("role") == "assistant":
-                        history.append({"role": "model", "parts": [msg.get("content", "")]})
-            
-            # Start chat session with history
-            chat = self.model.start_chat(history=history)
-            
-            # Send the current message
-            response = chat.send_message(message)
-            
-            return response.text
+# What the system prompt tells the model to answer off-topic questions with; the scope gate answers with it locally
+OFF_TOPIC_RESPONSE = '[{"type": "text", "content": "I\'m sorry, but I can only answer questions related to PLCs, IEC 61131-3 programming, industrial automation, and control systems. Please ask me about ladder diagrams, PLC programming, SCADA systems, or other industrial automation topics."}]'
+
+def response_schema(types) -> Dict[str, Any]:
+    """Structured array output with items of the given types"""
+    return {
+        "type": "array",
+        "items": {
+            "type": "object",
+            "properties": {
+                "type": {
+                    "type": "string",
+                    "enum": list(types)
+                },
+                "content": {
+                    "type": "string"
+                },
+                # Optional validation block for ladder/code outputs
+                "validation": {
+                    "type": "object",
+                    "properties": {
+                        "status": {
+                            "type": "string",
+                            "enum": ["valid", "invalid", "unknown"]
+                        },
+                        "executable": {"type": "boolean"},
+                        "reason": {"type": "string"},
+                        "warnings": {
+                            "type": "array",
+                            "items": {"type": "string"}
+                        }
+                    },
+                    "required": ["status", "executable"],
+                }
+            },
+            "required": ["type", "content"],
+        }
+    }
+
+SYSTEM_ACK = "Understood. I will respond only in valid JSON format with the specified types based on what you ask."
+
+# Session summaries (session_summary.py): the prompt that folds messages into one, and how it is given as context
+SUMMARY_PROMPT = """You maintain the running summary of a conversation between a user and an IEC 61131-3 / PLC programming assistant. The assistant will see only this summary and the latest few messages, so fold the new messages into the summary so far. Keep what later answers depend on: what the user is building, requirements, constraints and decisions, the names of programs, function blocks, variables and I/O addresses, and open questions. Drop greetings and full code listings (name what the code does instead). Write at most {max_chars} characters of plain prose.
+
+Response: [{{"type": "text", "content": "<the updated summary>"}}]"""
+SUMMARY_MESSAGE_CHARS = 2000  # per message sent to the summary tier
+SUMMARY_CONTEXT = "Summary of the earlier part of this conversation:\n{summary}"
+SUMMARY_ACK = "Understood. I will take the earlier conversation into account."
+
+def _summary_text(text: str) -> str:
+    """The text parts of a summary-tier response (plain text when it is not the JSON array)"""
+    try:
+        parts = json.loads(text)
+    except json.JSONDecodeError:
+        return text.strip()
+    if isinstance(parts, list):
+        return "\n".join(p["content"] for p in parts if isinstance(p, dict) and isinstance(p.get("content"), str)).strip()
+    return text.strip()
+
+class GeminiService(LazyInit):
+    _instance = None
+    _initialized = False
+    
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+        return cls._instance
+    
+    def __init__(self):
+        if not self._initialized:
+            self._setup_gemini()
+            self._initialized = True
+    
+    def _setup_gemini(self):
+        """Set up the call path; the models themselves are created by initialize()"""
+        self._setup_lazy_init()
+        self.model = None
+        # Model configuration per tier (model_router), and the client for each once initialized
+        self.tiers = parse_tiers(settings.GEMINI_MODEL_TIERS)
+        self.models: Dict[str, Any] = {}
+        # Optional record/replay layer for deterministic, offline runs
+        self.cassette = cassette_from_settings(settings)
+        # Identical concurrent prompts share one upstream call
+        self.single_flight = SingleFlight("gemini")
+        # Retries, hedging and circuit breaking around each upstream call
+        self.resilience = resilient_caller_from_settings("gemini")
+    
+    def _initialize(self):
+        """Import the Gemini SDK and create a model per tier"""
+        if self.model is not None:
+            return  # supplied directly (benchmarks)
+        if settings.GEMINI_API_KEY:
+            import google.generativeai as genai
+            genai.configure(api_key=settings.GEMINI_API_KEY)
             
+            models = {}
+            for tier in self.tiers.values():
+                # Tiers with the same configuration share a client
+                if tier.key not in models:
+                    models[tier.key] = genai.GenerativeModel(
+                        tier.model,
+                        generation_config=genai.GenerationConfig(
+                            temperature=0.3,
+                            max_output_tokens=tier.max_output_tokens,
+                            response_mime_type="application/json",
+                            response_schema=response_schema(tier.types)
+                        )
+                    )
+                self.models[tier.name] = models[tier.key]
+            self.model = self.models[FALLBACK_TIER]
+            print("Gemini configured: " + ", ".join(f"{t.name}={t.model}" for t in self.tiers.values()))
+        else:
+            print("Warning: GEMINI_API_KEY not found in environment variables")
+    
+    def warmup(self):
+        """Open the connection to the API with a token count (no generation)"""
+        if self.model is not None and hasattr(self.model, "count_tokens"):
+            with span("gemini.warmup"):
+                self.model.count_tokens("PLC")
+    
+    def health(self) -> str:
+        """'ok', 'degraded' (circuit open or probing) or 'unavailable' (not configured)"""
+        if not self.is_available():
+            return "unavailable"
+        return "ok" if self.resilience.breaker.state == "closed" else "degraded"
+    
+    def is_available(self) -> bool:
+        """Check if Gemini service is available"""
+        if self.cassette is not None and self.cassette.replay_only:
+            return True
+        return self.model is not None and bool(settings.GEMINI_API_KEY)
+    
+    def route(self, message: str, conversation_history: List[Dict[str, str]] = None) -> Tier:
+        """The tier (model, token limit, schema) a request goes to"""
+        if not settings.GEMINI_MODEL_ROUTING:
+            return self.tiers[FALLBACK_TIER]
+        return self.tiers[classify(message, conversation_history)]
+    
+    def chat(self, message: str, conversation_history: List[Dict[str, str]] = None) -> str:
+        """Send a message to Gemini and get a response"""
+        self.initialize()
+        if not self.is_available():
+            raise ValueError("Gemini API key not configured")
+        
+        try:
+            tier = self.route(message, conversation_history)
+            history = self._build_history(conversation_history)
+            return self.resilience.call_sync(lambda: self._send_tracked(tier, history, message))
+        except AdmissionRejected:
+            raise
         except Exception as e:
-            raise ValueError(f"Failed to get response from Gemini: {str(e)}")
+            raise UpstreamError(f"Failed to get response from Gemini: {str(e)}")
+    
+    async def chat_async(
+        self,
+        message: str,
+        conversation_history: List[Dict[str, str]] = None,
+        user_id: str = None,
+        summary: str = None
+    ) -> str:
+        """
+        Async variant of chat() used by the route handlers. The blocking SDK call
+        runs in the threadpool, and concurrent calls with the same normalized
+        prompt, context and tier share a single upstream request. The upstream call
+        waits for a fair-share concurrency slot (AdmissionRejected when shed);
+        transient upstream errors are retried, and UpstreamUnavailable is raised
+        when they persist or the circuit breaker is open; other upstream failures
+        are raised as UpstreamError. Clearly off-topic
+        messages get OFF_TOPIC_RESPONSE from the local scope gate instead.
+        `summary` is a session's rolling summary of the messages before
+        conversation_history.
+        """
+        if not await self.ensure_available():
+            raise ValueError("Gemini API key not configured")
+        if not await scope_gate.allows(message, follow_up=bool(conversation_history or summary)):
+            return OFF_TOPIC_RESPONSE
+        
+        tier = self.route(message, conversation_history)
+        history = self._build_history(conversation_history, summary)
+        key = coalescing_key(tier.key, history, message)
+        try:
+            return await self.single_flight.do(
+                key, lambda: self.resilience.call(lambda: self._send_admitted(user_id, tier, history, message))
+            )
+        except (asyncio.CancelledError, AdmissionRejected):
+            raise
+        except Exception as e:
+            raise UpstreamError(f"Failed to get response from Gemini: {str(e)}")
+    
+    async def summarize_async(
+        self,
+        summary: Optional[str],
+        messages: List[Dict[str, str]],
+        user_id: str = None
+    ) -> str:
+        """
+        Fold messages into a session's rolling summary with one call to the
+        summary tier (no system prompt, no scope gate, no coalescing); returns
+        the new summary. Raises UpstreamError when the call fails.
+        """
+        if not await self.ensure_available():
+            raise ValueError("Gemini API key not configured")
+        
+        tier = self.tiers["summary"]
+        lines = [SUMMARY_PROMPT.format(max_chars=settings.SESSION_SUMMARY_MAX_CHARS), "",
+                 "Summary so far:", summary or "(none)", "", "New messages:"]
+        for msg in messages:
+            speaker = "User" if msg.get("role") == "user" else "Assistant"
+            lines.append(f"{speaker}: {msg.get('content', '')[:SUMMARY_MESSAGE_CHARS]}")
+        message = "\n".join(lines)
+        try:
+            text = await self.resilience.call(lambda: self._send_admitted(user_id, tier, [], message))
+        except (asyncio.CancelledError, AdmissionRejected):
+            raise
+        except Exception as e:
+            raise UpstreamError(f"Failed to get summary from Gemini: {str(e)}")
+        return _summary_text(text)[:settings.SESSION_SUMMARY_MAX_CHARS]
+    
+    def _build_history(self, conversation_history: List[Dict[str, str]] = None,
+                       summary: str = None) -> List[Dict[str, Any]]:
+        """Prepare conversation history for Gemini, with the system prompt as first turn"""
+        history = [
+            {"role": "user", "parts": [SYSTEM_PROMPT]},
+            {"role": "model", "parts": [SYSTEM_ACK]},
+        ]
+        if summary:
+            history.append({"role": "user", "parts": [SUMMARY_CONTEXT.format(summary=summary)]})
+            history.append({"role": "model", "parts": [SUMMARY_ACK]})
+        
+        if conversation_history:
+            # Keep the last SESSION_CONTEXT_MESSAGES messages for context (older ones are in the summary)
+            for msg in conversation_history[-max(1, settings.SESSION_CONTEXT_MESSAGES):]:
+                if msg.get("role") == "user":
+                    history.append({"role": "user", "parts": [msg.get("content", "")]})
+                elif msg.get("role") == "assistant":
+                    history.append({"role": "model", "parts": [msg.get("content", "")]})
+        return history
+    
+    async def _send_admitted(self, user_id: str, tier: Tier, history: List[Dict[str, Any]], message: str) -> str:
+        async with llm_admission.slot(user_id or "anonymous"):
+            return await run_in_threadpool(self._send_tracked, tier, history, message)
+    
+    def _send_tracked(self, tier: Tier, history: List[Dict[str, Any]], message: str) -> str:
+        started = time.perf_counter()
+        with LLM_IN_FLIGHT.track_inprogress(model=tier.model), span("gemini.chat"):
+            response = self._send(tier, history, message)
+        LLM_TIER_LATENCY.observe(time.perf_counter() - started, tier=tier.name, model=tier.model)
+        usage = getattr(response, "usage_metadata", None)
+        if usage is not None:
+            LLM_TIER_TOKENS.inc(getattr(usage, "prompt_token_count", 0) or 0, tier=tier.name, model=tier.model,
+                                kind="input")
+            LLM_TIER_TOKENS.inc(getattr(usage, "candidates_token_count", 0) or 0, tier=tier.name, model=tier.model,
+                                kind="output")
+        return response.text
+
+    def _send(self, tier: Tier, history: List[Dict[str, Any]], message: str):
+        """Send one turn upstream, through the cassette when one is configured"""
+        def upstream():
+            # Start chat session with history and send the current message
+            chat = self.models.get(tier.name, self.model).start_chat(history=history)
+            return chat.send_message(message)
+        
+        if self.cassette is None:
+            return upstream()
+        
+        return self.cassette.call(
+            prompt_key(tier.key, history, message),
+            upstream,
+            model=tier.model,
+            prompt_chars=sum(len(part) for h in history for part in h["parts"]) + len(message)
+        )
+    
+    def tier_stats(self) -> Dict[str, Any]:
+        """Configuration, calls and recent latency per tier"""
+        stats = {}
+        for tier in self.tiers.values():
+            quantiles = LLM_TIER_LATENCY.quantiles(tier=tier.name, model=tier.model)
+            stats[tier.name] = {
+                **tier.as_dict(),
+                "calls": LLM_TIER_LATENCY.count(tier=tier.name, model=tier.model),
+                "input_tokens": LLM_TIER_TOKENS.value(tier=tier.name, model=tier.model, kind="input"),
+                "output_tokens": LLM_TIER_TOKENS.value(tier=tier.name, model=tier.model, kind="output"),
+                "p50_ms": round(1000 * quantiles[0.5], 1) if quantiles else None,
+                "p95_ms": round(1000 * quantiles[0.95], 1) if quantiles else None,
+            }
+        return {"routing": settings.GEMINI_MODEL_ROUTING, "tiers": stats}
 
 # Create singleton instance
 gemini_service = GeminiService()
@@ -0,0 +1,155 @@
+"""
+IEC 61131-3 and industrial automation vocabulary for the local question
+analysis (the semantic answer cache and the scope gate), without numpy.
+
+terms() tokenizes a question, drops filler words ("show me an example of
+...") and folds the IEC names and their spellings onto shared concepts, so
+"TON", "on-delay timer" and "delay on" produce the same terms; numbers are
+split from their units and the units folded ("5s", "5 sec", "5 seconds").
+
+Similar wording says nothing about the numbers in a question: a TON with
+PT := T#5S is not an answer to the same question about 10 seconds.
+number_key() is a hash of the numbers a question mentions; the semantic
+cache only considers matches with the same key.
+
+domain_hits() counts words that only come up in automation questions (PLC,
+SCADA, Modbus, contactor, sensor wiring such as NPN / sourcing, the units
+analog signals are scaled to ...) and code_like() spots IEC 61131-3 syntax; the
+scope gate never rejects a question that has either.
+"""
+import hashlib
+import re
+from typing import List, Tuple
+
+TOKEN = re.compile(r"[a-z_]+|\d+(?:\.\d+)?")
+
+STOPWORDS = frozenset("""
+a an and any are as at be by can code could do does example examples for from give going have help how i
+in into is it its me my need of on please program programs show simple some that the this to use using
+want way what when which will with write would you your iec 61131 61131-3 plc
+""".split())
+
+# Single words folded onto concepts; the concepts replace the word
+CONCEPTS = {
+    "ton": ("timer", "on_delay"), "tof": ("timer", "off_delay"), "tp": ("timer", "pulse"),
+    "timer": ("timer",), "timers": ("timer",), "timing": ("timer",), "timed": ("timer",),
+    "ctu": ("counter", "count_up"), "ctd": ("counter", "count_down"),
+    "ctud": ("counter", "count_up", "count_down"),
+    "counter": ("counter",), "counters": ("counter",), "count": ("counter",), "counting": ("counter",),
+    "r_trig": ("edge", "rising"), "f_trig": ("edge", "falling"),
+    "rising": ("rising",), "falling": ("falling",), "edge": ("edge",), "edges": ("edge",),
+    "sr": ("latch", "set_dominant"), "rs": ("latch", "reset_dominant"),
+    "latch": ("latch",), "latching": ("latch",), "latched": ("latch",), "interlock": ("interlock",),
+    "interlocks": ("interlock",), "interlocking": ("interlock",),
+    "ladder": ("ladder",), "ld": ("ladder",), "rung": ("ladder",), "rungs": ("ladder",),
+    "st": ("structured_text",), "scl": ("structured_text",), "fbd": ("function_block_diagram",),
+    "s": ("seconds",), "sec": ("seconds",), "secs": ("seconds",), "second": ("seconds",),
+    "seconds": ("seconds",), "ms": ("milliseconds",), "millisecond": ("milliseconds",),
+    "milliseconds": ("milliseconds",), "min": ("minutes",), "mins": ("minutes",), "minute": ("minutes",),
+    "minutes": ("minutes",), "motors": ("motor",), "pumps": ("pump",), "valves": ("valve",),
+    "conveyors": ("conveyor",), "belt": ("conveyor",), "tanks": ("tank",), "lights": ("light",),
+    "lamp": ("light",), "lamps": ("light",), "stop": ("stop",), "stopping": ("stop",),
+    "start": ("start",), "starting": ("start",), "starts": ("start",),
+}
+
+# Concepts that tell blocks of one family apart
+VARIANTS = frozenset({"on_delay", "off_delay", "pulse", "count_up", "count_down", "rising", "falling",
+                      "set_dominant", "reset_dominant"})
+
+# Two-word phrases folded onto concepts (checked before single words)
+PHRASES = {
+    ("on", "delay"): ("on_delay",), ("delay", "on"): ("on_delay",),
+    ("off", "delay"): ("off_delay",), ("delay", "off"): ("off_delay",),
+    ("pulse", "timer"): ("timer", "pulse"), ("up", "counter"): ("counter", "count_up"),
+    ("down", "counter"): ("counter", "count_down"), ("count", "up"): ("counter", "count_up"),
+    ("count", "down"): ("counter", "count_down"), ("seal", "in"): ("latch",),
+    ("self", "holding"): ("latch",), ("set", "reset"): ("latch",),
+    ("structured", "text"): ("structured_text",), ("ladder", "logic"): ("ladder",),
+    ("ladder", "diagram"): ("ladder",), ("function", "block"): ("function_block",),
+    ("traffic", "light"): ("traffic_light",), ("rising", "edge"): ("edge", "rising"),
+    ("falling", "edge"): ("edge", "falling"),
+}
+
+# Every concept the folding produces
+IEC_TERMS = frozenset(t for concepts in (*CONCEPTS.values(), *PHRASES.values()) for t in concepts)
+
+# Words that place a question in industrial automation on their own
+AUTOMATION_TERMS = frozenset("""
+plc plcs iec 61131 codesys twincat simatic rockwell allen bradley logix beckhoff scada hmi
+dcs profinet profibus modbus ethercat devicenet canopen opc rtu fieldbus ladder rung rungs coil coils ton
+tof ctu ctd ctud r_trig f_trig sfc fbd scl pid setpoint actuator actuators sensor sensors transducer
+encoder encoders servo vfd contactor contactors relay relays solenoid solenoids pneumatic hydraulic
+conveyor conveyors interlock interlocks estop proximity photoelectric dint bool var_input var_output
+var_in_out end_var function_block retain retentive sel mux date_and_time and_then or_else plcopen mc_power
+ethernet npn pnp sourcing sinking celsius fahrenheit kelvin thermocouple thermocouples rtd pt100 milliamp
+milliamps
+""".split())
+
+# Words common in automation questions but not only there (a hint, not proof)
+AUTOMATION_CONTEXT = frozenset("""
+input inputs output outputs io rack signal signals wire wiring switch switches button buttons alarm alarms
+sensor thermostat temperature pressure level flow speed robot machine machines cylinder heater fan door
+controller control controls loop analog digital instruction instructions scan cycle program fault faults
+overload breaker voltage ma current rpm setpoint station line sequence batch recipe dosing filling
+mixing heating cooling lift elevator crane compressor compressors chiller scaling scale units conversion
+""".split())
+
+# Assignments, END_ keywords, T# literals, %IX addresses, upper-case IEC identifiers (MC_MoveAbsolute)
+# and data types / standard functions written in upper case (REAL, LIMIT)
+CODE_SYNTAX = re.compile(r":=|\b[A-Z]{2,}_[A-Za-z_]+\b|\b(?:BOOL|BYTE|D?WORD|[SDUL]?INT|U[SDL]INT|L?REAL|STRING|LIMIT|SEL|MUX|MOVE)\b|(?i:\bEND_[A-Z_]+\b|\bT(?:IME)?#\d|%[IQM][XBWD]?\d)")
+
+
+def words(text: str) -> List[str]:
+    """Case-folded word and number tokens ("5s" -> "5", "s")"""
+    return TOKEN.findall(text.casefold().replace("-", " "))
+
+
+def terms(text: str) -> Tuple[List[str], List[str]]:
+    """(terms after filtering and concept folding, remaining plain words)"""
+    tokens = words(text)
+    folded: List[str] = []
+    rest: List[str] = []
+
+    def add(term: str) -> None:
+        if not folded or folded[-1] != term:
+            folded.append(term)
+
+    i = 0
+    while i < len(tokens):
+        phrase = PHRASES.get(tuple(tokens[i:i + 2]))
+        if phrase is not None:
+            for term in phrase:
+                add(term)
+            i += 2
+            continue
+        word = tokens[i]
+        i += 1
+        if word in STOPWORDS:
+            continue
+        concepts = CONCEPTS.get(word)
+        if concepts is not None:
+            for term in concepts:
+                add(term)
+        else:
+            add(word)
+            rest.append(word)
+    return folded, rest
+
+
+def number_key(text: str) -> int:
+    """Signed 64-bit hash of the set of numbers in a question (0 when there are none)"""
+    numbers = sorted({float(t) for t in terms(text)[0] if t[0].isdigit()})
+    if not numbers:
+        return 0
+    digest = hashlib.blake2b(repr(numbers).encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "little", signed=True)
+
+
+def domain_hits(text: str) -> int:
+    """Number of distinct AUTOMATION_TERMS in a question"""
+    return len(AUTOMATION_TERMS.intersection(words(text)))
+
+
+def code_like(text: str) -> bool:
+    """Whether a question contains IEC 61131-3 code or identifiers"""
+    return CODE_SYNTAX.search(text) is not None
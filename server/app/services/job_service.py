@@ -0,0 +1,466 @@
+"""
+Bulk generation jobs.
+
+A job is a batch of prompts (plus optional shared context) submitted in one
+request. Items are queued and processed by a bounded pool of worker tasks
+through GeminiService, so throughput grows with JOB_WORKERS until the LLM
+admission cap is reached. Workers run independently of the submitting
+request: a client can disconnect and poll or stream progress later.
+
+Items wait in one queue per user, and workers take them round-robin across
+users, so one user's large job does not hold up everyone else's. Each item
+is charged to its user's rate bucket (LLMAdmission.take_rate) when a worker
+takes it; a user whose bucket is empty sits out until it refills. A user has
+at most JOB_MAX_PENDING_PER_USER items queued. Results go through the same
+parser as chat turns (response_parser.py).
+
+Each item's result is persisted as soon as it finishes (in Firestore under
+generation_jobs/{job_id}/items/{index}); the job document holds the counters.
+Queued items live in the worker's memory only: at shutdown the unfinished
+items are marked failed, and at startup so are those of jobs a previous
+process left queued or running.
+"""
+import asyncio
+import contextvars
+import math
+import time
+from collections import OrderedDict, deque
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Deque, Dict, List, Optional, Tuple
+import uuid
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.models.job import JobItem, JobResponse
+from app.services.admission import AdmissionRejected, llm_admission
+from app.services.firestore_accounting import start_request_tally, set_request_user, finish_request_tally
+from app.services.storage import storage
+from app.services.gemini_service import gemini_service
+from app.services.response_parser import parse_ai_response
+
+JOB_ITEMS = metrics.counter(
+    "generation_job_items_total", "Bulk generation job items by final status", ("status",)
+)
+JOB_QUEUE_DEPTH = metrics.gauge(
+    "generation_job_queue_depth", "Job items waiting for a worker"
+)
+
+FINISHED = ("completed", "failed", "cancelled")
+ADMISSION_RETRIES = 3  # a shed item waits Retry-After and tries again this many times
+MAX_JOBS_IN_MEMORY = 200
+INTERRUPTED = "Interrupted by a server restart"
+# With several workers a job may belong to another live process; only jobs idle this long are recovered
+ORPHANED_AFTER = 3600
+
+
+def _naive(value: Optional[datetime]) -> Optional[datetime]:
+    return value.replace(tzinfo=None) if value is not None and value.tzinfo else value
+
+
+class _Job:
+    """In-memory state of a job; the source of truth while it runs"""
+
+    def __init__(self, job_id: str, user_id: str, prompts: List[str], context: Optional[str], title: Optional[str]):
+        self.job_id = job_id
+        self.user_id = user_id
+        self.title = title
+        self.context = context
+        self.items = [JobItem(index=i, prompt=p) for i, p in enumerate(prompts)]
+        self.status = "queued"
+        self.completed = 0
+        self.failed = 0
+        self.created_at = self.updated_at = datetime.utcnow()
+        self.changed = asyncio.Event()  # replaced after every change; set to wake streams
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED
+
+    def history(self) -> List[Dict[str, str]]:
+        """Conversation prefix shared by every item (identical for all, so coalescing/caching apply)"""
+        if not self.context:
+            return []
+        return [
+            {"role": "user", "content": f"Context for the following requests:\n{self.context}"},
+            {"role": "assistant", "content": "Understood. I will use this context."},
+        ]
+
+    def touch(self):
+        self.updated_at = datetime.utcnow()
+        self.changed.set()
+        self.changed = asyncio.Event()
+
+    def settle(self):
+        """Derive the job status once every item has finished"""
+        if all(item.status in FINISHED for item in self.items):
+            if any(item.status == "cancelled" for item in self.items):
+                self.status = "cancelled"
+            else:
+                self.status = "failed" if self.completed == 0 else "completed"
+
+    def interrupt(self) -> List[JobItem]:
+        """Fail the items still queued or running; returns them"""
+        interrupted = [item for item in self.items if item.status not in FINISHED]
+        for item in interrupted:
+            item.status, item.error, item.completed_at = "failed", INTERRUPTED, datetime.utcnow()
+            JOB_ITEMS.inc(status="failed")
+        self.failed += len(interrupted)
+        self.settle()
+        self.touch()
+        return interrupted
+
+    def to_document(self) -> Dict:
+        return {
+            "job_id": self.job_id,
+            "user_id": self.user_id,
+            "title": self.title,
+            "context": self.context,
+            "status": self.status,
+            "total": len(self.items),
+            "completed": self.completed,
+            "failed": self.failed,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+        }
+
+    def to_response(self, include_items: bool = True) -> JobResponse:
+        return JobResponse(
+            job_id=self.job_id,
+            title=self.title,
+            status=self.status,
+            total=len(self.items),
+            completed=self.completed,
+            failed=self.failed,
+            created_at=self.created_at,
+            updated_at=self.updated_at,
+            items=list(self.items) if include_items else None,
+        )
+
+
+class JobService:
+    _instance = None
+    _initialized = False
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+        return cls._instance
+
+    def __init__(self):
+        if not self._initialized:
+            self.workers = settings.JOB_WORKERS
+            self._jobs: "OrderedDict[str, _Job]" = OrderedDict()
+            # Queued items per user, in round-robin order, and when a rate-limited user may resume
+            self._queues: "OrderedDict[str, Deque[Tuple[_Job, int]]]" = OrderedDict()
+            self._paused: Dict[str, float] = {}
+            self._wakeup: Optional[asyncio.Event] = None
+            self._tasks: List[asyncio.Task] = []
+            self._loop = None
+            self._pending = 0
+            self._active = 0
+            self._started_at = datetime.utcnow()
+            self._initialized = True
+
+    # -- worker pool -------------------------------------------------------
+
+    def _ensure_workers(self):
+        """Start the worker pool on the running loop (restarted if the loop changed)"""
+        loop = asyncio.get_running_loop()
+        if self._loop is loop and self._tasks:
+            return
+        self._loop = loop
+        self._queues.clear()
+        self._paused.clear()
+        self._pending = 0
+        self._wakeup = asyncio.Event()
+        # A fresh context: workers must not inherit the submitting request's
+        # contextvars (Firestore op tally, user attribution)
+        self._tasks = [
+            loop.create_task(self._worker(), context=contextvars.Context())
+            for _ in range(self.workers)
+        ]
+
+    async def _next(self) -> Tuple[_Job, int]:
+        """The next item, round-robin across users, charged to its user's rate bucket"""
+        while True:
+            now = time.monotonic()
+            user_id = next((u for u in self._queues if self._paused.get(u, 0) <= now), None)
+            if user_id is None:
+                # Nothing queued, or every user with queued items is waiting for their bucket
+                resume = min((self._paused[u] for u in self._queues), default=None)
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), resume - now if resume is not None else None)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            queue = self._queues[user_id]
+            job, index = queue.popleft()
+            if queue:
+                self._queues.move_to_end(user_id)
+            else:
+                del self._queues[user_id]
+            self._pending -= 1
+            if job.items[index].status != "queued":
+                continue  # cancelled while waiting
+            wait = await llm_admission.take_rate(user_id)
+            if wait:
+                # Back to the front of the user's queue; the user sits out until the bucket refills
+                self._queues.setdefault(user_id, deque()).appendleft((job, index))
+                self._pending += 1
+                self._paused[user_id] = time.monotonic() + wait
+                continue
+            self._paused.pop(user_id, None)
+            return job, index
+
+    async def _worker(self):
+        while True:
+            job, index = await self._next()
+            JOB_QUEUE_DEPTH.set(self._pending)
+            self._active += 1
+            try:
+                await self._run_item(job, index)
+            except Exception as e:
+                print(f"Job {job.job_id} item {index} crashed: {e}")
+            finally:
+                self._active -= 1
+
+    async def _run_item(self, job: _Job, index: int):
+        item = job.items[index]
+        if item.status != "queued":
+            return  # cancelled while waiting
+        item.status = "running"
+        if job.status == "queued":
+            job.status = "running"
+        job.touch()
+
+        while True:
+            item.attempts += 1
+            try:
+                ai_response = await gemini_service.chat_async(
+                    message=item.prompt,
+                    conversation_history=job.history(),
+                    user_id=job.user_id
+                )
+                # Same cleanup and structural checks (ladder validation, code_hash) as a chat turn
+                item.response = parse_ai_response(ai_response)
+                item.status = "completed"
+                job.completed += 1
+                break
+            except AdmissionRejected as e:
+                if item.attempts <= ADMISSION_RETRIES:
+                    await asyncio.sleep(min(e.retry_after, 30))
+                    continue
+                item.status, item.error = "failed", e.detail
+            except Exception as e:
+                item.status, item.error = "failed", str(e)
+            job.failed += 1
+            break
+
+        item.completed_at = datetime.utcnow()
+        JOB_ITEMS.inc(status=item.status)
+        job.settle()
+        job.touch()
+        await self._persist(job, [item])
+
+    # -- persistence -------------------------------------------------------
+
+    async def _write(self, job: _Job, items: List[JobItem]):
+        await storage.save_job(job.to_document(), [item.model_dump() for item in items])
+
+    async def _persist(self, job: _Job, items: List[JobItem]):
+        """Write the job counters and the given finished items"""
+        if not await storage.ensure_available():
+            return
+        tally = start_request_tally()
+        set_request_user(job.user_id)
+        try:
+            await self._write(job, items)
+        except Exception as e:
+            print(f"Error persisting job {job.job_id}: {e}")
+        finally:
+            finish_request_tally(tally, "JOB", "generation_jobs")
+
+    async def recover(self) -> int:
+        """
+        Mark the unfinished items of jobs left queued or running by a previous
+        process as failed; returns the number of jobs. With several workers
+        only jobs idle for ORPHANED_AFTER seconds are taken (the others may
+        still run in another worker).
+        """
+        if not await storage.ensure_available():
+            return 0
+        idle = 0 if settings.WORKERS <= 1 else ORPHANED_AFTER
+        cutoff = self._started_at - timedelta(seconds=idle)
+        recovered = 0
+        tally = start_request_tally()
+        try:
+            for data in await storage.list_unfinished_jobs():
+                if data["job_id"] in self._jobs or _naive(data.get("updated_at") or data["created_at"]) >= cutoff:
+                    continue
+                _, item_docs = await storage.load_job(data["job_id"])
+                job = _Job(data["job_id"], data["user_id"], [], data.get("context"), data.get("title"))
+                job.items = [JobItem(**d) for d in item_docs or []]
+                job.completed, job.failed = data.get("completed", 0), data.get("failed", 0)
+                job.status, job.created_at = data["status"], data["created_at"]
+                await self._write(job, job.interrupt())
+                recovered += 1
+        except Exception as e:
+            print(f"Error recovering interrupted jobs: {e}")
+        finally:
+            finish_request_tally(tally, "JOB", "generation_jobs")
+        if recovered:
+            print(f"Marked {recovered} interrupted generation job(s) as finished")
+        return recovered
+
+    async def shutdown(self):
+        """Stop the workers and fail the items this process still had queued or running"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        for job in list(self._jobs.values()):
+            if not job.finished:
+                await self._persist(job, job.interrupt())
+
+    async def _load(self, job_id: str, user_id: str, include_items: bool) -> Optional[JobResponse]:
+        """Read a job that is no longer in memory (e.g. after a restart)"""
+        if not await storage.ensure_available():
+            return None
+        data, item_docs = await storage.load_job(job_id, include_items)
+        if not data or data.get("user_id") != user_id:
+            return None
+        items = [JobItem(**d) for d in item_docs] if item_docs is not None else None
+        return JobResponse(items=items, **{k: v for k, v in data.items() if k in JobResponse.model_fields})
+
+    # -- API ---------------------------------------------------------------
+
+    async def submit(self, user_id: str, prompts: List[str], context: Optional[str] = None,
+                     title: Optional[str] = None) -> JobResponse:
+        prompts = [p.strip() for p in prompts if p and p.strip()]
+        if not prompts:
+            raise ValueError("At least one non-empty prompt is required")
+        if len(prompts) > settings.JOB_MAX_PROMPTS:
+            raise ValueError(f"A job can contain at most {settings.JOB_MAX_PROMPTS} prompts")
+        if self._pending + len(prompts) > settings.JOB_MAX_PENDING:
+            raise AdmissionRejected(503, "Too many queued job items, please retry later", 30)
+        queued = len(self._queues.get(user_id, ()))
+        if queued + len(prompts) > settings.JOB_MAX_PENDING_PER_USER:
+            # The user's items drain at their rate limit
+            excess = queued + len(prompts) - settings.JOB_MAX_PENDING_PER_USER
+            retry_after = math.ceil(excess / llm_admission.user_rate) if llm_admission.user_rate > 0 else 30
+            raise AdmissionRejected(429, "Too many queued job items for this user, please wait for them to finish",
+                                    max(1, retry_after))
+
+        self._ensure_workers()
+        job = _Job(str(uuid.uuid4()), user_id, prompts, context, title)
+        self._jobs[job.job_id] = job
+        # Keep a bounded number of jobs in memory; finished ones can be read back from Firestore
+        while len(self._jobs) > MAX_JOBS_IN_MEMORY:
+            oldest_id, oldest = next(iter(self._jobs.items()))
+            if not oldest.finished:
+                break
+            del self._jobs[oldest_id]
+
+        if await storage.ensure_available():
+            await self._write(job, job.items)
+        self._queues.setdefault(user_id, deque()).extend((job, index) for index in range(len(job.items)))
+        self._pending += len(job.items)
+        JOB_QUEUE_DEPTH.set(self._pending)
+        self._wakeup.set()
+        return job.to_response(include_items=False)
+
+    def _owned(self, job_id: str, user_id: str) -> Optional[_Job]:
+        job = self._jobs.get(job_id)
+        return job if job is not None and job.user_id == user_id else None
+
+    async def get(self, job_id: str, user_id: str, include_items: bool = True) -> Optional[JobResponse]:
+        job = self._owned(job_id, user_id)
+        if job is not None:
+            return job.to_response(include_items)
+        return await self._load(job_id, user_id, include_items)
+
+    async def list_jobs(self, user_id: str, limit: int = 20) -> List[JobResponse]:
+        jobs = {j.job_id: j.to_response(False) for j in self._jobs.values() if j.user_id == user_id}
+        if await storage.ensure_available():
+            for data in await storage.list_jobs(user_id, limit):
+                if data.get("job_id") not in jobs:
+                    jobs[data["job_id"]] = JobResponse(
+                        **{k: v for k, v in data.items() if k in JobResponse.model_fields}
+                    )
+        return sorted(jobs.values(), key=lambda j: j.created_at, reverse=True)[:limit]
+
+    async def cancel(self, job_id: str, user_id: str) -> Optional[JobResponse]:
+        """Cancel the items still queued; running items finish normally"""
+        job = self._owned(job_id, user_id)
+        if job is None:
+            return None
+        if not job.finished:
+            cancelled = [item for item in job.items if item.status == "queued"]
+            for item in cancelled:
+                item.status = "cancelled"
+                item.completed_at = datetime.utcnow()
+                JOB_ITEMS.inc(status="cancelled")
+            # Drop them from the user's queue so they stop counting against the caps
+            queue = self._queues.get(user_id)
+            if queue:
+                kept = deque(entry for entry in queue if entry[0] is not job)
+                self._pending -= len(queue) - len(kept)
+                if kept:
+                    self._queues[user_id] = kept
+                else:
+                    del self._queues[user_id]
+                    self._paused.pop(user_id, None)
+                JOB_QUEUE_DEPTH.set(self._pending)
+            job.settle()
+            job.touch()
+            if await storage.ensure_available():
+                await self._write(job, cancelled)
+        return job.to_response(include_items=False)
+
+    async def stream(self, job_id: str, user_id: str) -> Optional[AsyncIterator[Dict]]:
+        """
+        Progress events for a job: one "item" event per finished item (those
+        already done first), a "progress" event on every change and a final
+        "job" event once it has finished
+        """
+        job = self._owned(job_id, user_id)
+        if job is None:
+            snapshot = await self.get(job_id, user_id)
+            if snapshot is None:
+                return None
+
+            async def replay():
+                for item in snapshot.items or []:
+                    if item.status in FINISHED:
+                        yield {"event": "item", **item.model_dump(mode="json")}
+                yield {"event": "job", **snapshot.model_dump(mode="json", exclude={"items"})}
+            return replay()
+
+        async def events():
+            sent = set()
+            while True:
+                changed = job.changed
+                for item in job.items:
+                    if item.status in FINISHED and item.index not in sent:
+                        sent.add(item.index)
+                        yield {"event": "item", **item.model_dump(mode="json")}
+                if job.finished and len(sent) == len(job.items):
+                    yield {"event": "job", **job.to_response(False).model_dump(mode="json", exclude={"items"})}
+                    return
+                yield {"event": "progress", "status": job.status, "completed": job.completed,
+                       "failed": job.failed, "total": len(job.items)}
+                await changed.wait()
+        return events()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "workers": self.workers,
+            "queued_items": self._pending,
+            "queued_users": len(self._queues),
+            "rate_limited_users": sum(1 for u in self._queues if self._paused.get(u, 0) > time.monotonic()),
+            "active_items": self._active,
+            "jobs_in_memory": len(self._jobs),
+        }
+
+# Create singleton instance
+job_service = JobService()
@@ -0,0 +1,412 @@
+import re
+from dataclasses import dataclass, field
+from typing import List, Dict, Optional, Any
+
+# Element tokens from the ladder conventions in the Gemini system prompt.
+# Order matters: longer / more specific tokens first.
+_TOKEN_RE = re.compile(
+    r"(?P<nc>\]/ ?\[)"
+    r"|(?P<edge>\][PN]\[)"
+    r"|(?P<no>\] \[)"
+    r"|(?P<coil>\((?: |S|R|/|P|N)?\))"
+    r"|(?P<fb>\[[A-Za-z_][A-Za-z0-9_]*\])"
+    r"|(?P<wire>-+)"
+    r"|(?P<junction>\+)"
+    r"|(?P<gap> +)"
+)
+_ELEMENT_KINDS = ("no", "nc", "edge", "coil", "fb")
+_LABEL_RE = re.compile(r"\S+")
+_FLOATING_RE = re.compile(r"\] ?/? ?\[|\((?: |S|R)?\)")
+
+# Canonical spelling used when re-rendering
+_CANONICAL = {
+    "no": "] [",
+    "nc": "]/[",
+}
+
+
+@dataclass
+class LadderElement:
+    kind: str      # no | nc | edge | coil | fb
+    symbol: str    # canonical token, e.g. "] [", "(S)", "[TON]"
+    col: int       # start column in the source line
+    end: int       # end column (exclusive)
+    label: Optional[str] = None
+
+    @property
+    def is_output(self) -> bool:
+        return self.kind == "coil"
+
+
+@dataclass
+class LadderBranch:
+    """A parallel path joining the main rung between two gaps"""
+    start_gap: int  # 0 = left rail, n = after the n-th main element
+    end_gap: int    # len(elements) = right rail
+    elements: List[LadderElement] = field(default_factory=list)
+    line: int = 0
+
+
+@dataclass
+class LadderRung:
+    line: int
+    elements: List[LadderElement] = field(default_factory=list)
+    branches: List[LadderBranch] = field(default_factory=list)
+    annotations: List[str] = field(default_factory=list)
+
+    def to_graph(self) -> Dict[str, Any]:
+        """Return the rung as nodes and directed edges from left to right rail"""
+        # Gap g sits between nodes[g] (L or e{g-1}) and nodes[g + 1]
+        nodes = ["L"] + [f"e{i}" for i in range(len(self.elements))] + ["R"]
+        edges = [(nodes[i], nodes[i + 1]) for i in range(len(nodes) - 1)]
+        for b, branch in enumerate(self.branches):
+            prev = nodes[branch.start_gap]
+            for j in range(len(branch.elements)):
+                node = f"b{b}.{j}"
+                nodes.append(node)
+                edges.append((prev, node))
+                prev = node
+            edges.append((prev, nodes[branch.end_gap + 1]))
+        labels = {f"e{i}": el.symbol for i, el in enumerate(self.elements)}
+        for b, branch in enumerate(self.branches):
+            labels.update({f"b{b}.{j}": el.symbol for j, el in enumerate(branch.elements)})
+        return {"nodes": nodes, "edges": edges, "symbols": labels}
+
+
+@dataclass
+class LadderReport:
+    rungs: List[LadderRung] = field(default_factory=list)
+    errors: List[str] = field(default_factory=list)
+    warnings: List[str] = field(default_factory=list)
+
+    @property
+    def is_valid(self) -> bool:
+        return bool(self.rungs) and not self.errors
+
+
+def _split_lines(content: str) -> List[str]:
+    # The model sometimes leaves the \n escapes from the prompt examples unexpanded
+    if "\n" not in content and "\\n" in content:
+        content = content.replace("\\n", "\n")
+    return [line.rstrip() for line in content.replace("\r\n", "\n").split("\n")]
+
+
+def _split_rails(line: str):
+    """Return (left_col, body, right_col) for a line; rail columns are None when missing"""
+    stripped = line.lstrip()
+    if not stripped:
+        return None, "", None
+    left = len(line) - len(stripped) if stripped[0] == "|" else None
+    start = left + 1 if left is not None else len(line) - len(stripped)
+    right = len(line) - 1 if len(line) - 1 > start - 1 and line.endswith("|") else None
+    end = right if right is not None else len(line)
+    return left, line[start:end], right
+
+
+def _tokenize(body: str, offset: int):
+    """Split a rung body into tokens; returns (tokens, bad_columns)"""
+    tokens = []
+    bad = []
+    pos = 0
+    length = len(body)
+    while pos < length:
+        m = _TOKEN_RE.match(body, pos)
+        if m is None:
+            bad.append(offset + pos)
+            pos += 1
+            continue
+        kind = m.lastgroup
+        tokens.append((kind, m.group(), offset + pos, offset + m.end()))
+        pos = m.end()
+    return tokens, bad
+
+
+def _classify(body: str) -> str:
+    """Classify a line body as rung, branch, connector or label"""
+    head = body.lstrip(" ")
+    if not head:
+        return "blank"
+    if body[0] in "-+" and "-" in body:
+        # Wire leaving the left rail; a trailing junction makes it a branch
+        return "branch" if body.rstrip(" ").endswith("+") else "rung"
+    if head[0] == "+" and "-" in head:
+        return "branch"
+    if not head.strip("| +"):
+        return "connector"
+    if _FLOATING_RE.search(head) and "--" in head:
+        return "floating"
+    return "label"
+
+
+def _build_elements(tokens, line_no: int, report: LadderReport, where: str) -> List[LadderElement]:
+    elements = []
+    for i, (kind, text, start, end) in enumerate(tokens):
+        if kind in _ELEMENT_KINDS:
+            symbol = _CANONICAL.get(kind, text.upper() if kind == "fb" else text)
+            if kind == "coil" and symbol == "()":
+                symbol = "( )"
+            elements.append(LadderElement(kind=kind, symbol=symbol, col=start, end=end))
+        elif kind == "gap":
+            # Gaps are fine at the end (before the right rail is padded), not between elements
+            if any(t[0] in _ELEMENT_KINDS or t[0] == "junction" for t in tokens[i + 1:]) and i > 0:
+                report.errors.append(f"{where} (line {line_no}): open circuit at column {start}")
+    return elements
+
+
+def _attach_labels(elements: List[LadderElement], label_line: str):
+    for m in _LABEL_RE.finditer(label_line):
+        word = m.group()
+        if word == "|":
+            continue
+        center = (m.start() + m.end() - 1) / 2
+        best = None
+        for el in elements:
+            el_center = (el.col + el.end - 1) / 2
+            distance = abs(el_center - center)
+            if distance <= max(len(word), el.end - el.col) and (best is None or distance < best[0]):
+                best = (distance, el)
+        if best and best[1].label is None:
+            best[1].label = word
+
+
+def _gap_for_column(elements: List[LadderElement], col: int) -> int:
+    return sum(1 for el in elements if el.end <= col)
+
+
+def parse_ladder(content: str) -> LadderReport:
+    """Parse an ASCII ladder diagram into rungs and check its structure"""
+    report = LadderReport()
+    lines = _split_lines(content or "")
+    rails_left = set()
+    rails_right = set()
+    current: Optional[LadderRung] = None
+    last_wired: Optional[List[LadderElement]] = None
+    rung_line_idx = -1
+
+    for idx, line in enumerate(lines):
+        line_no = idx + 1
+        left, body, right = _split_rails(line)
+        kind = _classify(body) if (left is not None or body) else "blank"
+
+        if kind in ("rung", "branch", "floating"):
+            if left is None:
+                report.errors.append(f"Line {line_no}: rung is not connected to the left power rail")
+            else:
+                rails_left.add(left)
+            if right is None:
+                report.errors.append(f"Line {line_no}: rung is not closed on the right power rail")
+            else:
+                rails_right.add(right)
+        elif left is not None and right is not None:
+            rails_left.add(left)
+            rails_right.add(right)
+
+        if kind == "floating":
+            report.errors.append(f"Line {line_no}: elements are not wired to the left rail")
+            continue
+
+        offset = (left + 1) if left is not None else len(line) - len(line.lstrip())
+        if kind == "rung":
+            tokens, bad = _tokenize(body, offset)
+            if bad:
+                report.errors.append(
+                    f"Rung {len(report.rungs) + 1} (line {line_no}): malformed element at column {bad[0]}"
+                )
+            current = LadderRung(line=line_no)
+            current.elements = _build_elements(tokens, line_no, report, f"Rung {len(report.rungs) + 1}")
+            report.rungs.append(current)
+            last_wired = current.elements
+            rung_line_idx = idx
+            continue
+
+        if kind == "branch":
+            if current is None:
+                report.errors.append(f"Line {line_no}: branch without a preceding rung")
+                continue
+            lead = len(body) - len(body.lstrip(" "))
+            tokens, bad = _tokenize(body[lead:], offset + lead)
+            if bad:
+                report.errors.append(f"Branch (line {line_no}): malformed element at column {bad[0]}")
+            junctions = [t[2] for t in tokens if t[0] == "junction"]
+            starts_at_rail = lead == 0 and body[0] == "-"
+            ends_at_rail = right is not None and not body.rstrip(" ").endswith("+")
+            for col in junctions:
+                above = [lines[i][col] if col < len(lines[i]) else " " for i in range(rung_line_idx, idx)]
+                if not above or above[0] != "+" or any(ch not in "|+" for ch in above[1:]):
+                    report.errors.append(f"Branch (line {line_no}): junction at column {col} is not connected to the rung")
+            start_col = junctions[0] if junctions and not starts_at_rail else -1
+            end_col = junctions[-1] if junctions and not ends_at_rail else None
+            branch = LadderBranch(
+                start_gap=0 if start_col < 0 else _gap_for_column(current.elements, start_col),
+                end_gap=len(current.elements) if end_col is None else _gap_for_column(current.elements, end_col),
+                line=line_no,
+            )
+            inner = [t for t in tokens if t[0] != "junction"]
+            branch.elements = _build_elements(inner, line_no, report, "Branch")
+            if not branch.elements:
+                report.warnings.append(f"Branch (line {line_no}) is a plain wire (shorts the rung)")
+            if branch.end_gap < branch.start_gap:
+                report.errors.append(f"Branch (line {line_no}) joins the rung before it leaves it")
+            current.branches.append(branch)
+            last_wired = branch.elements
+            continue
+
+        if kind == "label" and current is not None:
+            text = body.strip()
+            if ":=" in text or "." in text.split(" ")[0]:
+                current.annotations.append(text)
+            elif last_wired is not None:
+                _attach_labels(last_wired, " " * offset + body)
+                last_wired = None
+
+    for n, rung in enumerate(report.rungs, start=1):
+        _check_rung(rung, n, report)
+
+    if len(rails_left) > 1:
+        report.warnings.append("Left power rail is not aligned across lines")
+    if len(rails_right) > 1:
+        report.warnings.append("Right power rail is not aligned across lines")
+    if not report.rungs:
+        report.warnings.append("No ladder rungs recognised")
+    return report
+
+
+def _check_rung(rung: LadderRung, n: int, report: LadderReport):
+    paths = [rung.elements] + [b.elements for b in rung.branches if b.end_gap == len(rung.elements)]
+    if not rung.elements:
+        report.warnings.append(f"Rung {n} has no elements")
+        return
+    if not any(el.is_output or el.kind == "fb" for path in paths for el in path):
+        report.errors.append(f"Rung {n} has no output coil or function block")
+    for path in [rung.elements] + [b.elements for b in rung.branches]:
+        seen_coil = False
+        for el in path:
+            if el.is_output:
+                seen_coil = True
+            elif seen_coil and el.kind in ("no", "nc", "edge"):
+                report.errors.append(f"Rung {n}: contact {el.symbol} placed after a coil")
+                break
+    if rung.elements[-1].kind in ("no", "nc", "edge"):
+        report.errors.append(f"Rung {n} ends in a contact instead of an output")
+    for el in rung.elements:
+        if el.label is None and el.kind != "fb":
+            report.warnings.append(f"Rung {n}: {el.symbol} has no label")
+
+
+def render_ladder(report: LadderReport) -> str:
+    """Re-render parsed rungs with canonical symbols, aligned rails and centred labels"""
+    blocks = [_render_rung(rung) for rung in report.rungs]
+    width = max((len(row) for block in blocks for row in block), default=0)
+    out = []
+    for i, block in enumerate(blocks):
+        if i:
+            out.append("|" + " " * width + "|")
+        for text in block:
+            fill = "-" if text.endswith("-") else " "
+            out.append("|" + text.ljust(width, fill) + "|")
+    return "\n".join(out)
+
+
+def _cells(elements: List[LadderElement]) -> List[int]:
+    return [max(len(el.symbol), len(el.label or "")) + 2 for el in elements]
+
+
+def _render_rung(rung: LadderRung) -> List[str]:
+    widths = _cells(rung.elements)
+    # Make every branch fit between its junctions
+    for branch in rung.branches:
+        need = sum(_cells(branch.elements)) + 3 * len(branch.elements) + 2
+        lo, hi = branch.start_gap, branch.end_gap
+        have = sum(widths[lo:hi]) + 3 * max(hi - lo - 1, 0)
+        if hi > lo and need > have:
+            widths[hi - 1] += need - have
+
+    # Column of each gap connector ("---" before element i, i == n is the trailing wire)
+    gap_cols = []
+    col = 0
+    for w in widths:
+        gap_cols.append(col)
+        col += 3 + w
+    gap_cols.append(col)
+
+    wire = ["-"] * (col + 3)
+    labels = [" "] * (col + 3)
+    for el, w, start in zip(rung.elements, widths, gap_cols):
+        wire[start + 3:start + 3 + w] = el.symbol.center(w, "-")
+        if el.label:
+            labels[start + 3:start + 3 + w] = el.label.center(w)
+    rows = [wire, labels]
+
+    for branch in rung.branches:
+        from_rail = branch.start_gap == 0
+        to_rail = branch.end_gap == len(rung.elements)
+        start = 0 if from_rail else gap_cols[branch.start_gap] + 1
+        end = None if to_rail else gap_cols[branch.end_gap] + 1
+        if not from_rail:
+            wire[start] = "+"
+            for row in rows[1:]:
+                row[start] = "|"
+        if end is not None:
+            wire[end] = "+"
+            for row in rows[1:]:
+                row[end] = "|"
+        b_wire = [" "] * (col + 3)
+        b_labels = [" "] * (col + 3)
+        text = "" if from_rail else "+"
+        label_text = "" if from_rail else " "
+        for el, w in zip(branch.elements, _cells(branch.elements)):
+            text += "---" + el.symbol.center(w, "-")
+            label_text += "   " + (el.label or "").center(w)
+        span_end = end if end is not None else col + 2
+        text = text.ljust(span_end - start, "-")
+        b_wire[start:start + len(text)] = text
+        b_labels[start:start + len(label_text)] = label_text
+        if end is not None:
+            b_wire[end] = "+"
+        else:
+            b_wire[start + len(text):] = "-" * (len(b_wire) - start - len(text))
+        rows.extend([b_wire, b_labels])
+
+    # Even rows are wires, odd rows are labels
+    rendered = ["".join(row).rstrip() if i % 2 else "".join(row) for i, row in enumerate(rows)]
+    rendered.extend(rung.annotations)
+    return [r for i, r in enumerate(rendered) if i == 0 or r.strip()]
+
+
+def validate_ladder(content: str, validation: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Merge a structural check of a ladder diagram into the model-provided validation block.
+    Structural errors always win; otherwise the model's own verdict is kept.
+    """
+    report = parse_ladder(content)
+    result = dict(validation or {})
+    warnings = list(result.get("warnings") or [])
+    for warning in report.warnings:
+        if warning not in warnings:
+            warnings.append(warning)
+
+    if report.errors:
+        result["status"] = "invalid"
+        result["executable"] = False
+        result["reason"] = "Ladder structure check failed: " + "; ".join(report.errors[:3])
+        if len(report.errors) > 3:
+            result["reason"] += f" (+{len(report.errors) - 3} more)"
+    elif not report.rungs:
+        result.setdefault("status", "unknown")
+        result.setdefault("executable", False)
+    else:
+        if result.get("status") in (None, "unknown"):
+            result["status"] = "valid"
+        result.setdefault("executable", True)
+        result.setdefault("reason", f"{len(report.rungs)} rung(s) structurally valid")
+
+    result["warnings"] = warnings or None
+    return result
+
+
+def normalize_ladder(content: str) -> str:
+    """Re-render a structurally valid diagram; anything else is returned unchanged"""
+    report = parse_ladder(content)
+    if not report.is_valid:
+        return content
+    return render_ladder(report)
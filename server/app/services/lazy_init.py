@@ -0,0 +1,60 @@
+"""
+Deferred, thread-safe initialization for services that wrap a heavy SDK.
+
+The service singletons are cheap to construct; the SDK import and client
+setup happen in initialize(), which the app lifespan runs in the background
+(app/core/lifespan.py). Code paths that need the client await
+ensure_initialized() first, so a request that arrives during startup waits
+for the one dependency it uses instead of for all of them.
+"""
+import threading
+import time
+from typing import Any, Dict, Optional
+from starlette.concurrency import run_in_threadpool
+
+
+class LazyInit:
+    def _setup_lazy_init(self):
+        self._init_lock = threading.Lock()
+        self.init_done = False
+        self.init_error: Optional[str] = None
+        self.init_ms: Optional[float] = None
+
+    def _initialize(self):
+        """Import the SDK and create its client; raise on failure"""
+        raise NotImplementedError
+
+    def initialize(self):
+        """Run _initialize() once; concurrent callers wait for the first"""
+        if self.init_done:
+            return
+        with self._init_lock:
+            if self.init_done:
+                return
+            started = time.perf_counter()
+            try:
+                self._initialize()
+            except Exception as e:
+                self.init_error = str(e)
+            finally:
+                self.init_ms = 1000 * (time.perf_counter() - started)
+                self.init_done = True
+
+    async def ensure_initialized(self):
+        if not self.init_done:
+            await run_in_threadpool(self.initialize)
+
+    async def ensure_available(self) -> bool:
+        """is_available(), once initialization has finished"""
+        await self.ensure_initialized()
+        return self.is_available()
+
+    def readiness(self) -> Dict[str, Any]:
+        status = "starting" if not self.init_done else "ready" if self.is_available() else \
+            "failed" if self.init_error else "unavailable"
+        report: Dict[str, Any] = {"status": status}
+        if self.init_ms is not None:
+            report["init_ms"] = round(self.init_ms, 1)
+        if self.init_error:
+            report["error"] = self.init_error
+        return report
@@ -0,0 +1,414 @@
+"""
+Near-duplicate detection for knowledge library entries.
+
+Each entry gets a MinHash signature over word 3-shingles of its normalized
+question and the normalized code parts of its response (comments, case and
+whitespace removed, so re-indented or re-commented code still matches;
+Structured Text goes through st_formatter.canonical_tokens, so literal
+spellings like T#5000ms / T#5s match too). An
+LSH index splits signatures into bands: two entries share a bucket in some
+band with high probability when their Jaccard similarity is high, so a save
+checks a handful of candidates instead of the whole library. Candidates are
+confirmed by the estimated similarity (LIBRARY_DEDUP_THRESHOLD).
+
+Signatures are stored with the entry (`minhash`, base64) so the index is
+rebuilt from a projection instead of recomputing every entry; they carry a
+version prefix, and signatures from an older normalization are recomputed.
+Only canonical entries (not flagged as a duplicate) are indexed. The index
+is built in the background at startup and after an import; until it is
+ready a save is not checked. Entries without a current signature are left
+out of it until the admin pass (dedupe_existing) computes theirs, so a save
+never reads more than its own entry.
+
+The background pass (dedupe_existing) also stores the response_preview of
+entries saved before previews existed: it reads their full response for the
+signature anyway, and the library list stays a read-only projection.
+"""
+import asyncio
+import base64
+import contextvars
+import hashlib
+import json
+import random
+import re
+from array import array
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Set, Tuple
+from app.core.config import settings
+from app.core.metrics import metrics, timed
+from app.services.st_formatter import canonical_tokens
+from app.services.storage import storage
+
+LIBRARY_DUPLICATES = metrics.counter(
+    "library_duplicates_total", "Near-duplicate library entries detected", ("source", "action")
+)
+
+NUM_PERM = 64
+BANDS = 16                      # 16 bands of 4 rows: ~50% similar pairs become candidates
+ROWS = NUM_PERM // BANDS
+SHINGLE_SIZE = 3
+MAX_SHINGLES = 2000             # bound the work for very long responses
+SIGNATURE_VERSION = "2"         # bump when the normalization changes
+_PRIME = (1 << 61) - 1
+_MASK = 0xFFFFFFFF
+_rng = random.Random(61131)     # fixed seed: signatures must be stable across processes
+_PERMS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(NUM_PERM)]
+
+PREVIEW_CHARS = 200
+
+_COMMENT = re.compile(r"\(\*.*?\*\)|//[^\n]*", re.S)
+_TOKEN = re.compile(r"\w+|[^\w\s]")
+
+
+def response_preview(response: str, limit: int = PREVIEW_CHARS) -> str:
+    """Plain-text excerpt of a response (text parts of a structured JSON response)"""
+    text = response
+    try:
+        parts = json.loads(response)
+        if isinstance(parts, list):
+            text = " ".join(
+                p.get("content", "") for p in parts
+                if isinstance(p, dict) and p.get("type", "text") == "text"
+            ) or " ".join(p.get("content", "") for p in parts if isinstance(p, dict))
+    except (ValueError, TypeError, AttributeError):
+        pass
+    text = " ".join(str(text).split())
+    return text if len(text) <= limit else text[:limit].rstrip() + "…"
+
+
+def _plain_tokens(text: str) -> List[str]:
+    return _TOKEN.findall(_COMMENT.sub(" ", text).casefold())
+
+
+def _response_tokens(response: str) -> List[str]:
+    """Normalized tokens of the code/diagram parts of a structured response; the whole text otherwise"""
+    try:
+        parts = json.loads(response)
+    except (ValueError, TypeError):
+        return _plain_tokens(response)
+    if not isinstance(parts, list):
+        return _plain_tokens(response)
+    parts = [p for p in parts if isinstance(p, dict)]
+    code = [p for p in parts if p.get("type", "text") != "text"]
+    if not code:
+        return _plain_tokens(" ".join(str(p.get("content", "")) for p in parts))
+    tokens = []
+    for part in code:
+        content = str(part.get("content", ""))
+        tokens.extend(canonical_tokens(content) if part.get("type") == "plc-code" else _plain_tokens(content))
+    return tokens
+
+
+def shingles(question: str, response: str) -> Set[int]:
+    """Hashed word 3-shingles of the normalized question and code"""
+    tokens = _TOKEN.findall(question.casefold())
+    tokens.append("\x00")  # keep question and code shingles apart
+    tokens.extend(_response_tokens(response))
+    result = set()
+    for i in range(max(1, len(tokens) - SHINGLE_SIZE + 1)):
+        digest = hashlib.blake2b(" ".join(tokens[i:i + SHINGLE_SIZE]).encode(), digest_size=8).digest()
+        result.add(int.from_bytes(digest, "little"))
+        if len(result) >= MAX_SHINGLES:
+            break
+    return result
+
+
+def minhash(values: Set[int]) -> array:
+    """NUM_PERM minimum hashes (32-bit) of a shingle set"""
+    if not values:
+        return array("I", [_MASK] * NUM_PERM)
+    values = list(values)
+    return array("I", [min([(a * x + b) % _PRIME for x in values]) & _MASK for a, b in _PERMS])
+
+
+def signature(question: str, response: str) -> array:
+    return minhash(shingles(question, response))
+
+
+def encode_signature(sig: array) -> str:
+    return f"{SIGNATURE_VERSION}:" + base64.b64encode(sig.tobytes()).decode("ascii")
+
+
+def decode_signature(text: Optional[str]) -> Optional[array]:
+    """None for a missing, malformed or outdated signature"""
+    version, _, encoded = (text or "").partition(":")
+    if version != SIGNATURE_VERSION or not encoded:
+        return None
+    try:
+        sig = array("I")
+        sig.frombytes(base64.b64decode(encoded))
+    except (ValueError, TypeError):
+        return None
+    return sig if len(sig) == NUM_PERM else None
+
+
+def similarity(a: array, b: array) -> float:
+    """Estimated Jaccard similarity of two signatures"""
+    return sum(1 for x, y in zip(a, b) if x == y) / NUM_PERM
+
+
+def _band_keys(sig: array) -> List[Tuple[int, bytes]]:
+    raw = sig.tobytes()
+    width = ROWS * sig.itemsize
+    return [(band, raw[band * width:(band + 1) * width]) for band in range(BANDS)]
+
+
+class LSHIndex:
+    """Band buckets over MinHash signatures"""
+
+    def __init__(self):
+        self._buckets: Dict[Tuple[int, bytes], List[str]] = defaultdict(list)
+        self._signatures: Dict[str, array] = {}
+
+    def __len__(self) -> int:
+        return len(self._signatures)
+
+    def add(self, entry_id: str, sig: array):
+        if entry_id in self._signatures:
+            self.remove(entry_id)
+        self._signatures[entry_id] = sig
+        for key in _band_keys(sig):
+            self._buckets[key].append(entry_id)
+
+    def remove(self, entry_id: str):
+        sig = self._signatures.pop(entry_id, None)
+        if sig is None:
+            return
+        for key in _band_keys(sig):
+            bucket = self._buckets.get(key)
+            if bucket and entry_id in bucket:
+                bucket.remove(entry_id)
+                if not bucket:
+                    del self._buckets[key]
+
+    def query(self, sig: array, threshold: float) -> Optional[Tuple[str, float]]:
+        """Most similar indexed entry at or above the threshold"""
+        best, best_score = None, threshold
+        seen = set()
+        for key in _band_keys(sig):
+            for candidate in self._buckets.get(key, ()):
+                if candidate in seen:
+                    continue
+                seen.add(candidate)
+                score = similarity(sig, self._signatures[candidate])
+                if score >= best_score:
+                    best, best_score = candidate, score
+        return (best, best_score) if best is not None else None
+
+
+class LibraryDeduplicator:
+    _instance = None
+    _initialized = False
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+        return cls._instance
+
+    def __init__(self):
+        if not self._initialized:
+            self.mode = settings.LIBRARY_DEDUP_MODE
+            self.threshold = settings.LIBRARY_DEDUP_THRESHOLD
+            self._index: Optional[LSHIndex] = None
+            # Canonical entries saved while the index is rebuilt, added to the new one
+            self._added: Optional[Dict[str, array]] = None
+            self.unsigned = 0
+            self.last_pass: Dict[str, Any] = {"status": "never_run"}
+            self._pass_task: Optional[asyncio.Task] = None
+            self._build_task: Optional[asyncio.Task] = None
+            self._initialized = True
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode in ("flag", "merge")
+
+    def _running(self, task: Optional[asyncio.Task]) -> bool:
+        return task is not None and not task.done()
+
+    def reset(self):
+        """Drop the index (e.g. after a bulk import) and rebuild it in the background"""
+        if self._running(self._build_task):
+            self._build_task.cancel()
+        self._index = None
+        self.start_index_build()
+
+    async def _signatures(self, page_size: int = 500):
+        """
+        (entry, signature) for every entry; computes and stores missing
+        signatures and response previews
+        """
+        fields = ("entry_id", "created_at", "minhash", "tags", "duplicate_of", "response_preview")
+        async for entry in storage.iter_library_entries(page_size, fields=fields):
+            sig = decode_signature(entry.get("minhash"))
+            if sig is None or entry.get("response_preview") is None:
+                full = await storage.get_library_entry(entry["entry_id"])
+                if full is None:
+                    continue
+                update = {}
+                if sig is None:
+                    sig = signature(full["user_question"], full["assistant_response"])
+                    update["minhash"] = encode_signature(sig)
+                if entry.get("response_preview") is None:
+                    update["response_preview"] = response_preview(full["assistant_response"])
+                await storage.update_library_entries({entry["entry_id"]: update})
+            yield entry, sig
+
+    async def refresh_index(self, page_size: int = 500) -> LSHIndex:
+        """
+        Index the canonical entries by their stored signatures (one projected
+        scan, no writes); entries without a current one are counted in
+        `unsigned` and skipped
+        """
+        added = self._added = {}
+        try:
+            index, unsigned = LSHIndex(), 0
+            fields = ("entry_id", "minhash", "duplicate_of")
+            async for entry in storage.iter_library_entries(page_size, fields=fields):
+                if entry.get("duplicate_of"):
+                    continue
+                sig = decode_signature(entry.get("minhash"))
+                if sig is None:
+                    unsigned += 1
+                    continue
+                index.add(entry["entry_id"], sig)
+            for entry_id, sig in added.items():
+                index.add(entry_id, sig)
+        finally:
+            if self._added is added:
+                self._added = None
+        self._index, self.unsigned = index, unsigned
+        print(f"Library dedup index built with {len(index)} entries ({unsigned} without a signature)")
+        return index
+
+    def start_index_build(self):
+        """Run refresh_index in the background; at most one build, and none during a pass"""
+        if not self.enabled or self._running(self._build_task) or self._running(self._pass_task):
+            return
+
+        async def run():
+            try:
+                if await storage.ensure_available():
+                    await self.refresh_index()
+            except Exception as e:
+                print(f"Library dedup index build failed: {e}")
+
+        # A fresh context: the scan's reads are not charged to the request that triggered it
+        self._build_task = asyncio.get_running_loop().create_task(run(), context=contextvars.Context())
+
+    @timed("library_dedup.check")
+    async def check(self, entry_id: str, question: str, response: str) -> Tuple[str, Optional[str]]:
+        """
+        (encoded signature, id of the canonical entry this one duplicates or
+        None; always None while the index is not built). A new canonical
+        entry is indexed right away, so a concurrent save of the same answer
+        sees it; call forget() if the write fails.
+        """
+        sig = signature(question, response)
+        index = self._index
+        if index is None:
+            self.start_index_build()
+        match = index.query(sig, self.threshold) if index is not None else None
+        if match is None:
+            if index is not None:
+                index.add(entry_id, sig)
+            if self._added is not None:
+                self._added[entry_id] = sig
+        return encode_signature(sig), match[0] if match else None
+
+    def forget(self, entry_id: str):
+        if self._index is not None:
+            self._index.remove(entry_id)
+        if self._added is not None:
+            self._added.pop(entry_id, None)
+
+    # -- background pass ---------------------------------------------------
+
+    async def dedupe_existing(self, mode: str) -> Dict[str, Any]:
+        """
+        Cluster every entry, oldest first: an entry similar to an earlier
+        canonical one is flagged (duplicate_of) or, in merge mode, deleted
+        with its tags added to the canonical entry
+        """
+        entries = []
+        added = self._added = {}
+        try:
+            async for entry, sig in self._signatures():
+                entries.append((entry.get("created_at"), entry["entry_id"], sig,
+                                entry.get("tags") or [], entry.get("duplicate_of")))
+        except BaseException:
+            if self._added is added:
+                self._added = None
+            raise
+        entries.sort(key=lambda e: (e[0] is None, e[0] or 0, e[1]))
+
+        index = LSHIndex()
+        canonical_of: Dict[str, str] = {}
+        tags: Dict[str, List[str]] = {}
+        flags: Dict[str, Dict[str, Any]] = {}
+        for created_at, entry_id, sig, entry_tags, flagged in entries:
+            match = index.query(sig, self.threshold)
+            if match is None:
+                index.add(entry_id, sig)
+                tags[entry_id] = list(entry_tags)
+                if flagged:
+                    flags[entry_id] = {"duplicate_of": None}
+                continue
+            canonical_of[entry_id] = match[0]
+            if mode == "merge":
+                tags[match[0]].extend(t for t in entry_tags if t not in tags[match[0]])
+            elif flagged != match[0]:
+                flags[entry_id] = {"duplicate_of": match[0]}
+
+        if mode == "merge":
+            updates = {c: {"tags": tags[c]} for c in set(canonical_of.values())}
+            updates.update({k: v for k, v in flags.items() if k not in canonical_of})
+            if updates:
+                await storage.update_library_entries(updates)
+            if canonical_of:
+                await storage.delete_library_entries(list(canonical_of))
+        elif flags:
+            await storage.update_library_entries(flags)
+
+        # Entries saved during the pass are canonical unless it already holds a match
+        for entry_id, sig in added.items():
+            if index.query(sig, self.threshold) is None:
+                index.add(entry_id, sig)
+        if self._added is added:
+            self._added = None
+        self._index, self.unsigned = index, 0
+        action = "merged" if mode == "merge" else "flagged"
+        LIBRARY_DUPLICATES.inc(len(canonical_of), source="pass", action=action)
+        return {"scanned": len(entries), "duplicates": len(canonical_of), "canonical": len(index), "mode": mode}
+
+    def start_pass(self, mode: str) -> Dict[str, Any]:
+        """Run dedupe_existing in the background; at most one pass at a time"""
+        if self._running(self._pass_task):
+            return self.last_pass
+        # The pass builds a complete index of its own
+        if self._running(self._build_task):
+            self._build_task.cancel()
+
+        async def run():
+            try:
+                result = await self.dedupe_existing(mode)
+                self.last_pass = {"status": "completed", **result}
+            except Exception as e:
+                print(f"Library dedup pass failed: {e}")
+                self.last_pass = {"status": "failed", "mode": mode, "error": str(e)}
+
+        self.last_pass = {"status": "running", "mode": mode}
+        self._pass_task = asyncio.get_running_loop().create_task(run())
+        return self.last_pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "mode": self.mode,
+            "threshold": self.threshold,
+            "index": "ready" if self._index is not None else "building" if self._running(self._build_task) else "not_built",
+            "indexed_entries": len(self._index) if self._index is not None else None,
+            "unsigned_entries": self.unsigned,
+            "last_pass": self.last_pass,
+        }
+
+# Create singleton instance
+library_dedup = LibraryDeduplicator()
@@ -0,0 +1,159 @@
+"""
+Record/replay cassette for LLM calls.
+
+A cassette is a JSON-lines file (gzip-compressed when the path ends in .gz)
+of prompt -> response interactions including the upstream latency and token
+usage. In replay mode calls are answered from the cassette by prompt hash,
+optionally sleeping for the recorded latency, so benchmarks and regression
+runs are deterministic and work offline.
+
+Modes:
+    off     - cassette disabled (default)
+    record  - call the model and append every interaction
+    replay  - answer from the cassette only; unknown prompts raise CassetteMiss
+    auto    - replay when recorded, otherwise call the model and record
+"""
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+MODES = ("off", "record", "replay", "auto")
+
+
+class CassetteMiss(ValueError):
+    """Replay mode got a prompt that was never recorded"""
+
+
+class CassetteResponse:
+    """Stands in for a model response object (text + usage_metadata)"""
+
+    def __init__(self, text: str, usage: Optional[Dict[str, int]] = None):
+        self.text = text
+        usage = usage or {}
+        self.usage_metadata = type("Usage", (), {
+            "prompt_token_count": usage.get("prompt_tokens", 0),
+            "candidates_token_count": usage.get("output_tokens", 0),
+            "total_token_count": usage.get("prompt_tokens", 0) + usage.get("output_tokens", 0),
+        })()
+
+
+def prompt_key(model: str, history: List[Dict[str, Any]], message: str) -> str:
+    """Stable hash of everything that is sent upstream"""
+    payload = json.dumps({"model": model, "history": history, "message": message},
+                         sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _usage_of(response) -> Dict[str, int]:
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return {}
+    return {
+        "prompt_tokens": int(getattr(usage, "prompt_token_count", 0) or 0),
+        "output_tokens": int(getattr(usage, "candidates_token_count", 0) or 0),
+    }
+
+
+class Cassette:
+    def __init__(self, path: str, mode: str = "replay", simulate_latency: bool = False, latency_scale: float = 1.0):
+        if mode not in MODES:
+            raise ValueError(f"Unknown cassette mode: {mode}")
+        self.path = path
+        self.mode = mode
+        self.simulate_latency = simulate_latency
+        self.latency_scale = latency_scale
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "recorded": 0, "prompt_tokens": 0, "output_tokens": 0}
+        if mode != "off":
+            self._load()
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode != "off"
+
+    @property
+    def replay_only(self) -> bool:
+        return self.mode == "replay"
+
+    def _open(self, mode: str):
+        if self.path.endswith(".gz"):
+            return gzip.open(self.path, mode + "t", encoding="utf-8")
+        return open(self.path, mode, encoding="utf-8")
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with self._open("r") as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    entry = json.loads(line)
+                    # Later recordings of the same prompt win
+                    self._entries[entry["key"]] = entry
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def lookup(self, key: str) -> Optional[Dict[str, Any]]:
+        return self._entries.get(key)
+
+    def call(self, key: str, upstream: Callable[[], Any], model: str = "", prompt_chars: int = 0):
+        """Answer from the cassette or via `upstream()` depending on the mode"""
+        entry = self._entries.get(key) if self.mode in ("replay", "auto") else None
+        if entry is not None:
+            with self._lock:
+                self.stats["hits"] += 1
+                self.stats["prompt_tokens"] += entry.get("usage", {}).get("prompt_tokens", 0)
+                self.stats["output_tokens"] += entry.get("usage", {}).get("output_tokens", 0)
+            if self.simulate_latency:
+                time.sleep(entry.get("latency_s", 0) * self.latency_scale)
+            return CassetteResponse(entry["response"], entry.get("usage"))
+
+        if self.mode == "replay":
+            with self._lock:
+                self.stats["misses"] += 1
+            raise CassetteMiss(f"No recorded response for prompt {key[:12]}")
+
+        start = time.perf_counter()
+        response = upstream()
+        latency = time.perf_counter() - start
+        if self.mode in ("record", "auto"):
+            self.record(key, response.text, latency, _usage_of(response), model=model, prompt_chars=prompt_chars)
+        return response
+
+    def record(self, key: str, text: str, latency: float, usage: Dict[str, int], model: str = "", prompt_chars: int = 0):
+        entry = {
+            "key": key,
+            "model": model,
+            "prompt_chars": prompt_chars,
+            "response": text,
+            "latency_s": round(latency, 4),
+            "usage": usage,
+            "recorded_at": datetime.utcnow().isoformat(timespec="seconds"),
+        }
+        with self._lock:
+            self._entries[key] = entry
+            self.stats["recorded"] += 1
+            self.stats["prompt_tokens"] += usage.get("prompt_tokens", 0)
+            self.stats["output_tokens"] += usage.get("output_tokens", 0)
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with self._open("a") as f:
+                f.write(json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n")
+
+
+def cassette_from_settings(settings) -> Optional[Cassette]:
+    if settings.LLM_CASSETTE_MODE == "off":
+        return None
+    return Cassette(
+        settings.LLM_CASSETTE_PATH,
+        mode=settings.LLM_CASSETTE_MODE,
+        simulate_latency=settings.LLM_CASSETTE_SIMULATE_LATENCY,
+    )
@@ -0,0 +1,123 @@
+"""
+Model tiers for Gemini calls.
+
+Every request used to go to one configuration (gemini-2.0-flash, 2048
+output tokens, the full text / ladder / plc-code schema), including "what is
+a PLC scan cycle?" questions that only need a short text part. classify()
+sorts a request into a tier from its wording, without a model call:
+- text: conceptual questions (what is, explain, how does ... work) that ask
+  for no code or diagram
+- code: Structured Text / code without a ladder diagram
+- ladder: everything else that asks for logic, and ladder requests; the
+  original full configuration
+- refine: follow-ups to an answer that had code or a ladder diagram
+The summary tier is not a request class: it folds older session messages
+into the session's rolling summary (session_summary.py).
+Each tier has its own model, output token limit and the response types its
+schema allows (RESPONSE_TYPES). When unsure, classify() picks ladder, which
+answers like the single configuration did.
+
+GEMINI_MODEL_TIERS overrides tiers as "tier=model:max_tokens,...", e.g.
+"text=gemini-2.0-flash-lite:1024,ladder=gemini-2.5-flash:4096";
+GEMINI_MODEL_ROUTING=false sends everything to the ladder tier.
+"""
+from typing import Dict, List, Optional, Tuple
+from app.services.iec_vocabulary import code_like, terms, words
+
+DEFAULT_MODEL = "gemini-2.0-flash"
+DEFAULT_MAX_OUTPUT_TOKENS = 2048
+ALL_TYPES = ("text", "ladder", "plc-code")
+
+# Response types each tier's schema allows
+RESPONSE_TYPES = {
+    "text": ("text",),
+    "code": ("text", "plc-code"),
+    "ladder": ALL_TYPES,
+    "refine": ALL_TYPES,
+    "summary": ("text",),
+}
+DEFAULT_TIERS = {
+    "text": ("gemini-2.0-flash-lite", 1024),
+    "code": (DEFAULT_MODEL, DEFAULT_MAX_OUTPUT_TOKENS),
+    "ladder": (DEFAULT_MODEL, DEFAULT_MAX_OUTPUT_TOKENS),
+    "refine": (DEFAULT_MODEL, DEFAULT_MAX_OUTPUT_TOKENS),
+    "summary": ("gemini-2.0-flash-lite", 1024),
+}
+FALLBACK_TIER = "ladder"
+
+# Openings of conceptual questions
+QUESTION_OPENINGS = (
+    ("what", "is"), ("what", "are"), ("what", "does"), ("what", "do"), ("what", "s"), ("why",), ("when",),
+    ("which",), ("explain",), ("describe",), ("define",), ("how", "does"), ("how", "do"), ("how", "is"),
+    ("how", "are"), ("difference",), ("is",), ("are",), ("can", "a"), ("does",), ("tell", "me", "about"),
+    ("can", "you", "explain"),
+)
+# "how do I ..." asks for a way to do something
+PERSONAL = frozenset({"i", "we", "you"})
+# Words asking for something to be built rather than explained
+ACTION_WORDS = frozenset("""
+write create implement generate program code build design make show example examples add convert rewrite
+modify change fix debug sequence routine logic circuit control automate need want give
+""".split())
+LADDER_WORDS = frozenset({"ladder", "rung", "rungs", "coil", "coils", "contact", "contacts", "diagram", "ld"})
+CODE_TERMS = frozenset({"structured_text", "function_block", "function_block_diagram"})
+
+
+class Tier:
+    """One model configuration: model name, output token limit and allowed response types"""
+
+    def __init__(self, name: str, model: str, max_output_tokens: int, types: Tuple[str, ...]):
+        self.name = name
+        self.model = model
+        self.max_output_tokens = max_output_tokens
+        self.types = types
+
+    @property
+    def key(self) -> str:
+        """Identifies the configuration in coalescing and cassette keys (the bare model name for the original one)"""
+        if self.max_output_tokens == DEFAULT_MAX_OUTPUT_TOKENS and self.types == ALL_TYPES:
+            return self.model
+        return f"{self.model}:{self.max_output_tokens}:{'+'.join(self.types)}"
+
+    def as_dict(self) -> Dict[str, object]:
+        return {"model": self.model, "max_output_tokens": self.max_output_tokens, "types": list(self.types)}
+
+
+def parse_tiers(spec: str) -> Dict[str, Tier]:
+    """'text=gemini-2.0-flash-lite:1024,code=gemini-2.0-flash' -> tiers, with DEFAULT_TIERS for the rest"""
+    configured = dict(DEFAULT_TIERS)
+    for item in filter(None, (p.strip() for p in spec.split(","))):
+        name, _, value = item.partition("=")
+        name = name.strip()
+        if name not in RESPONSE_TYPES:
+            raise ValueError(f"Unknown model tier {name!r} in GEMINI_MODEL_TIERS")
+        model, _, tokens = value.strip().partition(":")
+        configured[name] = (model or configured[name][0], int(tokens) if tokens else configured[name][1])
+    return {name: Tier(name, model, tokens, RESPONSE_TYPES[name]) for name, (model, tokens) in configured.items()}
+
+
+def _answered_with_code(conversation_history: Optional[List[Dict[str, str]]]) -> bool:
+    for msg in reversed(conversation_history or []):
+        if msg.get("role") == "assistant":
+            content = msg.get("content", "")
+            return '"ladder"' in content or '"plc-code"' in content
+    return False
+
+
+def classify(message: str, conversation_history: Optional[List[Dict[str, str]]] = None) -> str:
+    """Tier name for a request (never summary)"""
+    if _answered_with_code(conversation_history):
+        return "refine"
+    tokens = words(message)
+    folded = set(terms(message)[0])
+    if not LADDER_WORDS.isdisjoint(tokens) or "ladder" in folded:
+        return "ladder"
+    asks_code = not CODE_TERMS.isdisjoint(folded) or "st" in tokens or code_like(message)
+    asks_action = not ACTION_WORDS.isdisjoint(tokens)
+    if asks_code and asks_action:
+        return "code"
+    conceptual = any(tuple(tokens[:len(opening)]) == opening for opening in QUESTION_OPENINGS)
+    how_to = tokens[:2] == ["how", "do"] and len(tokens) > 2 and tokens[2] in PERSONAL
+    if conceptual and not asks_action and not how_to:
+        return "text"
+    return FALLBACK_TIER
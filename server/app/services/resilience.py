@@ -0,0 +1,352 @@
+"""
+Resilience layer for upstream LLM calls.
+
+- Transient upstream errors (429, 5xx, timeouts, connection resets) are retried
+  with full-jitter exponential backoff, as long as the next attempt can still
+  start inside the call deadline. Other errors propagate unchanged.
+- Optional hedging: when an attempt is still running after the observed p95
+  latency, a second identical attempt is started and the first success wins.
+  Hedges are capped to a fraction of calls so they cannot double the load.
+- A circuit breaker opens after consecutive transient failures and fails fast
+  until a cooldown has passed; one probe call then decides whether it closes.
+  Any answer from the upstream, even an error retrying will not fix, closes
+  it; a cancelled probe decides nothing and the next call probes again.
+
+Calls that cannot be served are raised as UpstreamUnavailable, which the route
+handlers report like an admission rejection (503 with Retry-After). Errors
+that retrying will not fix are raised by GeminiService as UpstreamError and
+reported as 502.
+"""
+import asyncio
+import math
+import random
+import sys
+import threading
+import time
+from collections import deque
+from typing import Awaitable, Callable, Dict, Optional, TypeVar
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.services.admission import AdmissionRejected
+
+_TRANSIENT_ERROR_NAMES = ("TooManyRequests", "ResourceExhausted", "InternalServerError", "BadGateway",
+                          "ServiceUnavailable", "GatewayTimeout", "DeadlineExceeded")
+
+
+def _transient_errors() -> tuple:
+    """
+    google-api-core's retryable exception classes. Looked up rather than
+    imported, to keep the SDK off the import path: if the module is not
+    loaded yet, no exception can be one of them.
+    """
+    module = sys.modules.get("google.api_core.exceptions")
+    if module is None:
+        return ()
+    return tuple(getattr(module, name) for name in _TRANSIENT_ERROR_NAMES)
+
+T = TypeVar("T")
+
+LLM_RETRIES = metrics.counter(
+    "llm_retries_total", "Upstream LLM attempts retried after a transient error", ("reason",)
+)
+LLM_HEDGES = metrics.counter(
+    "llm_hedged_requests_total", "Hedged LLM attempts by outcome (launched, won)", ("outcome",)
+)
+LLM_CIRCUIT_STATE = metrics.gauge(
+    "llm_circuit_state", "Circuit breaker state (0 closed, 1 half-open, 2 open)", ("name",)
+)
+LLM_CIRCUIT_REJECTED = metrics.counter(
+    "llm_circuit_rejected_total", "Calls failed fast by an open circuit breaker", ("name",)
+)
+
+_TRANSIENT_MARKERS = ("429", "500", "502", "503", "504", "unavailable", "overloaded",
+                      "deadline exceeded", "timed out", "connection reset", "resource exhausted")
+
+
+def transient_reason(exc: BaseException) -> Optional[str]:
+    """Short reason label if `exc` is a transient upstream error worth retrying, else None"""
+    if isinstance(exc, AdmissionRejected):
+        return None
+    transient_errors = _transient_errors()
+    if transient_errors and isinstance(exc, transient_errors):
+        return type(exc).__name__
+    if isinstance(exc, (TimeoutError, ConnectionError)):
+        return type(exc).__name__
+    text = str(exc).lower()
+    for marker in _TRANSIENT_MARKERS:
+        if marker in text:
+            return marker.replace(" ", "_")
+    return None
+
+
+class UpstreamError(Exception):
+    """The upstream model failed a call for a reason retrying will not fix"""
+
+
+class UpstreamUnavailable(AdmissionRejected):
+    """The upstream model is failing or the circuit is open; retry later"""
+
+    def __init__(self, detail: str, retry_after: int):
+        super().__init__(503, detail, retry_after)
+
+
+class CircuitBreaker:
+    CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+    _STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+    def __init__(self, name: str, failure_threshold: int, cooldown: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.opened_count = 0
+        self._probing = False
+        self._lock = threading.Lock()
+        LLM_CIRCUIT_STATE.set(0, name=name)
+
+    def _set_state(self, state: str):
+        self.state = state
+        LLM_CIRCUIT_STATE.set(self._STATE_VALUES[state], name=self.name)
+
+    def retry_after(self) -> int:
+        remaining = self.cooldown - (time.monotonic() - self.opened_at)
+        return max(1, math.ceil(remaining))
+
+    def allow(self) -> bool:
+        """
+        Raise UpstreamUnavailable while open; let a single probe through once
+        the cooldown passed. Returns True for the probe, whose caller must
+        release_probe() when the attempt ends, whatever its outcome.
+        """
+        if self.failure_threshold <= 0:
+            return False
+        with self._lock:
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.cooldown:
+                self._set_state(self.HALF_OPEN)
+                self._probing = False
+            if self.state == self.CLOSED:
+                return False
+            if self.state == self.HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+        LLM_CIRCUIT_REJECTED.inc(name=self.name)
+        raise UpstreamUnavailable("AI service is temporarily unavailable, please retry", self.retry_after())
+
+    def release_probe(self):
+        """End a probe without a verdict (cancelled, rejected): the next call probes again"""
+        with self._lock:
+            self._probing = False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._probing = False
+            if self.state != self.CLOSED:
+                print(f"Circuit '{self.name}' closed")
+                self._set_state(self.CLOSED)
+
+    def record_failure(self):
+        if self.failure_threshold <= 0:
+            return
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.state == self.HALF_OPEN or (
+                self.state == self.CLOSED and self.failures >= self.failure_threshold
+            ):
+                self.opened_at = time.monotonic()
+                self.opened_count += 1
+                self._set_state(self.OPEN)
+                print(f"Circuit '{self.name}' opened after {self.failures} consecutive failures")
+
+    def stats(self) -> Dict[str, object]:
+        return {"state": self.state, "consecutive_failures": self.failures, "opened": self.opened_count}
+
+
+class ResilientCaller:
+    def __init__(
+        self,
+        name: str,
+        max_attempts: int,
+        base_delay: float,
+        max_delay: float,
+        deadline: float,
+        breaker: CircuitBreaker,
+        hedge: bool = False,
+        hedge_quantile: float = 0.95,
+        hedge_budget: float = 0.1,
+        hedge_min_samples: int = 20,
+        seed: Optional[int] = None,
+    ):
+        self.name = name
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+        self.breaker = breaker
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.hedge_budget = hedge_budget
+        self.hedge_min_samples = hedge_min_samples
+        self._rng = random.Random(seed)
+        self._latencies = deque(maxlen=512)
+        self._hedge_threshold: Optional[float] = None
+        self.calls = 0
+        self.retries = 0
+        self.hedged = 0
+        self.hedges_won = 0
+
+    # -- backoff -----------------------------------------------------------
+
+    def backoff(self, attempt: int) -> float:
+        """Full jitter: uniform in [0, min(max_delay, base * 2^attempt)]"""
+        return self._rng.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def _next_delay(self, attempt: int, exc: BaseException, started: float) -> Optional[float]:
+        """Backoff before the next attempt, or None when the error is final"""
+        reason = transient_reason(exc)
+        if reason is None:
+            if not isinstance(exc, AdmissionRejected):
+                # The upstream answered, with an error retrying will not fix
+                self.breaker.record_success()
+            return None
+        self.breaker.record_failure()
+        if attempt + 1 >= self.max_attempts:
+            return None
+        delay = self.backoff(attempt)
+        if time.monotonic() + delay - started >= self.deadline:
+            return None
+        self.retries += 1
+        LLM_RETRIES.inc(reason=reason)
+        return delay
+
+    def _give_up(self, exc: BaseException) -> BaseException:
+        if transient_reason(exc) is None:
+            return exc
+        return UpstreamUnavailable(
+            "AI service is temporarily unavailable, please retry",
+            self.breaker.retry_after() if self.breaker.state == CircuitBreaker.OPEN else max(1, math.ceil(self.base_delay * 4)),
+        )
+
+    # -- latency tracking --------------------------------------------------
+
+    def _observe(self, seconds: float):
+        self._latencies.append(seconds)
+        if len(self._latencies) >= self.hedge_min_samples and len(self._latencies) % 16 == 0:
+            ordered = sorted(self._latencies)
+            self._hedge_threshold = ordered[min(len(ordered) - 1, int(self.hedge_quantile * len(ordered)))]
+
+    def _may_hedge(self) -> bool:
+        return (
+            self.hedge
+            and self._hedge_threshold is not None
+            and self.hedged < self.hedge_budget * max(1, self.calls)
+        )
+
+    # -- calls -------------------------------------------------------------
+
+    def call_sync(self, fn: Callable[[], T]) -> T:
+        """Blocking variant: retries and circuit breaking, no hedging"""
+        self.calls += 1
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            probe = self.breaker.allow()
+            attempt_start = time.perf_counter()
+            try:
+                result = fn()
+            except Exception as e:
+                delay = self._next_delay(attempt, e, started)
+                if delay is None:
+                    raise self._give_up(e) from e
+            else:
+                self._observe(time.perf_counter() - attempt_start)
+                self.breaker.record_success()
+                return result
+            finally:
+                if probe:
+                    self.breaker.release_probe()
+            time.sleep(delay)
+            attempt += 1
+
+    async def call(self, fn: Callable[[], Awaitable[T]]) -> T:
+        """Run `fn` (one upstream attempt) with retries, hedging and circuit breaking"""
+        self.calls += 1
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            probe = self.breaker.allow()
+            attempt_start = time.perf_counter()
+            try:
+                result = await self._attempt(fn)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                delay = self._next_delay(attempt, e, started)
+                if delay is None:
+                    raise self._give_up(e) from e
+            else:
+                self._observe(time.perf_counter() - attempt_start)
+                self.breaker.record_success()
+                return result
+            finally:
+                # Every outcome ends the probe; a cancelled one leaves no verdict
+                if probe:
+                    self.breaker.release_probe()
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def _attempt(self, fn: Callable[[], Awaitable[T]]) -> T:
+        primary = asyncio.ensure_future(fn())
+        if not self._may_hedge():
+            return await primary
+
+        done, _ = await asyncio.wait({primary}, timeout=self._hedge_threshold)
+        if done:
+            return primary.result()
+
+        self.hedged += 1
+        LLM_HEDGES.inc(outcome="launched")
+        hedge = asyncio.ensure_future(fn())
+        pending = {primary, hedge}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            self.hedges_won += 1
+                            LLM_HEDGES.inc(outcome="won")
+                        return task.result()
+            # Both failed: surface the primary's error
+            return primary.result()
+        finally:
+            for task in pending:
+                # The loser keeps its threadpool worker until the SDK call returns;
+                # drop its result and any exception.
+                task.cancel()
+                task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "calls": self.calls,
+            "retries": self.retries,
+            "hedged": self.hedged,
+            "hedges_won": self.hedges_won,
+            "hedge_threshold_ms": round(1000 * self._hedge_threshold, 1) if self._hedge_threshold else None,
+            "circuit": self.breaker.stats(),
+        }
+
+
+def resilient_caller_from_settings(name: str, settings=settings) -> ResilientCaller:
+    return ResilientCaller(
+        name,
+        max_attempts=settings.LLM_RETRY_ATTEMPTS,
+        base_delay=settings.LLM_RETRY_BASE_DELAY,
+        max_delay=settings.LLM_RETRY_MAX_DELAY,
+        deadline=settings.LLM_DEADLINE,
+        breaker=CircuitBreaker(name, settings.LLM_BREAKER_FAILURES, settings.LLM_BREAKER_COOLDOWN),
+        hedge=settings.LLM_HEDGE,
+    )
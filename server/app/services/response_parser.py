@@ -0,0 +1,89 @@
+"""
+Model output parsing shared by chat turns and bulk generation jobs.
+
+parse_ai_response() strips markdown fences from the raw model output and,
+when it is a valid structured response (a JSON array of text / ladder /
+plc-code parts), applies the structural checks before it is stored: ladder
+diagrams are validated (and normalized with LADDER_NORMALIZE), plc-code is
+formatted with ST_FORMAT and gets its code_hash. Anything else is stored as
+plain text.
+"""
+import json
+from app.core.config import settings
+from app.models.chat import MultipleStructuredResponse, StructuredResponse
+from app.services.ladder_parser import normalize_ladder, validate_ladder
+from app.services.st_formatter import format_st, st_code_hash
+
+
+def parse_ai_response(ai_response: str) -> str:
+    """
+    Clean up and validate the raw model output; returns the content to store.
+    Valid structured responses are re-serialized (with ladder validation applied),
+    anything else is stored as plain text.
+    """
+    # Parse the JSON response - clean up markdown formatting first
+    structured_response = None
+    clean_response = ai_response.strip()
+
+    # Remove markdown code blocks if present
+    if clean_response.startswith('```json'):
+        clean_response = clean_response[7:]  # Remove ```json
+    if clean_response.startswith('```'):
+        clean_response = clean_response[3:]   # Remove ```
+    if clean_response.endswith('```'):
+        clean_response = clean_response[:-3]  # Remove ending ```
+
+    clean_response = clean_response.strip()
+
+    try:
+        # Parse the response as JSON array (enforced by schema)
+        parsed_response = json.loads(clean_response)
+        valid_types = ["text", "ladder", "plc-code"]
+
+        # Response should always be an array due to schema enforcement
+        if isinstance(parsed_response, list):
+            responses = []
+            valid_responses = True
+
+            for resp in parsed_response:
+                if (isinstance(resp, dict) and 
+                    "type" in resp and "content" in resp and 
+                    resp["type"] in valid_types):
+                    if resp["type"] == "ladder" and isinstance(resp["content"], str):
+                        # Structural check of the ASCII diagram, no extra LLM call
+                        resp["validation"] = validate_ladder(resp["content"], resp.get("validation"))
+                        if settings.LADDER_NORMALIZE:
+                            resp["content"] = normalize_ladder(resp["content"])
+                    elif resp["type"] == "plc-code" and isinstance(resp["content"], str):
+                        if settings.ST_FORMAT:
+                            resp["content"] = format_st(resp["content"], settings.ST_STRIP_COMMENTS)
+                        resp["code_hash"] = st_code_hash(resp["content"])
+                    responses.append(StructuredResponse(
+                        type=resp["type"],
+                        content=resp["content"],
+                        validation=resp.get("validation"),
+                        code_hash=resp.get("code_hash")
+                    ))
+                else:
+                    valid_responses = False
+                    break
+
+            if valid_responses and responses:
+                structured_response = MultipleStructuredResponse(responses=responses)
+                # Store the structured response as JSON for consistency
+                content_to_store = json.dumps(parsed_response)
+            else:
+                # Fallback to plain text if validation fails
+                content_to_store = clean_response
+                structured_response = None
+        else:
+            # Unexpected format (not array), treat as plain text
+            content_to_store = clean_response
+            structured_response = None
+
+    except json.JSONDecodeError:
+        # If not valid JSON, treat as plain text
+        content_to_store = clean_response
+        structured_response = None
+    
+    return content_to_store
@@ -0,0 +1,173 @@
+"""
+Local scope gate: answers clearly off-topic questions ("How do I cook
+pasta?") with the system prompt's canned rejection instead of spending a
+Gemini call on it.
+
+A logistic regression over the question's features, trained at startup on
+scope_gate_corpus.jsonl (a few hundred labelled questions; pure Python, a
+few tens of milliseconds):
+- the terms of iec_vocabulary.terms(), numbers collapsed to one feature
+- character 4-grams of the other words, for inflections and unseen words
+A question is rejected only when the model puts it in scope with probability
+below SCOPE_GATE_THRESHOLD and it mentions no automation term and contains
+no IEC 61131-3 code (iec_vocabulary.domain_hits / code_like). Everything
+else, including short questions the model has no features for, goes to
+Gemini, whose system prompt still rejects what the gate lets through.
+Follow-ups (messages sent with conversation history) use the stricter
+SCOPE_GATE_FOLLOW_UP_THRESHOLD: "and the other one?" is about the
+conversation, not about its own words.
+
+SCOPE_GATE_MODE=shadow (the default) evaluates and counts without rejecting,
+to measure what the gate would save, and how precisely, before turning it on.
+"""
+import json
+import math
+import os
+import random
+from typing import Dict, List, Optional
+from app.core.config import settings
+from app.core.metrics import metrics, timed
+from app.services.iec_vocabulary import AUTOMATION_CONTEXT, IEC_TERMS, code_like, domain_hits, terms, words
+from app.services.lazy_init import LazyInit
+
+SCOPE_GATE_DECISIONS = metrics.counter(
+    "scope_gate_decisions_total",
+    "Scope gate decisions (rejected = Gemini call saved, would_reject = rejected in shadow mode)",
+    ("decision",)
+)
+
+CORPUS_PATH = os.path.join(os.path.dirname(__file__), "scope_gate_corpus.jsonl")
+CHARGRAM_SIZE = 4
+CHARGRAM_WEIGHT = 0.3
+EPOCHS = 10
+LEARNING_RATE = 0.5
+L2 = 1e-4
+REFERENCES = frozenset({"it", "that", "this", "again", "them", "those", "instead"})
+MIN_TERMS = 2                   # "hello", "why?": too little to judge
+
+
+def features(text: str) -> Dict[str, float]:
+    """Weighted features of a question, scaled to unit length"""
+    folded, rest = terms(text)
+    result = {"t:#" if t[0].isdigit() else f"t:{t}": 1.0 for t in folded}
+    # Whether anything in the question is IEC / automation vocabulary at all
+    if domain_hits(text) or not IEC_TERMS.isdisjoint(folded):
+        result["v:iec"] = 1.0
+    elif not AUTOMATION_CONTEXT.isdisjoint(words(text)):
+        result["v:context"] = 1.0
+    else:
+        result["v:none"] = 1.0
+    # Follow-ups ("make it simpler") refer to the previous answer
+    if not REFERENCES.isdisjoint(words(text)):
+        result["v:refers"] = 1.0
+    for word in rest:
+        if len(word) > CHARGRAM_SIZE and not word[0].isdigit():
+            padded = f"<{word}>"
+            for j in range(len(padded) - CHARGRAM_SIZE + 1):
+                result.setdefault(f"c:{padded[j:j + CHARGRAM_SIZE]}", CHARGRAM_WEIGHT)
+    norm = math.sqrt(sum(w * w for w in result.values()))
+    return {f: w / norm for f, w in result.items()} if norm else result
+
+
+def _sigmoid(z: float) -> float:
+    return 1.0 / (1.0 + math.exp(-max(-30.0, min(30.0, z))))
+
+
+class ScopeModel:
+    """Binary logistic regression on sparse features; predict() is P(in scope)"""
+
+    def __init__(self, weights: Optional[Dict[str, float]] = None, bias: float = 0.0):
+        self.weights = weights or {}
+        self.bias = bias
+
+    @classmethod
+    def train(cls, examples: List[Dict], seed: int = 0) -> "ScopeModel":
+        """SGD over examples ({"text", "in_scope"}) in a seeded order, so training is deterministic"""
+        rows = [(features(e["text"]), 1.0 if e["in_scope"] else 0.0) for e in examples]
+        model = cls()
+        rng = random.Random(seed)
+        for epoch in range(EPOCHS):
+            rng.shuffle(rows)
+            rate = LEARNING_RATE / (1 + epoch / 10)
+            for x, y in rows:
+                error = y - model._probability(x)
+                model.bias += rate * error
+                for f, v in x.items():
+                    w = model.weights.get(f, 0.0)
+                    model.weights[f] = w + rate * (error * v - L2 * w)
+        return model
+
+    def _probability(self, x: Dict[str, float]) -> float:
+        weights = self.weights
+        return _sigmoid(self.bias + sum(weights.get(f, 0.0) * v for f, v in x.items()))
+
+    def predict(self, text: str) -> float:
+        return self._probability(features(text))
+
+
+def load_corpus(path: str = CORPUS_PATH) -> List[Dict]:
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+class ScopeGate(LazyInit):
+    _instance = None
+    _initialized = False
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+        return cls._instance
+
+    def __init__(self):
+        if not self._initialized:
+            self._setup_lazy_init()
+            self.mode = settings.SCOPE_GATE_MODE
+            self.model: Optional[ScopeModel] = None
+            self._initialized = True
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode in ("shadow", "on")
+
+    def is_available(self) -> bool:
+        return self.model is not None
+
+    def _initialize(self):
+        if not self.enabled:
+            return
+        examples = load_corpus()
+        self.model = ScopeModel.train(examples)
+        print(f"Scope gate: trained on {len(examples)} questions ({len(self.model.weights)} features)")
+
+    def rejects(self, message: str, follow_up: bool = False) -> bool:
+        """Whether the model is confident the message is off-topic (no automation terms, no code)"""
+        threshold = settings.SCOPE_GATE_FOLLOW_UP_THRESHOLD if follow_up else settings.SCOPE_GATE_THRESHOLD
+        if domain_hits(message) or code_like(message) or len(set(terms(message)[0])) < MIN_TERMS:
+            return False
+        return self.model.predict(message) < threshold
+
+    @timed("scope_gate.check")
+    async def allows(self, message: str, follow_up: bool = False) -> bool:
+        """False when the message should get the canned rejection instead of an LLM call"""
+        if not self.enabled or not await self.ensure_available():
+            return True
+        if not self.rejects(message, follow_up):
+            SCOPE_GATE_DECISIONS.inc(decision="passed")
+            return True
+        if self.mode == "shadow":
+            SCOPE_GATE_DECISIONS.inc(decision="would_reject")
+            return True
+        SCOPE_GATE_DECISIONS.inc(decision="rejected")
+        return False
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "mode": self.mode,
+            "threshold": settings.SCOPE_GATE_THRESHOLD,
+            "follow_up_threshold": settings.SCOPE_GATE_FOLLOW_UP_THRESHOLD,
+            "decisions": {d: SCOPE_GATE_DECISIONS.value(decision=d) for d in ("passed", "would_reject", "rejected")},
+        }
+
+# Create singleton instance
+scope_gate = ScopeGate()
@@ -0,0 +1,257 @@
+"""
+Semantic answer cache for /ai/chat.
+
+A question is embedded locally (embedding.HashingEmbedder) and compared, by
+cosine similarity, with
+- the canonical knowledge library questions: an IVFIndex persisted under
+  SEMANTIC_CACHE_DIR and memory-mapped, plus the entries saved since it was
+  built (searched exactly)
+- the questions this process answered recently, matched only for the user
+  who asked them
+Only matches that mention the same numbers (presets, durations, station
+numbers: iec_vocabulary.number_key) are considered. At or above
+SEMANTIC_CACHE_THRESHOLD the route answers from the match without
+calling Gemini (serve), or calls Gemini and returns the match as a
+suggestion (offer). Only stand-alone questions are looked up: the answer to a
+message sent with conversation history depends on it.
+
+The index is rebuilt in the background when the library version
+(storage.get_library_version()) differs from the one it was built at, which
+is checked at startup and every SEMANTIC_CACHE_SYNC_SECONDS; entries it
+already holds keep their vectors. A match whose entry has since been deleted
+or flagged as a duplicate is dropped when it is found.
+
+numpy is imported when the cache initializes, so it stays off the import
+path and is not needed at all with SEMANTIC_CACHE_MODE=off.
+"""
+import asyncio
+import contextvars
+import os
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set, Tuple
+from starlette.concurrency import run_in_threadpool
+from app.core.config import settings
+from app.core.metrics import metrics, record_cache, timed
+from app.services.iec_vocabulary import number_key
+from app.services.lazy_init import LazyInit
+from app.services.storage import storage
+
+SEMANTIC_CACHE_VECTORS = metrics.gauge(
+    "semantic_cache_vectors", "Vectors searched by the semantic answer cache", ("part",)
+)
+SEMANTIC_CACHE_BUILD_SECONDS = metrics.gauge(
+    "semantic_cache_build_seconds", "Duration of the last semantic index rebuild"
+)
+
+CACHE_NAME = "semantic_answer"
+TOP_K = 5
+MAX_ENTRY_READS = 2             # stale matches fetched before giving up on a lookup
+PENDING_CAPACITY = 4096         # library entries saved since the last build
+PENDING_REBUILD = 1024          # rebuild once this many are pending
+
+
+class SemanticCache(LazyInit):
+    _instance = None
+    _initialized = False
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+        return cls._instance
+
+    def __init__(self):
+        if not self._initialized:
+            self._setup_lazy_init()
+            self.mode = settings.SEMANTIC_CACHE_MODE
+            self.threshold = settings.SEMANTIC_CACHE_THRESHOLD
+            self.directory = settings.SEMANTIC_CACHE_DIR
+            self.embedder = None
+            self.index = None           # IVFIndex over the library, as of index.meta["library_version"]
+            self.pending = None         # RingIndex of library entries saved since
+            self.history = None         # RingIndex of answered questions (owner: uid, payload: answer)
+            self._dropped: Set[str] = set()
+            self._sync_task: Optional[asyncio.Task] = None
+            self._last_check = 0.0
+            self.last_sync: Dict[str, Any] = {"status": "never_run"}
+            self._initialized = True
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode in ("offer", "serve")
+
+    def is_available(self) -> bool:
+        return self.embedder is not None
+
+    def _initialize(self):
+        if not self.enabled:
+            return
+        from app.services.embedding import HashingEmbedder
+        from app.services.vector_index import IVFIndex, RingIndex
+
+        embedder = HashingEmbedder()
+        self.pending = RingIndex(embedder.dim, PENDING_CAPACITY)
+        self.history = RingIndex(embedder.dim, max(1, settings.SEMANTIC_CACHE_HISTORY))
+        index = IVFIndex.load(self.directory)
+        if index is not None and index.meta.get("embedding") == embedder.version:
+            self.index = index
+            print(f"Semantic cache: {len(index)} library questions mapped from {index.path}")
+        self.embedder = embedder
+        self._update_gauges()
+
+    def _update_gauges(self):
+        SEMANTIC_CACHE_VECTORS.set(len(self.index) if self.index is not None else 0, part="index")
+        SEMANTIC_CACHE_VECTORS.set(len(self.pending), part="pending")
+        SEMANTIC_CACHE_VECTORS.set(len(self.history), part="history")
+
+    # -- library sync ------------------------------------------------------
+
+    def _build(self, entries: List[Tuple[str, str]], version: str):
+        """Embed and cluster the canonical library questions, reusing vectors the current index has"""
+        import numpy as np
+        from app.services.vector_index import IVFIndex
+
+        vectors = np.zeros((len(entries), self.embedder.dim), dtype=np.float32)
+        tags = np.zeros(len(entries), dtype=np.int64)
+        current = self.index
+        reused = 0
+        for row, (entry_id, question) in enumerate(entries):
+            tags[row] = number_key(question)
+            vector = current.vector(entry_id) if current is not None else None
+            if vector is not None:
+                vectors[row] = vector
+                reused += 1
+            else:
+                vectors[row] = self.embedder.embed(question)
+        meta = {"library_version": version, "embedding": self.embedder.version,
+                "built_at": datetime.utcnow().isoformat()}
+        index = IVFIndex.build(vectors, [entry_id for entry_id, _ in entries], tags, meta=meta)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            index.save(self.directory)
+        except OSError as e:
+            # Still usable from memory; the next start rebuilds
+            print(f"Semantic cache: could not save the index to {self.directory}: {e}")
+        return index, reused
+
+    async def sync(self) -> Dict[str, Any]:
+        """Rebuild the library index if the library changed since it was built"""
+        self._last_check = time.monotonic()
+        version = await storage.get_library_version()
+        if self.index is not None and self.index.meta.get("library_version") == version:
+            return {"status": "up_to_date", "library_version": version}
+
+        started = time.perf_counter()
+        entries = []
+        async for entry in storage.iter_library_entries(fields=("user_question", "duplicate_of")):
+            if entry.get("user_question") and not entry.get("duplicate_of"):
+                entries.append((entry["entry_id"], entry["user_question"]))
+        index, reused = await run_in_threadpool(self._build, entries, version)
+
+        self.pending.remove(set(index.keys))
+        self.index = index
+        self._dropped.clear()
+        elapsed = time.perf_counter() - started
+        SEMANTIC_CACHE_BUILD_SECONDS.set(elapsed)
+        self._update_gauges()
+        print(f"Semantic cache: indexed {len(index)} library questions ({reused} reused) in {elapsed * 1000:.0f} ms")
+        return {"status": "rebuilt", "library_version": version, "entries": len(index),
+                "reused": reused, "build_ms": round(elapsed * 1000, 1)}
+
+    def start_sync(self) -> Dict[str, Any]:
+        """Run sync() in the background; at most one at a time"""
+        if not self.enabled or (self._sync_task is not None and not self._sync_task.done()):
+            return self.last_sync
+
+        async def run():
+            try:
+                await self.ensure_initialized()
+                if self.is_available():
+                    self.last_sync = await self.sync()
+            except Exception as e:
+                print(f"Semantic cache sync failed: {e}")
+                self.last_sync = {"status": "failed", "error": str(e)}
+
+        self._last_check = time.monotonic()
+        self.last_sync = {"status": "running"}
+        # A fresh context: the rebuild's reads are not charged to the request that triggered it
+        self._sync_task = asyncio.get_running_loop().create_task(run(), context=contextvars.Context())
+        return self.last_sync
+
+    def add_library_entry(self, entry_id: str, question: str):
+        """Make a newly saved canonical entry matchable before the next rebuild"""
+        if not self.is_available():
+            return
+        self.pending.add(entry_id, self.embedder.embed(question), number_key(question))
+        SEMANTIC_CACHE_VECTORS.set(len(self.pending), part="pending")
+        if len(self.pending) >= PENDING_REBUILD:
+            self.start_sync()
+
+    # -- lookup ------------------------------------------------------------
+
+    def _candidates(self, query, tag: int, uid: str) -> List[Tuple[float, str, str, Any]]:
+        """(similarity, source, key, answer) at or above the threshold, best first"""
+        found = []
+        if self.index is not None:
+            found.extend((score, "library", key, None) for key, score in
+                         self.index.search(query, TOP_K, settings.SEMANTIC_CACHE_NPROBE, tag=tag))
+        found.extend((score, "library", key, None) for key, score, _ in self.pending.search(query, TOP_K, tag=tag))
+        found.extend((score, "history", key, answer) for key, score, answer in self.history.search(
+            query, 1, tag=tag, owner=uid, max_age=settings.SEMANTIC_CACHE_HISTORY_TTL))
+        found = [c for c in found if c[0] >= self.threshold and c[2] not in self._dropped]
+        found.sort(key=lambda c: c[0], reverse=True)
+        return found
+
+    @timed("semantic_cache.lookup")
+    async def lookup(self, uid: str, question: str) -> Optional[Dict[str, Any]]:
+        """
+        Best match for a question: {"source": "library" | "history",
+        "entry_id", "question", "similarity", "answer"}, or None
+        """
+        if not await self.ensure_available():
+            return None
+        if time.monotonic() - self._last_check > settings.SEMANTIC_CACHE_SYNC_SECONDS:
+            self.start_sync()
+
+        query = self.embedder.embed(question)
+        hit = None
+        reads = 0
+        tag = number_key(question)
+        for score, source, key, answer in self._candidates(query, tag, uid) if query.any() else []:
+            if source == "history":
+                hit = {"source": source, "entry_id": None, "question": key, "similarity": score, "answer": answer}
+                break
+            if reads == MAX_ENTRY_READS:
+                break
+            reads += 1
+            entry = await storage.get_library_entry(key)
+            if entry is None or entry.get("duplicate_of"):
+                self._dropped.add(key)
+                continue
+            hit = {"source": source, "entry_id": key, "question": entry["user_question"],
+                   "similarity": score, "answer": entry["assistant_response"]}
+            break
+        record_cache(CACHE_NAME, hit is not None)
+        return hit
+
+    def remember(self, uid: str, question: str, answer: str):
+        """Keep an answered stand-alone question for the same user's later paraphrases"""
+        if not self.is_available():
+            return
+        self.history.add(question, self.embedder.embed(question), number_key(question),
+                         owner=uid, payload=answer)
+        SEMANTIC_CACHE_VECTORS.set(len(self.history), part="history")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "mode": self.mode,
+            "threshold": self.threshold,
+            "library_version": self.index.meta.get("library_version") if self.index is not None else None,
+            "indexed_entries": len(self.index) if self.index is not None else None,
+            "pending_entries": len(self.pending) if self.pending is not None else None,
+            "history_entries": len(self.history) if self.history is not None else None,
+            "last_sync": self.last_sync,
+        }
+
+# Create singleton instance
+semantic_cache = SemanticCache()
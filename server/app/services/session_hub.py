@@ -0,0 +1,92 @@
+"""
+Live chat connections per session.
+
+WebSocket connections (app/api/chat_ws.py) subscribe to the session they
+opened; anything that changes a session (a chat turn over HTTP or another
+socket, a rename, a delete) publishes an event that is pushed to every other
+connection on it. Sessions belong to one user, so subscribers of a session
+are always its owner's own tabs and devices.
+
+The hub lives in the worker's memory. With WORKERS > 1 (app/launcher.py) an
+event reaches only the connections held by the worker that published it: a
+tab connected to another worker misses it until it reloads the session.
+"""
+import asyncio
+import json
+from datetime import datetime
+from typing import Any, Dict, Set
+from app.core.metrics import metrics
+
+WS_CONNECTIONS = metrics.gauge("chat_ws_connections", "Open chat WebSocket connections")
+WS_FRAMES = metrics.counter("chat_ws_frames_total", "Chat WebSocket frames", ("direction", "type"))
+
+
+def frame(event: Dict[str, Any]) -> str:
+    """Compact JSON text of an event (datetimes as ISO strings)"""
+    return json.dumps(event, separators=(",", ":"),
+                      default=lambda v: v.isoformat() if isinstance(v, datetime) else str(v))
+
+
+class SessionHub:
+    _instance = None
+    _initialized = False
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+        return cls._instance
+
+    def __init__(self):
+        if not self._initialized:
+            # session_id -> connected WebSockets
+            self._subscribers: Dict[str, Set[Any]] = {}
+            self._initialized = True
+
+    def subscribe(self, session_id: str, websocket):
+        self._subscribers.setdefault(session_id, set()).add(websocket)
+        WS_CONNECTIONS.inc()
+
+    def unsubscribe(self, session_id: str, websocket):
+        subscribers = self._subscribers.get(session_id)
+        if subscribers and websocket in subscribers:
+            subscribers.discard(websocket)
+            WS_CONNECTIONS.dec()
+            if not subscribers:
+                del self._subscribers[session_id]
+
+    def connection_count(self) -> int:
+        return sum(len(s) for s in self._subscribers.values())
+
+    async def send(self, websocket, event: Dict[str, Any]) -> bool:
+        try:
+            await websocket.send_text(frame(event))
+        except Exception:
+            return False
+        WS_FRAMES.inc(direction="out", type=event.get("t", "unknown"))
+        return True
+
+    async def publish(self, session_id: str, event: Dict[str, Any], exclude=None):
+        """Push an event to the session's connections (except `exclude`); dead ones are dropped"""
+        targets = [ws for ws in self._subscribers.get(session_id, ()) if ws is not exclude]
+        if not targets:
+            return
+        results = await asyncio.gather(*(self.send(ws, event) for ws in targets))
+        for ws, ok in zip(targets, results):
+            if not ok:
+                self.unsubscribe(session_id, ws)
+
+    async def publish_turn(self, session_id: str, user_message: Dict[str, Any],
+                           assistant_message: Dict[str, Any], exclude=None):
+        """A finished chat turn: both messages, then the new session metadata"""
+        if session_id not in self._subscribers:
+            return
+        for message in (user_message, assistant_message):
+            await self.publish(session_id, {"t": "message", **message}, exclude=exclude)
+        content = assistant_message["content"]
+        await self.publish(session_id, {
+            "t": "session", "session_id": session_id, "updated_at": assistant_message.get("timestamp"),
+            "last_message": content[:100] + "..." if len(content) > 100 else content,
+        }, exclude=exclude)
+
+# Create singleton instance
+session_hub = SessionHub()
@@ -0,0 +1,171 @@
+"""
+Rolling conversation summary for chat sessions.
+
+A session turn used to read up to 20 stored messages and send the last 8 of
+them, so long sessions paid for reads they did not use and lost everything
+older. Now the session document carries a summary of its older messages,
+and a turn sends the summary plus the messages after it:
+- context() reads the summary fields and the newest SESSION_CONTEXT_MESSAGES
+  messages (one session read plus those messages) and keeps the ones the
+  summary does not cover yet
+- once a turn leaves SESSION_CONTEXT_MESSAGES messages outside the summary,
+  a background fold() merges all but the newest
+  SESSION_CONTEXT_MESSAGES - 2 * SESSION_SUMMARY_EVERY_TURNS of them into it
+  with one call to the summary model tier (GeminiService.summarize_async);
+  summary_through and summary_count on the session document record how far
+  it reaches. The uncovered tail then grows back over
+  SESSION_SUMMARY_EVERY_TURNS turns
+Prompt size and storage reads per turn stay constant however long the
+session gets. A failed fold keeps the previous summary and is retried after
+the next turn. Folds of one session never overlap within a worker; two
+workers folding the same session write the same range. Sessions older than
+the summary start it from their recent messages.
+
+SESSION_SUMMARY_MODE=off (the default) sends the newest messages without a
+summary; on costs one summary-tier call per SESSION_SUMMARY_EVERY_TURNS turns
+of a long session.
+"""
+import asyncio
+import contextvars
+from typing import Any, Dict, List, Optional, Tuple
+from app.core.config import settings
+from app.core.metrics import metrics, timed
+from app.models.session import ChatMessage
+from app.services.firestore_accounting import finish_request_tally, set_request_user, start_request_tally
+from app.services.gemini_service import gemini_service
+from app.services.storage import storage
+
+MAX_LANDED = 10000  # sessions remembered as just folded; forgetting one only costs a skipped fold
+
+SESSION_SUMMARY_FOLDS = metrics.counter(
+    "session_summary_folds_total", "Background folds of session messages into the rolling summary", ("outcome",)
+)
+SESSION_SUMMARY_MESSAGES = metrics.counter(
+    "session_summary_messages_total", "Session messages folded into rolling summaries"
+)
+
+
+class SessionSummarizer:
+    _instance = None
+    _initialized = False
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+        return cls._instance
+
+    def __init__(self):
+        if not self._initialized:
+            self.mode = settings.SESSION_SUMMARY_MODE
+            # Sessions with a fold in progress, and the tasks (kept referenced until done)
+            self._folding = set()
+            self._tasks = set()
+            # Sessions whose fold landed since their last turn
+            self._landed = set()
+            self._initialized = True
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode == "on"
+
+    @property
+    def window(self) -> int:
+        """Messages read and sent with each turn"""
+        return max(2, settings.SESSION_CONTEXT_MESSAGES)
+
+    @property
+    def keep(self) -> int:
+        """Messages left outside the summary after a fold"""
+        return max(1, self.window - 2 * max(1, settings.SESSION_SUMMARY_EVERY_TURNS))
+
+    @staticmethod
+    def _uncovered(state: Dict[str, Any], messages: List[ChatMessage]) -> List[ChatMessage]:
+        through = state.get("summary_through")
+        if through is None:
+            return messages
+        return [m for m in messages if m.timestamp is None or m.timestamp > through]
+
+    async def context(self, session_id: str, user_id: str) -> Tuple[Optional[str], List[ChatMessage]]:
+        """The session's summary (None when off or not written yet) and the newest messages it does not cover"""
+        state, messages = await storage.get_session_context(session_id, user_id, limit=self.window)
+        if not self.enabled:
+            return None, messages
+        return state.get("summary"), self._uncovered(state, messages)
+
+    def after_turn(self, session_id: str, user_id: str, uncovered: int):
+        """Start a background fold when a turn leaves `uncovered` messages outside the summary"""
+        if not self.enabled or session_id in self._folding:
+            return
+        if session_id in self._landed:
+            # The turn's context may have been read before the fold landed; the next turn sees it
+            self._landed.discard(session_id)
+            return
+        if uncovered < self.window:
+            return
+        self._folding.add(session_id)
+        # A fresh context: the fold's reads are not charged to the request that triggered it
+        task = asyncio.get_running_loop().create_task(
+            self._run_fold(session_id, user_id), context=contextvars.Context()
+        )
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run_fold(self, session_id: str, user_id: str):
+        # The fold's own Firestore tally, published under the route "session_summary"
+        tally = start_request_tally()
+        set_request_user(user_id)
+        try:
+            folded = await self.fold(session_id, user_id)
+            SESSION_SUMMARY_FOLDS.inc(outcome="folded" if folded else "skipped")
+            if folded:
+                if len(self._landed) > MAX_LANDED:
+                    self._landed.clear()
+                self._landed.add(session_id)
+        except Exception:
+            SESSION_SUMMARY_FOLDS.inc(outcome="failed")
+        finally:
+            self._folding.discard(session_id)
+            finish_request_tally(tally, "TASK", "session_summary")
+
+    @timed("session_summary.fold")
+    async def fold(self, session_id: str, user_id: str) -> int:
+        """
+        Fold all but the newest `keep` uncovered messages into the summary,
+        once at least `window` are uncovered; returns how many were folded
+        """
+        every = max(1, settings.SESSION_SUMMARY_EVERY_TURNS)
+        state, messages = await storage.get_session_context(session_id, user_id, limit=self.window + 2 * every)
+        uncovered = self._uncovered(state, messages)
+        if len(uncovered) < self.window:
+            return 0
+        folded = uncovered[:-self.keep]
+        summary = await gemini_service.summarize_async(
+            state.get("summary"),
+            [{"role": m.role, "content": m.content} for m in folded],
+            user_id=user_id
+        )
+        if not summary:
+            raise ValueError("empty summary")
+        await storage.save_session_summary(
+            session_id, user_id, summary, folded[-1].timestamp, (state.get("summary_count") or 0) + len(folded)
+        )
+        SESSION_SUMMARY_MESSAGES.inc(len(folded))
+        return len(folded)
+
+    async def drain(self):
+        """Wait for the folds in progress (benchmarks, shutdown)"""
+        if self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "mode": self.mode,
+            "context_messages": self.window,
+            "kept_after_fold": self.keep,
+            "folds": {o: SESSION_SUMMARY_FOLDS.value(outcome=o) for o in ("folded", "skipped", "failed")},
+            "messages_folded": SESSION_SUMMARY_MESSAGES.value(),
+            "in_progress": len(self._folding),
+        }
+
+# Create singleton instance
+session_summary = SessionSummarizer()
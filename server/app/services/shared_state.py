@@ -0,0 +1,303 @@
+"""
+State shared by every worker process: caches, verified ID tokens and the
+per-user rate-limit buckets. Selected by SHARED_STATE:
+
+- memory (default): a dict in this process; every uvicorn worker has its own
+- unix:///path/to.sock or redis://[:password@]host:port/db: a Redis-compatible
+  server. `python -m app.launcher` starts the local stand-in
+  (app/services/state_server.py) on a Unix socket when SHARED_STATE=local
+
+Values are bytes with an optional TTL. take_token() is an atomic token-bucket
+take; on Redis it runs as a Lua script, sent by its SHA once the server has
+it. When the server cannot be reached the call falls back to this process's
+memory, so a store outage degrades limits and caches to per-worker instead of
+failing requests; after a failure the server is left alone for
+FAILURE_BACKOFF seconds, so an unreachable store does not add a timeout to
+every request.
+"""
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import unquote, urlparse
+from app.core.config import settings
+from app.core.metrics import metrics
+
+SHARED_STATE_ERRORS = metrics.counter(
+    "shared_state_errors_total", "Shared state calls that fell back to process memory", ("op",)
+)
+
+MAX_MEMORY_KEYS = 100_000
+COMMAND_TIMEOUT = 1.0  # seconds; a slow store must not stall requests
+FAILURE_BACKOFF = 2.0  # seconds of process memory after a connection failure
+
+# Atomic token bucket: KEYS[1] bucket; ARGV rate/s, capacity, amount -> {allowed, wait seconds}
+TOKEN_BUCKET_LUA = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local amount = tonumber(ARGV[3])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(state[1]) or capacity
+local updated = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+local allowed, wait = 0, 0
+if tokens >= amount then
+  tokens = tokens - amount
+  allowed = 1
+else
+  wait = (amount - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate * 1000) + 1000)
+return {allowed, tostring(wait)}
+"""
+TOKEN_BUCKET_SHA = hashlib.sha1(TOKEN_BUCKET_LUA.encode()).hexdigest()
+
+
+class TokenBucket:
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate_per_second: float, capacity: float):
+        self.rate = rate_per_second
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def try_take(self, amount: float = 1.0) -> Tuple[bool, float]:
+        """Take tokens if available; otherwise return the seconds until they will be"""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= amount:
+            self.tokens -= amount
+            return True, 0.0
+        return False, (amount - self.tokens) / self.rate if self.rate > 0 else float("inf")
+
+
+class MemoryState:
+    """Process-local state: bounded key/value store with TTLs, and token buckets"""
+    name = "memory"
+
+    def __init__(self, max_keys: int = MAX_MEMORY_KEYS):
+        self.max_keys = max_keys
+        self._values: "OrderedDict[str, Tuple[bytes, Optional[float]]]" = OrderedDict()
+        self._buckets: Dict[str, TokenBucket] = {}
+
+    async def get(self, key: str) -> Optional[bytes]:
+        item = self._values.get(key)
+        if item is None:
+            return None
+        value, expires = item
+        if expires is not None and expires <= time.monotonic():
+            del self._values[key]
+            return None
+        return value
+
+    async def set(self, key: str, value: bytes, ttl: Optional[float] = None):
+        self._values[key] = (value, time.monotonic() + ttl if ttl else None)
+        self._values.move_to_end(key)
+        while len(self._values) > self.max_keys:
+            self._values.popitem(last=False)
+
+    async def delete(self, key: str):
+        self._values.pop(key, None)
+
+    async def take_token(self, key: str, rate: float, capacity: float, amount: float = 1.0) -> Tuple[bool, float]:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(rate, capacity)
+        return bucket.try_take(amount)
+
+    async def ping(self) -> bool:
+        return True
+
+    def readiness(self) -> Dict[str, Any]:
+        return {"backend": self.name, "status": "ready"}
+
+
+# -- RESP (Redis protocol) ------------------------------------------------
+
+class RespError(Exception):
+    pass
+
+
+def encode_command(args) -> bytes:
+    out = [b"*%d\r\n" % len(args)]
+    for arg in args:
+        data = arg if isinstance(arg, bytes) else str(arg).encode()
+        out.append(b"$%d\r\n%s\r\n" % (len(data), data))
+    return b"".join(out)
+
+
+async def read_reply(reader: asyncio.StreamReader):
+    line = await reader.readline()
+    if not line:
+        raise ConnectionError("connection closed by the shared state server")
+    kind, rest = line[:1], line[1:-2]
+    if kind == b"+":
+        return rest.decode()
+    if kind == b"-":
+        return RespError(rest.decode())
+    if kind == b":":
+        return int(rest)
+    if kind == b"$":
+        length = int(rest)
+        if length < 0:
+            return None
+        data = await reader.readexactly(length + 2)
+        return data[:-2]
+    if kind == b"*":
+        length = int(rest)
+        return None if length < 0 else [await read_reply(reader) for _ in range(length)]
+    raise RespError(f"bad reply line: {line!r}")
+
+
+class RespState:
+    """Client for a Redis-compatible server over TCP or a Unix socket, with a small connection pool"""
+
+    def __init__(self, url: str, pool_size: int = 16):
+        self.name = url
+        parsed = urlparse(url)
+        self._path = unquote(parsed.path) if parsed.scheme == "unix" else None
+        self._host = parsed.hostname or "localhost"
+        self._port = parsed.port or 6379
+        self._password = unquote(parsed.password) if parsed.password else None
+        self._db = int(parsed.path.lstrip("/") or 0) if parsed.scheme != "unix" else 0
+        self.pool_size = pool_size
+        self._idle: List[Tuple[asyncio.StreamReader, asyncio.StreamWriter]] = []
+        self._loop = None
+        self._retry_at = 0.0
+        self.last_error: Optional[str] = None
+        self.fallback = MemoryState()
+
+    async def _connect(self):
+        if self._path:
+            reader, writer = await asyncio.open_unix_connection(self._path)
+        else:
+            reader, writer = await asyncio.open_connection(self._host, self._port)
+        conn = (reader, writer)
+        if self._password:
+            await self._roundtrip(conn, ("AUTH", self._password))
+        if self._db:
+            await self._roundtrip(conn, ("SELECT", self._db))
+        return conn
+
+    async def _roundtrip(self, conn, args):
+        reader, writer = conn
+        writer.write(encode_command(args))
+        await writer.drain()
+        reply = await read_reply(reader)
+        if isinstance(reply, RespError):
+            raise reply
+        return reply
+
+    async def command(self, *args):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # Connections belong to the loop that opened them
+            self._loop, self._idle = loop, []
+        if time.monotonic() < self._retry_at:
+            # Keep the error that started the back-off for readiness()
+            raise ConnectionError(self.last_error or "shared state server unavailable")
+        try:
+            conn = self._idle.pop() if self._idle else await asyncio.wait_for(self._connect(), COMMAND_TIMEOUT)
+        except Exception:
+            self._retry_at = time.monotonic() + FAILURE_BACKOFF
+            raise
+        try:
+            reply = await asyncio.wait_for(self._roundtrip(conn, args), COMMAND_TIMEOUT)
+        except RespError:
+            self._release(conn)
+            raise
+        except Exception:
+            conn[1].close()
+            self._retry_at = time.monotonic() + FAILURE_BACKOFF
+            raise
+        except BaseException:
+            conn[1].close()
+            raise
+        self._release(conn)
+        self.last_error = None
+        return reply
+
+    def _release(self, conn):
+        if len(self._idle) < self.pool_size:
+            self._idle.append(conn)
+        else:
+            conn[1].close()
+
+    def _failed(self, op: str, e: Exception):
+        SHARED_STATE_ERRORS.inc(op=op)
+        if self.last_error is None:
+            print(f"Shared state {self.name} unavailable ({e}); using process memory")
+        self.last_error = str(e) or type(e).__name__
+
+    async def ping(self) -> bool:
+        try:
+            return await self.command("PING") == "PONG"
+        except Exception as e:
+            self._failed("ping", e)
+            return False
+
+    async def get(self, key: str) -> Optional[bytes]:
+        try:
+            return await self.command("GET", key)
+        except Exception as e:
+            self._failed("get", e)
+            return await self.fallback.get(key)
+
+    async def set(self, key: str, value: bytes, ttl: Optional[float] = None):
+        try:
+            if ttl:
+                await self.command("SET", key, value, "PX", max(1, int(ttl * 1000)))
+            else:
+                await self.command("SET", key, value)
+        except Exception as e:
+            self._failed("set", e)
+            await self.fallback.set(key, value, ttl)
+
+    async def delete(self, key: str):
+        try:
+            await self.command("DEL", key)
+        except Exception as e:
+            self._failed("delete", e)
+            await self.fallback.delete(key)
+
+    async def take_token(self, key: str, rate: float, capacity: float, amount: float = 1.0) -> Tuple[bool, float]:
+        args = (1, key, repr(rate), repr(capacity), repr(amount))
+        try:
+            try:
+                allowed, wait = await self.command("EVALSHA", TOKEN_BUCKET_SHA, *args)
+            except RespError as e:
+                if not str(e).startswith("NOSCRIPT"):
+                    raise
+                # The server does not have the script yet (new or restarted): EVAL caches it
+                allowed, wait = await self.command("EVAL", TOKEN_BUCKET_LUA, *args)
+            return allowed == 1, float(wait)
+        except Exception as e:
+            self._failed("take_token", e)
+            return await self.fallback.take_token(key, rate, capacity, amount)
+
+    def readiness(self) -> Dict[str, Any]:
+        report: Dict[str, Any] = {"backend": self.name, "status": "degraded" if self.last_error else "ready"}
+        if self.last_error:
+            report["error"] = self.last_error
+        return report
+
+
+def create_shared_state(spec: str = None):
+    spec = spec or settings.SHARED_STATE
+    if spec == "memory":
+        return MemoryState()
+    if spec == "local":
+        return RespState(f"unix://{settings.SHARED_STATE_SOCKET}")
+    if spec.startswith(("unix://", "redis://")):
+        return RespState(spec)
+    raise ValueError(f"Unknown SHARED_STATE '{spec}' (expected memory, local, unix://... or redis://...)")
+
+
+# Create singleton instance
+shared_state = create_shared_state()
@@ -0,0 +1,87 @@
+"""
+Single-flight request coalescing.
+
+Concurrent callers asking for the same key share one in-flight call: the first
+caller (leader) starts it, later callers (followers) await the same result and
+also receive its exception. A caller that is cancelled only stops waiting; the
+shared call is cancelled once every waiter has gone away.
+"""
+import asyncio
+import hashlib
+import json
+from typing import Any, Awaitable, Callable, Dict, List, TypeVar
+from app.core.metrics import metrics
+
+T = TypeVar("T")
+
+SINGLEFLIGHT_CALLS = metrics.counter(
+    "singleflight_calls_total", "Coalesced calls by role (leader = upstream call, shared = duplicate)", ("group", "role")
+)
+SINGLEFLIGHT_IN_FLIGHT = metrics.gauge(
+    "singleflight_keys_in_flight", "Distinct keys with a call in flight", ("group",)
+)
+
+
+def normalize_prompt(message: str) -> str:
+    """Collapse whitespace and case so trivially different prompts coalesce"""
+    return " ".join(message.split()).casefold()
+
+
+def coalescing_key(model: str, history: List[Dict[str, Any]], message: str) -> str:
+    """Key of a call: model, full context sent upstream and the normalized prompt"""
+    context = hashlib.sha256(
+        json.dumps(history, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8")
+    ).hexdigest()
+    return f"{model}:{context}:{hashlib.sha256(normalize_prompt(message).encode('utf-8')).hexdigest()}"
+
+
+class _Call:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    def __init__(self, group: str):
+        self.group = group
+        self._calls: Dict[str, _Call] = {}
+        self.leaders = 0
+        self.shared = 0
+
+    def _forget(self, key: str, call: _Call):
+        if call.task.done() and not call.task.cancelled():
+            call.task.exception()  # mark retrieved even if every waiter left
+        if self._calls.get(key) is call:
+            del self._calls[key]
+            SINGLEFLIGHT_IN_FLIGHT.set(len(self._calls), group=self.group)
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        call = self._calls.get(key)
+        if call is None:
+            call = _Call(asyncio.ensure_future(fn()))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda _task, key=key, call=call: self._forget(key, call))
+            self.leaders += 1
+            SINGLEFLIGHT_CALLS.inc(group=self.group, role="leader")
+            SINGLEFLIGHT_IN_FLIGHT.set(len(self._calls), group=self.group)
+        else:
+            self.shared += 1
+            SINGLEFLIGHT_CALLS.inc(group=self.group, role="shared")
+
+        call.waiters += 1
+        try:
+            # shield: one waiter being cancelled must not cancel the shared call
+            return await asyncio.shield(call.task)
+        except asyncio.CancelledError:
+            if not call.task.done():
+                call.waiters -= 1
+                if call.waiters == 0:
+                    # Nobody is interested any more; drop it so the next caller starts fresh
+                    call.task.cancel()
+                    self._forget(key, call)
+            raise
+
+    def stats(self) -> Dict[str, int]:
+        return {"leaders": self.leaders, "shared": self.shared, "in_flight": len(self._calls)}
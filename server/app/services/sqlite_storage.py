@@ -0,0 +1,466 @@
+"""
+Local SQLite storage backend (STORAGE_BACKEND=sqlite).
+
+For on-prem and air-gapped deployments, and for benchmarks that should not
+need Firestore or its emulator. The database runs in WAL mode (readers never
+block the writer) with indexes matching the access paths:
+
+- chat_sessions (user_id, updated_at)   session list of a user
+- messages (session_id, timestamp)      conversation of a session
+- knowledge_library (created_at)        newest library entries
+- symbol_refs (user_id, symbol_key)     symbol cross-reference lookups
+
+Triggers on knowledge_library count its writes in collection_versions.
+
+Queries take well under a millisecond, so they run directly on the event
+loop instead of paying for a threadpool hop.
+"""
+import json
+import os
+import sqlite3
+import uuid
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Tuple
+from app.core.metrics import timed
+from app.models.session import ChatMessage, SessionResponse
+from app.services.storage_backend import LIBRARY_SUMMARY_FIELDS, StorageBackend
+from app.services.st_symbols import message_symbols
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS chat_sessions (
+    session_id      TEXT PRIMARY KEY,
+    user_id         TEXT NOT NULL,
+    title           TEXT,
+    created_at      TEXT NOT NULL,
+    updated_at      TEXT NOT NULL,
+    message_count   INTEGER NOT NULL DEFAULT 0,
+    last_message    TEXT,
+    summary         TEXT,
+    summary_through TEXT,
+    summary_count   INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_sessions_user_updated ON chat_sessions (user_id, updated_at);
+
+CREATE TABLE IF NOT EXISTS messages (
+    message_id TEXT PRIMARY KEY,
+    session_id TEXT NOT NULL REFERENCES chat_sessions (session_id) ON DELETE CASCADE,
+    role       TEXT NOT NULL,
+    content    TEXT NOT NULL,
+    timestamp  TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_messages_session_timestamp ON messages (session_id, timestamp);
+
+CREATE TABLE IF NOT EXISTS knowledge_library (
+    entry_id           TEXT PRIMARY KEY,
+    user_id            TEXT NOT NULL,
+    user_name          TEXT,
+    user_question      TEXT NOT NULL,
+    assistant_response TEXT NOT NULL,
+    session_id         TEXT,
+    message_pair_id    TEXT,
+    created_at         TEXT NOT NULL,
+    tags               TEXT NOT NULL DEFAULT '[]',
+    category           TEXT,
+    response_preview   TEXT,
+    minhash            TEXT,
+    duplicate_of       TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_library_created ON knowledge_library (created_at);
+
+CREATE TABLE IF NOT EXISTS collection_versions (
+    name    TEXT PRIMARY KEY,
+    version INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO collection_versions (name, version) VALUES ('knowledge_library', 0);
+CREATE TRIGGER IF NOT EXISTS library_version_insert AFTER INSERT ON knowledge_library BEGIN
+    UPDATE collection_versions SET version = version + 1 WHERE name = 'knowledge_library';
+END;
+CREATE TRIGGER IF NOT EXISTS library_version_update AFTER UPDATE ON knowledge_library BEGIN
+    UPDATE collection_versions SET version = version + 1 WHERE name = 'knowledge_library';
+END;
+CREATE TRIGGER IF NOT EXISTS library_version_delete AFTER DELETE ON knowledge_library BEGIN
+    UPDATE collection_versions SET version = version + 1 WHERE name = 'knowledge_library';
+END;
+
+CREATE TABLE IF NOT EXISTS symbol_refs (
+    message_id  TEXT NOT NULL REFERENCES messages (message_id) ON DELETE CASCADE,
+    symbol_key  TEXT NOT NULL,
+    user_id     TEXT NOT NULL,
+    session_id  TEXT NOT NULL,
+    symbol      TEXT NOT NULL,
+    kind        TEXT NOT NULL,
+    data_type   TEXT,
+    address     TEXT,
+    fb_instance INTEGER NOT NULL DEFAULT 0,
+    pou         TEXT,
+    timestamp   TEXT NOT NULL,
+    PRIMARY KEY (message_id, symbol_key)
+);
+CREATE INDEX IF NOT EXISTS idx_symbol_refs_user_key ON symbol_refs (user_id, symbol_key);
+
+CREATE TABLE IF NOT EXISTS generation_jobs (
+    job_id     TEXT PRIMARY KEY,
+    user_id    TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    data       TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_user_created ON generation_jobs (user_id, created_at);
+
+CREATE TABLE IF NOT EXISTS generation_job_items (
+    job_id TEXT NOT NULL REFERENCES generation_jobs (job_id) ON DELETE CASCADE,
+    idx    INTEGER NOT NULL,
+    data   TEXT NOT NULL,
+    PRIMARY KEY (job_id, idx)
+);
+"""
+
+_JOB_DATETIME_FIELDS = ("created_at", "updated_at", "completed_at")
+
+_INSERT_LIBRARY_ENTRY = (
+    "INSERT OR REPLACE INTO knowledge_library (entry_id, user_id, user_name, user_question, "
+    "assistant_response, session_id, message_pair_id, created_at, tags, category, response_preview, "
+    "minhash, duplicate_of) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+)
+
+_LIBRARY_UPDATABLE = {"tags", "category", "response_preview", "minhash", "duplicate_of"}
+
+
+def _ts(value: Optional[datetime]) -> Optional[str]:
+    # Fixed-width ISO strings sort chronologically
+    return value.isoformat(timespec="microseconds") if value is not None else None
+
+
+def _dt(value: Optional[str]) -> Optional[datetime]:
+    return datetime.fromisoformat(value) if value else None
+
+
+def _dump_doc(doc: Dict[str, Any]) -> str:
+    return json.dumps(doc, default=lambda v: _ts(v) if isinstance(v, datetime) else str(v))
+
+
+def _load_doc(text: str) -> Dict[str, Any]:
+    doc = json.loads(text)
+    for field in _JOB_DATETIME_FIELDS:
+        if isinstance(doc.get(field), str):
+            doc[field] = _dt(doc[field])
+    return doc
+
+
+class SQLiteStorage(StorageBackend):
+    name = "sqlite"
+
+    def __init__(self, path: str):
+        self.path = path
+        if path != ":memory:" and os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("PRAGMA foreign_keys=ON")
+        self.db.executescript(SCHEMA)
+        print(f"SQLite storage initialized at {path}")
+
+    def is_available(self) -> bool:
+        return self.db is not None
+
+    def _owned_session(self, session_id: str, user_id: str) -> sqlite3.Row:
+        row = self.db.execute(
+            "SELECT * FROM chat_sessions WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        if row is None or row["user_id"] != user_id:
+            raise ValueError("Session not found or access denied")
+        return row
+
+    # -- chat sessions and messages ------------------------------------------
+
+    @timed("sqlite.create_chat_session")
+    async def create_chat_session(self, user_id: str, title: str = "New Chat") -> str:
+        session_id = str(uuid.uuid4())
+        now = _ts(datetime.utcnow())
+        self.db.execute(
+            "INSERT INTO chat_sessions (session_id, user_id, title, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+            (session_id, user_id, title, now, now)
+        )
+        return session_id
+
+    @timed("sqlite.get_user_sessions")
+    async def get_user_sessions(self, user_id: str, limit: int = 50) -> List[SessionResponse]:
+        rows = self.db.execute(
+            "SELECT * FROM chat_sessions WHERE user_id = ? ORDER BY updated_at DESC LIMIT ?",
+            (user_id, limit)
+        ).fetchall()
+        return [
+            SessionResponse(
+                session_id=row["session_id"],
+                title=row["title"] or "Untitled Chat",
+                created_at=_dt(row["created_at"]),
+                updated_at=_dt(row["updated_at"]),
+                message_count=row["message_count"],
+                last_message=row["last_message"]
+            )
+            for row in rows
+        ]
+
+    @timed("sqlite.get_session_messages")
+    async def get_session_messages(self, session_id: str, user_id: str, limit: int = 100) -> List[ChatMessage]:
+        self._owned_session(session_id, user_id)
+        rows = self.db.execute(
+            "SELECT * FROM messages WHERE session_id = ? ORDER BY timestamp LIMIT ?",
+            (session_id, limit)
+        ).fetchall()
+        return [
+            ChatMessage(
+                role=row["role"],
+                content=row["content"],
+                timestamp=_dt(row["timestamp"]),
+                message_id=row["message_id"]
+            )
+            for row in rows
+        ]
+
+    @timed("sqlite.get_session_version")
+    async def get_session_version(self, session_id: str, user_id: str) -> str:
+        row = self._owned_session(session_id, user_id)
+        return f"{row['updated_at']}:{row['message_count']}"
+
+    @timed("sqlite.get_session_context")
+    async def get_session_context(self, session_id: str, user_id: str,
+                                  limit: int) -> Tuple[Dict[str, Any], List[ChatMessage]]:
+        row = self._owned_session(session_id, user_id)
+        rows = self.db.execute(
+            "SELECT * FROM messages WHERE session_id = ? ORDER BY timestamp DESC LIMIT ?",
+            (session_id, limit)
+        ).fetchall()
+        summary = {
+            "summary": row["summary"],
+            "summary_through": _dt(row["summary_through"]),
+            "summary_count": row["summary_count"],
+        }
+        return summary, [
+            ChatMessage(
+                role=r["role"],
+                content=r["content"],
+                timestamp=_dt(r["timestamp"]),
+                message_id=r["message_id"]
+            )
+            for r in reversed(rows)
+        ]
+
+    @timed("sqlite.save_session_summary")
+    async def save_session_summary(self, session_id: str, user_id: str, summary: str,
+                                   through: datetime, count: int):
+        self.db.execute(
+            "UPDATE chat_sessions SET summary = ?, summary_through = ?, summary_count = ? "
+            "WHERE session_id = ? AND user_id = ?",
+            (summary, _ts(through), count, session_id, user_id)
+        )
+
+    @timed("sqlite.add_message_to_session")
+    async def add_message_to_session(self, session_id: str, user_id: str, role: str, content: str) -> str:
+        self._owned_session(session_id, user_id)
+        message_id = str(uuid.uuid4())
+        now = _ts(datetime.utcnow())
+        with self.db:
+            self.db.execute("BEGIN")
+            self.db.execute(
+                "INSERT INTO messages (message_id, session_id, role, content, timestamp) VALUES (?, ?, ?, ?, ?)",
+                (message_id, session_id, role, content, now)
+            )
+            self.db.execute(
+                "UPDATE chat_sessions SET updated_at = ?, message_count = message_count + 1, last_message = ? "
+                "WHERE session_id = ?",
+                (now, content[:100] + "..." if len(content) > 100 else content, session_id)
+            )
+            self.db.executemany(
+                "INSERT OR REPLACE INTO symbol_refs (message_id, symbol_key, user_id, session_id, symbol, kind, "
+                "data_type, address, fb_instance, pou, timestamp) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [(message_id, s["symbol_key"], user_id, session_id, s["symbol"], s["kind"], s["data_type"],
+                  s["address"], int(s["fb_instance"]), s["pou"], now) for s in message_symbols(content)]
+            )
+        return message_id
+
+    @timed("sqlite.update_session_title")
+    async def update_session_title(self, session_id: str, user_id: str, title: str) -> bool:
+        self._owned_session(session_id, user_id)
+        self.db.execute(
+            "UPDATE chat_sessions SET title = ?, updated_at = ? WHERE session_id = ?",
+            (title, _ts(datetime.utcnow()), session_id)
+        )
+        return True
+
+    @timed("sqlite.delete_session")
+    async def delete_session(self, session_id: str, user_id: str) -> bool:
+        self._owned_session(session_id, user_id)
+        # Messages and their symbol references go with it (ON DELETE CASCADE)
+        self.db.execute("DELETE FROM chat_sessions WHERE session_id = ?", (session_id,))
+        return True
+
+    @timed("sqlite.find_symbol_refs")
+    async def find_symbol_refs(self, user_id: str, key: str, prefix: bool = False,
+                               limit: int = 50) -> List[Dict[str, Any]]:
+        if prefix:
+            where, args = "symbol_key >= ? AND symbol_key < ?", (key, key + "\uf8ff")
+        else:
+            where, args = "symbol_key = ?", (key,)
+        rows = self.db.execute(
+            f"SELECT * FROM symbol_refs WHERE user_id = ? AND {where} ORDER BY timestamp DESC LIMIT ?",
+            (user_id, *args, limit)
+        ).fetchall()
+        results = []
+        for row in rows:
+            ref = dict(row)
+            ref["fb_instance"] = bool(ref["fb_instance"])
+            ref["timestamp"] = _dt(ref["timestamp"])
+            results.append(ref)
+        return results
+
+    # -- knowledge library ---------------------------------------------------
+
+    @staticmethod
+    def _entry(row: sqlite3.Row) -> Dict[str, Any]:
+        entry = dict(row)
+        if "created_at" in entry:
+            entry["created_at"] = _dt(entry["created_at"])
+        if "tags" in entry:
+            entry["tags"] = json.loads(entry["tags"] or "[]")
+        return entry
+
+    @timed("sqlite.get_library_version")
+    async def get_library_version(self) -> str:
+        row = self.db.execute("SELECT version FROM collection_versions WHERE name = 'knowledge_library'").fetchone()
+        return str(row["version"])
+
+    @timed("sqlite.add_library_entry")
+    async def add_library_entry(self, entry: Dict[str, Any]) -> str:
+        return self.insert_library_entry(entry)
+
+    @staticmethod
+    def _library_row(entry: Dict[str, Any]) -> tuple:
+        return (
+            entry["entry_id"], entry["user_id"], entry.get("user_name"), entry["user_question"],
+            entry["assistant_response"], entry.get("session_id"), entry.get("message_pair_id"),
+            _ts(entry.get("created_at") or datetime.utcnow()), json.dumps(entry.get("tags") or []),
+            entry.get("category"), entry.get("response_preview"), entry.get("minhash"),
+            entry.get("duplicate_of")
+        )
+
+    def insert_library_entry(self, entry: Dict[str, Any]) -> str:
+        """Synchronous insert, also used to seed a database"""
+        self.db.execute(_INSERT_LIBRARY_ENTRY, self._library_row(entry))
+        return entry["entry_id"]
+
+    @timed("sqlite.add_library_entries")
+    async def add_library_entries(self, entries: List[Dict[str, Any]]) -> int:
+        with self.db:
+            self.db.execute("BEGIN")
+            self.db.executemany(_INSERT_LIBRARY_ENTRY, [self._library_row(e) for e in entries])
+        return len(entries)
+
+    @timed("sqlite.update_library_entries")
+    async def update_library_entries(self, updates: Dict[str, Dict[str, Any]]) -> int:
+        with self.db:
+            self.db.execute("BEGIN")
+            for entry_id, fields in updates.items():
+                unknown = set(fields) - _LIBRARY_UPDATABLE
+                if unknown:
+                    raise ValueError(f"Cannot update library fields: {', '.join(sorted(unknown))}")
+                values = [json.dumps(v) if k == "tags" else v for k, v in fields.items()]
+                self.db.execute(
+                    f"UPDATE knowledge_library SET {', '.join(f'{k} = ?' for k in fields)} WHERE entry_id = ?",
+                    (*values, entry_id)
+                )
+        return len(updates)
+
+    @timed("sqlite.delete_library_entries")
+    async def delete_library_entries(self, entry_ids: List[str]) -> int:
+        with self.db:
+            self.db.execute("BEGIN")
+            self.db.executemany("DELETE FROM knowledge_library WHERE entry_id = ?", [(i,) for i in entry_ids])
+        return len(entry_ids)
+
+    @timed("sqlite.get_recent_library_entries")
+    async def get_recent_library_entries(self, limit: int = 50) -> List[Dict[str, Any]]:
+        rows = self.db.execute(
+            "SELECT * FROM knowledge_library ORDER BY created_at DESC LIMIT ?", (limit,)
+        ).fetchall()
+        return [self._entry(row) for row in rows]
+
+    @timed("sqlite.get_library_summaries")
+    async def get_library_summaries(self, limit: int = 50) -> List[Dict[str, Any]]:
+        rows = self.db.execute(
+            f"SELECT {', '.join(LIBRARY_SUMMARY_FIELDS)} FROM knowledge_library ORDER BY created_at DESC LIMIT ?",
+            (limit,)
+        ).fetchall()
+        return [self._entry(row) for row in rows]
+
+    @timed("sqlite.get_library_entry")
+    async def get_library_entry(self, entry_id: str) -> Optional[Dict[str, Any]]:
+        row = self.db.execute("SELECT * FROM knowledge_library WHERE entry_id = ?", (entry_id,)).fetchone()
+        return self._entry(row) if row is not None else None
+
+    @timed("sqlite.get_all_library_entries")
+    async def get_all_library_entries(self) -> List[Dict[str, Any]]:
+        return [self._entry(row) for row in self.db.execute("SELECT * FROM knowledge_library")]
+
+    async def iter_library_entries(self, page_size: int = 500,
+                                   fields: Optional[Sequence[str]] = None) -> AsyncIterator[Dict[str, Any]]:
+        columns = ", ".join(dict.fromkeys(["entry_id", *fields])) if fields is not None else "*"
+        # Keyset pages: no cursor is held open while the consumer awaits
+        last_id = ""
+        while True:
+            rows = self.db.execute(
+                f"SELECT {columns} FROM knowledge_library WHERE entry_id > ? ORDER BY entry_id LIMIT ?",
+                (last_id, page_size)
+            ).fetchall()
+            for row in rows:
+                yield self._entry(row)
+            if len(rows) < page_size:
+                return
+            last_id = rows[-1]["entry_id"]
+
+    # -- generation jobs -----------------------------------------------------
+
+    @timed("sqlite.save_job")
+    async def save_job(self, job: Dict[str, Any], items: List[Dict[str, Any]]):
+        with self.db:
+            self.db.execute("BEGIN")
+            self.db.execute(
+                "INSERT INTO generation_jobs (job_id, user_id, created_at, data) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (job_id) DO UPDATE SET data = excluded.data",
+                (job["job_id"], job["user_id"], _ts(job["created_at"]), _dump_doc(job))
+            )
+            self.db.executemany(
+                "INSERT OR REPLACE INTO generation_job_items (job_id, idx, data) VALUES (?, ?, ?)",
+                [(job["job_id"], item["index"], _dump_doc(item)) for item in items]
+            )
+
+    @timed("sqlite.load_job")
+    async def load_job(self, job_id: str, include_items: bool = True) -> Tuple[Optional[Dict[str, Any]], Optional[List[Dict[str, Any]]]]:
+        row = self.db.execute("SELECT data FROM generation_jobs WHERE job_id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None, None
+        items = None
+        if include_items:
+            items = [
+                _load_doc(r["data"]) for r in self.db.execute(
+                    "SELECT data FROM generation_job_items WHERE job_id = ? ORDER BY idx", (job_id,)
+                )
+            ]
+        return _load_doc(row["data"]), items
+
+    @timed("sqlite.list_jobs")
+    async def list_jobs(self, user_id: str, limit: int = 20) -> List[Dict[str, Any]]:
+        rows = self.db.execute(
+            "SELECT data FROM generation_jobs WHERE user_id = ? ORDER BY created_at DESC LIMIT ?",
+            (user_id, limit)
+        ).fetchall()
+        return [_load_doc(row["data"]) for row in rows]
+
+    @timed("sqlite.list_unfinished_jobs")
+    async def list_unfinished_jobs(self, limit: int = 500) -> List[Dict[str, Any]]:
+        rows = self.db.execute(
+            "SELECT data FROM generation_jobs WHERE json_extract(data, '$.status') IN ('queued', 'running') LIMIT ?",
+            (limit,)
+        ).fetchall()
+        return [_load_doc(row["data"]) for row in rows]
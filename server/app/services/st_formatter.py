@@ -0,0 +1,412 @@
+"""
+Canonical formatting and hashing of IEC 61131-3 Structured Text.
+
+format_st() re-lays out a program deterministically: upper-case keywords,
+identifiers spelled as at their first occurrence, one statement per line, block indentation (POU, VAR sections, IF/CASE/FOR/
+WHILE/REPEAT, TYPE/STRUCT), single spaces around assignments and binary
+operators, `name: TYPE` declarations and `(* ... *)` comments (optionally
+stripped). Formatting a formatted program returns it unchanged.
+
+st_code_hash() keys programs that differ only cosmetically: it hashes the
+token stream with comments dropped, identifiers case-folded (ST is case
+insensitive) and literals canonicalized (T#5000ms == T#5s, 16#FF == 255,
+1.50 == 1.5). It is a token-level normal form, not a full parse.
+"""
+import hashlib
+import re
+from typing import List, Optional, Tuple
+
+_TOKEN_RE = re.compile(r"""
+    (?P<comment>\(\*.*?\*\)|/\*.*?\*/|//[^\n]*)
+  | (?P<string>'(?:[^'$]|\$.)*'|"(?:[^"$]|\$.)*")
+  | (?P<typed>(?:\w+\#)+-?(?:[\w.]|[:\-](?=\w))+)
+  | (?P<number>\d[\d_]*(?:\.\d[\d_]*)?(?:[eE][+-]?\d+)?)
+  | (?P<ident>[A-Za-z_]\w*)
+  | (?P<op>:=|=>|<=|>=|<>|\*\*|\.\.|[-+*/=<>&:;,.()\[\]^])
+  | (?P<space>\s+)
+  | (?P<other>.)
+""", re.S | re.X)
+
+KEYWORDS = frozenset("""
+    PROGRAM END_PROGRAM FUNCTION END_FUNCTION FUNCTION_BLOCK END_FUNCTION_BLOCK METHOD END_METHOD
+    INTERFACE END_INTERFACE PROPERTY END_PROPERTY ACTION END_ACTION NAMESPACE END_NAMESPACE
+    CONFIGURATION END_CONFIGURATION RESOURCE END_RESOURCE TASK ON WITH USING
+    VAR VAR_INPUT VAR_OUTPUT VAR_IN_OUT VAR_GLOBAL VAR_EXTERNAL VAR_TEMP VAR_STAT VAR_INST VAR_CONFIG
+    VAR_ACCESS END_VAR CONSTANT RETAIN NON_RETAIN PERSISTENT AT
+    TYPE END_TYPE STRUCT END_STRUCT ARRAY OF STRING WSTRING POINTER TO REF_TO REF
+    IF THEN ELSIF ELSE END_IF CASE END_CASE FOR BY DO END_FOR WHILE END_WHILE REPEAT UNTIL END_REPEAT
+    EXIT RETURN CONTINUE JMP AND OR XOR NOT MOD AND_THEN OR_ELSE TRUE FALSE NULL THIS SUPER
+    EXTENDS IMPLEMENTS ABSTRACT FINAL OVERRIDE PUBLIC PRIVATE PROTECTED INTERNAL
+    STEP END_STEP INITIAL_STEP TRANSITION END_TRANSITION FROM
+    BOOL BYTE WORD DWORD LWORD SINT INT DINT LINT USINT UINT UDINT ULINT REAL LREAL
+    TIME LTIME DATE LDATE TIME_OF_DAY LTIME_OF_DAY TOD LTOD DATE_AND_TIME LDATE_AND_TIME DT LDT CHAR WCHAR
+    TON TOF TP CTU CTD CTUD R_TRIG F_TRIG SR RS
+""".split())
+
+# POU headers: keyword, name, optional ": TYPE" and modifiers end the header line
+_POU = {"PROGRAM", "FUNCTION", "FUNCTION_BLOCK", "METHOD", "INTERFACE", "PROPERTY", "ACTION",
+        "NAMESPACE", "CONFIGURATION", "RESOURCE", "STEP", "INITIAL_STEP", "TRANSITION"}
+_VAR_SECTIONS = {"VAR", "VAR_INPUT", "VAR_OUTPUT", "VAR_IN_OUT", "VAR_GLOBAL", "VAR_EXTERNAL",
+                 "VAR_TEMP", "VAR_STAT", "VAR_INST", "VAR_CONFIG", "VAR_ACCESS"}
+_VAR_MODIFIERS = {"CONSTANT", "RETAIN", "NON_RETAIN", "PERSISTENT"}
+# Keywords that may be followed directly by "(" or "[" (type constructors)
+_TYPE_CALLS = {"STRING", "WSTRING", "ARRAY", "POINTER", "REF_TO", "REF",
+               "TON", "TOF", "TP", "CTU", "CTD", "CTUD", "R_TRIG", "F_TRIG", "SR", "RS"}
+_TIME_UNITS = (("ms", 10**6), ("us", 10**3), ("ns", 1), ("d", 86400 * 10**9), ("h", 3600 * 10**9),
+               ("m", 60 * 10**9), ("s", 10**9))
+_TIME_PREFIXES = {"T", "TIME", "LT", "LTIME"}
+_TIME_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|us|ns|d|h|m|s)")
+
+INDENT = "    "
+
+
+class _Token:
+    __slots__ = ("kind", "text", "newlines")
+
+    def __init__(self, kind: str, text: str, newlines: int):
+        self.kind = kind          # keyword | ident | number | typed | string | op | comment | other
+        self.text = text          # canonical spelling for output
+        self.newlines = newlines  # line breaks in the source just before this token
+
+
+def _typed_literal(text: str) -> str:
+    prefix, _, value = text.rpartition("#")
+    prefix = prefix.upper()
+    base = prefix.rsplit("#", 1)[-1]
+    if base in _TIME_PREFIXES:
+        value = value.lower()
+    elif base in ("2", "8", "16"):
+        value = value.upper()
+    return f"{prefix}#{value}"
+
+
+def tokenize(code: str) -> List[_Token]:
+    tokens = []
+    newlines = 0
+    for m in _TOKEN_RE.finditer(code):
+        kind = m.lastgroup
+        text = m.group()
+        if kind == "space":
+            newlines += text.count("\n")
+            continue
+        if kind == "ident":
+            upper = text.upper()
+            if upper in KEYWORDS:
+                kind, text = "keyword", upper
+        elif kind == "typed":
+            text = _typed_literal(text)
+        elif kind == "op" and text == "&":
+            kind, text = "keyword", "AND"
+        tokens.append(_Token(kind, text, newlines))
+        newlines = 0
+    return tokens
+
+
+def _comment_lines(text: str) -> List[str]:
+    """Canonical (* ... *) spelling; multi-line comments keep their lines"""
+    if text.startswith("//"):
+        body = text[2:].strip()
+    else:
+        body = text[2:-2]
+    if "\n" in body:
+        return ["(*"] + [line.strip() for line in body.strip().split("\n")] + ["*)"]
+    body = " ".join(body.split())
+    if "*)" in body:
+        return [text.strip()]
+    return [f"(* {body} *)" if body else "(**)"]
+
+
+def _is_operand(token: Optional[_Token]) -> bool:
+    """Whether the token ends an operand (so a following +/- is binary)"""
+    if token is None:
+        return False
+    if token.kind in ("ident", "number", "typed", "string"):
+        return True
+    if token.kind == "keyword":
+        return token.text in ("TRUE", "FALSE", "NULL", "THIS", "SUPER") or token.text in _TYPE_CALLS
+    return token.text in (")", "]", "^")
+
+
+def _space_between(prev: _Token, cur: _Token, prev_unary: bool) -> bool:
+    p, c = prev.text, cur.text
+    if c in (";", ",", ")", "]", ".", "..", "^", ":") or p in ("(", "[", ".", "..") or prev_unary:
+        return False
+    if c in ("(", "["):
+        return not (prev.kind == "ident" or p in (")", "]", "^") or p in _TYPE_CALLS)
+    return True
+
+
+class _Layout:
+    def __init__(self, strip_comments: bool, indent: str):
+        self.strip_comments = strip_comments
+        self.indent_unit = indent
+        self.lines: List[str] = []
+        self.parts: List[str] = []       # text of the line being built
+        self.trailing: List[str] = []    # comments to append to that line
+        self.level = 0
+        self.prev: Optional[_Token] = None
+        self.prev_unary = False
+        self.pending_break = False
+        self.blank_pending = False
+
+    def flush(self):
+        if self.parts:
+            line = self.indent_unit * self.level + "".join(self.parts)
+            if self.trailing:
+                line += "  " + " ".join(self.trailing)
+            self.lines.append(line)
+        self.parts, self.trailing = [], []
+        self.prev, self.prev_unary, self.pending_break = None, False, False
+
+    def emit(self, token: _Token, unary: bool = False):
+        if self.parts and self.prev is not None and _space_between(self.prev, token, self.prev_unary):
+            self.parts.append(" ")
+        self.parts.append(token.text)
+        self.prev, self.prev_unary = token, unary
+
+    def standalone(self, lines: List[str]):
+        self.flush()
+        if self.blank_pending and self.lines:
+            self.lines.append("")
+        self.blank_pending = False
+        self.lines.extend(self.indent_unit * self.level + line for line in lines)
+
+
+def _case_label_ahead(tokens: List[_Token], i: int) -> bool:
+    """A CASE label (e.g. `1, 2:` or `10..20:`) starts at tokens[i]"""
+    for j in range(i, min(len(tokens), i + 64)):
+        t = tokens[j]
+        if t.kind == "comment":
+            continue
+        if t.text == ":":
+            return j > i
+        if t.kind in ("number", "typed", "ident", "string") or t.text in (",", "..", "-", "+", "."):
+            continue
+        return False
+    return False
+
+
+def format_st(code: str, strip_comments: bool = False, indent: str = INDENT) -> str:
+    """Deterministic canonical layout of a Structured Text program"""
+    tokens = tokenize(code)
+    spelling = {}
+    for tok in tokens:
+        if tok.kind == "ident":
+            tok.text = spelling.setdefault(tok.text.casefold(), tok.text)
+    out = _Layout(strip_comments, indent)
+    # Open blocks: (END keyword, level to restore, kind)
+    stack: List[Tuple[str, int, str]] = []
+    awaiting_of = False
+
+    i = 0
+    while i < len(tokens):
+        tok = tokens[i]
+        text = tok.text
+
+        if tok.kind == "comment":
+            i += 1
+            if strip_comments:
+                continue
+            lines = _comment_lines(text)
+            if tok.newlines or (not out.parts) or len(lines) > 1:
+                if tok.newlines > 1:
+                    out.blank_pending = True
+                out.standalone(lines)
+            else:
+                out.trailing.extend(lines)
+            continue
+
+        if out.pending_break and text != ";":
+            out.flush()
+        if not out.parts and tok.newlines > 1 and out.lines:
+            out.blank_pending = True
+        if not out.parts and out.blank_pending:
+            if out.lines and out.lines[-1] != "":
+                out.lines.append("")
+            out.blank_pending = False
+
+        top = stack[-1] if stack else None
+
+        # POU header: keyword, name, return type and modifiers on one line.
+        # The body and VAR sections stay at the POU's level, as in the prompt examples.
+        if tok.kind == "keyword" and text in _POU and not out.parts:
+            stack.append(("END_" + text, out.level, text))
+            out.emit(tok)
+            i += 1
+            while i < len(tokens):
+                nxt = tokens[i]
+                if nxt.kind == "comment" or nxt.newlines or nxt.text == ";":
+                    break
+                if nxt.kind == "keyword" and (nxt.text in _VAR_SECTIONS or nxt.text.startswith("END_")):
+                    break
+                if nxt.kind == "ident" and out.prev.kind == "ident":
+                    break  # a statement follows on the same line
+                out.emit(nxt)
+                i += 1
+            out.flush()
+            continue
+
+        if tok.kind == "keyword" and text in _VAR_SECTIONS and not out.parts:
+            out.emit(tok)
+            i += 1
+            while i < len(tokens) and tokens[i].kind == "keyword" and tokens[i].text in _VAR_MODIFIERS:
+                out.emit(tokens[i])
+                i += 1
+            out.flush()
+            stack.append(("END_VAR", out.level, "VAR"))
+            out.level += 1
+            continue
+
+        if tok.kind == "keyword" and text.startswith("END_"):
+            out.flush()
+            # Close blocks up to the matching one (tolerates a missing END_x)
+            for depth in range(len(stack) - 1, -1, -1):
+                if stack[depth][0] == text:
+                    out.level = stack[depth][1]
+                    del stack[depth:]
+                    break
+            out.emit(tok)
+            out.pending_break = True
+            i += 1
+            continue
+
+        if text == ";":
+            out.emit(tok)
+            out.pending_break = True
+            i += 1
+            continue
+
+        if tok.kind == "keyword" and text in ("TYPE", "STRUCT"):
+            # TYPE opens a line of its own; STRUCT ends "Name: STRUCT"
+            stack.append(("END_" + text, out.level, text))
+            out.emit(tok)
+            out.flush()
+            out.level += 1
+            i += 1
+            continue
+
+        # Statements opening blocks
+        if tok.kind == "keyword" and text in ("IF", "FOR", "WHILE", "CASE", "REPEAT") and not out.parts:
+            end = {"IF": "END_IF", "FOR": "END_FOR", "WHILE": "END_WHILE", "CASE": "END_CASE",
+                   "REPEAT": "END_REPEAT"}[text]
+            stack.append((end, out.level, text))
+            out.emit(tok)
+            if text == "REPEAT":
+                out.flush()
+                out.level += 1
+            awaiting_of = awaiting_of or text == "CASE"
+            i += 1
+            continue
+
+        if tok.kind == "keyword" and text in ("THEN", "DO"):
+            out.emit(tok)
+            out.flush()
+            out.level += 1
+            i += 1
+            continue
+
+        if tok.kind == "keyword" and text == "OF" and awaiting_of and top and top[2] == "CASE":
+            awaiting_of = False
+            out.emit(tok)
+            out.flush()
+            out.level = top[1] + 1
+            i += 1
+            continue
+
+        if tok.kind == "keyword" and text == "ELSIF":
+            out.flush()
+            if top and top[2] == "IF":
+                out.level = top[1]
+            out.emit(tok)
+            i += 1
+            continue
+
+        if tok.kind == "keyword" and text == "ELSE":
+            out.flush()
+            if top and top[2] in ("IF", "CASE"):
+                out.level = top[1] + (1 if top[2] == "CASE" else 0)
+                out.emit(tok)
+                out.flush()
+                out.level += 1
+                i += 1
+                continue
+
+        if tok.kind == "keyword" and text == "UNTIL" and top and top[2] == "REPEAT":
+            out.flush()
+            out.level = top[1]
+            out.emit(tok)
+            i += 1
+            continue
+
+        # CASE labels: "1:", "2, 3:", "10..20:", "Color#Red:"
+        if (top and top[2] == "CASE" and not awaiting_of and not out.parts
+                and _case_label_ahead(tokens, i)):
+            out.level = top[1] + 1
+            while tokens[i].text != ":":
+                if tokens[i].kind != "comment":
+                    out.emit(tokens[i], unary=tokens[i].text in ("-", "+") and not _is_operand(out.prev))
+                i += 1
+            out.emit(tokens[i])
+            out.flush()
+            out.level = top[1] + 2
+            i += 1
+            continue
+
+        unary = text in ("-", "+") and not _is_operand(out.prev)
+        out.emit(tok, unary=unary)
+        i += 1
+
+    out.flush()
+    while out.lines and out.lines[-1] == "":
+        out.lines.pop()
+    return "\n".join(out.lines)
+
+
+def _canonical_literal(tok: _Token) -> str:
+    text = tok.text
+    if tok.kind == "number":
+        digits = text.replace("_", "")
+        try:
+            return str(int(digits))
+        except ValueError:
+            return repr(float(digits))
+    if tok.kind == "typed":
+        prefix, _, value = text.rpartition("#")
+        base = prefix.rsplit("#", 1)[-1]
+        value = value.replace("_", "")
+        if base in _TIME_PREFIXES:
+            negative = value.startswith("-")
+            parts = _TIME_PART.findall(value.lstrip("-"))
+            if parts and "".join(n + u for n, u in parts) == value.lstrip("-"):
+                units = dict(_TIME_UNITS)
+                total = sum(float(n) * units[u] for n, u in parts)
+                return f"TIME#{'-' if negative else ''}{int(round(total))}ns"
+        elif base in ("2", "8", "16"):
+            try:
+                return str(int(value, int(base)))
+            except ValueError:
+                pass
+        elif base == "BOOL":
+            return {"1": "TRUE", "0": "FALSE"}.get(value, value.upper())
+        return text.casefold()
+    if tok.kind == "ident":
+        return text.casefold()
+    return text
+
+
+def canonical_tokens(code: str) -> List[str]:
+    """Token stream of the program with comments, case and literal spelling normalized"""
+    result = []
+    for tok in tokenize(code):
+        if tok.kind == "comment":
+            continue
+        text = _canonical_literal(tok)
+        if text == ";" and result and result[-1] == ";":
+            continue  # empty statements
+        result.append(text)
+    return result
+
+
+def st_code_hash(code: str) -> str:
+    """Key shared by programs that differ only in layout, case, comments or literal spelling"""
+    return hashlib.sha256("\x1f".join(canonical_tokens(code)).encode("utf-8")).hexdigest()[:32]
@@ -0,0 +1,124 @@
+"""
+Symbols declared by the Structured Text in chat messages.
+
+message_symbols() pulls the POU names, declared variables (with their VAR
+section, type and AT address) and function block instances out of the
+plc-code parts of a stored assistant message. The storage backends write one
+reference per symbol next to the message, which makes up the per-user
+cross-reference index behind GET /chat/symbols.
+"""
+import json
+from typing import Any, Dict, List, Optional
+from app.services.st_formatter import tokenize
+
+MAX_SYMBOLS_PER_MESSAGE = 200   # one write each; keeps a message within a Firestore batch
+MAX_SYMBOL_LENGTH = 64
+
+_POU_KINDS = {
+    "PROGRAM": "program", "FUNCTION_BLOCK": "function_block", "FUNCTION": "function",
+    "METHOD": "method", "INTERFACE": "interface", "ACTION": "action",
+}
+_SECTION_KINDS = {
+    "VAR": "local", "VAR_STAT": "local", "VAR_INST": "local", "VAR_TEMP": "temp",
+    "VAR_INPUT": "input", "VAR_OUTPUT": "output", "VAR_IN_OUT": "in_out",
+    "VAR_GLOBAL": "global", "VAR_EXTERNAL": "external", "VAR_CONFIG": "config", "VAR_ACCESS": "access",
+}
+STANDARD_FBS = {"TON", "TOF", "TP", "CTU", "CTD", "CTUD", "R_TRIG", "F_TRIG", "SR", "RS"}
+
+
+def symbol_key(name: str) -> str:
+    """Lookup key of a symbol name (ST identifiers are case insensitive)"""
+    return name.strip().casefold()
+
+
+def _type_text(tokens) -> str:
+    text = ""
+    for tok in tokens:
+        if text and (text[-1].isalnum() or text[-1] in "_])") and (tok.text[0].isalnum() or tok.text[0] == "_"):
+            text += " "
+        text += tok.text
+    return text
+
+
+def extract_symbols(code: str) -> List[Dict[str, Any]]:
+    """POUs, declared variables and FB instances of a Structured Text program"""
+    tokens = [t for t in tokenize(code) if t.kind != "comment"]
+    symbols: List[Dict[str, Any]] = []
+    pou: Optional[str] = None
+    section: Optional[str] = None
+    fb_types = set(STANDARD_FBS)
+    i = 0
+    while i < len(tokens):
+        tok = tokens[i]
+        if tok.kind == "keyword" and tok.text in _POU_KINDS and i + 1 < len(tokens) \
+                and tokens[i + 1].kind == "ident":
+            pou = tokens[i + 1].text
+            if tok.text == "FUNCTION_BLOCK":
+                fb_types.add(pou.upper())
+            symbols.append({"symbol": pou, "kind": _POU_KINDS[tok.text], "data_type": None,
+                            "address": None, "fb_instance": False, "pou": None})
+            i += 2
+            continue
+        if tok.kind == "keyword" and tok.text in _SECTION_KINDS:
+            section = _SECTION_KINDS[tok.text]
+            i += 1
+            continue
+        if tok.text == "END_VAR":
+            section = None
+            i += 1
+            continue
+        if section is None or tok.kind != "ident":
+            i += 1
+            continue
+
+        # name {, name} [AT %address] : type [:= initial] ;
+        names, address = [tok.text], None
+        i += 1
+        while i + 1 < len(tokens) and tokens[i].text == "," and tokens[i + 1].kind == "ident":
+            names.append(tokens[i + 1].text)
+            i += 2
+        if i < len(tokens) and tokens[i].text == "AT":
+            start = i = i + 1
+            while i < len(tokens) and tokens[i].text not in (":", ";"):
+                i += 1
+            address = "".join(t.text for t in tokens[start:i]).upper() or None
+        if i >= len(tokens) or tokens[i].text != ":":
+            continue  # not a declaration
+        start = i = i + 1
+        while i < len(tokens) and tokens[i].text not in (":=", ";") and tokens[i].text != "END_VAR":
+            i += 1
+        data_type = _type_text(tokens[start:i]) or None
+        for name in names:
+            symbols.append({"symbol": name, "kind": section, "data_type": data_type, "address": address,
+                            "fb_instance": False, "pou": pou})
+        while i < len(tokens) and tokens[i].text not in (";", "END_VAR"):
+            i += 1
+
+    # FB types declared after their instances are recognized too
+    for symbol in symbols:
+        if symbol["data_type"] and symbol["data_type"].upper() in fb_types:
+            symbol["fb_instance"] = True
+    return symbols
+
+
+def message_symbols(content: str) -> List[Dict[str, Any]]:
+    """Symbols of the plc-code parts of a stored message, one per name (first declaration wins)"""
+    if not content or not content.lstrip().startswith("["):
+        return []
+    try:
+        parts = json.loads(content)
+    except ValueError:
+        return []
+    if not isinstance(parts, list):
+        return []
+    found: Dict[str, Dict[str, Any]] = {}
+    for part in parts:
+        if not isinstance(part, dict) or part.get("type") != "plc-code" or not isinstance(part.get("content"), str):
+            continue
+        for symbol in extract_symbols(part["content"]):
+            key = symbol_key(symbol["symbol"])
+            if len(key) <= MAX_SYMBOL_LENGTH and key not in found:
+                found[key] = {"symbol_key": key, **symbol}
+            if len(found) >= MAX_SYMBOLS_PER_MESSAGE:
+                return list(found.values())
+    return list(found.values())
@@ -0,0 +1,154 @@
+"""
+Local stand-in for the Redis-compatible shared state server.
+
+    python -m app.services.state_server --socket /tmp/iec-shared-state.sock
+    python -m app.services.state_server --port 6390
+
+Speaks RESP and implements the commands RespState uses: PING, GET,
+SET [EX|PX] [NX], DEL, FLUSHALL, and EVAL / EVALSHA of the token-bucket
+script, which runs as its Python equivalent (there is no Lua here). One asyncio process
+serves every worker, so each command is atomic. `python -m app.launcher`
+starts it when SHARED_STATE=local; point SHARED_STATE at a real Redis instead
+when workers run on more than one host.
+"""
+import argparse
+import asyncio
+import hashlib
+import os
+import signal
+import sys
+from typing import Optional
+from app.services.shared_state import MemoryState, RespError, TOKEN_BUCKET_SHA
+
+
+def encode_reply(value) -> bytes:
+    if value is None:
+        return b"$-1\r\n"
+    if isinstance(value, RespError):
+        return b"-%s\r\n" % str(value).encode()
+    if isinstance(value, bool):
+        return b":%d\r\n" % int(value)
+    if isinstance(value, int):
+        return b":%d\r\n" % value
+    if isinstance(value, str):
+        return b"+%s\r\n" % value.encode()
+    if isinstance(value, bytes):
+        return b"$%d\r\n%s\r\n" % (len(value), value)
+    if isinstance(value, list):
+        return b"*%d\r\n" % len(value) + b"".join(encode_reply(v) for v in value)
+    raise TypeError(f"cannot encode {type(value).__name__}")
+
+
+async def read_command(reader: asyncio.StreamReader) -> Optional[list]:
+    line = await reader.readline()
+    if not line:
+        return None
+    if not line.startswith(b"*"):
+        return line.split()  # inline command (e.g. PING from a terminal)
+    args = []
+    for _ in range(int(line[1:-2])):
+        length = int((await reader.readline())[1:-2])
+        args.append((await reader.readexactly(length + 2))[:-2])
+    return args
+
+
+class StateServer:
+    def __init__(self, max_keys: int = 1_000_000):
+        self.store = MemoryState(max_keys)
+        self.commands = 0
+
+    async def execute(self, args: list):
+        name = args[0].decode().upper()
+        self.commands += 1
+        if name == "PING":
+            return "PONG"
+        if name == "GET":
+            return await self.store.get(args[1].decode())
+        if name == "SET":
+            key, value, ttl, nx = args[1].decode(), args[2], None, False
+            options = [a.decode().upper() for a in args[3:]]
+            for i, option in enumerate(options):
+                if option == "EX":
+                    ttl = float(options[i + 1])
+                elif option == "PX":
+                    ttl = float(options[i + 1]) / 1000
+                elif option == "NX":
+                    nx = True
+            if nx and await self.store.get(key) is not None:
+                return None
+            await self.store.set(key, value, ttl)
+            return "OK"
+        if name == "DEL":
+            removed = 0
+            for key in (a.decode() for a in args[1:]):
+                removed += await self.store.get(key) is not None
+                await self.store.delete(key)
+            return removed
+        if name == "FLUSHALL":
+            self.store = MemoryState(self.store.max_keys)
+            return "OK"
+        if name in ("EVAL", "EVALSHA"):
+            sha = args[1].decode() if name == "EVALSHA" else hashlib.sha1(args[1]).hexdigest()
+            if sha != TOKEN_BUCKET_SHA:
+                if name == "EVALSHA":
+                    return RespError("NOSCRIPT No matching script")
+                return RespError("ERR only the token bucket script is supported by this server")
+            key = args[3].decode()
+            rate, capacity, amount = (float(a) for a in args[4:7])
+            allowed, wait = await self.store.take_token(key, rate, capacity, amount)
+            return [int(allowed), repr(wait).encode()]
+        if name in ("AUTH", "SELECT"):
+            return "OK"
+        return RespError(f"ERR unknown command '{name}'")
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                args = await read_command(reader)
+                if not args:
+                    break
+                try:
+                    reply = await self.execute(args)
+                except (IndexError, ValueError) as e:
+                    reply = RespError(f"ERR {e}")
+                writer.write(encode_reply(reply))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+async def serve(socket_path: Optional[str] = None, port: Optional[int] = None):
+    server = StateServer()
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        listener = await asyncio.start_unix_server(server.handle, path=socket_path)
+        print(f"Shared state server listening on unix://{socket_path}")
+    else:
+        listener = await asyncio.start_server(server.handle, "127.0.0.1", port)
+        print(f"Shared state server listening on redis://127.0.0.1:{port}")
+    async with listener:
+        await listener.serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local Redis-compatible shared state server")
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("--socket", help="Unix socket path")
+    group.add_argument("--port", type=int, help="TCP port on 127.0.0.1")
+    args = parser.parse_args(argv)
+    # The launcher stops the server with SIGTERM
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        asyncio.run(serve(args.socket, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if args.socket and os.path.exists(args.socket):
+            os.remove(args.socket)
+
+
+if __name__ == "__main__":
+    main()
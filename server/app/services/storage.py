@@ -0,0 +1,23 @@
+"""
+Active storage backend, selected by STORAGE_BACKEND:
+
+- firestore (default): FirestoreService on the async Firestore client
+- sqlite: SQLiteStorage on a local WAL-mode database at SQLITE_PATH
+"""
+from app.core.config import settings
+from app.services.storage_backend import StorageBackend
+
+
+def create_storage(backend: str = None) -> StorageBackend:
+    backend = (backend or settings.STORAGE_BACKEND).lower()
+    if backend == "sqlite":
+        from app.services.sqlite_storage import SQLiteStorage
+        return SQLiteStorage(settings.SQLITE_PATH)
+    if backend == "firestore":
+        from app.services.firestore_service import firestore_service
+        return firestore_service
+    raise ValueError(f"Unknown STORAGE_BACKEND '{backend}' (expected firestore or sqlite)")
+
+
+# Create singleton instance
+storage = create_storage()
@@ -0,0 +1,174 @@
+"""
+Storage interface for chat sessions, messages, library entries and generation
+jobs. Implemented by FirestoreService (firestore_service.py) and SQLiteStorage
+(sqlite_storage.py); the active backend is chosen in storage.py.
+
+Methods that take a session_id and user_id raise ValueError when the session
+does not exist or belongs to someone else.
+"""
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Tuple
+from app.models.session import ChatMessage, SessionResponse
+
+# Fields returned for library list views; the full response stays behind
+LIBRARY_SUMMARY_FIELDS = (
+    "entry_id", "user_name", "user_question", "response_preview",
+    "session_id", "created_at", "tags", "category", "duplicate_of",
+)
+
+
+class StorageBackend(ABC):
+    name = "abstract"
+
+    @abstractmethod
+    def is_available(self) -> bool:
+        ...
+
+    # Startup hooks (see app/core/lifespan.py); backends with a heavy client
+    # override them through LazyInit
+    def initialize(self):
+        """Create the client; called once, off the event loop"""
+
+    async def ensure_initialized(self):
+        pass
+
+    async def ensure_available(self) -> bool:
+        return self.is_available()
+
+    def readiness(self) -> Dict[str, Any]:
+        return {"status": "ready" if self.is_available() else "unavailable"}
+
+    async def warmup(self):
+        """Optional first round trip, so the first request does not pay for it"""
+
+    # -- chat sessions and messages ------------------------------------------
+
+    @abstractmethod
+    async def create_chat_session(self, user_id: str, title: str = "New Chat") -> str:
+        ...
+
+    @abstractmethod
+    async def get_user_sessions(self, user_id: str, limit: int = 50) -> List[SessionResponse]:
+        """Sessions of a user, most recently updated first"""
+
+    @abstractmethod
+    async def get_session_messages(self, session_id: str, user_id: str, limit: int = 100) -> List[ChatMessage]:
+        """Messages of a session in chronological order"""
+
+    @abstractmethod
+    async def get_session_version(self, session_id: str, user_id: str) -> str:
+        """
+        Changes whenever the session's messages do (its updated_at and
+        message_count); one document read, used for ETags
+        """
+
+    @abstractmethod
+    async def get_session_context(self, session_id: str, user_id: str,
+                                  limit: int) -> Tuple[Dict[str, Any], List[ChatMessage]]:
+        """
+        The session's rolling summary ({"summary", "summary_through",
+        "summary_count"}, see session_summary.py) and its newest `limit`
+        messages in chronological order; one document read plus the messages
+        """
+
+    @abstractmethod
+    async def save_session_summary(self, session_id: str, user_id: str, summary: str,
+                                   through: datetime, count: int):
+        """
+        Store a session's summary of its messages up to and including the one
+        at `through` (`count` messages in all); leaves updated_at alone
+        """
+
+    @abstractmethod
+    async def add_message_to_session(self, session_id: str, user_id: str, role: str, content: str) -> str:
+        """
+        Append a message and update the session metadata; returns the message
+        id. Symbols declared by the message's plc-code parts are added to the
+        user's symbol index (st_symbols.message_symbols) in the same write.
+        """
+
+    @abstractmethod
+    async def update_session_title(self, session_id: str, user_id: str, title: str) -> bool:
+        ...
+
+    @abstractmethod
+    async def delete_session(self, session_id: str, user_id: str) -> bool:
+        """Delete a session, all its messages and their symbol references"""
+
+    @abstractmethod
+    async def find_symbol_refs(self, user_id: str, key: str, prefix: bool = False,
+                               limit: int = 50) -> List[Dict[str, Any]]:
+        """
+        References to a symbol (st_symbols.symbol_key) in the user's messages,
+        newest first; with prefix=True every symbol starting with `key`. When
+        a prefix matches more than `limit` references, Firestore returns those
+        of the alphabetically first symbols, SQLite the newest overall
+        """
+
+    # -- knowledge library ---------------------------------------------------
+
+    @abstractmethod
+    async def get_library_version(self) -> str:
+        """
+        Changes with every write to the library (entries added, updated or
+        deleted); one document read, used for ETags
+        """
+
+    @abstractmethod
+    async def add_library_entry(self, entry: Dict[str, Any]) -> str:
+        """Store a library entry (a dict with the LibraryEntry fields, entry_id set)"""
+
+    @abstractmethod
+    async def get_recent_library_entries(self, limit: int = 50) -> List[Dict[str, Any]]:
+        """Library entries from all users, newest first"""
+
+    @abstractmethod
+    async def get_library_summaries(self, limit: int = 50) -> List[Dict[str, Any]]:
+        """Newest entries with the LIBRARY_SUMMARY_FIELDS only (no assistant_response)"""
+
+    @abstractmethod
+    async def get_library_entry(self, entry_id: str) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    async def get_all_library_entries(self) -> List[Dict[str, Any]]:
+        """Every library entry, in no particular order"""
+
+    @abstractmethod
+    def iter_library_entries(self, page_size: int = 500,
+                             fields: Optional[Sequence[str]] = None) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Every library entry ordered by entry_id, read one page at a time
+        (async generator); `fields` projects each entry to those fields
+        """
+
+    @abstractmethod
+    async def add_library_entries(self, entries: List[Dict[str, Any]]) -> int:
+        """Upsert many library entries in batched commits; returns the number written"""
+
+    @abstractmethod
+    async def update_library_entries(self, updates: Dict[str, Dict[str, Any]]) -> int:
+        """Set fields on existing entries ({entry_id: {field: value}}) in batched commits"""
+
+    @abstractmethod
+    async def delete_library_entries(self, entry_ids: List[str]) -> int:
+        ...
+
+    # -- generation jobs -----------------------------------------------------
+
+    @abstractmethod
+    async def save_job(self, job: Dict[str, Any], items: List[Dict[str, Any]]):
+        """Upsert the job document and the given items (keyed by item index)"""
+
+    @abstractmethod
+    async def load_job(self, job_id: str, include_items: bool = True) -> Tuple[Optional[Dict[str, Any]], Optional[List[Dict[str, Any]]]]:
+        """(job document or None, items ordered by index or None)"""
+
+    @abstractmethod
+    async def list_jobs(self, user_id: str, limit: int = 20) -> List[Dict[str, Any]]:
+        """A user's `limit` newest job documents, newest first"""
+
+    @abstractmethod
+    async def list_unfinished_jobs(self, limit: int = 500) -> List[Dict[str, Any]]:
+        """Job documents of every user still queued or running (startup recovery)"""
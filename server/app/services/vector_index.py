@@ -0,0 +1,226 @@
+"""
+Approximate nearest-neighbour index over unit vectors, in NumPy.
+
+IVFIndex (inverted file): spherical k-means splits the vectors into about
+sqrt(N) lists, stored contiguously in list order with an offsets array. A
+query scores the centroids, scans the nprobe closest lists and returns the
+top-k by dot product (cosine similarity), touching a few percent of the
+matrix instead of all of it. Rows can carry an int64 tag; a search given a
+tag only returns rows with that tag (exact-match constraints next to the
+similarity, e.g. the numbers a question mentions).
+
+An index is saved as a build directory of .npy files plus keys.json and
+meta.json; `current` is a symlink to the latest build, replaced atomically
+so concurrent workers never read a half-written index, and load() maps the
+matrix read-only (np.load mmap_mode="r") instead of reading it: workers
+share the page cache and start without parsing anything but the keys.
+
+RingIndex is the mutable counterpart, searched exhaustively: vectors added
+since the last build, and other small sets that change on every request.
+"""
+import json
+import os
+import shutil
+import time
+import uuid
+from typing import Any, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+CURRENT = "current"
+KEEP_BUILDS = 2
+TRAIN_SAMPLE = 20000
+KMEANS_ITERATIONS = 8
+ASSIGN_CHUNK = 8192
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k highest scores, best first"""
+    if k >= len(scores):
+        return np.argsort(-scores)
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top])]
+
+
+def _assign(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    labels = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), ASSIGN_CHUNK):
+        labels[start:start + ASSIGN_CHUNK] = np.argmax(vectors[start:start + ASSIGN_CHUNK] @ centroids.T, axis=1)
+    return labels
+
+
+def _kmeans(vectors: np.ndarray, nlist: int, seed: int) -> np.ndarray:
+    """Spherical k-means centroids (unit vectors) trained on a sample"""
+    rng = np.random.default_rng(seed)
+    sample = vectors
+    if len(vectors) > TRAIN_SAMPLE:
+        sample = vectors[np.sort(rng.choice(len(vectors), TRAIN_SAMPLE, replace=False))]
+    centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+    for _ in range(KMEANS_ITERATIONS):
+        labels = _assign(sample, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, sample)
+        empty = ~sums.any(axis=1)
+        # Empty lists restart from random sample points
+        sums[empty] = sample[rng.choice(len(sample), int(empty.sum()))]
+        centroids = sums / np.maximum(np.linalg.norm(sums, axis=1, keepdims=True), 1e-12)
+    return centroids.astype(np.float32)
+
+
+class IVFIndex:
+    def __init__(self, vectors: np.ndarray, keys: List[str], tags: np.ndarray, centroids: np.ndarray,
+                 offsets: np.ndarray, meta: dict, path: Optional[str] = None):
+        self.vectors = vectors
+        self.keys = keys
+        self.tags = tags
+        self.centroids = centroids
+        self.offsets = offsets
+        self.meta = meta
+        self.path = path
+        self._positions = None
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    @classmethod
+    def build(cls, vectors: np.ndarray, keys: Sequence[str], tags: Optional[np.ndarray] = None,
+              meta: Optional[dict] = None, nlist: Optional[int] = None, seed: int = 0) -> "IVFIndex":
+        """Cluster vectors (N x D, unit rows) keyed by keys"""
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        tags = np.zeros(len(vectors), dtype=np.int64) if tags is None else np.asarray(tags, dtype=np.int64)
+        if len(vectors) == 0:
+            return cls(vectors, [], tags, np.zeros((0, vectors.shape[1]), dtype=np.float32),
+                       np.zeros(1, dtype=np.int64), dict(meta or {}))
+        nlist = max(1, min(nlist or int(np.sqrt(len(vectors))), len(vectors)))
+        centroids = _kmeans(vectors, nlist, seed)
+        labels = _assign(vectors, centroids)
+        order = np.argsort(labels, kind="stable")
+        offsets = np.zeros(nlist + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(np.bincount(labels, minlength=nlist))
+        return cls(vectors[order], [keys[i] for i in order], tags[order], centroids, offsets, dict(meta or {}))
+
+    def _results(self, rows: np.ndarray, scores: np.ndarray, k: int,
+                 tag: Optional[int]) -> List[Tuple[str, float]]:
+        if tag is not None:
+            scores = np.where(self.tags[rows] == tag, scores, -np.inf)
+        return [(self.keys[rows[i]], float(scores[i])) for i in _top_k(scores, k) if np.isfinite(scores[i])]
+
+    def search(self, query: np.ndarray, k: int = 5, nprobe: int = 8,
+               tag: Optional[int] = None) -> List[Tuple[str, float]]:
+        """Approximate top-k (key, similarity), best first"""
+        if not self.keys:
+            return []
+        lists = _top_k(self.centroids @ query, min(nprobe, len(self.centroids)))
+        rows = np.concatenate([np.arange(self.offsets[c], self.offsets[c + 1]) for c in lists])
+        if len(rows) == 0:
+            return []
+        # Probed lists are contiguous slices, so a mapped matrix reads only their pages
+        scores = np.concatenate([self.vectors[self.offsets[c]:self.offsets[c + 1]] @ query for c in lists])
+        return self._results(rows, scores, k, tag)
+
+    def search_exact(self, query: np.ndarray, k: int = 5, tag: Optional[int] = None) -> List[Tuple[str, float]]:
+        """Brute-force top-k, for reference"""
+        if not self.keys:
+            return []
+        return self._results(np.arange(len(self.keys)), np.asarray(self.vectors @ query), k, tag)
+
+    def vector(self, key: str) -> Optional[np.ndarray]:
+        if self._positions is None:
+            self._positions = {k: i for i, k in enumerate(self.keys)}
+        position = self._positions.get(key)
+        return None if position is None else np.asarray(self.vectors[position])
+
+    # -- persistence -------------------------------------------------------
+
+    def save(self, directory: str) -> str:
+        """Write a new build under directory and point `current` at it"""
+        build = os.path.join(directory, uuid.uuid4().hex)
+        os.makedirs(build)
+        np.save(os.path.join(build, "vectors.npy"), np.asarray(self.vectors))
+        np.save(os.path.join(build, "tags.npy"), np.asarray(self.tags))
+        np.save(os.path.join(build, "centroids.npy"), self.centroids)
+        np.save(os.path.join(build, "offsets.npy"), self.offsets)
+        with open(os.path.join(build, "keys.json"), "w") as f:
+            json.dump(self.keys, f)
+        with open(os.path.join(build, "meta.json"), "w") as f:
+            json.dump(self.meta, f)
+
+        link = os.path.join(directory, f".{CURRENT}-{uuid.uuid4().hex}")
+        os.symlink(os.path.basename(build), link)
+        os.replace(link, os.path.join(directory, CURRENT))
+        self.path = build
+        _remove_old_builds(directory, keep=os.path.basename(build))
+        return build
+
+    @classmethod
+    def load(cls, directory: str) -> Optional["IVFIndex"]:
+        """Map the current build read-only; None when there is none"""
+        current = os.path.join(directory, CURRENT)
+        if not os.path.exists(current):
+            return None
+        build = os.path.realpath(current)
+        with open(os.path.join(build, "meta.json")) as f:
+            meta = json.load(f)
+        with open(os.path.join(build, "keys.json")) as f:
+            keys = json.load(f)
+        return cls(np.load(os.path.join(build, "vectors.npy"), mmap_mode="r"), keys,
+                   np.load(os.path.join(build, "tags.npy"), mmap_mode="r"), np.load(os.path.join(build, "centroids.npy")), np.load(os.path.join(build, "offsets.npy")),
+                   meta, path=build)
+
+
+class RingIndex:
+    """Fixed-capacity exact-search store; when full, the oldest vector is overwritten"""
+
+    def __init__(self, dim: int, capacity: int):
+        self.vectors = np.zeros((capacity, dim), dtype=np.float32)
+        self.keys: List[Optional[str]] = [None] * capacity
+        self.owners = np.full(capacity, None, dtype=object)
+        self.tags = np.zeros(capacity, dtype=np.int64)
+        self.payloads: List[Any] = [None] * capacity
+        self.added = np.zeros(capacity)
+        self._next = 0
+        self.size = 0
+
+    def __len__(self) -> int:
+        return sum(1 for key in self.keys[:self.size] if key is not None)
+
+    def add(self, key: str, vector: np.ndarray, tag: int = 0, owner: Optional[str] = None, payload: Any = None):
+        slot = self._next
+        self.vectors[slot] = vector
+        self.tags[slot] = tag
+        self.keys[slot] = key
+        self.owners[slot] = owner
+        self.payloads[slot] = payload
+        self.added[slot] = time.time()
+        self._next = (slot + 1) % len(self.keys)
+        self.size = min(self.size + 1, len(self.keys))
+
+    def remove(self, keys):
+        """Drop every vector whose key is in keys (a set, for large ones)"""
+        for slot in range(self.size):
+            if self.keys[slot] is not None and self.keys[slot] in keys:
+                self.vectors[slot] = 0
+                self.keys[slot] = self.owners[slot] = self.payloads[slot] = None
+
+    def search(self, query: np.ndarray, k: int = 5, tag: Optional[int] = None, owner: Optional[str] = None,
+               max_age: Optional[float] = None) -> List[Tuple[str, float, Any]]:
+        """Top-k (key, similarity, payload), limited to a tag, one owner's vectors and recent ones when given"""
+        if self.size == 0:
+            return []
+        scores = self.vectors[:self.size] @ query
+        if tag is not None:
+            scores[self.tags[:self.size] != tag] = -np.inf
+        if owner is not None:
+            scores[self.owners[:self.size] != owner] = -np.inf
+        if max_age is not None:
+            scores[self.added[:self.size] < time.time() - max_age] = -np.inf
+        return [(self.keys[i], float(scores[i]), self.payloads[i]) for i in _top_k(scores, k)
+                if self.keys[i] is not None and np.isfinite(scores[i])]
+
+
+def _remove_old_builds(directory: str, keep: str) -> None:
+    """Keep the newest KEEP_BUILDS builds; older ones may still be mapped by workers, which is fine on POSIX"""
+    builds = [e for e in os.scandir(directory) if e.is_dir(follow_symlinks=False) and e.name != keep]
+    builds.sort(key=lambda e: e.stat().st_mtime, reverse=True)
+    for entry in builds[KEEP_BUILDS - 1:]:
+        shutil.rmtree(entry.path, ignore_errors=True)
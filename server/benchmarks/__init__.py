@@ -0,0 +1 @@
+# Benchmark and load-testing package (fake Gemini, in-memory Firestore, auth bypass)
@@ -0,0 +1,179 @@
+"""
+Chat turns over the session WebSocket versus POST /messages, and the server
+memory an idle WebSocket costs.
+
+    cd server
+    python -m benchmarks.chat_ws --turns 200 --history 20 --verify-ms 1
+    python -m benchmarks.chat_ws --idle 5000
+
+Both paths run in-process against the fake Gemini (no model latency), so the
+difference is per-turn overhead: token verification (the fake verifier is
+free; --verify-ms adds what an RS256 check costs), the Authorization header
+and the JSON body the web client sends (message plus the conversation
+history the server ignores) against one small frame. Connection setup and
+TLS, which a real HTTPS request may pay again, are not included. Idle
+connections are opened straight against the ASGI app and their memory is
+measured with tracemalloc.
+"""
+import argparse
+import asyncio
+import gc
+import json
+import time
+import tracemalloc
+
+import httpx
+
+from benchmarks.fakes import FakeGenerativeModel, fake_verify_id_token, mint_token
+from benchmarks.harness import load_app
+from benchmarks.run import git_revision, percentile
+from benchmarks.workloads import API
+
+USER = "bench-ws"
+
+
+class ASGISocket:
+    """A WebSocket client driving the ASGI app directly"""
+
+    def __init__(self, app, path: str):
+        self.incoming: asyncio.Queue = asyncio.Queue()
+        self.outgoing: asyncio.Queue = asyncio.Queue()
+        scope = {"type": "websocket", "path": path, "raw_path": path.encode(), "query_string": b"",
+                 "headers": [], "scheme": "ws", "server": ("bench", 80), "client": ("bench", 1),
+                 "subprotocols": [], "asgi": {"version": "3.0"}}
+        self.task = asyncio.ensure_future(app(scope, self.incoming.get, self.outgoing.put))
+        self.bytes_sent = 0
+
+    async def connect(self, token: str):
+        await self.incoming.put({"type": "websocket.connect"})
+        assert (await self.outgoing.get())["type"] == "websocket.accept"
+        await self.send({"t": "auth", "token": token})
+        ready = await self.receive()
+        assert ready["t"] == "ready", ready
+
+    async def send(self, event):
+        text = json.dumps(event, separators=(",", ":"))
+        self.bytes_sent += len(text.encode())
+        await self.incoming.put({"type": "websocket.receive", "text": text})
+
+    async def receive(self):
+        message = await self.outgoing.get()
+        if message["type"] != "websocket.send":
+            raise RuntimeError(f"socket closed: {message}")
+        return json.loads(message["text"])
+
+    async def close(self):
+        await self.incoming.put({"type": "websocket.disconnect", "code": 1000})
+        await self.task
+
+
+def history(n: int):
+    """What the web client sends along with every HTTP turn"""
+    return [{"role": "user" if i % 2 == 0 else "assistant",
+             "content": "Add a second pump with alternating duty. " * (1 if i % 2 == 0 else 25),
+             "timestamp": "2026-01-01T00:00:00"} for i in range(n)]
+
+
+async def http_turns(client, session_id: str, turns: int, n_history: int):
+    token = mint_token(USER)
+    latencies, sent = [], 0
+    past = history(n_history)
+    for i in range(turns):
+        body = json.dumps({"message": f"Turn {i}: add an interlock", "conversation_history": past})
+        headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
+        sent += len(body) + sum(len(k) + len(v) + 4 for k, v in headers.items())
+        started = time.perf_counter()
+        resp = await client.post(f"{API}/chat/sessions/{session_id}/messages", content=body, headers=headers)
+        latencies.append(time.perf_counter() - started)
+        resp.raise_for_status()
+    return latencies, sent / turns
+
+
+async def ws_turns(app, session_id: str, turns: int):
+    socket = ASGISocket(app, f"{API}/chat/sessions/{session_id}/ws")
+    await socket.connect(mint_token(USER))
+    socket.bytes_sent = 0
+    latencies = []
+    for i in range(turns):
+        started = time.perf_counter()
+        await socket.send({"t": "msg", "id": str(i), "text": f"Turn {i}: add an interlock"})
+        while (await socket.receive())["t"] != "done":
+            pass
+        latencies.append(time.perf_counter() - started)
+    await socket.close()
+    return latencies, socket.bytes_sent / turns
+
+
+async def idle_memory(app, session_id: str, connections: int):
+    """Server-side bytes per idle, authenticated connection"""
+    token = mint_token(USER)
+    path = f"{API}/chat/sessions/{session_id}/ws"
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    sockets = []
+    for _ in range(connections):
+        socket = ASGISocket(app, path)
+        await socket.connect(token)
+        sockets.append(socket)
+    gc.collect()
+    per_connection = (tracemalloc.get_traced_memory()[0] - before) / connections
+    tracemalloc.stop()
+    await asyncio.gather(*(s.close() for s in sockets))
+    return per_connection
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Chat turns over WebSocket against HTTP")
+    parser.add_argument("--turns", type=int, default=200)
+    parser.add_argument("--history", type=int, default=20, help="messages of history the web client sends per HTTP turn")
+    parser.add_argument("--verify-ms", type=float, default=0.0, help="simulated cost of verifying an ID token")
+    parser.add_argument("--idle", type=int, default=1000, help="idle connections to open")
+    parser.add_argument("--output", help="write the JSON report here")
+    args = parser.parse_args(argv)
+
+    app, _ = load_app(FakeGenerativeModel(latency="fixed:0"))
+    from app.services.firebase_service import firebase_service
+    from app.services.session_hub import session_hub
+    from app.services.storage import storage
+
+    def verify(token):
+        time.sleep(args.verify_ms / 1000)
+        return fake_verify_id_token(token)
+    firebase_service.verify_id_token = verify
+
+    async def run():
+        http_session = await storage.create_chat_session(USER, "HTTP")
+        ws_session = await storage.create_chat_session(USER, "WebSocket")
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            http = await http_turns(client, http_session, args.turns, args.history)
+        ws = await ws_turns(app, ws_session, args.turns)
+        idle = await idle_memory(app, ws_session, args.idle)
+        assert session_hub.connection_count() == 0
+        return http, ws, idle
+
+    (http_lat, http_bytes), (ws_lat, ws_bytes), idle = asyncio.run(run())
+    report = {
+        "http_p50_ms": 1000 * percentile(http_lat, 0.5),
+        "http_p95_ms": 1000 * percentile(http_lat, 0.95),
+        "http_bytes_per_turn": http_bytes,
+        "ws_p50_ms": 1000 * percentile(ws_lat, 0.5),
+        "ws_p95_ms": 1000 * percentile(ws_lat, 0.95),
+        "ws_bytes_per_turn": ws_bytes,
+        "idle_connections": args.idle,
+        "idle_bytes_per_connection": idle,
+    }
+    print(f"{args.turns} turns, {args.history} history messages per HTTP turn, token check {args.verify_ms} ms")
+    print(f"{'':<12}{'p50 ms':>9}{'p95 ms':>9}{'bytes up':>10}")
+    print(f"{'HTTP':<12}{report['http_p50_ms']:>9.2f}{report['http_p95_ms']:>9.2f}{http_bytes:>10.0f}")
+    print(f"{'WebSocket':<12}{report['ws_p50_ms']:>9.2f}{report['ws_p95_ms']:>9.2f}{ws_bytes:>10.0f}")
+    print(f"{args.idle} idle connections: {idle / 1024:.1f} KiB each")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"revision": git_revision(), "config": vars(args), "report": report}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
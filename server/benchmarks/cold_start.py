@@ -0,0 +1,122 @@
+"""
+Cold start: import time of app.main and time to first response of a fresh
+server process.
+
+    cd server
+    python -m benchmarks.cold_start --runs 5
+    python -m benchmarks.cold_start --storage sqlite --blocking
+
+Each run starts `uvicorn app.main:app` in a new interpreter and polls /health
+until it answers (time to first response), then until every dependency has
+left "starting" (time to ready). --blocking sets STARTUP_BLOCKING=True, where
+the server only listens once the services are initialized, as it did when
+they were created at import time. Without credentials Firebase and Firestore
+fail fast; GEMINI_API_KEY defaults to a dummy value so the Gemini SDK is
+still imported and configured (no call is made).
+"""
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import httpx
+
+from benchmarks.run import git_revision, percentile
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+IMPORT_SNIPPET = (
+    "import time; started = time.perf_counter(); import app.main; "
+    "print(time.perf_counter() - started)"
+)
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def import_seconds(env) -> float:
+    out = subprocess.run([sys.executable, "-c", IMPORT_SNIPPET], cwd=SERVER_DIR, env=env,
+                         capture_output=True, text=True, check=True)
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def serve_once(env, timeout: float = 60.0):
+    """Seconds from process start to the first /health response and to all dependencies ready"""
+    port = free_port()
+    started = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=SERVER_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    first = ready = None
+    body = {}
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=1.0) as client:
+            while time.perf_counter() - started < timeout:
+                try:
+                    body = client.get("/health").json()
+                except httpx.TransportError:
+                    time.sleep(0.002)
+                    continue
+                now = time.perf_counter() - started
+                first = first if first is not None else now
+                if body.get("status") != "starting":
+                    ready = now
+                    break
+                time.sleep(0.002)
+    finally:
+        proc.terminate()
+        proc.wait()
+    if ready is None:
+        raise RuntimeError("server did not become ready")
+    return first, ready, body.get("dependencies", {})
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import time and time to first response")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--storage", choices=["firestore", "sqlite"], default="firestore")
+    parser.add_argument("--blocking", action="store_true", help="STARTUP_BLOCKING=True")
+    parser.add_argument("--output", help="write the JSON report here")
+    args = parser.parse_args(argv)
+
+    env = dict(os.environ, STORAGE_BACKEND=args.storage,
+               STARTUP_BLOCKING="True" if args.blocking else "False",
+               GEMINI_API_KEY=os.getenv("GEMINI_API_KEY") or "cold-start-benchmark",
+               SQLITE_PATH=os.path.join(SERVER_DIR, ".cold_start.sqlite3"))
+    imports, firsts, readies = [], [], []
+    dependencies = {}
+    for _ in range(args.runs):
+        imports.append(import_seconds(env))
+        first, ready, dependencies = serve_once(env)
+        firsts.append(first)
+        readies.append(ready)
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(env["SQLITE_PATH"] + suffix):
+            os.remove(env["SQLITE_PATH"] + suffix)
+
+    report = {
+        "import_p50_ms": 1000 * percentile(imports, 0.5),
+        "first_response_p50_ms": 1000 * percentile(firsts, 0.5),
+        "ready_p50_ms": 1000 * percentile(readies, 0.5),
+        "dependencies": dependencies,
+    }
+    print(f"{args.runs} runs, storage {args.storage}, {'blocking' if args.blocking else 'background'} startup")
+    print(f"import app.main       {report['import_p50_ms']:8.0f} ms")
+    print(f"first /health answer  {report['first_response_p50_ms']:8.0f} ms")
+    print(f"all services ready    {report['ready_p50_ms']:8.0f} ms")
+    for name, state in dependencies.items():
+        print(f"  {name:<10} {state.get('status', '?'):<12} {state.get('init_ms', 0):8.1f} ms")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"revision": git_revision(), "config": vars(args), "report": report}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
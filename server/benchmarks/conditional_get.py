@@ -0,0 +1,113 @@
+"""
+Response compression and conditional GET on the heavy read endpoints.
+
+    cd server
+    python -m benchmarks.conditional_get --entries 200 --turns 50 --rtt 0.004
+    python -m benchmarks.conditional_get --storage sqlite
+
+For GET /library/entries, POST /library/search and
+GET /chat/sessions/{id}/messages this reports the bytes on the wire without
+compression, with gzip and with br (when the brotli module is installed),
+then the latency and Firestore reads of a full 200 against a revalidation
+that sends the ETag back and gets 304 Not Modified. --rtt simulates a
+Firestore round trip per RPC.
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import httpx
+
+from benchmarks.fakes import FakeGenerativeModel, mint_token
+from benchmarks.harness import load_app, seed_library
+from benchmarks.run import git_revision, percentile
+from benchmarks.workloads import API
+
+USER = "bench-conditional"
+
+
+def reads(resp: httpx.Response) -> int:
+    fields = dict(item.strip().split("=") for item in resp.headers["x-firestore-ops"].split(";"))
+    return int(fields["reads"])
+
+
+async def timed_requests(client, request, repeat: int, headers):
+    samples, counts, statuses = [], [], set()
+    for _ in range(repeat):
+        started = time.perf_counter()
+        resp = await request(client, headers)
+        samples.append(time.perf_counter() - started)
+        counts.append(reads(resp))
+        statuses.add(resp.status_code)
+    return 1000 * percentile(samples, 0.5), max(counts), statuses
+
+
+async def measure(app, args):
+    from app.core.middleware import brotli
+
+    auth = {"Authorization": f"Bearer {mint_token(USER)}"}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+        session_id = (await client.post(f"{API}/chat/sessions", json={"title": "bench"}, headers=auth)).json()["session_id"]
+        for i in range(args.turns):
+            (await client.post(f"{API}/chat/sessions/{session_id}/messages",
+                               json={"message": f"Explain a TON timer, example {i}"}, headers=auth)).raise_for_status()
+
+        endpoints = {
+            "library entries": lambda c, h: c.get(f"{API}/library/entries", params={"limit": 50}, headers=h),
+            "library search": lambda c, h: c.post(f"{API}/library/search", json={"query": "timer"}, headers=h),
+            "session messages": lambda c, h: c.get(f"{API}/chat/sessions/{session_id}/messages", headers=h),
+        }
+        encodings = ["identity", "gzip"] + (["br"] if brotli is not None else [])
+        report = {}
+        for name, request in endpoints.items():
+            (await request(client, auth)).raise_for_status()  # first library list backfills previews
+            result = {}
+            for encoding in encodings:
+                resp = await request(client, {**auth, "Accept-Encoding": encoding})
+                resp.raise_for_status()
+                result[f"{encoding}_bytes"] = resp.num_bytes_downloaded
+            etag = resp.headers["etag"]
+            headers = {**auth, "Accept-Encoding": encodings[-1]}
+            result["full_p50_ms"], result["full_reads"], _ = await timed_requests(client, request, args.repeat, headers)
+            result["revalidate_p50_ms"], result["revalidate_reads"], statuses = await timed_requests(
+                client, request, args.repeat, {**headers, "If-None-Match": etag})
+            if statuses != {304}:
+                raise AssertionError(f"{name}: revalidation answered {statuses}, expected 304")
+            report[name] = result
+    return encodings, report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compression and ETag revalidation of heavy read endpoints")
+    parser.add_argument("--entries", type=int, default=200, help="library entries")
+    parser.add_argument("--response-size", type=int, default=1500, help="assistant_response characters per entry")
+    parser.add_argument("--turns", type=int, default=50, help="chat turns in the session (two messages each)")
+    parser.add_argument("--rtt", type=float, default=0.004, help="simulated Firestore round trip (s)")
+    parser.add_argument("--repeat", type=int, default=30)
+    parser.add_argument("--storage", choices=["firestore", "sqlite"], default="firestore")
+    parser.add_argument("--output", help="write the JSON report here")
+    args = parser.parse_args(argv)
+
+    from app.core.config import settings
+    settings.FIRESTORE_OPS_HEADER = True
+    app, raw = load_app(FakeGenerativeModel(latency="fixed:0"), firestore_rtt=args.rtt,
+                        storage_backend=args.storage)
+    seed_library(raw, args.entries, response_size=args.response_size)
+    encodings, report = asyncio.run(measure(app, args))
+
+    print(f"{args.entries} library entries, {2 * args.turns} messages, storage {args.storage}, rtt {args.rtt * 1000:.0f} ms")
+    print(f"{'endpoint':<18}" + "".join(f"{e + ' KiB':>14}" for e in encodings)
+          + f"{'200 ms':>9}{'reads':>7}{'304 ms':>9}{'reads':>7}")
+    for name, r in report.items():
+        print(f"{name:<18}" + "".join(f"{r[e + '_bytes'] / 1024:>14.1f}" for e in encodings)
+              + f"{r['full_p50_ms']:>9.2f}{r['full_reads']:>7}{r['revalidate_p50_ms']:>9.2f}{r['revalidate_reads']:>7}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"revision": git_revision(), "config": vars(args), "report": report}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
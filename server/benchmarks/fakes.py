@@ -0,0 +1,505 @@
+"""
+Stand-ins for the external services used by the server:
+
+- FakeGenerativeModel: replaces the google.generativeai model inside
+  GeminiService, with configurable latency distribution and response size
+- InMemoryFirestore: a small Firestore double covering the client API the
+  server uses (collections, sub-collections, where/order_by/limit/select,
+  stream/get/set/update/delete and write batches); AsyncInMemoryFirestore is
+  the AsyncClient-shaped view of the same data, with an optional simulated
+  round-trip time per RPC
+- mint_token / fake_verify_id_token: an auth bypass for FirebaseService
+"""
+import asyncio
+import copy
+import json
+import math
+import random
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    from google.api_core.exceptions import ServiceUnavailable as _DefaultFault
+except ImportError:  # pragma: no cover
+    _DefaultFault = RuntimeError
+
+
+# ---------------------------------------------------------------------------
+# Latency distributions
+# ---------------------------------------------------------------------------
+
+class LatencyDistribution:
+    """
+    Parsed from a spec string:
+      fixed:0.8             always 0.8 s
+      uniform:0.2,1.5       uniform between 0.2 and 1.5 s
+      lognormal:0.9,0.4     lognormal with median 0.9 s and sigma 0.4
+    """
+
+    def __init__(self, spec: str = "fixed:0", seed: Optional[int] = None):
+        self.spec = spec
+        kind, _, params = spec.partition(":")
+        self.kind = kind
+        self.params = [float(p) for p in params.split(",") if p]
+        self._rng = random.Random(seed)
+        if kind not in ("fixed", "uniform", "lognormal"):
+            raise ValueError(f"Unknown latency distribution: {spec}")
+
+    def sample(self) -> float:
+        if self.kind == "fixed":
+            return self.params[0] if self.params else 0.0
+        if self.kind == "uniform":
+            return self._rng.uniform(self.params[0], self.params[1])
+        median, sigma = self.params
+        return self._rng.lognormvariate(math.log(median), sigma)
+
+
+# ---------------------------------------------------------------------------
+# Gemini
+# ---------------------------------------------------------------------------
+
+_LADDER = "|----] [----]/[----( )----|\n|   Start   Stop   Motor   |"
+_ST_LINE = "  Motor := Start AND NOT Stop;  (* seal-in *)\n"
+
+
+def build_response(size: int, kind: str = "code") -> str:
+    """Build a structured JSON-array response of roughly `size` characters"""
+    parts = [{"type": "text", "content": "Here is a start/stop circuit with a seal-in contact."}]
+    if kind in ("code", "ladder"):
+        if kind == "ladder":
+            parts.append({
+                "type": "ladder",
+                "content": _LADDER,
+                "validation": {"status": "valid", "executable": True, "reason": "Standard seal-in"},
+            })
+        budget = max(0, size - len(json.dumps(parts)) - 120)
+        body = _ST_LINE * max(1, budget // len(_ST_LINE))
+        parts.append({
+            "type": "plc-code",
+            "content": "PROGRAM Motor_Control\nVAR\n  Start: BOOL;\n  Stop: BOOL;\n  Motor: BOOL;\nEND_VAR\n" + body + "END_PROGRAM",
+            "validation": {"status": "valid", "executable": True, "reason": "Declarations complete"},
+        })
+    return json.dumps(parts)
+
+
+class FakeResponse:
+    def __init__(self, text: str, prompt_tokens: int = 0, output_tokens: int = 0):
+        self.text = text
+        self.usage_metadata = type("Usage", (), {
+            "prompt_token_count": prompt_tokens,
+            "candidates_token_count": output_tokens,
+            "total_token_count": prompt_tokens + output_tokens,
+        })()
+
+
+class FakeChat:
+    def __init__(self, model: "FakeGenerativeModel", history):
+        self._model = model
+        self._history = history
+
+    def send_message(self, message, **kwargs):
+        return self._model._respond(self._history, message)
+
+
+class FakeGenerativeModel:
+    """
+    Mimics genai.GenerativeModel for GeminiService: start_chat(history).send_message(msg).
+    `fault_rate` injects upstream errors (raised as `fault_exception`, a 503 by
+    default); `outage=(start, duration)` fails every call in that window, in
+    seconds from the first call, to exercise the circuit breaker.
+    """
+
+    def __init__(
+        self,
+        latency: str = "lognormal:0.9,0.35",
+        response_size: int = 1500,
+        response_kind: str = "code",
+        fault_rate: float = 0.0,
+        fault_exception: Optional[type] = None,
+        outage: Optional[Tuple[float, float]] = None,
+        seed: Optional[int] = None,
+    ):
+        self.latency = LatencyDistribution(latency, seed=seed)
+        self.response_size = response_size
+        self.response_kind = response_kind
+        self.fault_rate = fault_rate
+        self.fault_exception = fault_exception or _DefaultFault
+        self.outage = outage
+        self._started: Optional[float] = None
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.faults = 0
+        self._text = build_response(response_size, response_kind)
+
+    def start_chat(self, history=None, **kwargs):
+        return FakeChat(self, history or [])
+
+    def generate_content(self, contents, **kwargs):
+        return self._respond([], contents)
+
+    def _respond(self, history, message):
+        with self._lock:
+            self.calls += 1
+            delay = self.latency.sample()
+            now = time.monotonic()
+            if self._started is None:
+                self._started = now
+            fault = self._rng.random() < self.fault_rate or self._in_outage(now)
+            if fault:
+                self.faults += 1
+        time.sleep(delay)
+        if fault:
+            raise self.fault_exception("503 injected upstream failure")
+        prompt_chars = sum(len(str(p)) for h in history for p in h.get("parts", [])) + len(str(message))
+        return FakeResponse(self._text, prompt_tokens=prompt_chars // 4, output_tokens=len(self._text) // 4)
+
+    def _in_outage(self, now: float) -> bool:
+        if not self.outage:
+            return False
+        start, duration = self.outage
+        return start <= now - self._started < start + duration
+
+
+# ---------------------------------------------------------------------------
+# Firestore
+# ---------------------------------------------------------------------------
+
+class _Store:
+    """Shared state: {collection path: {doc id: data}}"""
+
+    def __init__(self):
+        self.collections: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self.lock = threading.RLock()
+
+    def collection(self, path: str) -> Dict[str, Dict[str, Any]]:
+        return self.collections.setdefault(path, {})
+
+
+class InMemorySnapshot:
+    def __init__(self, reference: "InMemoryDocument", data: Optional[Dict[str, Any]]):
+        self.reference = reference
+        self.id = reference.id
+        self._data = data
+
+    @property
+    def exists(self) -> bool:
+        return self._data is not None
+
+    def to_dict(self) -> Optional[Dict[str, Any]]:
+        return copy.copy(self._data) if self._data is not None else None
+
+    def get(self, field: str):
+        return (self._data or {}).get(field)
+
+
+class InMemoryDocument:
+    def __init__(self, store: _Store, collection_path: str, doc_id: str):
+        self._store = store
+        self._collection_path = collection_path
+        self.id = doc_id
+        self.path = f"{collection_path}/{doc_id}"
+
+    def get(self, *args, **kwargs) -> InMemorySnapshot:
+        with self._store.lock:
+            data = self._store.collection(self._collection_path).get(self.id)
+            return InMemorySnapshot(self, copy.copy(data) if data is not None else None)
+
+    def set(self, data: Dict[str, Any], merge: bool = False, **kwargs):
+        with self._store.lock:
+            docs = self._store.collection(self._collection_path)
+            if merge and self.id in docs:
+                docs[self.id].update(copy.deepcopy(data))
+            else:
+                docs[self.id] = copy.deepcopy(data)
+
+    def create(self, data: Dict[str, Any], **kwargs):
+        with self._store.lock:
+            if self.id in self._store.collection(self._collection_path):
+                raise ValueError(f"Document already exists: {self.path}")
+            self.set(data)
+
+    def update(self, updates: Dict[str, Any], **kwargs):
+        with self._store.lock:
+            docs = self._store.collection(self._collection_path)
+            if self.id not in docs:
+                raise ValueError(f"No document to update: {self.path}")
+            docs[self.id].update(copy.deepcopy(updates))
+
+    def delete(self, **kwargs):
+        with self._store.lock:
+            self._store.collection(self._collection_path).pop(self.id, None)
+
+    def collection(self, name: str) -> "InMemoryQuery":
+        return InMemoryQuery(self._store, f"{self.path}/{name}")
+
+
+_OPS = {
+    "==": lambda a, b: a == b,
+    "!=": lambda a, b: a != b,
+    "<": lambda a, b: a is not None and a < b,
+    "<=": lambda a, b: a is not None and a <= b,
+    ">": lambda a, b: a is not None and a > b,
+    ">=": lambda a, b: a is not None and a >= b,
+    "in": lambda a, b: a in b,
+    "array_contains": lambda a, b: isinstance(a, list) and b in a,
+    "array_contains_any": lambda a, b: isinstance(a, list) and any(x in a for x in b),
+}
+
+
+class InMemoryQuery:
+    """Collection reference and query in one (queries are immutable copies)"""
+
+    def __init__(self, store: _Store, path: str):
+        self._store = store
+        self._path = path
+        self.id = path.rsplit("/", 1)[-1]
+        self._filters: List[Tuple[str, str, Any]] = []
+        self._orders: List[Tuple[str, str]] = []
+        self._limit: Optional[int] = None
+        self._offset = 0
+        self._fields: Optional[List[str]] = None
+        self._start_after: Optional[Dict[str, Any]] = None
+
+    def _copy(self) -> "InMemoryQuery":
+        clone = InMemoryQuery(self._store, self._path)
+        clone._filters = list(self._filters)
+        clone._orders = list(self._orders)
+        clone._limit = self._limit
+        clone._offset = self._offset
+        clone._fields = self._fields
+        clone._start_after = self._start_after
+        return clone
+
+    def document(self, doc_id: Optional[str] = None) -> InMemoryDocument:
+        return InMemoryDocument(self._store, self._path, doc_id or uuid.uuid4().hex)
+
+    def add(self, data: Dict[str, Any]):
+        ref = self.document()
+        ref.set(data)
+        return time.time(), ref
+
+    def where(self, field_path: str = None, op_string: str = None, value: Any = None, filter=None):
+        if filter is not None:
+            field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+        clone = self._copy()
+        clone._filters.append((field_path, op_string, value))
+        return clone
+
+    def order_by(self, field_path: str, direction: str = "ASCENDING"):
+        clone = self._copy()
+        clone._orders.append((field_path, direction))
+        return clone
+
+    def limit(self, count: int):
+        clone = self._copy()
+        clone._limit = count
+        return clone
+
+    def offset(self, count: int):
+        clone = self._copy()
+        clone._offset = count
+        return clone
+
+    def select(self, field_paths):
+        clone = self._copy()
+        clone._fields = list(field_paths)
+        return clone
+
+    def start_after(self, values: Dict[str, Any]):
+        """Cursor given as {order_by field: value} (ascending orders only)"""
+        clone = self._copy()
+        clone._start_after = dict(values)
+        return clone
+
+    def stream(self, *args, **kwargs):
+        with self._store.lock:
+            items = list(self._store.collection(self._path).items())
+        for field, op, value in self._filters:
+            items = [(k, d) for k, d in items if _OPS[op](d.get(field), value)]
+        for field, direction in reversed(self._orders):
+            items = [(k, d) for k, d in items if d.get(field) is not None]
+            items.sort(key=lambda kv: kv[1][field], reverse=direction == "DESCENDING")
+        if self._start_after is not None:
+            fields = [field for field, _ in self._orders]
+            cursor = tuple(self._start_after[f] for f in fields)
+            items = [(k, d) for k, d in items if tuple(d[f] for f in fields) > cursor]
+        items = items[self._offset:]
+        if self._limit is not None:
+            items = items[:self._limit]
+        for doc_id, data in items:
+            if self._fields is not None:
+                data = {f: data[f] for f in self._fields if f in data}
+            yield InMemorySnapshot(InMemoryDocument(self._store, self._path, doc_id), copy.copy(data))
+
+    def get(self, *args, **kwargs):
+        return list(self.stream())
+
+
+class InMemoryBatch:
+    def __init__(self):
+        self._ops = []
+
+    def set(self, reference, data, merge: bool = False):
+        self._ops.append(lambda: reference.set(data, merge=merge))
+
+    def update(self, reference, updates):
+        self._ops.append(lambda: reference.update(updates))
+
+    def delete(self, reference):
+        self._ops.append(reference.delete)
+
+    def commit(self):
+        for op in self._ops:
+            op()
+        self._ops = []
+        return []
+
+
+class InMemoryFirestore:
+    """Firestore client double; share one instance between services"""
+
+    def __init__(self):
+        self._store = _Store()
+
+    def collection(self, name: str) -> InMemoryQuery:
+        return InMemoryQuery(self._store, name)
+
+    def document(self, path: str) -> InMemoryDocument:
+        collection_path, _, doc_id = path.rpartition("/")
+        return InMemoryDocument(self._store, collection_path, doc_id)
+
+    def batch(self) -> InMemoryBatch:
+        return InMemoryBatch()
+
+    def document_count(self) -> int:
+        with self._store.lock:
+            return sum(len(docs) for docs in self._store.collections.values())
+
+
+class AsyncInMemoryDocument:
+    def __init__(self, sync: InMemoryDocument, rtt: float):
+        self._sync = sync
+        self._rtt = rtt
+        self.id = sync.id
+        self.path = sync.path
+
+    async def get(self, *args, **kwargs) -> InMemorySnapshot:
+        await asyncio.sleep(self._rtt)
+        snapshot = self._sync.get()
+        snapshot.reference = self
+        return snapshot
+
+    async def set(self, data: Dict[str, Any], merge: bool = False, **kwargs):
+        await asyncio.sleep(self._rtt)
+        self._sync.set(data, merge=merge)
+
+    async def create(self, data: Dict[str, Any], **kwargs):
+        await asyncio.sleep(self._rtt)
+        self._sync.create(data)
+
+    async def update(self, updates: Dict[str, Any], **kwargs):
+        await asyncio.sleep(self._rtt)
+        self._sync.update(updates)
+
+    async def delete(self, **kwargs):
+        await asyncio.sleep(self._rtt)
+        self._sync.delete()
+
+    def collection(self, name: str) -> "AsyncInMemoryQuery":
+        return AsyncInMemoryQuery(self._sync.collection(name), self._rtt)
+
+
+class AsyncInMemoryQuery:
+    def __init__(self, sync: InMemoryQuery, rtt: float):
+        self._sync = sync
+        self._rtt = rtt
+        self.id = sync.id
+
+    def _chain(name):
+        def method(self, *args, **kwargs):
+            return AsyncInMemoryQuery(getattr(self._sync, name)(*args, **kwargs), self._rtt)
+        method.__name__ = name
+        return method
+
+    where = _chain("where")
+    order_by = _chain("order_by")
+    limit = _chain("limit")
+    offset = _chain("offset")
+    select = _chain("select")
+    start_after = _chain("start_after")
+    del _chain
+
+    def document(self, doc_id: Optional[str] = None) -> AsyncInMemoryDocument:
+        return AsyncInMemoryDocument(self._sync.document(doc_id), self._rtt)
+
+    async def add(self, data: Dict[str, Any]):
+        ref = self.document()
+        await ref.set(data)
+        return time.time(), ref
+
+    async def stream(self, *args, **kwargs):
+        await asyncio.sleep(self._rtt)
+        for snapshot in self._sync.stream():
+            snapshot.reference = AsyncInMemoryDocument(snapshot.reference, self._rtt)
+            yield snapshot
+
+    async def get(self, *args, **kwargs):
+        return [snapshot async for snapshot in self.stream()]
+
+
+class AsyncInMemoryBatch(InMemoryBatch):
+    def __init__(self, rtt: float):
+        super().__init__()
+        self._rtt = rtt
+
+    def set(self, reference, data, merge: bool = False):
+        super().set(reference._sync, data, merge=merge)
+
+    def update(self, reference, updates):
+        super().update(reference._sync, updates)
+
+    def delete(self, reference):
+        super().delete(reference._sync)
+
+    async def commit(self):
+        await asyncio.sleep(self._rtt)
+        return super().commit()
+
+
+class AsyncInMemoryFirestore:
+    """AsyncClient double over the data of an InMemoryFirestore"""
+
+    def __init__(self, sync: Optional[InMemoryFirestore] = None, rtt: float = 0.0):
+        self.sync = sync or InMemoryFirestore()
+        self.rtt = rtt
+
+    def collection(self, name: str) -> AsyncInMemoryQuery:
+        return AsyncInMemoryQuery(self.sync.collection(name), self.rtt)
+
+    def document(self, path: str) -> AsyncInMemoryDocument:
+        return AsyncInMemoryDocument(self.sync.document(path), self.rtt)
+
+    def batch(self) -> AsyncInMemoryBatch:
+        return AsyncInMemoryBatch(self.rtt)
+
+
+# ---------------------------------------------------------------------------
+# Auth bypass
+# ---------------------------------------------------------------------------
+
+TOKEN_PREFIX = "bench-token:"
+
+
+def mint_token(uid: str, name: Optional[str] = None) -> str:
+    """Mint a test ID token accepted by fake_verify_id_token"""
+    return f"{TOKEN_PREFIX}{uid}:{name or uid}"
+
+
+def fake_verify_id_token(id_token: str) -> dict:
+    if not id_token.startswith(TOKEN_PREFIX):
+        raise ValueError("Invalid authentication credentials: not a benchmark token")
+    uid, _, name = id_token[len(TOKEN_PREFIX):].partition(":")
+    return {"uid": uid, "name": name, "email": f"{uid}@bench.local", "email_verified": True}
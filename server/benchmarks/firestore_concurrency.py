@@ -0,0 +1,120 @@
+"""
+Firestore concurrency scaling: async service versus the old blocking calls.
+
+    cd server
+    FIRESTORE_EMULATOR_HOST=localhost:8080 python -m benchmarks.firestore_concurrency --firestore emulator
+    python -m benchmarks.firestore_concurrency --rtt 0.004     # in-memory with a simulated round trip
+
+Each virtual caller loads a session's messages repeatedly, at increasing
+concurrency. "async" goes through FirestoreService (AsyncClient, ownership
+check and message query issued together); "sync" replays the pre-migration
+code path, blocking calls made straight from the event loop, which cannot
+overlap no matter how many callers there are.
+"""
+import argparse
+import asyncio
+import json
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from benchmarks.fakes import FakeGenerativeModel, InMemoryFirestore
+from benchmarks.harness import load_app
+from benchmarks.run import git_revision, percentile
+
+
+def seed_sessions(client, sessions: int, messages: int):
+    ids = []
+    start = datetime(2025, 1, 1)
+    for s in range(sessions):
+        session_id = str(uuid.uuid4())
+        ref = client.collection("chat_sessions").document(session_id)
+        ref.set({"session_id": session_id, "user_id": "bench-fs", "title": f"Session {s}",
+                 "created_at": start, "updated_at": start, "message_count": messages})
+        batch = client.batch()
+        for m in range(messages):
+            message_id = str(uuid.uuid4())
+            batch.set(ref.collection("messages").document(message_id), {
+                "role": "user" if m % 2 == 0 else "assistant",
+                "content": f"message {m} " * 20,
+                "timestamp": start + timedelta(seconds=m),
+                "message_id": message_id,
+            })
+        batch.commit()
+        ids.append(session_id)
+    return ids
+
+
+def blocking_messages(client, session_id: str, user_id: str, rtt: float):
+    """The pre-migration get_session_messages: sequential blocking round trips"""
+    time.sleep(rtt)
+    session_doc = client.collection("chat_sessions").document(session_id).get()
+    if not session_doc.exists or session_doc.to_dict().get("user_id") != user_id:
+        raise ValueError("Session not found or access denied")
+    time.sleep(rtt)
+    query = client.collection("chat_sessions").document(session_id).collection("messages").order_by("timestamp")
+    return [doc.to_dict() for doc in query.limit(100).stream()]
+
+
+async def run_level(mode, concurrency, calls, session_ids, raw_client, rtt):
+    from app.services.firestore_service import firestore_service
+
+    latencies = []
+
+    async def caller(index):
+        for i in range(calls):
+            session_id = session_ids[(index + i) % len(session_ids)]
+            start = time.perf_counter()
+            if mode == "async":
+                await firestore_service.get_session_messages(session_id, "bench-fs")
+            else:
+                blocking_messages(raw_client, session_id, "bench-fs", rtt)
+                await asyncio.sleep(0)
+            latencies.append(time.perf_counter() - start)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(caller(i) for i in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {
+        "mode": mode,
+        "concurrency": concurrency,
+        "ops_per_s": concurrency * calls / elapsed,
+        "p50_ms": 1000 * percentile(latencies, 0.5),
+        "p95_ms": 1000 * percentile(latencies, 0.95),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Firestore throughput versus concurrent callers")
+    parser.add_argument("--firestore", choices=["memory", "emulator"], default="memory")
+    parser.add_argument("--rtt", type=float, default=0.004,
+                        help="simulated round trip per RPC for the in-memory backend (seconds)")
+    parser.add_argument("--concurrency", default="1,2,4,8,16,32,64")
+    parser.add_argument("--calls", type=int, default=20, help="calls per virtual caller")
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--messages", type=int, default=30, help="messages per session")
+    parser.add_argument("--modes", default="sync,async")
+    parser.add_argument("--output", help="write the JSON report here")
+    args = parser.parse_args(argv)
+
+    _, raw_client = load_app(FakeGenerativeModel(latency="fixed:0"), firestore_backend=args.firestore,
+                             firestore_rtt=args.rtt)
+    # Only the in-memory backend needs a simulated round trip on the blocking path
+    sync_rtt = args.rtt if isinstance(raw_client, InMemoryFirestore) else 0.0
+    session_ids = seed_sessions(raw_client, args.sessions, args.messages)
+
+    rows = []
+    print(f"{'mode':<7}{'callers':>8}{'ops/s':>10}{'p50 ms':>9}{'p95 ms':>9}")
+    for mode in args.modes.split(","):
+        for concurrency in (int(c) for c in args.concurrency.split(",")):
+            row = asyncio.run(run_level(mode, concurrency, args.calls, session_ids, raw_client, sync_rtt))
+            rows.append(row)
+            print(f"{mode:<7}{concurrency:>8}{row['ops_per_s']:>10.1f}{row['p50_ms']:>9.1f}{row['p95_ms']:>9.1f}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"revision": git_revision(), "config": vars(args), "runs": rows}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Boots app.main:app in-process with the stand-ins from benchmarks.fakes.
+"""
+import os
+import random
+import sys
+import tempfile
+import uuid
+from datetime import datetime, timedelta
+
+from benchmarks.fakes import (
+    AsyncInMemoryFirestore, FakeGenerativeModel, InMemoryFirestore, build_response, fake_verify_id_token
+)
+
+
+def load_app(
+    gemini: FakeGenerativeModel,
+    firestore_backend: str = "memory",
+    firestore_client=None,
+    user_rate_per_minute: float = 0,
+    hedge: bool = False,
+    firestore_rtt: float = 0.0,
+    storage_backend: str = "firestore",
+):
+    """
+    Import the FastAPI app and swap the external services for stand-ins.
+    Returns (app, raw_client). For Firestore the raw client is synchronous and
+    sees the same data as the service's async client (use it for seeding);
+    `firestore_rtt` adds a simulated round trip to every in-memory RPC.
+    With storage_backend="sqlite" the app runs on a fresh SQLite database in
+    a temporary directory and raw_client is the SQLiteStorage itself.
+    """
+    from app.core.config import settings
+    if storage_backend == "sqlite":
+        if "app.services.storage" in sys.modules and sys.modules["app.services.storage"].storage.name != "sqlite":
+            raise RuntimeError("The storage backend was already initialized; select sqlite before importing the app")
+        settings.STORAGE_BACKEND = "sqlite"
+        settings.SQLITE_PATH = os.path.join(tempfile.mkdtemp(prefix="iec-bench-"), "bench.db")
+
+    from app.main import app
+    from app.services.storage import storage
+    from app.services.firebase_service import firebase_service
+    from app.services.gemini_service import gemini_service
+    from app.services.firestore_service import firestore_service
+    from app.services.firestore_accounting import AsyncAccountedClient
+    from app.services.admission import llm_admission
+
+    if firestore_client is None:
+        if firestore_backend == "emulator":
+            if not os.getenv("FIRESTORE_EMULATOR_HOST"):
+                raise RuntimeError("FIRESTORE_EMULATOR_HOST must be set to benchmark against the emulator")
+            from google.cloud import firestore as gcf
+            firestore_client = gcf.Client(project=os.getenv("GCLOUD_PROJECT", "bench"))
+        else:
+            firestore_client = InMemoryFirestore()
+    if isinstance(firestore_client, InMemoryFirestore):
+        async_client = AsyncInMemoryFirestore(firestore_client, rtt=firestore_rtt)
+    else:
+        from google.cloud import firestore as gcf
+        async_client = gcf.AsyncClient(project=firestore_client.project)
+
+    if storage_backend == "sqlite":
+        firestore_client = storage
+
+    settings.GEMINI_API_KEY = settings.GEMINI_API_KEY or "benchmark"
+    gemini_service.model = gemini
+    firestore_service.db = AsyncAccountedClient(async_client)
+    firebase_service.verify_id_token = fake_verify_id_token
+    # Virtual users would trip the per-user rate limit; 0 disables it
+    llm_admission.user_rate = user_rate_per_minute / 60.0
+    gemini_service.resilience.hedge = hedge
+    return app, firestore_client
+
+
+def seed_library(client, entries: int, seed: int = 0, response_size: int = 1500):
+    """Pre-populate knowledge_library with `entries` documents (not counted as request ops)"""
+    rng = random.Random(seed)
+    categories = ["Timers", "Counters", "Motor Control", "Interlocks", "General"]
+    topics = ["TON timer", "seal-in circuit", "CTU counter", "tank level control", "conveyor interlock"]
+    response = build_response(response_size, "ladder")
+    start = datetime(2025, 1, 1)
+    if hasattr(client, "insert_library_entry"):
+        insert = client.insert_library_entry
+    else:
+        collection = client.collection("knowledge_library")
+        insert = lambda entry: collection.document(entry["entry_id"]).set(entry)
+    for i in range(entries):
+        entry_id = str(uuid.UUID(int=rng.getrandbits(128)))
+        insert({
+            "entry_id": entry_id,
+            "user_id": f"seed-user-{i % 7}",
+            "user_name": f"Seed User {i % 7}",
+            "user_question": f"Show me a {rng.choice(topics)} example #{i}",
+            "assistant_response": response,
+            "session_id": f"seed-session-{i}",
+            "message_pair_id": None,
+            "created_at": start + timedelta(minutes=i),
+            "tags": [rng.choice(topics)],
+            "category": rng.choice(categories),
+        })
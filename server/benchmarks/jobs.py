@@ -0,0 +1,102 @@
+"""
+Throughput of bulk generation jobs as the worker pool grows.
+
+    cd server
+    python -m benchmarks.jobs --prompts 64 --workers 1,2,4,8,16 --gemini-latency fixed:0.2
+
+For each worker count a fresh job is submitted through POST /ai/jobs and its
+NDJSON stream is consumed until the final event. Throughput should grow with
+the workers until LLM_MAX_CONCURRENCY (the upstream quota) caps it. The
+per-user rate limit, which job items are charged to, is off here.
+
+Then fairness: one user submits a job of --prompts items and a second user a
+job of --small items right after; with per-user queues drained round-robin
+the small job finishes in about 2 x --small item times instead of waiting
+behind the large one.
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import httpx
+
+from benchmarks.fakes import FakeGenerativeModel, mint_token
+from benchmarks.harness import load_app
+from benchmarks.run import git_revision
+from benchmarks.workloads import API, PROMPTS
+
+
+async def run_job(app, prompts: int, uid: str):
+    headers = {"Authorization": f"Bearer {mint_token(uid)}"}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        started = time.perf_counter()
+        resp = await client.post(f"{API}/ai/jobs", headers=headers, json={
+            "title": "Interlock spec",
+            "context": "Conveyor line with three zones, E-stop on every zone.",
+            # Distinct prompts so single-flight coalescing does not merge them
+            "prompts": [f"{PROMPTS[i % len(PROMPTS)]} (interlock #{i})" for i in range(prompts)],
+        })
+        resp.raise_for_status()
+        job_id = resp.json()["job_id"]
+        final = None
+        async with client.stream("GET", f"{API}/ai/jobs/{job_id}/stream", headers=headers) as stream:
+            async for line in stream.aiter_lines():
+                if not line:
+                    continue
+                event = json.loads(line)
+                if event["event"] == "job":
+                    final = event
+        return time.perf_counter() - started, final
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk job throughput versus worker count")
+    parser.add_argument("--prompts", type=int, default=64)
+    parser.add_argument("--workers", default="1,2,4,8,16", help="comma-separated worker counts")
+    parser.add_argument("--gemini-latency", default="fixed:0.2")
+    parser.add_argument("--small", type=int, default=4, help="items of the second user's job (fairness)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write the JSON report here")
+    args = parser.parse_args(argv)
+
+    from app.services.admission import llm_admission
+    from app.services.job_service import job_service
+
+    app, _ = load_app(FakeGenerativeModel(latency=args.gemini_latency, seed=args.seed))
+    llm_admission.user_rate = 0
+    rows = []
+    print(f"LLM concurrency cap {llm_admission.max_concurrency}")
+    print(f"{'workers':>8}{'elapsed s':>11}{'items/s':>10}{'failed':>8}")
+    for workers in (int(w) for w in args.workers.split(",")):
+        job_service.workers = workers
+        # Each asyncio.run gets a new loop, so the pool restarts with the new size
+        elapsed, final = asyncio.run(run_job(app, args.prompts, f"bench-jobs-{workers}"))
+        rows.append({
+            "workers": workers,
+            "elapsed_s": elapsed,
+            "items_per_s": args.prompts / elapsed,
+            "failed": final["failed"] if final else None,
+        })
+        print(f"{workers:>8}{elapsed:>11.2f}{args.prompts / elapsed:>10.1f}{rows[-1]['failed']:>8}")
+
+    async def fairness():
+        large = asyncio.create_task(run_job(app, args.prompts, "bench-jobs-large"))
+        await asyncio.sleep(0.05)
+        small, _ = await run_job(app, args.small, "bench-jobs-small")
+        return (await large)[0], small
+
+    job_service.workers = 1
+    large_s, small_s = asyncio.run(fairness())
+    print(f"\nfairness (1 worker): {args.prompts} items {large_s:.2f} s, "
+          f"{args.small} items submitted after them {small_s:.2f} s")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"revision": git_revision(), "config": vars(args), "runs": rows,
+                       "fairness": {"large_s": large_s, "small_s": small_s}}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
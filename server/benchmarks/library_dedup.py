@@ -0,0 +1,164 @@
+"""
+Near-duplicate detection for library saves.
+
+    cd server
+    python -m benchmarks.library_dedup --sizes 1000,10000,50000 --duplicates 0.2
+
+Builds a synthetic library of distinct Structured Text programs and a set of
+near-duplicates (re-indented, re-commented, a line edited, question
+reworded) plus unrelated controls. Reports, per library size, the time of a
+save-time check (should stay flat as the library grows), detection recall
+and false positives, and the duration of the background pass that dedupes
+the existing entries.
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from benchmarks.fakes import FakeGenerativeModel
+from benchmarks.harness import load_app
+from benchmarks.run import git_revision, percentile
+
+_NAMES = ["Motor", "Pump", "Valve", "Conveyor", "Fan", "Heater", "Mixer", "Tank", "Lamp", "Alarm",
+          "Start", "Stop", "Level", "Temp", "Pressure", "Flow", "Door", "Gate", "Press", "Robot"]
+_OPS = ["AND", "OR", "AND NOT", "OR NOT"]
+_TOPICS = ["timer", "counter", "interlock", "seal-in circuit", "level control", "sequence", "alarm"]
+
+
+def program(rng: random.Random, lines: int = 30):
+    """A random but plausible ST program as a structured response"""
+    names = [f"{rng.choice(_NAMES)}_{rng.randrange(100)}" for _ in range(12)]
+    decls = "".join(f"  {n}: BOOL;\n" for n in names)
+    body = []
+    for _ in range(lines):
+        a, b, c = rng.sample(names, 3)
+        body.append(f"  {a} := {b} {rng.choice(_OPS)} {c};  (* step {rng.randrange(1000)} *)")
+    code = f"PROGRAM P_{rng.randrange(10**6)}\nVAR\n{decls}END_VAR\n" + "\n".join(body) + "\nEND_PROGRAM"
+    question = f"Write a {rng.choice(_TOPICS)} for {names[0]} and {names[1]} with {rng.randrange(2, 9)} inputs"
+    return question, code
+
+
+def structured(code: str) -> str:
+    return json.dumps([{"type": "text", "content": "Here is the program."}, {"type": "plc-code", "content": code}])
+
+
+def near_duplicate(rng: random.Random, question: str, code: str):
+    """Same answer, cosmetically changed: indentation, comments, one edited line, reworded question"""
+    lines = code.split("\n")
+    lines = ["    " + l.strip() if l.startswith("  ") else l for l in lines]
+    lines = [l.split("(*")[0].rstrip() + ("  (* updated *)" if rng.random() < 0.3 else "") for l in lines]
+    i = rng.randrange(len(lines))
+    lines[i] = lines[i].replace("AND", "OR", 1)
+    return "Please " + question[0].lower() + question[1:] + ".", "\n".join(lines)
+
+
+def seed(storage, dedup, size: int, rng: random.Random):
+    start = datetime(2025, 1, 1)
+    originals = []
+    for i in range(size):
+        question, code = program(rng)
+        response = structured(code)
+        sig = dedup.signature(question, response)
+        entry_id = str(uuid.UUID(int=rng.getrandbits(128)))
+        storage.insert_library_entry({
+            "entry_id": entry_id, "user_id": f"seed-user-{i % 7}", "user_name": "Seed",
+            "user_question": question, "assistant_response": response, "session_id": f"s-{i}",
+            "created_at": start + timedelta(seconds=i), "tags": [], "category": None,
+            "minhash": dedup.encode_signature(sig),
+        })
+        originals.append((entry_id, question, code))
+    return originals
+
+
+async def run_size(storage, size: int, probes: int, duplicate_share: float, threshold: float, seed_value: int):
+    from app.services import library_dedup as dedup
+    from app.services.library_dedup import library_dedup as service
+
+    storage.db.execute("DELETE FROM knowledge_library")
+    rng = random.Random(seed_value)
+    originals = seed(storage, dedup, size, rng)
+    service.threshold = threshold
+
+    started = time.perf_counter()
+    await service.refresh_index()
+    build_s = time.perf_counter() - started
+
+    hits = misses = false_positives = 0
+    latencies = []
+    for p in range(probes):
+        if rng.random() < duplicate_share:
+            entry_id, question, code = rng.choice(originals)
+            question, code = near_duplicate(rng, question, code)
+            expected = entry_id
+        else:
+            question, code = program(rng)
+            expected = None
+        probe_id = f"probe-{p}"
+        t = time.perf_counter()
+        _, match = await service.check(probe_id, question, structured(code))
+        latencies.append(time.perf_counter() - t)
+        service.forget(probe_id)  # probes are not saved
+        if expected is not None:
+            hits += match == expected
+            misses += match != expected
+        elif match is not None:
+            false_positives += 1
+
+    # Background pass over the library with a share of duplicates added
+    for entry_id, question, code in rng.sample(originals, int(size * duplicate_share)):
+        question, code = near_duplicate(rng, question, code)
+        storage.insert_library_entry({
+            "entry_id": str(uuid.uuid4()), "user_id": "dup", "user_question": question,
+            "assistant_response": structured(code), "session_id": "dup",
+            "created_at": datetime(2026, 1, 1), "tags": ["dup"],
+        })  # no stored signature: the pass computes it
+    started = time.perf_counter()
+    result = await service.dedupe_existing("flag")
+    pass_s = time.perf_counter() - started
+
+    duplicates = hits + misses
+    return {
+        "library_size": size,
+        "index_build_s": build_s,
+        "check_p50_ms": 1000 * percentile(latencies, 0.5),
+        "check_p95_ms": 1000 * percentile(latencies, 0.95),
+        "recall": hits / duplicates if duplicates else None,
+        "false_positives": false_positives,
+        "controls": probes - duplicates,
+        "pass_s": pass_s,
+        "pass_scanned": result["scanned"],
+        "pass_flagged": result["duplicates"],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Library near-duplicate detection: latency and accuracy")
+    parser.add_argument("--sizes", default="1000,10000", help="comma-separated library sizes")
+    parser.add_argument("--probes", type=int, default=400, help="save-time checks per size")
+    parser.add_argument("--duplicates", type=float, default=0.2, help="share of near-duplicate probes")
+    parser.add_argument("--threshold", type=float, default=0.8)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write the JSON report here")
+    args = parser.parse_args(argv)
+
+    _, storage = load_app(FakeGenerativeModel(latency="fixed:0"), storage_backend="sqlite")
+    rows = []
+    print(f"{'entries':>8}{'build s':>9}{'check p50':>11}{'p95 ms':>8}{'recall':>8}{'false +':>9}"
+          f"{'pass s':>8}{'flagged':>9}")
+    for size in (int(s) for s in args.sizes.split(",")):
+        row = asyncio.run(run_size(storage, size, args.probes, args.duplicates, args.threshold, args.seed))
+        rows.append(row)
+        print(f"{size:>8}{row['index_build_s']:>9.2f}{row['check_p50_ms']:>11.2f}{row['check_p95_ms']:>8.2f}"
+              f"{row['recall']:>8.2f}{row['false_positives']:>9}{row['pass_s']:>8.2f}{row['pass_flagged']:>9}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"revision": git_revision(), "config": vars(args), "runs": rows}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
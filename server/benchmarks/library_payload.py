@@ -0,0 +1,109 @@
+"""
+Library list payload: full entries versus summaries.
+
+    cd server
+    python -m benchmarks.library_payload --page 50 --response-size 1500,6000
+
+For a page of library entries this compares the old list response (every
+entry with its full assistant_response) with the summary list served by
+GET /library/entries since responses moved behind GET /library/entries/{id}.
+"serialize ms" is the time to build the response models and render them the
+way the route does (response_model validation and serialization, then
+JSONResponse); "bytes" is the body size.
+The summary row also reports the bytes of a real request through the app.
+"""
+import argparse
+import asyncio
+import json
+import time
+from typing import List
+
+import httpx
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+from benchmarks.fakes import FakeGenerativeModel, InMemoryFirestore, mint_token
+from benchmarks.harness import load_app, seed_library
+from benchmarks.run import git_revision, percentile
+from benchmarks.workloads import API
+
+
+async def render(rows, model, field):
+    started = time.perf_counter()
+    content = [model(**{f: row.get(f) for f in model.model_fields}) for row in rows]
+    body = JSONResponse(await serialize_response(field=field, response_content=content)).body
+    return time.perf_counter() - started, len(body)
+
+
+async def measure(app, page: int, repeat: int):
+    from app.api.library import response_preview
+    from app.models.library import LibraryEntryResponse, LibraryEntrySummary
+    from app.services.storage import storage
+
+    # Seeded entries have no preview; store the ones a save would have written
+    full_rows = await storage.get_recent_library_entries(page)
+    for row in full_rows:
+        row["response_preview"] = response_preview(row["assistant_response"])
+    await storage.update_library_entries({row["entry_id"]: {"response_preview": row["response_preview"]}
+                                          for row in full_rows})
+
+    headers = {"Authorization": f"Bearer {mint_token('bench-library')}"}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        resp = await client.get(f"{API}/library/entries", params={"limit": page}, headers=headers)
+        resp.raise_for_status()
+        http_bytes = len(resp.content)
+
+    summary_rows = await storage.get_library_summaries(page)
+
+    results = {}
+    for name, rows, model in (("full", full_rows, LibraryEntryResponse),
+                              ("summary", summary_rows, LibraryEntrySummary)):
+        field = create_response_field(name="Response", type_=List[model])
+        samples = [await render(rows, model, field) for _ in range(repeat)]
+        results[name] = {
+            "entries": len(rows),
+            "bytes": samples[0][1],
+            "serialize_ms": 1000 * percentile([s[0] for s in samples], 0.5),
+        }
+    results["summary"]["http_bytes"] = http_bytes
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Library list payload and serialization cost")
+    parser.add_argument("--page", type=int, default=50, help="entries per list request")
+    parser.add_argument("--response-size", default="1500,6000",
+                        help="comma-separated assistant_response sizes (characters)")
+    parser.add_argument("--repeat", type=int, default=200, help="serializations per measurement")
+    parser.add_argument("--storage", choices=["firestore", "sqlite"], default="firestore")
+    parser.add_argument("--output", help="write the JSON report here")
+    args = parser.parse_args(argv)
+
+    rows = []
+    print(f"{'resp chars':>11}{'mode':>9}{'bytes':>10}{'serialize ms':>14}")
+    for size in (int(s) for s in args.response_size.split(",")):
+        client = InMemoryFirestore() if args.storage == "firestore" else None
+        app, raw_client = load_app(FakeGenerativeModel(latency="fixed:0"), firestore_client=client,
+                                   storage_backend=args.storage)
+        if args.storage == "sqlite":
+            raw_client.db.execute("DELETE FROM knowledge_library")
+        seed_library(raw_client, args.page, response_size=size)
+        result = asyncio.run(measure(app, args.page, args.repeat))
+        for mode in ("full", "summary"):
+            r = result[mode]
+            rows.append({"response_size": size, "mode": mode, **r})
+            print(f"{size:>11}{mode:>9}{r['bytes']:>10}{r['serialize_ms']:>14.2f}")
+        full, summary = result["full"], result["summary"]
+        print(f"{'':>11}{'ratio':>9}{full['bytes'] / summary['bytes']:>10.1f}"
+              f"{full['serialize_ms'] / summary['serialize_ms']:>14.1f}"
+              f"   (HTTP body {summary['http_bytes']} bytes)")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"revision": git_revision(), "config": vars(args), "runs": rows}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""
+Library export / import at scale.
+
+    cd server
+    python -m benchmarks.library_transfer --entries 100000 --storage sqlite
+    python -m benchmarks.library_transfer --entries 20000 --compress
+
+Seeds a library, streams GET /library/export into a temporary file, then
+streams that file into POST /library/import on a second, empty database.
+Requests are driven as raw ASGI calls (httpx's ASGI transport buffers whole
+bodies), so the reported peak is the memory the server allocates while the
+transfer runs (tracemalloc, seed data excluded), next to the file size.
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks.fakes import FakeGenerativeModel, InMemoryFirestore, mint_token
+from benchmarks.harness import load_app, seed_library
+from benchmarks.run import git_revision
+from benchmarks.workloads import API
+
+CHUNK_BYTES = 64 * 1024
+
+
+async def asgi_call(app, method, path, query=b"", headers=(), body_chunks=None, sink=None):
+    """One HTTP request straight through the ASGI app; the body is streamed both ways"""
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": method,
+        "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": query,
+        "root_path": "", "headers": [(k.lower().encode(), v.encode()) for k, v in headers],
+        "client": ("127.0.0.1", 1), "server": ("bench", 80),
+    }
+    chunks = iter(body_chunks or [])
+    response = {"status": None, "body": b""}
+    body_sent, finished = False, asyncio.Event()
+
+    async def receive():
+        nonlocal body_sent
+        if body_sent:
+            # Starlette listens for a disconnect while streaming the response
+            await finished.wait()
+            return {"type": "http.disconnect"}
+        chunk = next(chunks, None)
+        if chunk is None:
+            body_sent = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        return {"type": "http.request", "body": chunk, "more_body": True}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+        elif message["type"] == "http.response.body":
+            if sink is not None:
+                sink.write(message.get("body", b""))
+            else:
+                response["body"] += message.get("body", b"")
+            if not message.get("more_body", False):
+                finished.set()
+
+    await app(scope, receive, send)
+    return response
+
+
+def read_chunks(path):
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(CHUNK_BYTES)
+            if not chunk:
+                return
+            yield chunk
+
+
+def measured(coro):
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    base = tracemalloc.get_traced_memory()[0]
+    started = time.perf_counter()
+    result = asyncio.run(coro)
+    elapsed = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1] - base
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Streaming library export and import")
+    parser.add_argument("--entries", type=int, default=20000)
+    parser.add_argument("--response-size", type=int, default=1500)
+    parser.add_argument("--compress", action="store_true", help="gzip the export and the import body")
+    parser.add_argument("--storage", choices=["firestore", "sqlite"], default="sqlite")
+    parser.add_argument("--output", help="write the JSON report here")
+    args = parser.parse_args(argv)
+
+    from app.core.config import settings
+    settings.LIBRARY_ADMIN_UIDS = "bench-admin"
+    app, raw_client = load_app(FakeGenerativeModel(latency="fixed:0"), storage_backend=args.storage)
+    seed_library(raw_client, args.entries, response_size=args.response_size)
+    headers = [("Authorization", f"Bearer {mint_token('bench-admin')}")]
+
+    export_path = os.path.join(tempfile.mkdtemp(prefix="iec-export-"),
+                               "library.ndjson.gz" if args.compress else "library.ndjson")
+    with open(export_path, "wb") as sink:
+        query = b"compress=true" if args.compress else b""
+        resp, export_s, export_peak = measured(
+            asgi_call(app, "GET", f"{API}/library/export", query=query, headers=headers, sink=sink))
+    assert resp["status"] == 200, resp
+    size = os.path.getsize(export_path)
+
+    # Import into an empty library
+    from app.services.firestore_service import firestore_service
+    from app.services.firestore_accounting import AsyncAccountedClient
+    from benchmarks.fakes import AsyncInMemoryFirestore
+    if args.storage == "sqlite":
+        raw_client.db.execute("DELETE FROM knowledge_library")
+    else:
+        firestore_service.db = AsyncAccountedClient(AsyncInMemoryFirestore(InMemoryFirestore()))
+    import_headers = headers + [("Content-Type", "application/gzip" if args.compress else "application/x-ndjson")]
+    resp, import_s, import_peak = measured(
+        asgi_call(app, "POST", f"{API}/library/import", headers=import_headers,
+                  body_chunks=read_chunks(export_path)))
+    assert resp["status"] == 200, resp
+    result = json.loads(resp["body"])
+
+    rows = [
+        {"op": "export", "entries": args.entries, "seconds": export_s, "peak_mb": export_peak / 2**20,
+         "file_mb": size / 2**20},
+        {"op": "import", "entries": result["imported"], "seconds": import_s, "peak_mb": import_peak / 2**20,
+         "skipped": result["skipped"]},
+    ]
+    print(f"{'op':<8}{'entries':>9}{'seconds':>9}{'entries/s':>11}{'peak MB':>9}")
+    for row in rows:
+        print(f"{row['op']:<8}{row['entries']:>9}{row['seconds']:>9.2f}"
+              f"{row['entries'] / row['seconds']:>11.0f}{row['peak_mb']:>9.1f}")
+    print(f"export file {size / 2**20:.1f} MB ({'gzip' if args.compress else 'plain'})")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"revision": git_revision(), "config": vars(args), "runs": rows}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
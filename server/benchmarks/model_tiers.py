@@ -0,0 +1,197 @@
+"""
+Model tier routing: latency, output tokens and cost per request class with
+routing off (one configuration) and on.
+
+    cd server
+    python -m benchmarks.model_tiers
+    python -m benchmarks.model_tiers --speeds gemini-2.0-flash=0.4:150,gemini-2.0-flash-lite=0.25:250
+    # live numbers: record once against the API, then replay offline
+    python -m benchmarks.model_tiers --cassette cassettes/tiers.jsonl.gz --mode record
+    python -m benchmarks.model_tiers --cassette cassettes/tiers.jsonl.gz --simulate-latency
+
+The questions are the in-scope prompts of corpus/prompts.jsonl and the
+held-out in-scope questions of corpus/scope_eval.jsonl; the table first shows
+the tier each one is routed to and the cost of classifying it.
+
+Without --cassette every model is a stand-in whose latency is a time to
+first token plus output tokens at a decode rate (--speeds, per model). The
+answer length depends on what a question asks for (--sizes), not on the
+tier, so the difference between the runs comes from the models' speed, the
+tiers' token limits and the schema (a text-tier answer has no code part).
+Sleeps are scaled by --time-scale to keep the run short and reported
+unscaled. Cost uses --prices (USD per million input:output tokens).
+"""
+import argparse
+import json
+import os
+import time
+
+from app.services.model_router import FALLBACK_TIER, classify
+from benchmarks.fakes import FakeChat, FakeResponse, build_response
+from benchmarks.run import git_revision, percentile
+
+CORPUS_DIR = os.path.join(os.path.dirname(__file__), "corpus")
+TIERS = ("text", "code", "ladder", "refine")
+
+
+def load_questions():
+    questions = []
+    with open(os.path.join(CORPUS_DIR, "prompts.jsonl")) as f:
+        for item in map(json.loads, filter(str.strip, f)):
+            if item["id"] != "off-topic":
+                questions.append((item["message"], item.get("history") or []))
+    with open(os.path.join(CORPUS_DIR, "scope_eval.jsonl")) as f:
+        for item in map(json.loads, filter(str.strip, f)):
+            if item["in_scope"] and not item.get("borderline"):
+                questions.append((item["text"], []))
+    return questions
+
+
+def parse_pairs(spec: str):
+    """'a=1:2,b=3:4' -> {'a': (1.0, 2.0), 'b': (3.0, 4.0)}"""
+    pairs = {}
+    for item in filter(None, (p.strip() for p in spec.split(","))):
+        name, _, value = item.partition("=")
+        first, _, second = value.partition(":")
+        pairs[name] = (float(first), float(second))
+    return pairs
+
+
+class TierModel:
+    """Stand-in for one tier's GenerativeModel: answer length by question, speed by model"""
+
+    def __init__(self, tier, speeds, sizes, time_scale: float):
+        self.tier = tier
+        self.ttft, self.rate = speeds[tier.model]
+        self.sizes = sizes
+        self.time_scale = time_scale
+
+    def start_chat(self, history=None, **kwargs):
+        return FakeChat(self, history or [])
+
+    def _respond(self, history, message):
+        needs = classify(message)
+        if needs == "text" or self.tier.types == ("text",):
+            text = json.dumps([{"type": "text", "content": "A scan cycle reads inputs, runs the program. " *
+                                max(1, self.sizes["text"] // 46)}])
+        else:
+            kind = "ladder" if needs == "ladder" and "ladder" in self.tier.types else "code"
+            text = build_response(self.sizes[needs], kind)
+        tokens = min(len(text) // 4, self.tier.max_output_tokens)
+        time.sleep((self.ttft + tokens / self.rate) * self.time_scale)
+        prompt_chars = sum(len(str(p)) for h in history for p in h.get("parts", [])) + len(message)
+        return FakeResponse(text[:tokens * 4], prompt_tokens=prompt_chars // 4, output_tokens=tokens)
+
+
+def run(questions, routing: bool, args):
+    from app.core.config import settings
+    from app.services.gemini_service import gemini_service
+
+    settings.GEMINI_MODEL_ROUTING = routing
+    rows = []
+    for message, history in questions:
+        tier = gemini_service.route(message, history)
+        started = time.perf_counter()
+        try:
+            gemini_service.chat(message, history)
+        except ValueError as e:
+            rows.append({"message": message, "error": str(e)})
+            continue
+        elapsed = time.perf_counter() - started
+        if gemini_service.cassette is None:
+            elapsed /= args.time_scale
+        rows.append({"message": message, "class": classify(message, history), "tier": tier.name,
+                     "model": tier.model, "latency_s": elapsed})
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Latency, tokens and cost per request class with model tier routing")
+    parser.add_argument("--speeds", default="gemini-2.0-flash=0.35:160,gemini-2.0-flash-lite=0.25:240",
+                        help="stand-in models: model=time to first token (s):output tokens per second")
+    parser.add_argument("--sizes", default="text=700,code=2400,ladder=3200,refine=3200",
+                        help="answer characters by what the question asks for")
+    parser.add_argument("--prices", default="gemini-2.0-flash=0.10:0.40,gemini-2.0-flash-lite=0.075:0.30",
+                        help="USD per million tokens, model=input:output")
+    parser.add_argument("--time-scale", type=float, default=0.05, help="stand-in sleeps are multiplied by this")
+    parser.add_argument("--cassette", help="use recorded live responses instead of the stand-ins")
+    parser.add_argument("--mode", choices=["replay", "record", "auto"], default="replay")
+    parser.add_argument("--simulate-latency", action="store_true", help="sleep for the recorded upstream latency")
+    parser.add_argument("--output", help="write the JSON report here")
+    args = parser.parse_args(argv)
+
+    from app.core.config import settings
+    from app.services.gemini_service import LLM_TIER_TOKENS, gemini_service
+    from app.services.llm_cassette import Cassette
+
+    questions = load_questions()
+    started = time.perf_counter()
+    for _ in range(20):
+        for message, history in questions:
+            classify(message, history)
+    classify_us = (time.perf_counter() - started) / (20 * len(questions)) * 1e6
+    classes = {t: sum(1 for m, h in questions if classify(m, h) == t) for t in TIERS}
+    print(f"{len(questions)} questions: " + ", ".join(f"{n} {t}" for t, n in classes.items())
+          + f"; classification {classify_us:.0f} us")
+    print("tiers: " + ", ".join(f"{t.name}={t.model} ({t.max_output_tokens} tokens, {'+'.join(t.types)})"
+                                for t in gemini_service.tiers.values()))
+
+    speeds = parse_pairs(args.speeds)
+    sizes = {name: int(size) for name, size in (item.split("=") for item in args.sizes.split(","))}
+    prices = parse_pairs(args.prices)
+    if args.cassette:
+        gemini_service.cassette = Cassette(args.cassette, mode=args.mode, simulate_latency=args.simulate_latency)
+        gemini_service.initialize()
+    else:
+        settings.GEMINI_API_KEY = settings.GEMINI_API_KEY or "benchmark"
+        gemini_service.models = {name: TierModel(tier, speeds, sizes, args.time_scale)
+                                 for name, tier in gemini_service.tiers.items()}
+        gemini_service.model = gemini_service.models[FALLBACK_TIER]
+
+    def tokens():
+        return {(t.model, kind): sum(LLM_TIER_TOKENS.value(tier=u.name, model=u.model, kind=kind)
+                                     for u in gemini_service.tiers.values() if u.model == t.model)
+                for t in gemini_service.tiers.values() for kind in ("input", "output")}
+
+    report = {"classes": classes, "classify_us": classify_us, "runs": {}}
+    for routing in (False, True):
+        name = "routed" if routing else "single"
+        before = tokens()
+        rows = run(questions, routing, args)
+        after = tokens()
+        used = {key: after[key] - before[key] for key in after}
+        answered = max(1, sum(1 for r in rows if "latency_s" in r))
+        cost = sum(n * prices.get(model, (0.0, 0.0))[kind == "output"] / 1e6 for (model, kind), n in used.items())
+        report["runs"][name] = {
+            "rows": rows,
+            "mean_ms": 1000 * sum(r.get("latency_s", 0) for r in rows) / answered,
+            "input_tokens": sum(n for (_, kind), n in used.items() if kind == "input") / answered,
+            "output_tokens": sum(n for (_, kind), n in used.items() if kind == "output") / answered,
+            "cost_per_1k": 1000 * cost / answered,
+        }
+
+    print(f"\n{'class':<8}{'n':>4}{'single p50 ms':>15}{'routed p50 ms':>15}  routed to")
+    for cls in TIERS:
+        single = [r["latency_s"] for r in report["runs"]["single"]["rows"] if r.get("class") == cls]
+        routed = [r["latency_s"] for r in report["runs"]["routed"]["rows"] if r.get("class") == cls]
+        if single:
+            report[f"class/{cls}"] = {"single_p50_ms": 1000 * percentile(single, 0.5),
+                                      "routed_p50_ms": 1000 * percentile(routed, 0.5)}
+            print(f"{cls:<8}{len(single):>4}{report[f'class/{cls}']['single_p50_ms']:>15.0f}"
+                  f"{report[f'class/{cls}']['routed_p50_ms']:>15.0f}  {gemini_service.tiers[cls].model}")
+
+    print(f"\n{'run':<8}{'mean ms':>9}{'input tok':>11}{'output tok':>12}{'USD / 1k requests':>19}  (per request)")
+    for name, r in report["runs"].items():
+        print(f"{name:<8}{r['mean_ms']:>9.0f}{r['input_tokens']:>11.0f}{r['output_tokens']:>12.0f}{r['cost_per_1k']:>19.4f}")
+    errors = [r for run in report["runs"].values() for r in run["rows"] if "error" in r]
+    if errors:
+        print(f"\n{len(errors)} calls failed, e.g. {errors[0]['error']}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"revision": git_revision(), "config": vars(args), "report": report}, f, indent=2,
+                      default=str)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Offline prompt/parsing benchmark on a fixed corpus using the LLM cassette.
+
+    cd server
+    # one-off: record the corpus against the live model (needs GEMINI_API_KEY)
+    python -m benchmarks.replay --mode record --cassette cassettes/corpus.jsonl.gz
+    # afterwards, fully offline and deterministic
+    python -m benchmarks.replay --cassette cassettes/corpus.jsonl.gz --simulate-latency
+
+Reports token usage, parse success rate (structured JSON array accepted by the
+chat pipeline) and end-to-end latency for every corpus prompt. --fake records
+from the benchmark's fake model instead of Gemini, for trying the tooling.
+"""
+import argparse
+import json
+import os
+import time
+
+from benchmarks.run import percentile
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(__file__), "corpus", "prompts.jsonl")
+
+
+def load_corpus(path: str):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay a prompt corpus through GeminiService and the response parser")
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS)
+    parser.add_argument("--cassette", default="cassettes/corpus.jsonl.gz")
+    parser.add_argument("--mode", choices=["replay", "record", "auto"], default="replay")
+    parser.add_argument("--simulate-latency", action="store_true", help="sleep for the recorded upstream latency")
+    parser.add_argument("--fake", action="store_true", help="record from the fake model instead of Gemini")
+    parser.add_argument("--output", help="write the JSON report here")
+    args = parser.parse_args(argv)
+
+    from app.core.config import settings
+    from app.services.gemini_service import gemini_service
+    from app.services.llm_cassette import Cassette
+    from app.services.resilience import UpstreamError
+    from app.services.response_parser import parse_ai_response
+
+    if args.fake:
+        from benchmarks.fakes import FakeGenerativeModel
+        settings.GEMINI_API_KEY = settings.GEMINI_API_KEY or "benchmark"
+        gemini_service.model = FakeGenerativeModel(latency="fixed:0.01", seed=0)
+    cassette = Cassette(args.cassette, mode=args.mode, simulate_latency=args.simulate_latency)
+    gemini_service.cassette = cassette
+
+    corpus = load_corpus(args.corpus)
+    latencies, parse_times, rows = [], [], []
+    parsed_ok = 0
+    for item in corpus:
+        start = time.perf_counter()
+        try:
+            raw = gemini_service.chat(item["message"], item.get("history") or [])
+        except (ValueError, UpstreamError) as e:
+            rows.append({"id": item["id"], "error": str(e)})
+            continue
+        parse_start = time.perf_counter()
+        stored = parse_ai_response(raw)
+        end = time.perf_counter()
+        try:
+            structured = isinstance(json.loads(stored), list)
+        except json.JSONDecodeError:
+            structured = False
+        parsed_ok += structured
+        latencies.append(end - start)
+        parse_times.append(end - parse_start)
+        rows.append({"id": item["id"], "structured": structured, "latency_ms": 1000 * (end - start)})
+
+    answered = len(latencies)
+    report = {
+        "corpus": os.path.basename(args.corpus),
+        "prompts": len(corpus),
+        "answered": answered,
+        "cassette": dict(cassette.stats),
+        "parse_success_rate": parsed_ok / answered if answered else 0.0,
+        "latency_ms": {
+            "p50": 1000 * percentile(latencies, 0.5),
+            "p95": 1000 * percentile(latencies, 0.95),
+        },
+        "parse_ms_mean": 1000 * sum(parse_times) / len(parse_times) if parse_times else 0.0,
+        "items": rows,
+    }
+
+    print(f"prompts {report['prompts']}  answered {answered}  misses {cassette.stats['misses']}")
+    print(f"tokens  prompt {cassette.stats['prompt_tokens']}  output {cassette.stats['output_tokens']}")
+    print(f"parse success {100 * report['parse_success_rate']:.1f}%  mean parse {report['parse_ms_mean']:.3f} ms")
+    print(f"latency p50 {report['latency_ms']['p50']:.1f} ms  p95 {report['latency_ms']['p95']:.1f} ms")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
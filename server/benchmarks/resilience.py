@@ -0,0 +1,181 @@
+"""
+Fault injection for the LLM resilience layer: a ResilientCaller in front of
+FakeGenerativeModel, checked against what app/services/resilience.py promises.
+
+    cd server
+    python -m benchmarks.resilience
+    python -m benchmarks.resilience --calls 500 --fault-rate 0.3 --attempts 4
+
+Scenarios:
+- faults: with --fault-rate, retries turn most faults into successes, and the
+  calls that still fail are raised as UpstreamUnavailable, not the SDK error
+- outage: consecutive failures open the circuit, calls fail fast without
+  reaching the model while it is open, and it closes once the outage is over
+- probe: the half-open probe fails with a non-transient error, is cancelled,
+  or goes through the blocking path; the circuit must not stay stuck and the
+  next healthy call must succeed
+
+Prints every check and exits non-zero when one fails.
+"""
+import argparse
+import asyncio
+import sys
+import time
+
+from app.services.resilience import CircuitBreaker, ResilientCaller, UpstreamUnavailable
+from benchmarks.fakes import FakeGenerativeModel
+
+
+class _Rejected(Exception):
+    """A non-transient upstream error, like a blocked prompt"""
+
+    def __init__(self, _message: str = ""):
+        super().__init__("400 invalid argument: prompt blocked")
+
+
+class Checks:
+    def __init__(self):
+        self.failed = 0
+
+    def check(self, name: str, ok: bool, detail: str = ""):
+        if not ok:
+            self.failed += 1
+        print(f"  {'ok  ' if ok else 'FAIL'} {name}{'  (' + detail + ')' if detail else ''}")
+
+
+def make_caller(attempts: int, failures: int, cooldown: float, seed: int) -> ResilientCaller:
+    return ResilientCaller(
+        "bench",
+        max_attempts=attempts,
+        base_delay=0.001,
+        max_delay=0.01,
+        deadline=5,
+        breaker=CircuitBreaker("bench", failures, cooldown),
+        seed=seed,
+    )
+
+
+def send(model: FakeGenerativeModel):
+    """One upstream attempt, run in a worker thread like GeminiService does"""
+    return lambda: asyncio.to_thread(model.start_chat([]).send_message, "Start/stop circuit for a motor")
+
+
+async def run_faults(args, checks: Checks):
+    print(f"faults: {args.calls} calls, fault rate {args.fault_rate}, {args.attempts} attempts")
+    model = FakeGenerativeModel(latency="fixed:0.001", response_size=200, fault_rate=args.fault_rate, seed=args.seed)
+    caller = make_caller(args.attempts, 0, 1, args.seed)
+    ok = unavailable = other = 0
+    for _ in range(args.calls):
+        try:
+            await caller.call(send(model))
+            ok += 1
+        except UpstreamUnavailable:
+            unavailable += 1
+        except Exception:
+            other += 1
+    print(f"  {ok} ok, {unavailable} unavailable, {caller.retries} retries, {model.faults} faults injected")
+    checks.check("failures surface as UpstreamUnavailable", other == 0, f"{other} other errors")
+    if args.fault_rate > 0:
+        checks.check("retries recover faults", caller.retries > 0 and ok > args.calls * (1 - args.fault_rate),
+                     f"success rate {ok / args.calls:.3f}, {1 - args.fault_rate:.3f} without retries")
+
+
+async def run_outage(args, checks: Checks):
+    start, duration = 0.05, 0.3
+    print(f"outage: every call fails from {start}s for {duration}s, breaker after 3 failures, cooldown 0.1s")
+    model = FakeGenerativeModel(latency="fixed:0.002", response_size=200, outage=(start, duration), seed=args.seed)
+    caller = make_caller(1, 3, 0.1, args.seed)
+    calls = rejected = 0
+    last_ok = False
+    began = time.monotonic()
+    while time.monotonic() - began < start + duration + 0.3:
+        calls += 1
+        before = model.calls
+        try:
+            await caller.call(send(model))
+            last_ok = True
+        except UpstreamUnavailable:
+            last_ok = False
+            rejected += model.calls == before
+        await asyncio.sleep(0.005)
+    stats = caller.breaker.stats()
+    print(f"  {calls} calls, {model.calls} reached the model, {rejected} failed fast, circuit {stats}")
+    checks.check("circuit opens during the outage", stats["opened"] >= 1)
+    checks.check("open circuit fails fast", rejected > 0)
+    checks.check("circuit closes after the outage", stats["state"] == CircuitBreaker.CLOSED and last_ok)
+
+
+async def open_circuit(caller: ResilientCaller, cooldown: float):
+    """Trip the breaker with transient faults, then wait until the next call is the probe"""
+    failing = FakeGenerativeModel(latency="fixed:0", fault_rate=1.0)
+    for _ in range(caller.breaker.failure_threshold):
+        try:
+            await caller.call(send(failing))
+        except UpstreamUnavailable:
+            pass
+    await asyncio.sleep(cooldown)
+
+
+async def run_probe(args, checks: Checks):
+    cooldown = 0.05
+    healthy = FakeGenerativeModel(latency="fixed:0", response_size=200)
+    print("probe: the half-open probe ends without a transient failure")
+
+    caller = make_caller(1, 2, cooldown, args.seed)
+    await open_circuit(caller, cooldown)
+    rejecting = FakeGenerativeModel(latency="fixed:0", fault_rate=1.0, fault_exception=_Rejected)
+    try:
+        await caller.call(send(rejecting))
+    except _Rejected:
+        pass
+    checks.check("non-transient error closes the circuit", caller.breaker.state == CircuitBreaker.CLOSED,
+                 caller.breaker.state)
+    try:
+        await caller.call(send(healthy))
+        checks.check("healthy call after a non-transient probe", True)
+    except UpstreamUnavailable:
+        checks.check("healthy call after a non-transient probe", False, "probe slot still taken")
+
+    caller = make_caller(1, 2, cooldown, args.seed)
+    await open_circuit(caller, cooldown)
+    slow = FakeGenerativeModel(latency="fixed:0.2", response_size=200)
+    try:
+        await asyncio.wait_for(caller.call(send(slow)), timeout=0.02)
+    except asyncio.TimeoutError:
+        pass
+    try:
+        await caller.call(send(healthy))
+        checks.check("healthy call after a cancelled probe", caller.breaker.state == CircuitBreaker.CLOSED,
+                     caller.breaker.state)
+    except UpstreamUnavailable:
+        checks.check("healthy call after a cancelled probe", False, "probe slot still taken")
+
+    caller = make_caller(1, 2, cooldown, args.seed)
+    await open_circuit(caller, cooldown)
+    try:
+        await asyncio.to_thread(caller.call_sync, lambda: rejecting.start_chat([]).send_message("x"))
+    except _Rejected:
+        pass
+    try:
+        await asyncio.to_thread(caller.call_sync, lambda: healthy.start_chat([]).send_message("x"))
+        checks.check("blocking path releases the probe", caller.breaker.state == CircuitBreaker.CLOSED)
+    except UpstreamUnavailable:
+        checks.check("blocking path releases the probe", False, "probe slot still taken")
+
+
+async def main(args) -> int:
+    checks = Checks()
+    await run_faults(args, checks)
+    await run_outage(args, checks)
+    await run_probe(args, checks)
+    print(f"\n{checks.failed} check(s) failed" if checks.failed else "\nall checks passed")
+    return 1 if checks.failed else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=200, help="calls in the fault-rate scenario")
+    parser.add_argument("--fault-rate", type=float, default=0.2, help="fraction of Gemini calls that fail")
+    parser.add_argument("--attempts", type=int, default=3, help="LLM_RETRY_ATTEMPTS for the fault-rate scenario")
+    parser.add_argument("--seed", type=int, default=1)
+    sys.exit(asyncio.run(main(parser.parse_args())))
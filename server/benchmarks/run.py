@@ -0,0 +1,203 @@
+"""
+End-to-end load test against app.main:app with fake Gemini, in-memory Firestore
+and minted auth tokens.
+
+    cd server
+    python -m benchmarks.run --users 20 --requests 50 --mix mixed --output before.json
+    python -m benchmarks.run --users 20 --requests 50 --mix mixed --compare before.json
+    python -m benchmarks.run --check-budgets      # exit 1 when a route exceeds its Firestore read budget
+    python -m benchmarks.run --storage sqlite     # local SQLite backend, no Firestore at all
+    python -m benchmarks.run --mix chat --fault-rate 0.2 --outage 2,3 --hedge   # resilience under faults
+
+Runs are comparable between commits: the request sequence is fully determined
+by --seed, and the report records the git revision and the run configuration.
+"""
+import argparse
+import asyncio
+import json
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from typing import Dict, List
+
+import httpx
+
+from benchmarks.fakes import FakeGenerativeModel
+from benchmarks.harness import load_app, seed_library
+from benchmarks.workloads import MIXES, OPERATIONS, VirtualUser, pick_operation
+
+
+def percentile(samples: List[float], q: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, int(round(q * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except Exception:
+        return "unknown"
+
+
+async def run_user(client, user: VirtualUser, mix, requests: int, deadline: float, results):
+    done = 0
+    while done < requests and time.perf_counter() < deadline:
+        op = pick_operation(user, mix)
+        start = time.perf_counter()
+        try:
+            resp = await OPERATIONS[op](client, user)
+            status = resp.status_code
+        except Exception as e:
+            status = f"exception:{type(e).__name__}"
+        results[op].append((time.perf_counter() - start, status))
+        done += 1
+
+
+async def run_benchmark(args) -> Dict:
+    gemini = FakeGenerativeModel(
+        latency=args.gemini_latency,
+        response_size=args.response_size,
+        fault_rate=args.fault_rate,
+        outage=tuple(float(x) for x in args.outage.split(",")) if args.outage else None,
+        seed=args.seed,
+    )
+    app, raw_client = load_app(
+        gemini, firestore_backend=args.firestore, user_rate_per_minute=args.user_rate, hedge=args.hedge,
+        storage_backend=args.storage
+    )
+    if args.library_size:
+        seed_library(raw_client, args.library_size, seed=args.seed)
+
+    from app.services.firestore_accounting import FIRESTORE_OPS, FIRESTORE_BUDGET_EXCEEDED
+    from app.services.gemini_service import gemini_service
+
+    users = [VirtualUser(i, args.seed) for i in range(args.users)]
+    results = defaultdict(list)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        started = time.perf_counter()
+        deadline = started + args.duration if args.duration else float("inf")
+        await asyncio.gather(*(
+            run_user(client, user, MIXES[args.mix], args.requests, deadline, results) for user in users
+        ))
+        elapsed = time.perf_counter() - started
+
+    operations = {}
+    total = 0
+    for op, samples in sorted(results.items()):
+        latencies = [s[0] for s in samples]
+        errors = sum(1 for s in samples if not (isinstance(s[1], int) and s[1] < 400))
+        statuses = defaultdict(int)
+        for s in samples:
+            statuses[str(s[1])] += 1
+        total += len(samples)
+        operations[op] = {
+            "count": len(samples),
+            "errors": errors,
+            "statuses": dict(statuses),
+            "mean_ms": 1000 * sum(latencies) / len(latencies),
+            "p50_ms": 1000 * percentile(latencies, 0.50),
+            "p95_ms": 1000 * percentile(latencies, 0.95),
+            "p99_ms": 1000 * percentile(latencies, 0.99),
+        }
+
+    firestore_ops = defaultdict(dict)
+    for (route, op), value in FIRESTORE_OPS.items():
+        firestore_ops[route][op] = value
+    budget_violations = {route: value for (route,), value in FIRESTORE_BUDGET_EXCEEDED.items()}
+
+    return {
+        "revision": git_revision(),
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "compare", "check_budgets")},
+        "elapsed_s": elapsed,
+        "requests": total,
+        "throughput_rps": total / elapsed if elapsed else 0.0,
+        "operations": operations,
+        "gemini": {"calls": gemini.calls, "faults": gemini.faults},
+        "resilience": gemini_service.resilience.stats(),
+        "firestore_ops": dict(firestore_ops),
+        "firestore_budget_violations": budget_violations,
+    }
+
+
+def print_report(report: Dict, baseline: Dict = None):
+    print(f"\nrevision {report['revision']}  requests {report['requests']}  "
+          f"elapsed {report['elapsed_s']:.2f}s  throughput {report['throughput_rps']:.1f} req/s")
+    if baseline:
+        print(f"baseline {baseline['revision']}  throughput {baseline['throughput_rps']:.1f} req/s "
+              f"({_delta(report['throughput_rps'], baseline['throughput_rps'])})")
+    print(f"\n{'operation':<16}{'count':>7}{'err':>5}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for op, stats in report["operations"].items():
+        line = (f"{op:<16}{stats['count']:>7}{stats['errors']:>5}"
+                f"{stats['p50_ms']:>10.1f}{stats['p95_ms']:>10.1f}{stats['p99_ms']:>10.1f}")
+        base = (baseline or {}).get("operations", {}).get(op)
+        if base:
+            line += f"   p50 {_delta(stats['p50_ms'], base['p50_ms'])}  p95 {_delta(stats['p95_ms'], base['p95_ms'])}"
+        print(line)
+
+    print(f"\n{'route':<52}{'reads':>8}{'writes':>8}{'deletes':>8}")
+    for route, ops in sorted(report["firestore_ops"].items()):
+        print(f"{route:<52}{ops.get('reads', 0):>8}{ops.get('writes', 0):>8}{ops.get('deletes', 0):>8}")
+    print(f"\ngemini calls {report['gemini']['calls']} (faults {report['gemini']['faults']})")
+    resilience = report.get("resilience")
+    if resilience:
+        print(f"retries {resilience['retries']}  hedged {resilience['hedged']} (won {resilience['hedges_won']})  "
+              f"circuit {resilience['circuit']['state']} (opened {resilience['circuit']['opened']}x)")
+    for op, stats in report["operations"].items():
+        failed = {k: v for k, v in stats.get("statuses", {}).items() if not k.startswith(("2", "3"))}
+        if failed:
+            print(f"{op} failures: " + ", ".join(f"{k}={v}" for k, v in sorted(failed.items())))
+    for route, count in report["firestore_budget_violations"].items():
+        print(f"READ BUDGET EXCEEDED {route}: {count} request(s)")
+
+
+def _delta(new: float, old: float) -> str:
+    if not old:
+        return "n/a"
+    return f"{100 * (new - old) / old:+.1f}%"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test the server with fake Gemini and Firestore")
+    parser.add_argument("--users", type=int, default=10, help="concurrent virtual users")
+    parser.add_argument("--requests", type=int, default=30, help="requests per user")
+    parser.add_argument("--duration", type=float, default=0, help="stop after N seconds (0 = no limit)")
+    parser.add_argument("--mix", choices=sorted(MIXES), default="mixed")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--gemini-latency", default="lognormal:0.05,0.35",
+                        help="fixed:S | uniform:A,B | lognormal:MEDIAN,SIGMA (seconds)")
+    parser.add_argument("--response-size", type=int, default=1500, help="approximate Gemini response size in chars")
+    parser.add_argument("--fault-rate", type=float, default=0.0, help="fraction of Gemini calls that fail")
+    parser.add_argument("--outage", help="START,DURATION: every Gemini call fails in this window (seconds)")
+    parser.add_argument("--hedge", action="store_true", help="enable hedged Gemini requests")
+    parser.add_argument("--library-size", type=int, default=200, help="library entries seeded before the run")
+    parser.add_argument("--user-rate", type=float, default=0,
+                        help="per-user LLM requests per minute (0 disables the rate limit)")
+    parser.add_argument("--storage", choices=["firestore", "sqlite"], default="firestore",
+                        help="storage backend (sqlite: fresh database in a temporary directory)")
+    parser.add_argument("--firestore", choices=["memory", "emulator"], default="memory")
+    parser.add_argument("--output", help="write the JSON report here")
+    parser.add_argument("--compare", help="baseline JSON report to diff against")
+    parser.add_argument("--check-budgets", action="store_true",
+                        help="exit with status 1 if any route exceeded its Firestore read budget")
+    args = parser.parse_args(argv)
+
+    report = asyncio.run(run_benchmark(args))
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2, default=str)
+    if args.check_budgets and report["firestore_budget_violations"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+"""
+Local scope gate: how many off-topic questions it answers without a Gemini
+call, how many in-scope ones it wrongly turns away, and what a decision costs.
+
+    cd server
+    python -m benchmarks.scope_gate
+    python -m benchmarks.scope_gate --thresholds 0.1,0.2,0.3 --folds 10 --requests 400
+
+Precision and recall are of the rejection (positive = rejected as
+off-topic), measured two ways:
+- k-fold cross-validation over the training corpus
+  (app/services/scope_gate_corpus.jsonl)
+- the held-out set benchmarks/corpus/scope_eval.jsonl, phrased differently
+  and never trained on; its borderline questions (greetings, follow-ups,
+  near-domain topics) are reported apart, since passing them is the right
+  call either way
+Then a mixed stream of held-out questions goes through POST /ai/chat against
+the fake Gemini (--latency per call) with the gate off and on: upstream calls
+saved and the latency of rejected and passed requests. The off-topic prompt
+of the replay corpus (benchmarks/corpus/prompts.jsonl) must be rejected and
+the others passed.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+
+import httpx
+
+from app.services.scope_gate import ScopeModel, load_corpus
+from benchmarks.fakes import FakeGenerativeModel, mint_token
+from benchmarks.harness import load_app
+from benchmarks.run import git_revision, percentile
+from benchmarks.workloads import API
+
+CORPUS_DIR = os.path.join(os.path.dirname(__file__), "corpus")
+USER = "bench-scope"
+
+
+def load_jsonl(name: str):
+    with open(os.path.join(CORPUS_DIR, name)) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def gate_with(model: ScopeModel):
+    """A scope gate around a given model"""
+    from app.services.scope_gate import ScopeGate
+
+    gate = object.__new__(ScopeGate)
+    gate.model = model
+    return gate
+
+
+def scores(examples, rejected):
+    """Precision / recall of rejection and the in-scope questions turned away"""
+    tp = sum(1 for e, r in zip(examples, rejected) if r and not e["in_scope"])
+    fp = sum(1 for e, r in zip(examples, rejected) if r and e["in_scope"])
+    off_topic = sum(1 for e in examples if not e["in_scope"])
+    return {"precision": tp / (tp + fp) if tp + fp else 1.0, "recall": tp / off_topic if off_topic else 0.0,
+            "false_rejects": [e["text"] for e, r in zip(examples, rejected) if r and e["in_scope"]]}
+
+
+def decide(gate, examples, threshold: float):
+    from app.core.config import settings
+    settings.SCOPE_GATE_THRESHOLD = threshold
+    return [gate.rejects(e["text"]) for e in examples]
+
+
+def cross_validate(examples, folds: int, thresholds, seed: int):
+    rows = examples[:]
+    random.Random(seed).shuffle(rows)
+    ordered, predictions = [], {t: [] for t in thresholds}
+    for k in range(folds):
+        test = rows[k::folds]
+        gate = gate_with(ScopeModel.train([r for i, r in enumerate(rows) if i % folds != k]))
+        ordered.extend(test)
+        for threshold in thresholds:
+            predictions[threshold].extend(decide(gate, test, threshold))
+    return {t: scores(ordered, predictions[t]) for t in thresholds}
+
+
+def print_scores(title: str, results):
+    print(f"\n{title}")
+    print(f"{'threshold':<11}{'precision':>10}{'recall':>8}{'false rejects':>15}")
+    for threshold, r in results.items():
+        print(f"{threshold:<11g}{r['precision']:>10.3f}{r['recall']:>8.3f}{len(r['false_rejects']):>15}")
+
+
+async def stream(app, questions, latencies):
+    """POST each question to /ai/chat; latency per question in ms"""
+    auth = {"Authorization": f"Bearer {mint_token(USER)}"}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+        for text in questions:
+            started = time.perf_counter()
+            resp = await client.post(f"{API}/ai/chat", json={"message": text, "use_cache": False}, headers=auth)
+            resp.raise_for_status()
+            latencies.append(1000 * (time.perf_counter() - started))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Scope gate precision/recall, saved calls and decision cost")
+    parser.add_argument("--thresholds", default="0.05,0.1,0.2,0.3,0.4")
+    parser.add_argument("--folds", type=int, default=5)
+    parser.add_argument("--requests", type=int, default=200, help="questions in the /ai/chat stream")
+    parser.add_argument("--latency", default="fixed:0.05", help="fake Gemini latency per call")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write the JSON report here")
+    args = parser.parse_args(argv)
+    thresholds = [float(t) for t in args.thresholds.split(",")]
+    report = {}
+
+    from app.core.config import settings
+    from app.services.scope_gate import scope_gate
+    default_threshold = settings.SCOPE_GATE_THRESHOLD
+    training = load_corpus()
+    held_out = load_jsonl("scope_eval.jsonl")
+    clear = [e for e in held_out if not e.get("borderline")]
+    borderline = [e for e in held_out if e.get("borderline")]
+
+    started = time.perf_counter()
+    model = ScopeModel.train(training)
+    report["train_ms"] = 1000 * (time.perf_counter() - started)
+    gate = gate_with(model)
+    print(f"trained on {len(training)} questions ({sum(e['in_scope'] for e in training)} in scope) "
+          f"in {report['train_ms']:.0f} ms, {len(model.weights)} features")
+
+    report["cross_validation"] = cross_validate(training, args.folds, thresholds, args.seed)
+    print_scores(f"{args.folds}-fold cross-validation ({len(training)} questions)", report["cross_validation"])
+    report["held_out"] = {t: scores(clear, decide(gate, clear, t)) for t in thresholds}
+    print_scores(f"held out ({len(clear)} questions)", report["held_out"])
+    for threshold in thresholds:
+        if report["held_out"][threshold]["false_rejects"]:
+            print(f"held-out false rejects at {threshold:g}: {report['held_out'][threshold]['false_rejects']}")
+    report["borderline"] = [(e["text"], e["in_scope"]) for e, r in
+                            zip(borderline, decide(gate, borderline, default_threshold)) if r]
+    print(f"\nborderline questions rejected at {default_threshold:g} (text, in scope):")
+    for text, in_scope in report["borderline"]:
+        print(f"  {text!r} {in_scope}")
+
+    settings.SCOPE_GATE_THRESHOLD = default_threshold
+    texts = [e["text"] for e in held_out]
+    started = time.perf_counter()
+    for _ in range(20):
+        for text in texts:
+            gate.rejects(text)
+    report["decision_us"] = (time.perf_counter() - started) / (20 * len(texts)) * 1e6
+    print(f"\ndecision: {report['decision_us']:.0f} us per question")
+
+    prompts = load_jsonl("prompts.jsonl")
+    report["replay_prompts"] = {p["id"]: gate.rejects(p["message"], follow_up=bool(p.get("history")))
+                                for p in prompts}
+    wrong = [pid for pid, rejected in report["replay_prompts"].items() if rejected != (pid == "off-topic")]
+    if wrong:
+        raise AssertionError(f"replay prompts decided wrongly: {wrong}")
+    print(f"replay prompts: only 'off-topic' rejected ({len(prompts)} prompts)")
+
+    # End to end: the same mixed stream through /ai/chat with the gate off and on
+    gemini = FakeGenerativeModel(latency=args.latency)
+    app, _ = load_app(gemini)
+    rng = random.Random(args.seed)
+    picked = [rng.choice(held_out) for _ in range(args.requests)]
+    questions = [e["text"] for e in picked]
+    rejected = [gate.rejects(q) for q in questions]
+    print(f"\n/ai/chat stream: {len(questions)} questions, {sum(not e['in_scope'] for e in picked)} off topic, "
+          f"Gemini {args.latency}")
+    print(f"{'gate':<6}{'Gemini calls':>14}{'saved':>8}{'rejected p50 ms':>17}{'passed p50 ms':>15}")
+    for mode in ("off", "on"):
+        scope_gate.mode = mode
+        calls = gemini.calls
+        latencies = []
+        asyncio.run(stream(app, questions, latencies))
+        made = gemini.calls - calls
+        result = {
+            "calls": made, "saved": 1 - made / len(questions),
+            "rejected_p50_ms": percentile([t for t, r in zip(latencies, rejected) if r], 0.5),
+            "passed_p50_ms": percentile([t for t, r in zip(latencies, rejected) if not r], 0.5),
+        }
+        report[f"stream/{mode}"] = result
+        print(f"{mode:<6}{made:>14}{result['saved']:>8.1%}{result['rejected_p50_ms']:>17.1f}"
+              f"{result['passed_p50_ms']:>15.1f}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"revision": git_revision(), "config": vars(args), "report": report}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+"""
+Semantic answer cache: hit rate against exact matching, and top-k latency
+of the vector index at library scale.
+
+    cd server
+    python -m benchmarks.semantic_cache --entries 100000 --queries 2000
+    python -m benchmarks.semantic_cache --thresholds 0.8,0.85,0.9 --nprobe 4,8,16
+
+The library is synthetic: every entry asks for one intent (an IEC 61131-3
+block, a piece of equipment, a production line and a preset) in one of several phrasings, with
+the blocks under different names (TON / on-delay timer / delay-on timer).
+Queries are a mix of verbatim repeats of library questions, paraphrases of
+library intents (another phrasing and name) and new intents that are not in
+the library but differ from ones that are only by a line, a preset or a block.
+For each threshold this reports the share of each kind answered from the
+cache with the right entry and with a wrong one (false hits), by similarity
+alone and with the service's same-numbers constraint (number_key), next to
+what exact matching of the normalized question string would have answered.
+
+Latency is measured on the index as the service uses it: built, saved, then
+loaded memory-mapped; brute force over the same mapped matrix is the
+reference for recall@k of the IVF search.
+"""
+import argparse
+import json
+import random
+import re
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from app.services.embedding import HashingEmbedder
+from app.services.iec_vocabulary import number_key
+from app.services.vector_index import IVFIndex
+from benchmarks.run import git_revision, percentile
+
+# block: (names, unit spellings, preset range)
+BLOCKS = {
+    "ton": (["TON timer", "on-delay timer", "delay-on timer"], ["seconds", "s", "sec"], 120),
+    "tof": (["TOF timer", "off-delay timer", "delay-off timer"], ["seconds", "s", "sec"], 120),
+    "tp": (["TP timer", "pulse timer"], ["ms", "milliseconds"], 120),
+    "ctu": (["CTU counter", "up counter", "count-up counter"], ["parts", "parts"], 200),
+    "ctd": (["CTD counter", "down counter", "count-down counter"], ["parts", "parts"], 200),
+    "latch": (["seal-in circuit", "latching circuit", "self-holding circuit"], ["seconds", "s"], 60),
+    "r_trig": (["R_TRIG", "rising edge detection"], ["ms", "milliseconds"], 60),
+    "f_trig": (["F_TRIG", "falling edge detection"], ["ms", "milliseconds"], 60),
+}
+EQUIPMENT = [
+    "mixer motor", "feed pump", "conveyor belt", "inlet valve", "exhaust fan", "boiler burner", "air compressor",
+    "hydraulic press", "packaging robot", "filling station", "labeling machine", "cooling tower", "batch reactor",
+    "dosing pump", "agitator", "crusher", "bucket elevator", "screw feeder", "palletizer", "wrapping machine",
+    "sorting gate", "drying oven", "chiller", "heat exchanger", "sump pump", "garage door", "car wash",
+    "elevator door", "traffic light", "parking barrier", "water tank", "silo discharge", "bottle capper",
+    "spray booth", "dust collector", "saw blade", "lathe spindle", "drill head", "welding robot", "kiln damper",
+]
+LINES = 6
+LIBRARY_TEMPLATES = [
+    "Show me a {block} example for the {equipment} on line {line} with {value} {unit}",
+    "How do I program a {block} on the line {line} {equipment}, preset {value} {unit}?",
+    "Write a {block} for {equipment} {line} with {value} {unit}",
+]
+QUERY_TEMPLATES = [
+    "{block} for the {equipment} of line {line}, {value}{unit}",
+    "I need a {block}: line {line} {equipment}, {value} {unit}",
+    "can you give me {equipment} {line} {block} code with {value} {unit}",
+    "{equipment} (line {line}) with a {block} of {value} {unit} please",
+]
+
+
+def intents():
+    for block, (_, _, values) in BLOCKS.items():
+        for equipment in EQUIPMENT:
+            for line in range(1, LINES + 1):
+                for value in range(1, values + 1):
+                    yield block, equipment, line, value
+
+
+def phrase(intent, templates, rng: random.Random) -> str:
+    block, equipment, line, value = intent
+    names, units, _ = BLOCKS[block]
+    return rng.choice(templates).format(block=rng.choice(names), equipment=equipment, line=line, value=value,
+                                        unit=rng.choice(units))
+
+
+def normalize(question: str) -> str:
+    return re.sub(r"\s+", " ", question.casefold()).strip(" ?.!")
+
+
+def make_workload(args, rng: random.Random):
+    space = list(intents())
+    if args.entries > len(space):
+        raise SystemExit(f"--entries at most {len(space)}")
+    rng.shuffle(space)
+    library = space[:args.entries]
+    novel = space[args.entries:]
+    questions = [phrase(intent, LIBRARY_TEMPLATES, rng) for intent in library]
+
+    queries = []  # (kind, text, index of the expected entry or None)
+    for _ in range(args.queries):
+        kind = rng.choices(["repeat", "paraphrase", "novel"], weights=[1, 2, 1])[0]
+        if kind == "novel" and novel:
+            queries.append((kind, phrase(rng.choice(novel), QUERY_TEMPLATES, rng), None))
+            continue
+        position = rng.randrange(len(library))
+        text = questions[position] if kind == "repeat" else phrase(library[position], QUERY_TEMPLATES, rng)
+        queries.append((kind, text, position))
+    return library, questions, queries
+
+
+def timed_searches(search, vectors, repeat: int = 1):
+    samples, results = [], []
+    for vector in vectors:
+        started = time.perf_counter()
+        for _ in range(repeat):
+            result = search(vector)
+        samples.append((time.perf_counter() - started) / repeat)
+        results.append(result)
+    return 1000 * percentile(samples, 0.5), 1000 * percentile(samples, 0.95), results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Semantic answer cache hit rate and vector search latency")
+    parser.add_argument("--entries", type=int, default=100000, help="library questions")
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--nprobe", default="4,8,16")
+    parser.add_argument("--thresholds", default="0.75,0.8,0.85,0.9,0.95")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write the JSON report here")
+    args = parser.parse_args(argv)
+    rng = random.Random(args.seed)
+    embedder = HashingEmbedder()
+    report = {}
+
+    library, questions, queries = make_workload(args, rng)
+    started = time.perf_counter()
+    vectors = embedder.embed_many(questions)
+    embed_s = time.perf_counter() - started
+    started = time.perf_counter()
+    index = IVFIndex.build(vectors, [str(i) for i in range(len(questions))], [number_key(q) for q in questions])
+    build_s = time.perf_counter() - started
+    directory = tempfile.mkdtemp(prefix="semantic-bench-")
+    try:
+        started = time.perf_counter()
+        index.save(directory)
+        save_s = time.perf_counter() - started
+        started = time.perf_counter()
+        index = IVFIndex.load(directory)
+        load_s = time.perf_counter() - started
+        report["index"] = {"entries": len(index), "dim": embedder.dim, "lists": len(index.centroids),
+                           "matrix_mib": index.vectors.nbytes / 2 ** 20, "embed_s": embed_s, "build_s": build_s,
+                           "save_s": save_s, "load_ms": load_s * 1000}
+        print(f"{len(index)} questions, dim {embedder.dim}, {len(index.centroids)} lists, "
+              f"{index.vectors.nbytes / 2 ** 20:.0f} MiB mapped")
+        print(f"embed {embed_s:.2f} s ({embed_s / len(questions) * 1e6:.0f} us/question), build {build_s:.2f} s, "
+              f"save {save_s:.2f} s, load (mmap) {load_s * 1000:.1f} ms")
+
+        started = time.perf_counter()
+        query_vectors = embedder.embed_many(text for _, text, _ in queries)
+        query_tags = [number_key(text) for _, text, _ in queries]
+        report["embed_query_us"] = (time.perf_counter() - started) / len(queries) * 1e6
+
+        # Latency and recall@k against brute force over the mapped matrix
+        exact_p50, exact_p95, exact = timed_searches(lambda q: index.search_exact(q, args.k), query_vectors)
+        report["search"] = {"exact": {"p50_ms": exact_p50, "p95_ms": exact_p95, "recall": 1.0}}
+        print(f"\nquery embedding {report['embed_query_us']:.0f} us; top-{args.k} search over {len(index)} vectors")
+        print(f"{'search':<12}{'p50 ms':>9}{'p95 ms':>9}{f'recall@{args.k}':>11}{'top-1 same':>12}")
+        print(f"{'exact':<12}{exact_p50:>9.3f}{exact_p95:>9.3f}{1.0:>11.3f}{1.0:>12.3f}")
+        for nprobe in [int(n) for n in args.nprobe.split(",")]:
+            p50, p95, found = timed_searches(lambda q: index.search(q, args.k, nprobe), query_vectors)
+            recall = np.mean([len({k for k, _ in a} & {k for k, _ in b}) / max(1, len(b))
+                              for a, b in zip(found, exact)])
+            same = np.mean([bool(a) and bool(b) and a[0][1] >= b[0][1] - 1e-6 for a, b in zip(found, exact)])
+            report["search"][f"ivf/{nprobe}"] = {"p50_ms": p50, "p95_ms": p95, "recall": recall, "top1": same}
+            print(f"{f'ivf nprobe {nprobe}':<12}{p50:>9.3f}{p95:>9.3f}{recall:>11.3f}{same:>12.3f}")
+        p50, p95, guarded = timed_searches(lambda q: index.search(q[0], args.k, 8, tag=q[1]),
+                                           list(zip(query_vectors, query_tags)))
+        report["search"]["ivf/8+numbers"] = {"p50_ms": p50, "p95_ms": p95}
+        print(f"{'+ numbers':<12}{p50:>9.3f}{p95:>9.3f}")
+        approximate = [index.search(q, 1, 8) for q in query_vectors]
+
+        # Hit rates per query kind: the cache answers with the best match at or above the threshold
+        exact_lookup = {}
+        for position, question in enumerate(questions):
+            exact_lookup.setdefault(normalize(question), position)
+        kinds = ["repeat", "paraphrase", "novel"]
+        counts = {kind: sum(1 for q in queries if q[0] == kind) for kind in kinds}
+        print(f"\nqueries: {', '.join(f'{counts[k]} {k}' for k in kinds)} (search: ivf nprobe 8)")
+        print(f"{'matcher':<16}" + "".join(f"{k + ' hit':>16}{'wrong':>7}" for k in kinds) + f"{'hit rate':>10}")
+
+        def row(name, answers):
+            result = {}
+            for kind in kinds:
+                right = sum(1 for (k, _, expected), got in zip(queries, answers)
+                            if k == kind and got is not None and got == expected)
+                wrong = sum(1 for (k, _, expected), got in zip(queries, answers)
+                            if k == kind and got is not None and got != expected)
+                result[kind] = {"hit": right / max(1, counts[kind]), "wrong": wrong / max(1, counts[kind])}
+            result["hit_rate"] = sum(1 for a in answers if a is not None) / len(answers)
+            report.setdefault("hits", {})[name] = result
+            print(f"{name:<16}" + "".join(f"{result[k]['hit']:>16.3f}{result[k]['wrong']:>7.3f}" for k in kinds)
+                  + f"{result['hit_rate']:>10.3f}")
+
+        row("exact string", [exact_lookup.get(normalize(text)) for _, text, _ in queries])
+        thresholds = [float(t) for t in args.thresholds.split(",")]
+        for name, results in (("cosine", approximate), ("+ numbers", guarded)):
+            for threshold in thresholds:
+                row(f"{name} >= {threshold:g}", [int(found[0][0]) if found and found[0][1] >= threshold else None
+                                                 for found in results])
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"revision": git_revision(), "config": vars(args), "report": report}, f, indent=2,
+                      default=float)
+
+
+if __name__ == "__main__":
+    main()
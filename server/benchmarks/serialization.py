@@ -0,0 +1,132 @@
+"""
+Response serialization: FastAPI's response_model path against
+trusted_response().
+
+    cd server
+    python -m benchmarks.serialization --sizes 100,1000,10000 --repeat 20
+
+For a session's messages and for library summaries of each size, times
+building the route's result from storage data and turning it into the
+response body. "validated" is how the routes worked before: models built
+with validation, then FastAPI's serialize_response (validation against the
+response_model, jsonable_encoder) and JSONResponse. "fast" is the current
+route: messages stay the ChatMessage models storage returns, library
+summaries become plain dicts, and the result is encoded with orjson (the
+standard library when orjson is not installed). "construct" is the fast
+path with model_construct() instead of plain dicts, for reference. All
+bodies are checked to decode to the same JSON.
+"""
+import argparse
+import asyncio
+import json
+import time
+from datetime import datetime, timedelta
+from typing import List
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+from app.api.library import _to_summary
+from app.core.responses import orjson, trusted_response
+from app.models.library import LibraryEntrySummary
+from app.models.session import ChatMessage, SessionMessagesResponse
+from benchmarks.run import git_revision, percentile
+
+ANSWER = ('[{"type": "text", "content": "A TON timer delays switching on."}, '
+          '{"type": "plc-code", "content": "PROGRAM Main\\nVAR\\n  t : TON;\\nEND_VAR\\nt(IN := start, PT := T#5S);\\nEND_PROGRAM"}]')
+
+
+def message_rows(n: int):
+    base = datetime(2026, 1, 1)
+    return [{"role": "user" if i % 2 == 0 else "assistant",
+             "content": "Explain a TON timer" if i % 2 == 0 else ANSWER,
+             "timestamp": base + timedelta(seconds=i), "message_id": f"msg-{i:06d}"} for i in range(n)]
+
+
+def library_rows(n: int):
+    base = datetime(2026, 1, 1)
+    return [{"entry_id": f"entry-{i:06d}", "user_name": "Bench User", "user_question": f"Question {i} about a TON timer",
+             "response_preview": "A TON timer delays switching on. " * 5, "session_id": f"session-{i % 50}",
+             "created_at": base + timedelta(seconds=i), "tags": ["timers", "ton"], "category": "timers",
+             "duplicate_of": None} for i in range(n)]
+
+
+# payload: (response_model, storage rows, validated result, fast result, model_construct result)
+PAYLOADS = {
+    "messages": (
+        SessionMessagesResponse,
+        message_rows,
+        lambda rows: SessionMessagesResponse(session_id="s", messages=[ChatMessage(**r) for r in rows], total=len(rows)),
+        lambda rows: SessionMessagesResponse.model_construct(
+            session_id="s", messages=[ChatMessage(**r) for r in rows], total=len(rows)),
+        lambda rows: SessionMessagesResponse.model_construct(
+            session_id="s", messages=[ChatMessage.model_construct(**r) for r in rows], total=len(rows)),
+    ),
+    "library": (
+        List[LibraryEntrySummary],
+        library_rows,
+        lambda rows: [LibraryEntrySummary(**r) for r in rows],
+        lambda rows: [_to_summary(r) for r in rows],
+        lambda rows: [LibraryEntrySummary.model_construct(**r) for r in rows],
+    ),
+}
+
+
+async def validated_body(field, build, rows) -> bytes:
+    content = await serialize_response(field=field, response_content=build(rows), is_coroutine=True)
+    return JSONResponse(content).body
+
+
+async def fast_body(build, rows) -> bytes:
+    return trusted_response(build(rows)).body
+
+
+async def best_of(repeat: int, fn, *args):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        body = await fn(*args)
+        samples.append(time.perf_counter() - started)
+    return percentile(samples, 0.5), body
+
+
+async def run(args):
+    report = {}
+    print(f"encoder: {'orjson ' + orjson.__version__ if orjson else 'json (orjson not installed)'}")
+    print(f"{'payload':<10}{'items':>7}{'validated ms':>14}{'fast ms':>10}{'construct ms':>14}{'speedup':>9}"
+          f"{'body KiB':>10}")
+    for name, (schema, rows_for, build_validated, build_fast, build_construct) in PAYLOADS.items():
+        field = create_response_field(name=f"bench_{name}", type_=schema)
+        for size in args.sizes:
+            rows = rows_for(size)
+            slow, slow_body = await best_of(args.repeat, validated_body, field, build_validated, rows)
+            fast, fast_body_ = await best_of(args.repeat, fast_body, build_fast, rows)
+            construct, construct_body = await best_of(args.repeat, fast_body, build_construct, rows)
+            expected = json.loads(slow_body)
+            if json.loads(fast_body_) != expected or json.loads(construct_body) != expected:
+                raise AssertionError(f"{name}/{size}: the paths produce different JSON")
+            report[f"{name}/{size}"] = {"validated_ms": slow * 1000, "fast_ms": fast * 1000,
+                                        "construct_ms": construct * 1000, "speedup": slow / fast,
+                                        "body_bytes": len(fast_body_)}
+            print(f"{name:<10}{size:>7}{slow * 1000:>14.2f}{fast * 1000:>10.2f}{construct * 1000:>14.2f}"
+                  f"{slow / fast:>8.1f}x{len(fast_body_) / 1024:>10.1f}")
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Response serialization microbenchmark")
+    parser.add_argument("--sizes", default="100,1000,10000")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--output", help="write the JSON report here")
+    args = parser.parse_args(argv)
+    args.sizes = [int(s) for s in args.sizes.split(",")]
+
+    report = asyncio.run(run(args))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"revision": git_revision(), "config": vars(args), "report": report}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""
+Rolling session summary: prompt size and Firestore reads per turn as a chat
+session grows, with SESSION_SUMMARY_MODE off and on.
+
+    cd server
+    python -m benchmarks.session_summary
+    python -m benchmarks.session_summary --turns 200 --context 8 --every 2 --storage sqlite
+
+For each mode one session of --turns turns goes through
+POST /chat/sessions/{id}/messages against the fake Gemini (--latency per
+call). The fake records the characters of every prompt it is sent (system
+prompt, summary, history and message); calls to the summary tier are
+counted apart. Per stretch of the session (first, middle and last third):
+prompt characters per turn, Firestore reads per turn (X-Firestore-Ops) and
+turn latency. For on, also the folds: calls, characters sent and reads each
+(published under the route "session_summary"). Folds run in the background
+as they would in production, so a turn may start before the previous fold
+has landed.
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import httpx
+
+from benchmarks.fakes import FakeGenerativeModel, mint_token
+from benchmarks.harness import load_app
+from benchmarks.run import git_revision, percentile
+from benchmarks.workloads import API
+
+USER = "bench-summary"
+TOPICS = ["conveyor start/stop interlock", "tank level alarm", "TON timer on the pump", "CTU batch counter",
+          "emergency stop chain", "star-delta starter"]
+
+
+class RecordingModel(FakeGenerativeModel):
+    """Fake Gemini that keeps the prompt size of every call; summary calls are the ones without history"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.turn_prompts, self.summary_prompts = [], []
+
+    def _respond(self, history, message):
+        chars = sum(len(str(p)) for h in history for p in h.get("parts", [])) + len(str(message))
+        (self.turn_prompts if history else self.summary_prompts).append(chars)
+        return super()._respond(history, message)
+
+
+def reads(resp: httpx.Response) -> int:
+    fields = dict(item.strip().split("=") for item in resp.headers["x-firestore-ops"].split(";"))
+    return int(fields["reads"])
+
+
+async def session(app, turns: int):
+    """One session of `turns` turns; (reads, latency in ms) per turn"""
+    from app.services.session_summary import session_summary
+
+    auth = {"Authorization": f"Bearer {mint_token(USER)}"}
+    transport = httpx.ASGITransport(app=app)
+    rows = []
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+        resp = await client.post(f"{API}/chat/sessions", json={"title": "bench"}, headers=auth)
+        session_id = resp.json()["session_id"]
+        for i in range(turns):
+            message = f"Now extend the ladder logic for the {TOPICS[i % len(TOPICS)]} (step {i + 1})"
+            started = time.perf_counter()
+            resp = await client.post(f"{API}/chat/sessions/{session_id}/messages", json={"message": message},
+                                     headers=auth)
+            resp.raise_for_status()
+            rows.append((reads(resp), 1000 * (time.perf_counter() - started)))
+        await session_summary.drain()
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Prompt size and reads per turn with and without the session summary")
+    parser.add_argument("--turns", type=int, default=60)
+    parser.add_argument("--context", type=int, default=8, help="SESSION_CONTEXT_MESSAGES")
+    parser.add_argument("--every", type=int, default=2, help="SESSION_SUMMARY_EVERY_TURNS")
+    parser.add_argument("--latency", default="fixed:0.02", help="fake Gemini latency per call")
+    parser.add_argument("--response-size", type=int, default=1500, help="characters per fake answer")
+    parser.add_argument("--storage", choices=["firestore", "sqlite"], default="firestore")
+    parser.add_argument("--output", help="write the JSON report here")
+    args = parser.parse_args(argv)
+
+    from app.core.config import settings
+    settings.FIRESTORE_OPS_HEADER = True
+    settings.SESSION_CONTEXT_MESSAGES = args.context
+    settings.SESSION_SUMMARY_EVERY_TURNS = args.every
+    gemini = RecordingModel(latency=args.latency, response_size=args.response_size)
+    app, _ = load_app(gemini, storage_backend=args.storage)
+
+    from app.services.firestore_accounting import FIRESTORE_OPS
+    from app.services.session_summary import session_summary
+
+    print(f"{args.turns} turns, {args.context} context messages, fold every {args.every} turns, "
+          f"storage {args.storage}")
+    print(f"{'mode':<5}{'turns':>10}{'prompt chars':>14}{'reads':>7}{'p50 ms':>8}")
+    report = {}
+    for mode in ("off", "on"):
+        session_summary.mode = mode
+        turn_calls, summary_calls = len(gemini.turn_prompts), len(gemini.summary_prompts)
+        fold_reads = FIRESTORE_OPS.value(route="session_summary", op="reads")
+        rows = asyncio.run(session(app, args.turns))
+        prompts = gemini.turn_prompts[turn_calls:]
+        summaries = gemini.summary_prompts[summary_calls:]
+        result = {"stretches": []}
+        third = max(1, args.turns // 3)
+        for start in range(0, args.turns, third):
+            end = min(args.turns, start + third)
+            stretch = {
+                "turns": f"{start + 1}-{end}",
+                "prompt_chars": sum(prompts[start:end]) / (end - start),
+                "max_reads": max(r for r, _ in rows[start:end]),
+                "p50_ms": percentile([ms for _, ms in rows[start:end]], 0.5),
+            }
+            result["stretches"].append(stretch)
+            print(f"{mode:<5}{stretch['turns']:>10}{stretch['prompt_chars']:>14.0f}{stretch['max_reads']:>7}"
+                  f"{stretch['p50_ms']:>8.1f}")
+        if summaries:
+            result["folds"] = {
+                "calls": len(summaries),
+                "chars_per_call": sum(summaries) / len(summaries),
+                "reads_per_fold": (FIRESTORE_OPS.value(route="session_summary", op="reads") - fold_reads)
+                / len(summaries),
+            }
+        report[mode] = result
+
+    folds = report["on"].get("folds")
+    if folds:
+        print(f"\nfolds (on): {folds['calls']} summary calls for {args.turns} turns, "
+              f"{folds['chars_per_call']:.0f} prompt chars and {folds['reads_per_fold']:.0f} reads each")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"revision": git_revision(), "config": vars(args), "report": report}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""
+Token-cache hit rate and per-user rate limiting as the worker count grows,
+with per-process state against the shared state server.
+
+    cd server
+    python -m benchmarks.shared_state --workers 1,2,4,8 --users 50 --requests 2000
+    python -m benchmarks.shared_state --state memory,local,redis://localhost:6379/0
+
+Every worker is a separate process running the app in-process (fake Gemini,
+in-memory Firestore). Requests are spread over the workers at random, as a
+shared listening socket does. Each user makes --requests / --users
+authenticated GET /chat/sessions calls, which go through the ID-token cache,
+then a burst of --llm-calls POST /ai/chat with LLM_USER_BURST tokens and a
+refill of one per minute: at most the burst should get through, whatever the
+number of workers. The fake token verifier is free; what carries over is the
+hit rate, each miss being one RS256 verification (and, per process, a key
+fetch) on a real deployment.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+
+from benchmarks.run import git_revision
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def worker(spec: str, burst: int, requests, results):
+    os.environ["SHARED_STATE"] = spec
+    os.environ["LLM_USER_BURST"] = str(burst)
+    os.environ["ID_TOKEN_CACHE_TTL"] = "300"
+    import asyncio
+    import httpx
+    from benchmarks.fakes import FakeGenerativeModel, mint_token
+    from benchmarks.harness import load_app
+    from benchmarks.workloads import API
+
+    app, _ = load_app(FakeGenerativeModel(latency="fixed:0"), user_rate_per_minute=1)
+    from app.core.metrics import CACHE_REQUESTS
+
+    async def run():
+        admitted, rejected = Counter(), 0
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            for kind, uid in requests:
+                headers = {"Authorization": f"Bearer {mint_token(uid)}"}
+                if kind == "list":
+                    (await client.get(f"{API}/chat/sessions", headers=headers)).raise_for_status()
+                    continue
+                resp = await client.post(f"{API}/ai/chat", json={"message": "Explain a TON timer"}, headers=headers)
+                if resp.status_code == 200:
+                    admitted[uid] += 1
+                elif resp.status_code == 429:
+                    rejected += 1
+                else:
+                    resp.raise_for_status()
+        return admitted, rejected
+
+    admitted, rejected = asyncio.run(run())
+    counts = {result: value for (cache, result), value in CACHE_REQUESTS.items() if cache == "id_token"}
+    results.put({"hits": counts.get("hit", 0), "misses": counts.get("miss", 0),
+                 "admitted": dict(admitted), "rejected": rejected})
+
+
+def run_config(spec: str, workers: int, args, rng: random.Random):
+    users = [f"user-{i}" for i in range(args.users)]
+    stream = [("list", u) for u in users for _ in range(args.requests // args.users)]
+    rng.shuffle(stream)
+    stream += [("llm", u) for u in users for _ in range(args.llm_calls)]
+    shares = [[] for _ in range(workers)]
+    for request in stream:
+        shares[rng.randrange(workers)].append(request)
+
+    ctx = multiprocessing.get_context("spawn")
+    results = ctx.Queue()
+    procs = [ctx.Process(target=worker, args=(spec, args.burst, share, results)) for share in shares]
+    for p in procs:
+        p.start()
+    outcomes = [results.get(timeout=600) for _ in procs]
+    for p in procs:
+        p.join()
+
+    hits = sum(o["hits"] for o in outcomes)
+    misses = sum(o["misses"] for o in outcomes)
+    admitted = defaultdict(int)
+    for o in outcomes:
+        for uid, n in o["admitted"].items():
+            admitted[uid] += n
+    per_user = [admitted[u] for u in users]
+    return {
+        "hit_ratio": hits / (hits + misses) if hits + misses else 0.0,
+        "verifications": misses,
+        "admitted_per_user_avg": sum(per_user) / len(per_user),
+        "admitted_per_user_max": max(per_user),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Shared state across worker processes")
+    parser.add_argument("--workers", default="1,2,4,8")
+    parser.add_argument("--state", default="memory,local", help="memory, local, unix://... or redis://...")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=2000, help="authenticated requests in total")
+    parser.add_argument("--llm-calls", type=int, default=20, help="AI calls per user, in a burst")
+    parser.add_argument("--burst", type=int, default=5, help="LLM_USER_BURST")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write the JSON report here")
+    args = parser.parse_args(argv)
+
+    report = {}
+    print(f"{args.users} users, {args.requests} authenticated requests, {args.llm_calls} AI calls per user "
+          f"(burst {args.burst})")
+    print(f"{'state':<10}{'workers':>8}{'token hit':>11}{'verifies':>10}{'AI admitted/user':>18}")
+    for spec in args.state.split(","):
+        for workers in [int(w) for w in args.workers.split(",")]:
+            server, target = None, spec
+            if spec == "local":
+                path = os.path.join(tempfile.mkdtemp(), "state.sock")
+                server = subprocess.Popen([sys.executable, "-m", "app.services.state_server", "--socket", path],
+                                          cwd=SERVER_DIR, stdout=subprocess.DEVNULL)
+                while not os.path.exists(path):
+                    time.sleep(0.02)
+                target = f"unix://{path}"
+            try:
+                result = run_config(target, workers, args, random.Random(args.seed))
+            finally:
+                if server is not None:
+                    server.terminate()
+                    server.wait()
+            report[f"{spec}/{workers}"] = result
+            print(f"{spec[:10]:<10}{workers:>8}{result['hit_ratio']:>11.3f}{result['verifications']:>10}"
+                  f"{result['admitted_per_user_avg']:>12.1f} (max {result['admitted_per_user_max']})")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"revision": git_revision(), "config": vars(args), "report": report}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""
+Structured Text formatter and code hash throughput.
+
+    cd server
+    python -m benchmarks.st_format --lines 30,200,1000 --programs 300
+
+Generates ST programs (see benchmarks.library_dedup.program) and a messy
+variant of each: random indentation and casing, `:=` spacing, `//` instead
+of `(* *)` comments, several statements per line. Reports programs/s and
+MB/s for format_st() and st_code_hash(), per-program p95, and checks that
+every messy variant hashes like its original, that formatting is
+idempotent and that both format to the same layout (up to identifier case
+and literal spelling).
+"""
+import argparse
+import json
+import random
+import re
+import time
+
+from benchmarks.library_dedup import program
+from benchmarks.run import git_revision, percentile
+
+_WORD = re.compile(r"[A-Za-z_]\w*")
+_TYPED = re.compile(r"\w+#[\w.:-]+")
+_EXTRA = [
+    "IF {a} AND NOT {b} THEN\n  {c} := TRUE;\nELSIF {b} THEN\n  {c} := FALSE;\nELSE\n  {a} := {b};\nEND_IF;",
+    "Timer_{n}(IN := {a}, PT := T#{ms}ms);\n{c} := Timer_{n}.Q;",
+    "CASE Step_{n} OF\n  1: {a} := TRUE;\n  2, 3: {b} := FALSE;\nELSE\n  Step_{n} := 0;\nEND_CASE;",
+    "FOR I := 1 TO 16#{hx} DO\n  Count := Count + 1;\nEND_FOR;",
+]
+
+
+def source(rng: random.Random, lines: int) -> str:
+    """A program with declarations, boolean logic, IF/CASE/FOR and typed literals"""
+    _, code = program(rng, lines)
+    head, _, body = code.partition("END_VAR\n")
+    names = re.findall(r"(\w+): BOOL;", head)
+    extra = []
+    for n in range(max(1, lines // 10)):
+        a, b, c = rng.sample(names, 3)
+        extra.append(rng.choice(_EXTRA).format(a=a, b=b, c=c, n=n, ms=rng.randrange(1, 10) * 1000,
+                                               hx=format(rng.randrange(16, 255), "X")))
+    decls = "".join(f"  Timer_{n}: TON;\n  Step_{n}: INT;\n" for n in range(len(extra)))
+    head = head + decls + "  I: INT;\n  Count: INT;\n"
+    body = body.replace("\nEND_PROGRAM", "\n" + "\n".join(extra) + "\nEND_PROGRAM")
+    return head + "END_VAR\n" + body
+
+
+def messy(rng: random.Random, code: str) -> str:
+    """Same program, cosmetically different"""
+    def case(m):
+        word = m.group()
+        return rng.choice([word, word.lower(), word.upper(), word.capitalize()])
+
+    def time_literal(m):
+        ms = int(m.group(1))
+        return f"t#{ms // 1000}S" if ms % 1000 == 0 and rng.random() < 0.5 else f"TIME#{ms}ms"
+
+    code = re.sub(r"T#(\d+)ms", time_literal, code)
+    out = []
+    for line in code.split("\n"):
+        line = line.strip()
+        line = re.sub(r"\(\* (.*?) \*\)", lambda m: f"// {m.group(1)}" if rng.random() < 0.5 else f"(*{m.group(1)}*)",
+                      line)
+        line = _WORD.sub(case, line)
+        line = line.replace(" := ", rng.choice([":=", " :=", " := ", "  :=  "]))
+        line = line.replace(", ", rng.choice([",", ", ", " , "]))
+        out.append(" " * rng.randrange(0, 9) + line)
+    # Join a few statements onto one line (not after a // comment)
+    text = ""
+    for line in out:
+        joined = text and not text.rstrip().endswith(")") and "//" not in text.rsplit("\n", 1)[-1]
+        text += (" " if joined and rng.random() < 0.2 else "\n") + line
+    return text.strip("\n") + "\n" * rng.randrange(1, 3)
+
+
+def measure(fn, inputs, repeat):
+    samples = []
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for text in inputs:
+            t = time.perf_counter()
+            fn(text)
+            samples.append(time.perf_counter() - t)
+    return time.perf_counter() - started, samples
+
+
+def run_size(lines: int, programs: int, repeat: int, seed_value: int):
+    from app.services.st_formatter import format_st, st_code_hash
+
+    rng = random.Random(seed_value)
+    originals = [source(rng, lines) for _ in range(programs)]
+    variants = [messy(rng, code) for code in originals]
+    total_bytes = sum(len(v.encode()) for v in variants)
+
+    stable = sum(st_code_hash(a) == st_code_hash(b) for a, b in zip(originals, variants))
+    idempotent = sum(format_st(format_st(v)) == format_st(v) for v in variants)
+    # Layout is fully determined: only identifier case and literal spelling may differ
+    def layout(code):
+        return _TYPED.sub("#", format_st(code, strip_comments=True).casefold())
+    same_layout = sum(layout(a) == layout(b) for a, b in zip(originals, variants))
+
+    row = {"lines": lines, "programs": programs, "avg_bytes": total_bytes // programs,
+           "hash_stable": stable / programs, "idempotent": idempotent / programs,
+           "same_layout": same_layout / programs}
+    for name, fn in (("format", format_st), ("hash", st_code_hash)):
+        elapsed, samples = measure(fn, variants, repeat)
+        row[f"{name}_per_s"] = programs * repeat / elapsed
+        row[f"{name}_mb_s"] = total_bytes * repeat / elapsed / 2**20
+        row[f"{name}_p50_ms"] = 1000 * percentile(samples, 0.5)
+        row[f"{name}_p95_ms"] = 1000 * percentile(samples, 0.95)
+    return row
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="ST formatter and code hash throughput")
+    parser.add_argument("--lines", default="30,200,1000", help="comma-separated statements per program")
+    parser.add_argument("--programs", type=int, default=300)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write the JSON report here")
+    args = parser.parse_args(argv)
+
+    rows = []
+    print(f"{'lines':>6}{'bytes':>8}{'fmt/s':>9}{'fmt MB/s':>10}{'fmt p95 ms':>12}"
+          f"{'hash/s':>9}{'hash MB/s':>11}{'stable':>8}{'idemp':>7}{'layout':>8}")
+    for lines in (int(s) for s in args.lines.split(",")):
+        row = run_size(lines, args.programs, args.repeat, args.seed)
+        rows.append(row)
+        print(f"{lines:>6}{row['avg_bytes']:>8}{row['format_per_s']:>9.0f}{row['format_mb_s']:>10.2f}"
+              f"{row['format_p95_ms']:>12.2f}{row['hash_per_s']:>9.0f}{row['hash_mb_s']:>11.2f}"
+              f"{row['hash_stable']:>8.2f}{row['idempotent']:>7.2f}{row['same_layout']:>8.2f}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"revision": git_revision(), "config": vars(args), "runs": rows}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
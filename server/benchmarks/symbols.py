@@ -0,0 +1,140 @@
+"""
+Symbol cross-reference lookups versus scanning chat history.
+
+    cd server
+    python -m benchmarks.symbols --sessions 200 --messages 20 --rtt 0.004
+    python -m benchmarks.symbols --storage sqlite
+
+Writes sessions for one user through the storage backend (assistant
+messages carry generated Structured Text, see benchmarks.st_format), then
+answers "where did I use X?" two ways: GET /chat/symbols, and the scan a
+client needed before (list the sessions, load every session's messages,
+search the plc-code). Also reports what the index adds to
+add_message_to_session, and on Firestore the documents each way reads. The
+in-memory Firestore filters queries linearly, so there the read count, not
+the lookup time, is what carries over to a real database.
+"""
+import argparse
+import asyncio
+import json
+import random
+import re
+import time
+
+import httpx
+
+from benchmarks.fakes import FakeGenerativeModel, mint_token
+from benchmarks.harness import load_app
+from benchmarks.library_dedup import structured
+from benchmarks.run import git_revision, percentile
+from benchmarks.st_format import source
+from benchmarks.workloads import API
+
+USER = "bench-symbols"
+
+
+async def seed(storage, sessions: int, messages: int, rng: random.Random):
+    """Returns (symbol names, add_message_to_session latencies of code and text messages)"""
+    names, code_lat, text_lat = set(), [], []
+    for s in range(sessions):
+        session_id = await storage.create_chat_session(USER, f"Machine {s}")
+        for m in range(messages):
+            if m % 2 == 0:
+                content, lat = f"Question {m} about the machine", text_lat
+            else:
+                code = source(rng, 20)
+                names.update(re.findall(r"(\w+): BOOL;", code))
+                content, lat = structured(code), code_lat
+            started = time.perf_counter()
+            await storage.add_message_to_session(session_id, USER, "assistant" if m % 2 else "user", content)
+            lat.append(time.perf_counter() - started)
+    return sorted(names), code_lat, text_lat
+
+
+async def scan(storage, name: str):
+    """The lookup without an index: every message of every session"""
+    needle = re.compile(rf"\b{re.escape(name)}\b", re.I)
+    sessions = await storage.get_user_sessions(USER, limit=1000)
+    pages = await asyncio.gather(*(storage.get_session_messages(s.session_id, USER, limit=1000) for s in sessions))
+    return [(s.session_id, msg.message_id) for s, page in zip(sessions, pages)
+            for msg in page if msg.role == "assistant" and needle.search(msg.content)]
+
+
+async def reads(coro) -> int:
+    from app.services.firestore_accounting import start_request_tally
+    tally = start_request_tally()
+    await coro
+    return tally.reads
+
+
+async def measure(app, storage, names, lookups: int, rng: random.Random):
+    from app.services.st_symbols import symbol_key
+    headers = {"Authorization": f"Bearer {mint_token(USER)}"}
+    indexed, scanned, hits = [], [], []
+    name = names[0]
+    read_counts = (await reads(storage.find_symbol_refs(USER, symbol_key(name), limit=100)),
+                   await reads(scan(storage, name)))
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for _ in range(lookups):
+            name = rng.choice(names)
+            started = time.perf_counter()
+            resp = await client.get(f"{API}/chat/symbols", params={"name": name.lower(), "limit": 100},
+                                    headers=headers)
+            indexed.append(time.perf_counter() - started)
+            resp.raise_for_status()
+            hits.append(resp.json()["total"])
+            started = time.perf_counter()
+            await scan(storage, name)
+            scanned.append(time.perf_counter() - started)
+    return indexed, scanned, hits, read_counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Symbol index lookups against a history scan")
+    parser.add_argument("--sessions", type=int, default=200)
+    parser.add_argument("--messages", type=int, default=20, help="messages per session (half carry code)")
+    parser.add_argument("--lookups", type=int, default=50)
+    parser.add_argument("--rtt", type=float, default=0.0, help="simulated Firestore round trip (seconds)")
+    parser.add_argument("--storage", choices=["firestore", "sqlite"], default="firestore")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write the JSON report here")
+    args = parser.parse_args(argv)
+
+    app, _ = load_app(FakeGenerativeModel(latency="fixed:0"), firestore_rtt=args.rtt,
+                      storage_backend=args.storage)
+    from app.services.storage import storage
+    rng = random.Random(args.seed)
+
+    async def run():
+        names, code_lat, text_lat = await seed(storage, args.sessions, args.messages, rng)
+        return (code_lat, text_lat) + await measure(app, storage, names, args.lookups, rng)
+
+    code_lat, text_lat, indexed, scanned, hits, read_counts = asyncio.run(run())
+    report = {
+        "messages": args.sessions * args.messages,
+        "lookup_p50_ms": 1000 * percentile(indexed, 0.5),
+        "lookup_p95_ms": 1000 * percentile(indexed, 0.95),
+        "scan_p50_ms": 1000 * percentile(scanned, 0.5),
+        "scan_p95_ms": 1000 * percentile(scanned, 0.95),
+        "refs_per_lookup": sum(hits) / len(hits),
+        "lookup_reads": read_counts[0],
+        "scan_reads": read_counts[1],
+        "add_code_message_p50_ms": 1000 * percentile(code_lat, 0.5),
+        "add_text_message_p50_ms": 1000 * percentile(text_lat, 0.5),
+    }
+    print(f"{args.storage}, {report['messages']} messages in {args.sessions} sessions, rtt {args.rtt * 1000:.0f} ms")
+    print(f"{'':<22}{'p50 ms':>9}{'p95 ms':>9}{'reads':>8}")
+    print(f"{'GET /chat/symbols':<22}{report['lookup_p50_ms']:>9.2f}{report['lookup_p95_ms']:>9.2f}"
+          f"{report['lookup_reads']:>8}   ({report['refs_per_lookup']:.1f} refs per lookup)")
+    print(f"{'history scan':<22}{report['scan_p50_ms']:>9.2f}{report['scan_p95_ms']:>9.2f}{report['scan_reads']:>8}")
+    print(f"add_message_to_session p50: {report['add_code_message_p50_ms']:.2f} ms with code, "
+          f"{report['add_text_message_p50_ms']:.2f} ms text only")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"revision": git_revision(), "config": vars(args), "report": report}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Virtual-user operations and workload mixes.
+
+Each operation is an async callable (client, user, rng) -> httpx.Response.
+Operations pick their inputs from the user's seeded RNG so that a run with the
+same seed issues the same request sequence on every commit.
+"""
+import random
+from typing import Callable, Dict, List
+
+import httpx
+
+from benchmarks.fakes import mint_token
+
+API = "/api/v1"
+
+PROMPTS = [
+    "Show me a TON timer that turns on a motor 5 seconds after start",
+    "Write a start/stop seal-in circuit with an emergency stop",
+    "What is a PLC scan cycle?",
+    "Create a CTU counter that counts bottles and stops the conveyor at 12",
+    "Tank level control with high and low level switches and a fill valve",
+    "Explain the difference between SET and RESET coils",
+]
+SEARCHES = ["timer", "counter", "motor", "interlock", "seal-in"]
+
+
+class VirtualUser:
+    def __init__(self, index: int, seed: int):
+        self.uid = f"bench-user-{index}"
+        self.headers = {"Authorization": f"Bearer {mint_token(self.uid)}"}
+        self.rng = random.Random(seed * 1000 + index)
+        self.session_ids: List[str] = []
+
+
+async def create_session(client: httpx.AsyncClient, user: VirtualUser) -> httpx.Response:
+    resp = await client.post(f"{API}/chat/sessions", json={"title": "Bench chat"}, headers=user.headers)
+    if resp.status_code == 200:
+        user.session_ids.append(resp.json()["session_id"])
+    return resp
+
+
+async def _session(client: httpx.AsyncClient, user: VirtualUser) -> str:
+    if not user.session_ids:
+        await create_session(client, user)
+    return user.rng.choice(user.session_ids) if user.session_ids else "missing"
+
+
+async def send_message(client: httpx.AsyncClient, user: VirtualUser) -> httpx.Response:
+    session_id = await _session(client, user)
+    return await client.post(
+        f"{API}/chat/sessions/{session_id}/messages",
+        json={"message": user.rng.choice(PROMPTS)},
+        headers=user.headers,
+    )
+
+
+async def list_sessions(client: httpx.AsyncClient, user: VirtualUser) -> httpx.Response:
+    return await client.get(f"{API}/chat/sessions", headers=user.headers)
+
+
+async def get_messages(client: httpx.AsyncClient, user: VirtualUser) -> httpx.Response:
+    session_id = await _session(client, user)
+    return await client.get(f"{API}/chat/sessions/{session_id}/messages", headers=user.headers)
+
+
+async def browse_library(client: httpx.AsyncClient, user: VirtualUser) -> httpx.Response:
+    return await client.get(f"{API}/library/entries", headers=user.headers)
+
+
+async def search_library(client: httpx.AsyncClient, user: VirtualUser) -> httpx.Response:
+    return await client.post(
+        f"{API}/library/search", json={"query": user.rng.choice(SEARCHES)}, headers=user.headers
+    )
+
+
+async def library_stats(client: httpx.AsyncClient, user: VirtualUser) -> httpx.Response:
+    return await client.get(f"{API}/library/stats", headers=user.headers)
+
+
+async def save_to_library(client: httpx.AsyncClient, user: VirtualUser) -> httpx.Response:
+    session_id = await _session(client, user)
+    return await client.post(
+        f"{API}/library/entries",
+        json={
+            "user_question": user.rng.choice(PROMPTS),
+            "assistant_response": '[{"type": "text", "content": "Saved by the benchmark"}]',
+            "session_id": session_id,
+            "tags": ["bench"],
+            "category": "General",
+        },
+        headers=user.headers,
+    )
+
+
+OPERATIONS: Dict[str, Callable] = {
+    "create_session": create_session,
+    "send_message": send_message,
+    "list_sessions": list_sessions,
+    "get_messages": get_messages,
+    "browse_library": browse_library,
+    "search_library": search_library,
+    "library_stats": library_stats,
+    "save_to_library": save_to_library,
+}
+
+# Relative weights per operation
+MIXES: Dict[str, Dict[str, int]] = {
+    "mixed": {
+        "create_session": 5, "send_message": 30, "list_sessions": 20, "get_messages": 20,
+        "browse_library": 12, "search_library": 6, "library_stats": 4, "save_to_library": 3,
+    },
+    "chat": {
+        "create_session": 10, "send_message": 60, "list_sessions": 15, "get_messages": 15,
+    },
+    "library": {
+        "browse_library": 50, "search_library": 25, "library_stats": 15, "save_to_library": 10,
+    },
+}
+
+
+def pick_operation(user: VirtualUser, mix: Dict[str, int]) -> str:
+    names = list(mix)
+    return user.rng.choices(names, weights=[mix[n] for n in names], k=1)[0]